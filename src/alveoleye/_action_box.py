@@ -1,7 +1,8 @@
+import time
 from pathlib import Path
 
 from qtpy.QtCore import Qt, QTimer, QThread
-from qtpy.QtWidgets import QVBoxLayout, QPushButton, QGroupBox
+from qtpy.QtWidgets import QVBoxLayout, QPushButton, QGroupBox, QMessageBox
 
 import alveoleye._gui_creator
 import alveoleye._rules as rules
@@ -9,6 +10,7 @@ import alveoleye._gui_creator as gui_creator
 from alveoleye._config_utils import Config
 from alveoleye._export_operations import make_save_image_callback
 from alveoleye._workers import WorkerParent
+from alveoleye.lungcv.profiling import StageProfiler
 
 
 class ActionBox(QGroupBox):
@@ -30,6 +32,9 @@ class ActionBox(QGroupBox):
     all_action_boxes = []
     step = 0
 
+    # one writer per snapshot directory and format, so names stay unique across boxes and runs
+    snapshot_writers = {}
+
     def __init__(self, napari_viewer):
         super().__init__()
 
@@ -54,6 +59,7 @@ class ActionBox(QGroupBox):
 
         self.worker = None
         self.thread = None
+        self.snapshot_writer = None
         self.action_button = None
         self.animation_timer = None
 
@@ -111,10 +117,25 @@ class ActionBox(QGroupBox):
 
         self.setTitle(new_title)
 
+    def get_snapshot_writer(self):
+        export_location = Path.home() / self.action_box_config_data["INTERMEDIATE_SNAPSHOT_SAVE_LOCATION"]
+        snapshot_format = self.action_box_config_data["INTERMEDIATE_SNAPSHOT_FORMAT"]
+        key = (str(export_location), snapshot_format)
+
+        if key not in ActionBox.snapshot_writers:
+            ActionBox.snapshot_writers[key] = make_save_image_callback(export_location, fmt=snapshot_format)
+
+        return ActionBox.snapshot_writers[key]
+
     def thread_worker(self):
+        self.snapshot_writer = None
         if self.action_box_config_data["SAVE_INTERMEDIATE_SNAPSHOTS"]:
-            export_location = Path.home() / self.action_box_config_data["INTERMEDIATE_SNAPSHOT_SAVE_LOCATION"]
-            self.worker.set_callback(make_save_image_callback(export_location))
+            self.snapshot_writer = self.get_snapshot_writer()
+            self.worker.snapshots_failed.connect(self.on_snapshots_failed)
+        self.worker.set_callback(self.snapshot_writer)
+
+        if self.action_box_config_data["PROFILE_STAGES"]:
+            self.worker.set_profiler(StageProfiler())
 
         self.thread = QThread()
         self.worker.moveToThread(self.thread)
@@ -152,10 +173,32 @@ class ActionBox(QGroupBox):
         self.broadcast_step_change_message()
 
     def on_thread_completed(self):
+        if self.snapshot_writer is not None:
+            self.worker.snapshots_failed.disconnect(self.on_snapshots_failed)
+
+        if self.worker.profiler is not None:
+            self.save_profile()
+
         self.thread.deleteLater()
         self.stop_animation()
         self.set_state(0)
 
+    def on_snapshots_failed(self, error_message):
+        print(f"[-] Intermediate snapshots were not all saved: {error_message}")
+        QMessageBox.warning(self, "Snapshots Not Saved",
+                            f"Some intermediate snapshots could not be saved to "
+                            f"{self.snapshot_writer.save_dir}:\n{error_message}")
+
+    def save_profile(self):
+        profile_location = Path.home() / self.action_box_config_data["PROFILE_SAVE_LOCATION"] / "profiles"
+        profile_name = f"{self.__class__.__name__}_{time.strftime('%Y%m%d_%H%M%S')}"
+
+        try:
+            self.worker.profiler.save(profile_location, profile_name)
+            print(f"[+] Saved stage profile to {profile_location / profile_name}.profile.json")
+        except OSError as e:
+            print(f"[!] Could not save stage profile: {e}")
+
     def create_ui_rules(self):
         self.rules_engine.add_rule(lambda: self.state == 2, lambda: alveoleye._gui_creator.toggle(False, self.action_button))
 
@@ -11,8 +11,9 @@ from qtpy.QtCore import QTimer
 from alveoleye._action_box import ActionBox
 import alveoleye._gui_creator as gui_creator
 import alveoleye._layers_editor as layers_editor
-from alveoleye._export_operations import is_real_writable_dir
+from alveoleye._export_operations import DEFAULT_TIFF_CODEC, is_real_writable_dir
 from alveoleye._models import Result
+from alveoleye._result_spool import ResultSpool
 from alveoleye._verifiers import verify_png_or_tiff
 from alveoleye._workers import (
     AssessmentsWorker,
@@ -38,6 +39,8 @@ class ProcessingActionBox(ActionBox):
         self.import_weights_line_edit = None
         self.confidence_threshold_label_and_spin_box_layout = None
         self.confidence_threshold_spin_box = None
+        self.inference_preset_label_and_combo_box_layout = None
+        self.inference_preset_combo_box = None
 
         self.box_id = 1
 
@@ -57,6 +60,7 @@ class ProcessingActionBox(ActionBox):
         self.worker.set_image_path(ActionBox.import_paths["image"])
         self.worker.set_use_ai(self.use_ai_check_box.isChecked())
         self.worker.set_weights(ActionBox.import_paths["weights"])
+        self.worker.set_preset(self.inference_preset_combo_box.currentText())
         self.worker.set_labels(self.labels_config_data)
         self.worker.set_image_shape(self.image.shape)
         self.worker.set_confidence_threshold_value(self.confidence_threshold_spin_box.value())
@@ -94,10 +98,17 @@ class ProcessingActionBox(ActionBox):
             self.box_config_data["CONFIDENCE_THRESHOLD_SPIN_BOX_STEP"],
             self.box_config_data["CONFIDENCE_THRESHOLD_SPIN_BOX_SUFFIX"]
         )
+        inference_preset_label_and_combo_box = gui_creator.create_label_and_combo_box_layout(
+            self.box_config_data["INFERENCE_PRESET_LABEL_TEXT"],
+            self.box_config_data["INFERENCE_PRESET_COMBO_BOX_TOOLTIP_TEXT"],
+            self.box_config_data["INFERENCE_PRESET_COMBO_BOX_OPTIONS"],
+            self.box_config_data["INFERENCE_PRESET_COMBO_BOX_DEFAULT_VALUE"]
+        )
 
         import_image_button_and_line_edit_layout = import_image_button_and_line_edit[0]
         import_weights_button_and_line_edit_layout = import_weights_button_and_line_edit[0]
         confidence_threshold_label_and_spin_box_layout = confidence_threshold_label_and_spin_box[0]
+        inference_preset_label_and_combo_box_layout = inference_preset_label_and_combo_box[0]
 
         self.import_image_line_edit = import_image_button_and_line_edit[2]
         self.import_weights_button_and_line_edit_layout = import_weights_button_and_line_edit_layout
@@ -105,6 +116,8 @@ class ProcessingActionBox(ActionBox):
         self.import_weights_line_edit = import_weights_button_and_line_edit[2]
         self.confidence_threshold_spin_box = confidence_threshold_label_and_spin_box[2]
         self.confidence_threshold_label_and_spin_box_layout = confidence_threshold_label_and_spin_box_layout
+        self.inference_preset_combo_box = inference_preset_label_and_combo_box[2]
+        self.inference_preset_label_and_combo_box_layout = inference_preset_label_and_combo_box_layout
 
         ui_elements = [
             import_image_button_and_line_edit_layout,
@@ -112,6 +125,7 @@ class ProcessingActionBox(ActionBox):
             use_ai_check_box,
             import_weights_button_and_line_edit_layout,
             confidence_threshold_label_and_spin_box_layout,
+            inference_preset_label_and_combo_box_layout,
         ]
 
         self.create_action_box_layout(
@@ -147,6 +161,7 @@ class ProcessingActionBox(ActionBox):
             lambda: gui_creator.toggle(True, [
                 self.import_weights_button_and_line_edit_layout,
                 self.confidence_threshold_label_and_spin_box_layout,
+                self.inference_preset_label_and_combo_box_layout,
             ])
         )
         self.rules_engine.add_rule(
@@ -154,6 +169,7 @@ class ProcessingActionBox(ActionBox):
             lambda: gui_creator.toggle(False, [
                 self.import_weights_button_and_line_edit_layout,
                 self.confidence_threshold_label_and_spin_box_layout,
+                self.inference_preset_label_and_combo_box_layout,
             ])
         )
 
@@ -469,6 +485,8 @@ class AssessmentsActionBox(ActionBox):
         self.asvd_check_box = None
         self.asvd_check_box_and_line_edit_layout = None
 
+        self.rerun_pending = False
+
         self.box_id = 3
 
         self.create_ui_elements()
@@ -540,6 +558,9 @@ class AssessmentsActionBox(ActionBox):
         self.min_length_spin_box = min_length_label_and_spin_box[2]
         self.scale_spin_box = scale_label_and_spin_box[2]
 
+        for spin_box in (self.lines_spin_box, self.min_length_spin_box, self.scale_spin_box):
+            spin_box.valueChanged.connect(self.on_mli_parameter_changed)
+
         ui_elements = [self.asvd_check_box_and_line_edit_layout,
                        horizontal_line_one,
                        self.mli_check_box_and_line_edit_layout,
@@ -591,6 +612,27 @@ class AssessmentsActionBox(ActionBox):
 
         super().create_ui_rules()
 
+    def on_mli_parameter_changed(self):
+        # Only the cached MLI stage depends on these values, so refresh the results in place
+        if ActionBox.step != self.box_id or not self.mli_check_box.isChecked():
+            return
+
+        if self.state == 1:
+            self.rerun_pending = True
+            return
+
+        if any(box.state for box in ActionBox.all_action_boxes):
+            return
+
+        self.on_action_button_press()
+
+    def on_thread_completed(self):
+        super().on_thread_completed()
+
+        if self.rerun_pending:
+            self.rerun_pending = False
+            self.on_mli_parameter_changed()
+
     def on_results_ready(self, asvd, mli, chords, stdev_chord_lengths,
                          airspace_pixels, non_airspace_pixels, wrapped_assessments_layer):
         assessments_layer = wrapped_assessments_layer["assessments_layer"]
@@ -660,6 +702,8 @@ class ExportActionBox(ActionBox):
 
         self.accumulated_results: list[Result] = []
         self.current_result: Result | None = None
+        self.spool = ResultSpool(Path.home() / self.box_config_data["SPOOL_LOCATION"])
+        self.destroyed.connect(self.spool.close)
 
         self.exp_parent_folder = ""
         self.exp_project_name = ""
@@ -667,12 +711,16 @@ class ExportActionBox(ActionBox):
         self.exp_labelmap_ext = "tif"
         self.exp_rgb_color = False
         self.exp_zip_it = False
+        self.exp_tiff_codec = DEFAULT_TIFF_CODEC
+        self.exp_tiff_pyramid = False
 
         self.box_id = 4
 
         self.create_ui_elements()
         self.create_ui_rules()
 
+        QTimer.singleShot(0, self.offer_spool_recovery)
+
     def create_ui_elements(self):
         mli_layout, _, self.mli_line_edit = gui_creator.create_label_and_line_edit_layout(
             self.box_config_data["MLI_METRIC"],
@@ -851,12 +899,10 @@ class ExportActionBox(ActionBox):
             )
             for layer_name, layer_data in zip(all_layer_names, layers_data):
                 if layer_data is not None:
-                    labelmaps[layer_name] = np.array(layer_data, copy=True)
+                    labelmaps[layer_name] = layer_data
 
-        full_r = Result(
-            **self.current_result.to_dict(),
-            labelmaps=labelmaps or None
-        )
+        # the spool writes the layers to disk, so only metadata stays in memory
+        full_r = self.spool.add(self.current_result, labelmaps)
 
         # store and update UI
         self.accumulated_results.append(full_r)
@@ -868,6 +914,7 @@ class ExportActionBox(ActionBox):
                 self, self.box_config_data["REMOVE_CONFIRMATION_MESSAGE"]
         ):
             self.accumulated_results.pop()
+            self.spool.pop()
             self.rules_engine.evaluate_rules()
             self.update_export_counter()
 
@@ -876,8 +923,22 @@ class ExportActionBox(ActionBox):
                 self, self.box_config_data["CLEAR_CONFIRMATION_MESSAGE"]
         ):
             self.accumulated_results.clear()
+            self.spool.clear()
+            self.rules_engine.evaluate_rules()
+            self.update_export_counter()
+
+    def offer_spool_recovery(self):
+        sessions = self.spool.interrupted_sessions()
+        count = self.spool.count_recoverable(sessions)
+
+        if count and gui_creator.create_confirmation_message_box(
+                self, self.box_config_data["RECOVER_CONFIRMATION_MESSAGE"].format(count=count)
+        ):
+            self.accumulated_results.extend(self.spool.recover(sessions))
             self.rules_engine.evaluate_rules()
             self.update_export_counter()
+        else:
+            self.spool.discard(sessions)
 
     def update_export_counter(self):
         base = self.box_config_data["ACTION_BUTTON_TEXT"]
@@ -917,6 +978,8 @@ class ExportActionBox(ActionBox):
             self.exp_labelmap_ext,
             self.exp_rgb_color,
             self.exp_zip_it,
+            self.exp_tiff_codec,
+            self.exp_tiff_pyramid,
         ) = params
 
         super().on_action_button_press()
@@ -929,10 +992,17 @@ class ExportActionBox(ActionBox):
         self.worker.set_labelmap_format(self.exp_labelmap_ext)
         self.worker.set_exp_rgb(self.exp_rgb_color)
         self.worker.set_zip(self.exp_zip_it)
+        self.worker.set_tiff_codec(self.exp_tiff_codec)
+        self.worker.set_tiff_pyramid(self.exp_tiff_pyramid)
         self.worker.set_accumulated_results(self.accumulated_results)
+        self.worker.progress.connect(self.on_export_progress)
 
         super().thread_worker()
 
+    def on_export_progress(self, done: int, total: int):
+        if self.state == 1:
+            self.action_button.setToolTip(f"Cancel operation ({done}/{total} files written)")
+
     def on_thread_completed(self):
         super().on_thread_completed()
         self.update_export_counter()
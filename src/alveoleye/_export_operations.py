@@ -1,10 +1,16 @@
 import csv
+import io
 import json
 import os
-import shutil
-from typing import List, Optional, Dict
+import posixpath
+import queue
+import threading
+import zipfile
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
 
-import os
 import tifffile
 
 import numpy as np
@@ -14,6 +20,38 @@ from PIL import Image
 from alveoleye._config_utils import Config
 from alveoleye._models import Result
 
+# Extensions written as palette images, which keep one byte per pixel instead of RGB
+PALETTE_EXTENSIONS = {"png", "tif", "tiff", "bmp", "gif"}
+
+# Extensions that are already compressed and are stored in archives as-is
+COMPRESSED_EXTENSIONS = {"png", "jpg", "jpeg", "gif", "webp"}
+
+# TIFF labelmap codecs offered for export, mapped to tifffile compression names
+TIFF_CODECS = {"deflate": "zlib", "zstd": "zstd", "lzw": "lzw", "none": None}
+DEFAULT_TIFF_CODEC = "deflate"
+
+# Labelmaps larger than one tile are written tiled, and pyramids halve down to one tile
+TIFF_TILE_SIZE = 512
+
+# Threads encoding export files
+EXPORT_WORKERS = min(8, os.cpu_count() or 1)
+
+# Snapshot encodings and their extensions; npy keeps the raw array, uncolored
+SNAPSHOT_FORMATS = {"png": ".png", "bmp": ".bmp", "tiff": ".tif", "npy": ".npy"}
+DEFAULT_SNAPSHOT_FORMAT = "png"
+
+# zlib level of PNG snapshots (Pillow's default); 1 encodes several times faster
+DEFAULT_SNAPSHOT_COMPRESS_LEVEL = 6
+
+# Snapshots waiting to be written before the pipeline blocks; each holds a copy of its array
+SNAPSHOT_QUEUE_SIZE = 4
+
+# Seconds an idle snapshot writer thread waits for work before exiting
+SNAPSHOT_WRITER_IDLE_SECONDS = 1.0
+
+# Archive-relative path and a function encoding the file, or returning None to skip it
+EncodeJob = Tuple[str, Callable[[], Optional[bytes]]]
+
 
 def get_unique_export_folder(base_dir: str, desired_name: str) -> str:
     root = os.path.abspath(base_dir)
@@ -29,8 +67,7 @@ def get_unique_export_folder(base_dir: str, desired_name: str) -> str:
     return candidate
 
 
-def write_metrics(results: List[Result], out_path: str, fmt: str):
-    os.makedirs(os.path.dirname(out_path), exist_ok=True)
+def _metrics_bytes(results: List[Result], fmt: str) -> bytes:
     rows = []
 
     for idx, r in enumerate(results, start=1):
@@ -40,74 +77,237 @@ def write_metrics(results: List[Result], out_path: str, fmt: str):
 
     if fmt.lower() == "csv":
         fieldnames = ["case_id"] + [k for k in rows[0] if k != "case_id"] if rows else []
-        with open(out_path, "w", newline="") as fh:
-            writer = csv.DictWriter(fh, fieldnames=fieldnames)
-            writer.writeheader()
-            writer.writerows(rows)
-    else:
-        payload = {str(idx): {**r.to_dict(), "case_id": idx}
-                   for idx, r in enumerate(results, start=1)}
-        with open(out_path, "w") as fh:
-            json.dump(payload, fh, indent=2)
+        fh = io.StringIO(newline="")
+        writer = csv.DictWriter(fh, fieldnames=fieldnames)
+        writer.writeheader()
+        writer.writerows(rows)
+        return fh.getvalue().encode()
+
+    payload = {str(idx): {**r.to_dict(), "case_id": idx}
+               for idx, r in enumerate(results, start=1)}
+    return json.dumps(payload, indent=2).encode()
+
+
+def _minimal_dtype(lm: np.ndarray) -> np.ndarray:
+    if lm.dtype.kind == "b":
+        return lm.astype(np.uint8)
+    if lm.dtype.kind not in "iu":
+        return lm.astype(np.uint16)
+    if not lm.size:
+        return lm.astype(np.uint8)
+
+    low, high = int(lm.min()), int(lm.max())
+    for dtype in (np.uint8, np.uint16, np.uint32, np.int8, np.int16, np.int32):
+        info = np.iinfo(dtype)
+        if info.min <= low and high <= info.max:
+            return lm.astype(dtype, copy=False)
+    return lm
+
+
+def _tiff_compression(codec: str) -> Optional[str]:
+    try:
+        return TIFF_CODECS[codec.lower()]
+    except KeyError:
+        raise ValueError(f"Unknown TIFF codec {codec!r}, expected one of {sorted(TIFF_CODECS)}") from None
+
+
+def available_tiff_codecs() -> List[str]:
+    available = []
+    for codec, compression in TIFF_CODECS.items():
+        try:
+            tifffile.imwrite(io.BytesIO(), np.zeros((1, 1), dtype=np.uint8), compression=compression)
+        except Exception:
+            continue
+        available.append(codec)
+    return available
 
 
-def write_labelmaps(results: List[Result], labelmap_dir: str, ext: str):
-    for idx, r in enumerate(results, start=1):
-        if not r.labelmaps:
-            continue
+def _tiff_bytes(lm: np.ndarray, codec: str = DEFAULT_TIFF_CODEC, pyramid: bool = False, ome: bool = False) -> bytes:
+    lm = _minimal_dtype(np.asarray(lm))
+    rgb = lm.ndim == 3 and lm.shape[-1] in (3, 4)
 
-        result_dir = os.path.join(labelmap_dir, str(idx))
-        os.makedirs(result_dir, exist_ok=True)
+    options = {"compression": _tiff_compression(codec), "photometric": "rgb" if rgb else "minisblack"}
+    if max(lm.shape[:2]) > TIFF_TILE_SIZE:
+        options["tile"] = (TIFF_TILE_SIZE, TIFF_TILE_SIZE)
 
-        for layer_name, lm in r.labelmaps.items():
-            fn = f"{layer_name}.{ext}"
-            outp = os.path.join(result_dir, fn)
-            tifffile.imwrite(outp, lm.astype("uint16"))
+    # Halve by subsampling so lower levels keep exact label values
+    levels = []
+    if pyramid:
+        level = lm
+        while max(level.shape[:2]) > TIFF_TILE_SIZE:
+            level = level[::2, ::2]
+            levels.append(level)
 
+    buffer = io.BytesIO()
+    with tifffile.TiffWriter(buffer, ome=ome) as tif:
+        metadata = {"axes": "YXS" if rgb else "YX"} if ome else None
+        tif.write(lm, subifds=len(levels) or None, metadata=metadata, **options)
+        for level in levels:
+            level_options = dict(options)
+            if max(level.shape[:2]) <= TIFF_TILE_SIZE:
+                level_options.pop("tile", None)
+            tif.write(level, subfiletype=1, **level_options)
 
-def write_images(results: List[Result], labelmap_dir: str, ext: str):
-    colormap = _norm_to_rgb(Config.get_label_indexed_colormap())
+    return buffer.getvalue()
+
+
+def _labelmap_bytes(lm: np.ndarray, ext: str, codec: str = DEFAULT_TIFF_CODEC, pyramid: bool = False) -> bytes:
+    ext = ext.lower()
+    if ext.endswith(("tif", "tiff")):
+        return _tiff_bytes(lm, codec, pyramid, ome=ext.startswith("ome."))
+
+    lm = _minimal_dtype(np.asarray(lm))
+    image_format = Image.registered_extensions().get(f".{ext}")
+    if image_format is None or lm.dtype not in (np.uint8, np.uint16):
+        return _tiff_bytes(lm, codec, pyramid)
+
+    buffer = io.BytesIO()
+    Image.fromarray(lm).save(buffer, format=image_format)
+    return buffer.getvalue()
+
+
+def _image_bytes(arr, layer_name: str, ext: str, lut: np.ndarray, palette: bool) -> Optional[bytes]:
+    arr = np.asarray(arr)
+
+    if arr.ndim == 3 and arr.shape[2] == 3:
+        image = Image.fromarray(arr.astype(np.uint8))
+
+    else:
+        if arr.ndim == 3 and arr.shape[0] == 1:
+            lm = arr[0]
+        elif arr.ndim == 2:
+            lm = arr
+        else:
+            print(f"[!] Skipping {layer_name!r}: unsupported shape {arr.shape}")
+            return None
+
+        image = labelmap_to_image(lm, lut, palette=palette)
+
+    image_format = Image.registered_extensions().get(f".{ext.lower().rsplit('.', 1)[-1]}")
+    if image_format is None:
+        raise ValueError(f"Unsupported image format: {ext}")
+
+    buffer = io.BytesIO()
+    image.save(buffer, format=image_format)
+    return buffer.getvalue()
+
+
+def _labelmap_jobs(
+    results: List[Result],
+    ext: str,
+    export_as_rgb: bool,
+    tiff_codec: str = DEFAULT_TIFF_CODEC,
+    tiff_pyramid: bool = False,
+) -> Iterator[EncodeJob]:
+    if export_as_rgb:
+        lut = build_color_lut(_norm_to_rgb(Config.get_label_indexed_colormap()))
+        palette = ext.lower() in PALETTE_EXTENSIONS
 
     for idx, r in enumerate(results, start=1):
         if not r.labelmaps:
             continue
 
-        result_dir = os.path.join(labelmap_dir, str(idx))
-        os.makedirs(result_dir, exist_ok=True)
+        for layer_name, lm in r.labelmaps.items():
+            path = f"{idx}/{layer_name}.{ext}"
+            if export_as_rgb:
+                yield path, partial(_image_bytes, lm, layer_name, ext, lut, palette)
+            else:
+                yield path, partial(_labelmap_bytes, lm, ext, tiff_codec, tiff_pyramid)
+
+
+class ExportWriter:
+    """Writes encoded files into a folder, a zip archive, or both as they arrive."""
+
+    def __init__(
+        self,
+        folder: Optional[str] = None,
+        archive: Optional[str] = None,
+        archive_root: str = "",
+        stored_extensions: Iterable[str] = COMPRESSED_EXTENSIONS,
+    ):
+        self.folder = folder
+        self.archive_root = archive_root
+        self.stored_extensions = set(stored_extensions)
+        self.zip = zipfile.ZipFile(archive, "w", allowZip64=True) if archive else None
+
+    def write(self, path: str, data: bytes):
+        if self.folder:
+            out_path = os.path.join(self.folder, *path.split("/"))
+            os.makedirs(os.path.dirname(out_path), exist_ok=True)
+            with open(out_path, "wb") as fh:
+                fh.write(data)
+
+        if self.zip:
+            ext = path.rsplit(".", 1)[-1].lower()
+            compress_type = zipfile.ZIP_STORED if ext in self.stored_extensions else zipfile.ZIP_DEFLATED
+            self.zip.writestr(posixpath.join(self.archive_root, path), data, compress_type=compress_type)
+
+    def close(self):
+        if self.zip:
+            self.zip.close()
+            self.zip = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def write_encoded(
+    writer: ExportWriter,
+    jobs: Iterable[EncodeJob],
+    workers: int = EXPORT_WORKERS,
+    progress: Optional[Callable[[int, int], None]] = None,
+) -> int:
+    """Encode jobs in a thread pool and write them in order, keeping at most a few encoded files in memory."""
+    jobs = list(jobs)
+    pending = deque()
+    written = 0
+
+    def write_next():
+        nonlocal written
+        path, future = pending.popleft()
+        data = future.result()
+        if data is not None:
+            writer.write(path, data)
+
+        written += 1
+        if progress:
+            progress(written, len(jobs))
+
+    with ThreadPoolExecutor(max_workers=max(workers, 1)) as pool:
+        for path, encode in jobs:
+            pending.append((path, pool.submit(encode)))
+            if len(pending) > 2 * workers:
+                write_next()
+
+        while pending:
+            write_next()
+
+    return written
 
-        for layer_name, arr in r.labelmaps.items():
-            arr = np.asarray(arr)
 
-            if arr.ndim == 3 and arr.shape[2] == 3:
-                rgb_image = arr.astype(np.uint8)
+def write_metrics(results: List[Result], out_path: str, fmt: str):
+    os.makedirs(os.path.dirname(out_path), exist_ok=True)
+    with open(out_path, "wb") as fh:
+        fh.write(_metrics_bytes(results, fmt))
 
-            else:
-                if arr.ndim == 3 and arr.shape[0] == 1:
-                    lm = arr[0]
-                elif arr.ndim == 2:
-                    lm = arr
-                else:
-                    print(f"[!] Skipping {layer_name!r}: unsupported shape {arr.shape}")
-                    continue
-
-                h, w = lm.shape
-                rgb_image = np.zeros((h, w, 3), dtype=np.uint8)
-                for label, color in colormap.items():
-                    rgb_image[lm == label] = color
-
-            fn = f"{layer_name}.{ext}"
-            outp = os.path.join(result_dir, fn)
-            Image.fromarray(rgb_image).save(outp)
-            
-
-def zip_folder(src_folder: str, zip_target: str):
-    root, folder = os.path.split(src_folder.rstrip("/\\"))
-    temp_archive = shutil.make_archive(os.path.join(root, folder), 'zip', root, folder)
-
-    if os.path.abspath(temp_archive) != os.path.abspath(zip_target):
-        if os.path.exists(zip_target):
-            os.remove(zip_target)
-        os.replace(temp_archive, zip_target)
+
+def write_labelmaps(
+    results: List[Result],
+    labelmap_dir: str,
+    ext: str,
+    tiff_codec: str = DEFAULT_TIFF_CODEC,
+    tiff_pyramid: bool = False,
+):
+    with ExportWriter(labelmap_dir) as writer:
+        write_encoded(writer, _labelmap_jobs(results, ext, False, tiff_codec, tiff_pyramid))
+
+
+def write_images(results: List[Result], labelmap_dir: str, ext: str):
+    with ExportWriter(labelmap_dir) as writer:
+        write_encoded(writer, _labelmap_jobs(results, ext, export_as_rgb=True))
 
 
 def export_results(
@@ -118,30 +318,43 @@ def export_results(
     labelmap_ext: str = "tif",
     zip_it: bool = False,
     export_as_rgb: bool = False,
+    progress: Optional[Callable[[int, int], None]] = None,
+    tiff_codec: str = DEFAULT_TIFF_CODEC,
+    tiff_pyramid: bool = False,
 ) -> Dict[str, Optional[str]]:
+    # Fail before creating anything if the codec is unknown or needs a missing package
+    if _tiff_compression(tiff_codec) is not None and tiff_codec.lower() not in available_tiff_codecs():
+        raise ValueError(f"TIFF codec {tiff_codec!r} is not available; install imagecodecs to use it")
+
     export_folder = get_unique_export_folder(base_dir, project_name)
     os.makedirs(export_folder, exist_ok=True)
 
-    metrics_fp = os.path.join(export_folder, f"metrics.{metrics_format}")
-    write_metrics(results, metrics_fp, metrics_format)
+    metrics_name = f"metrics.{metrics_format}"
+    jobs = [(metrics_name, partial(_metrics_bytes, results, metrics_format))]
 
     labelmaps_dir = None
     if any(r.labelmaps is not None for r in results):
         labelmaps_dir = os.path.join(export_folder, "labelmaps")
+        jobs.extend((f"labelmaps/{path}", encode)
+                    for path, encode in _labelmap_jobs(results, labelmap_ext, export_as_rgb,
+                                                       tiff_codec, tiff_pyramid))
 
-        if export_as_rgb:
-            write_images(results, labelmaps_dir, labelmap_ext)
-        else:
-            write_labelmaps(results, labelmaps_dir, labelmap_ext)
-
+    # Files go to the folder and the archive as they are encoded, so the folder is never read back
     archive_fp = None
     if zip_it:
         archive_fp = os.path.join(base_dir, f"{os.path.basename(export_folder)}.zip")
-        zip_folder(export_folder, archive_fp)
+
+    # Compressed TIFF labelmaps are stored as-is instead of deflated a second time
+    stored_extensions = COMPRESSED_EXTENSIONS
+    if not export_as_rgb and _tiff_compression(tiff_codec) is not None:
+        stored_extensions = stored_extensions | {"tif", "tiff"}
+
+    with ExportWriter(export_folder, archive_fp, os.path.basename(export_folder), stored_extensions) as writer:
+        write_encoded(writer, jobs, progress=progress)
 
     return {
         "export_folder": export_folder,
-        "metrics": metrics_fp,
+        "metrics": os.path.join(export_folder, metrics_name),
         "labelmaps": labelmaps_dir,
         "archive": archive_fp,
     }
@@ -160,6 +373,48 @@ def _norm_to_rgb(colormap):
     return rgb_map
 
 
+def build_color_lut(colormap) -> np.ndarray:
+    """(max_label + 1, 3) uint8 lookup table from a label -> RGB colormap; unmapped labels are black."""
+    lut = np.zeros((max(colormap, default=0) + 1, 3), dtype=np.uint8)
+    for label, color in colormap.items():
+        lut[label] = color
+    return lut
+
+
+def _lut_for(lm: np.ndarray, lut: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Labels and a LUT covering all of them, with out-of-range labels indexing black."""
+    if lm.dtype == np.uint8:
+        size = 256
+    else:
+        if lm.dtype.kind not in "ui":
+            lm = lm.astype(np.int64)
+        size = max(len(lut), int(lm.max()) + 1 if lm.size else 0) + 1
+        if lm.dtype.kind == "i" and lm.size and lm.min() < 0:
+            lm = np.where(lm < 0, size - 1, lm)
+
+    padded = np.zeros((max(size, len(lut)), 3), dtype=np.uint8)
+    padded[:len(lut)] = lut
+    return lm, padded
+
+
+def render_labelmap(lm: np.ndarray, lut: np.ndarray) -> np.ndarray:
+    """Colorize a 2D labelmap to (H, W, 3) uint8 RGB in one lookup."""
+    lm, lut = _lut_for(np.asarray(lm), lut)
+    return np.take(lut, lm, axis=0)
+
+
+def labelmap_to_image(lm: np.ndarray, lut: np.ndarray, palette: bool = True) -> Image.Image:
+    """Image of a colorized labelmap: palette-mode when labels fit in a byte, RGB otherwise."""
+    lm = np.asarray(lm)
+
+    if palette and lm.size and lm.dtype.kind in "uib" and 0 <= lm.min() and lm.max() < 256 and len(lut) <= 256:
+        image = Image.fromarray(lm.astype(np.uint8, copy=False), mode="P")
+        image.putpalette(_lut_for(lm.astype(np.uint8, copy=False), lut)[1].ravel().tolist())
+        return image
+
+    return Image.fromarray(render_labelmap(lm, lut))
+
+
 def load_image_specific_colormap(snapshot_step):
     colormap = Config.get_label_indexed_colormap()
     rgb_colormap = _norm_to_rgb(colormap)
@@ -174,59 +429,154 @@ def load_image_specific_colormap(snapshot_step):
     return rgb_colormap
 
 
-def save_image(data, snapshot_step, save_dir, get_colormap_function=None):
-    os.makedirs(save_dir, exist_ok=True)
+def _snapshot_array(data, copy=False) -> np.ndarray:
+    if isinstance(data, torch.Tensor):
+        data = data.detach().cpu().numpy()
 
-    name = Config.get_snapshot_names()[snapshot_step]
+    if not isinstance(data, np.ndarray):
+        raise ValueError(f"Unsupported data type: {type(data)}")
+
+    data = np.squeeze(data)
+    if not (data.ndim == 2 or (data.ndim == 3 and data.shape[2] in {3, 4})):
+        raise ValueError(f"Unsupported image shape after squeeze: {data.shape}")
+
+    # The pipeline may reuse its buffers once the callback returns
+    return np.array(data) if copy else data
 
-    base_name = name
-    ext = ".png"
-    candidate_name = f"{base_name}{ext}"
-    counter = 1
 
+def _snapshot_colormap(snapshot_step, get_colormap_function=None):
     if get_colormap_function:
-        colormap = get_colormap_function(snapshot_step)
-    else:
-        colormap = load_image_specific_colormap(snapshot_step)
+        return get_colormap_function(snapshot_step)
+    return load_image_specific_colormap(snapshot_step)
+
 
-    existing_files = set(os.listdir(save_dir))
-    while candidate_name in existing_files:
+def _unique_snapshot_name(base_name, ext, taken):
+    candidate_name = f"{base_name}{ext}"
+    counter = 1
+
+    while candidate_name in taken:
         candidate_name = f"{base_name}({counter}){ext}"
         counter += 1
 
-    save_path = os.path.join(save_dir, candidate_name)
+    return candidate_name
 
-    if isinstance(data, torch.Tensor):
-        data = data.detach().cpu().numpy()
 
-    if isinstance(data, np.ndarray):
-        data = np.squeeze(data)
-
-        if data.ndim == 3 and data.shape[2] in {3, 4}:
-            image = Image.fromarray(data.astype(np.uint8))
-        elif data.ndim == 2:
-            if colormap:
-                h, w = data.shape
-                rgb_image = np.zeros((h, w, 3), dtype=np.uint8)
-                for label, color in colormap.items():
-                    rgb_image[data == label] = color
-                image = Image.fromarray(rgb_image)
-            else:
-                image = Image.fromarray(data.astype(np.uint8), mode='L')
-        else:
-            raise ValueError(f"Unsupported image shape after squeeze: {data.shape}")
+def _write_snapshot(data, save_path, colormap, fmt=DEFAULT_SNAPSHOT_FORMAT,
+                    compress_level=DEFAULT_SNAPSHOT_COMPRESS_LEVEL):
+    if fmt == "npy":
+        np.save(save_path, data)
+        return
+
+    if data.ndim == 3:
+        image = Image.fromarray(data.astype(np.uint8))
+    elif colormap:
+        image = labelmap_to_image(data, build_color_lut(colormap))
     else:
-        raise ValueError(f"Unsupported data type: {type(data)}")
+        image = Image.fromarray(data.astype(np.uint8), mode='L')
 
-    image.save(save_path)
-    print(f"[+] Saved image to {save_path}")
+    if fmt == "png":
+        image.save(save_path, compress_level=compress_level)
+    else:
+        image.save(save_path)
 
 
-def make_save_image_callback(save_dir, get_colormap_function=None):
-    snapshots_dir = os.path.join(save_dir, "snapshots")
+def save_image(data, snapshot_step, save_dir, get_colormap_function=None):
+    os.makedirs(save_dir, exist_ok=True)
 
-    def save_image_callback(data, name):
-        save_image(data, name, snapshots_dir, get_colormap_function)
+    data = _snapshot_array(data)
+    candidate_name = _unique_snapshot_name(Config.get_snapshot_names()[snapshot_step], ".png",
+                                           set(os.listdir(save_dir)))
+    save_path = os.path.join(save_dir, candidate_name)
+
+    _write_snapshot(data, save_path, _snapshot_colormap(snapshot_step, get_colormap_function))
+    print(f"[+] Saved image to {save_path}")
 
-    return save_image_callback
 
+class SnapshotWriter:
+    """Pipeline callback saving snapshots from a background thread.
+
+    Names are reserved in the calling thread, so they match save_image's
+    name(1).png numbering, but the directory is listed only once. Encoding
+    and writing happen in a writer thread fed by a bounded queue; the thread
+    exits after SNAPSHOT_WRITER_IDLE_SECONDS without work and is restarted
+    by the next snapshot. Errors are printed and raised again by flush.
+    """
+
+    def __init__(self, save_dir, get_colormap_function=None, fmt=DEFAULT_SNAPSHOT_FORMAT,
+                 compress_level=DEFAULT_SNAPSHOT_COMPRESS_LEVEL, queue_size=SNAPSHOT_QUEUE_SIZE):
+        if fmt not in SNAPSHOT_FORMATS:
+            raise ValueError(f"Unsupported snapshot format: {fmt}")
+
+        self.save_dir = save_dir
+        self.get_colormap_function = get_colormap_function
+        self.fmt = fmt
+        self.compress_level = compress_level
+        self.errors = []
+
+        self._queue = queue.Queue(maxsize=max(queue_size, 1))
+        self._lock = threading.Lock()
+        self._thread = None
+        self._taken = None
+
+    def _reserve_path(self, snapshot_step):
+        if self._taken is None:
+            os.makedirs(self.save_dir, exist_ok=True)
+            self._taken = set(os.listdir(self.save_dir))
+
+        candidate_name = _unique_snapshot_name(Config.get_snapshot_names()[snapshot_step],
+                                               SNAPSHOT_FORMATS[self.fmt], self._taken)
+        self._taken.add(candidate_name)
+        return os.path.join(self.save_dir, candidate_name)
+
+    def __call__(self, data, snapshot_step):
+        data = _snapshot_array(data, copy=True)
+        colormap = _snapshot_colormap(snapshot_step, self.get_colormap_function)
+
+        with self._lock:
+            save_path = self._reserve_path(snapshot_step)
+
+        self._queue.put((data, save_path, colormap))
+
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="alveoleye-snapshots")
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            try:
+                data, save_path, colormap = self._queue.get(timeout=SNAPSHOT_WRITER_IDLE_SECONDS)
+            except queue.Empty:
+                with self._lock:
+                    if self._queue.empty():
+                        self._thread = None
+                        return
+                continue
+
+            try:
+                _write_snapshot(data, save_path, colormap, self.fmt, self.compress_level)
+                print(f"[+] Saved image to {save_path}")
+            except Exception as e:
+                print(f"[-] Error saving snapshot {save_path}: {e}")
+                self.errors.append(e)
+            finally:
+                self._queue.task_done()
+
+    def flush(self):
+        """Wait for queued snapshots to be written, raising the first error since the last flush."""
+        self._queue.join()
+
+        if self.errors:
+            error, self.errors = self.errors[0], []
+            raise error
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.flush()
+
+
+def make_save_image_callback(save_dir, get_colormap_function=None, fmt=DEFAULT_SNAPSHOT_FORMAT,
+                             compress_level=DEFAULT_SNAPSHOT_COMPRESS_LEVEL):
+    return SnapshotWriter(os.path.join(save_dir, "snapshots"), get_colormap_function, fmt, compress_level)
@@ -23,6 +23,8 @@ from qtpy.QtWidgets import (
     QVBoxLayout,
 )
 
+from alveoleye._export_operations import DEFAULT_TIFF_CODEC, available_tiff_codecs
+
 class NoScrollSpinBox(QSpinBox):
     def wheelEvent(self, event):
         event.ignore()
@@ -31,6 +33,10 @@ class NoScrollDoubleSpinBox(QDoubleSpinBox):
     def wheelEvent(self, event):
         event.ignore()
 
+class NoScrollComboBox(QComboBox):
+    def wheelEvent(self, event):
+        event.ignore()
+
 def create_sub_layout(layout, elements):
     for element in elements:
         if isinstance(element, QLayout):
@@ -69,6 +75,26 @@ def create_label_and_spin_box_layout(label_text, tooltip_text, spin_box_min, spi
     return label_and_spin_box_layout, label, spin_box
 
 
+def create_label_and_combo_box_layout(label_text, tooltip_text, combo_box_items, combo_box_default):
+    label = QLineEdit(label_text)
+    label.setReadOnly(True)
+    label.setObjectName("labelLineEdit")
+
+    combo_box = NoScrollComboBox()
+    combo_box.addItems(combo_box_items)
+    combo_box.setCurrentText(combo_box_default)
+
+    label_and_combo_box_layout = create_sub_layout(QHBoxLayout(), [label, combo_box])
+
+    combo_box.setToolTip(tooltip_text)
+    combo_box.setCursor(Qt.PointingHandCursor)
+
+    combo_box.setSizePolicy(QSizePolicy.Expanding, QSizePolicy.Fixed)
+    label.setSizePolicy(QSizePolicy.Expanding, QSizePolicy.Fixed)
+
+    return label_and_combo_box_layout, label, combo_box
+
+
 def create_check_box_widget(check_box_text, on_check_box_checked, check_box_tooltip_text, default_checked=False):
     check_box = QCheckBox(check_box_text)
     check_box.setChecked(default_checked)
@@ -274,14 +300,22 @@ class ExportDialog(QDialog):
 
         if self.has_labelmaps:
             self.labelmap_combo = QComboBox(self)
-            self.labelmap_combo.addItems(["tif", "png"])
+            self.labelmap_combo.addItems(["tif", "ome.tif", "png"])
+            self.tiff_codec_combo = QComboBox(self)
+            self.tiff_codec_combo.addItems(available_tiff_codecs())
+            self.pyramid_cb = QCheckBox("Write multiresolution TIFF pyramid")
             self.rgb_cb = QCheckBox("Export as RGB image")
             self.zip_cb = QCheckBox("Compress into ZIP archive")
 
             form.addRow("Labelmap format:", self.labelmap_combo)
+            form.addRow("TIFF compression:", self.tiff_codec_combo)
+            form.addRow("", self.pyramid_cb)
             form.addRow("", self.rgb_cb)
             form.addRow("", self.zip_cb)
 
+            self.labelmap_combo.currentTextChanged.connect(self._on_labelmap_format_changed)
+            self.rgb_cb.toggled.connect(self._on_labelmap_format_changed)
+
         buttons = QDialogButtonBox(QDialogButtonBox.Ok | QDialogButtonBox.Cancel)
         buttons.accepted.connect(self._on_accept)
         buttons.rejected.connect(self.reject)
@@ -299,8 +333,16 @@ class ExportDialog(QDialog):
             self.labelmap_combo.currentText() if self.has_labelmaps else None,
             self.rgb_cb.isChecked() if self.has_labelmaps else False,
             self.zip_cb.isChecked() if self.has_labelmaps else False,
+            self.tiff_codec_combo.currentText() if self.has_labelmaps else DEFAULT_TIFF_CODEC,
+            self.pyramid_cb.isChecked() if self.has_labelmaps else False,
         )
 
+    def _on_labelmap_format_changed(self):
+        # Codec and pyramid only apply to TIFF labelmaps
+        is_tiff = self.labelmap_combo.currentText().endswith("tif") and not self.rgb_cb.isChecked()
+        self.tiff_codec_combo.setEnabled(is_tiff)
+        self.pyramid_cb.setEnabled(is_tiff)
+
     def _on_browse_parent(self):
         start = self.parent_le.text().strip() or self._default_parent
         chosen = QFileDialog.getExistingDirectory(
@@ -0,0 +1,219 @@
+import json
+import os
+import shutil
+import time
+import uuid
+import weakref
+from collections.abc import Mapping
+from typing import Dict, Iterator, List, Optional, Sequence
+
+import numpy as np
+
+from alveoleye._models import Result
+
+ENTRY_METADATA = "result.json"
+OWNER_FILE = "owner.pid"
+SESSION_PREFIX = "session-"
+
+# Windows OpenProcess access right, error for unknown pids and exit code of live processes
+PROCESS_QUERY_LIMITED_INFORMATION = 0x1000
+ERROR_INVALID_PARAMETER = 87
+STILL_ACTIVE = 259
+
+
+class SpooledLabelmaps(Mapping):
+    """Labelmaps of a spooled result, read memory-mapped from the spool on access."""
+
+    def __init__(self, directory: str, names: Sequence[str]):
+        self.directory = directory
+        self.names = list(names)
+
+    def __getitem__(self, name: str) -> np.ndarray:
+        try:
+            index = self.names.index(name)
+        except ValueError:
+            raise KeyError(name) from None
+        return np.load(os.path.join(self.directory, f"layer_{index}.npy"), mmap_mode="r")
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.names)
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+
+def _compact(arr) -> np.ndarray:
+    # Labelmaps are usually int32/int64 layers holding a handful of small labels
+    arr = np.asarray(arr)
+    if arr.dtype.kind in "iu" and arr.size:
+        low, high = int(arr.min()), int(arr.max())
+        for dtype in (np.uint8, np.uint16):
+            if 0 <= low and high <= np.iinfo(dtype).max:
+                return arr.astype(dtype, copy=False)
+    return arr
+
+
+def _json_default(value):
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def _windows_process_running(pid: int) -> bool:
+    import ctypes
+
+    kernel32 = ctypes.WinDLL("kernel32", use_last_error=True)
+    handle = kernel32.OpenProcess(PROCESS_QUERY_LIMITED_INFORMATION, False, pid)
+    if not handle:
+        # Access denied still means the process exists
+        return ctypes.get_last_error() != ERROR_INVALID_PARAMETER
+
+    try:
+        exit_code = ctypes.c_ulong()
+        if not kernel32.GetExitCodeProcess(handle, ctypes.byref(exit_code)):
+            return True
+        return exit_code.value == STILL_ACTIVE
+    finally:
+        kernel32.CloseHandle(handle)
+
+
+def _is_running(pid: int) -> bool:
+    # When liveness cannot be checked the session is treated as running, never recovered or discarded
+    if pid == os.getpid():
+        return True
+    if os.name == "nt":
+        try:
+            return _windows_process_running(pid)
+        except (AttributeError, OSError):
+            return True
+    if os.name != "posix":
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class ResultSpool:
+    """Staged export results kept on disk, one session directory per running plugin.
+
+    Each result is an entry directory holding its metadata in result.json and
+    its labelmaps as .npy files, so staged results do not stay in memory.
+    Entries are written under a temporary name and renamed when complete, so
+    a session left behind by a crash can be recovered entry by entry. The
+    session is removed by close, when the spool is garbage collected, or at
+    interpreter exit, so only crashed sessions are ever offered for recovery.
+    """
+
+    def __init__(self, root: str):
+        self.root = str(root)
+        session = f"{SESSION_PREFIX}{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:8]}"
+        self.session_dir = os.path.join(self.root, session)
+        self.entries: List[str] = []
+        self._finalizer = weakref.finalize(self, shutil.rmtree, self.session_dir, ignore_errors=True)
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def _ensure_session(self):
+        if not os.path.isdir(self.session_dir):
+            # Created under a hidden name, so other instances never see a session without its owner
+            partial = os.path.join(self.root, f".{os.path.basename(self.session_dir)}")
+            os.makedirs(partial)
+            with open(os.path.join(partial, OWNER_FILE), "w") as fh:
+                fh.write(str(os.getpid()))
+            os.rename(partial, self.session_dir)
+
+    def _next_entry(self) -> str:
+        index = int(os.path.basename(self.entries[-1])) + 1 if self.entries else 0
+        return os.path.join(self.session_dir, f"{index:06d}")
+
+    def add(self, result: Result, labelmaps: Optional[Dict[str, np.ndarray]] = None) -> Result:
+        """Spool a result and its labelmaps, returning the result reading them from disk."""
+        self._ensure_session()
+        entry = self._next_entry()
+        partial = f"{entry}.tmp"
+        os.makedirs(partial, exist_ok=True)
+
+        names = list(labelmaps or {})
+        for index, name in enumerate(names):
+            np.save(os.path.join(partial, f"layer_{index}.npy"), _compact(labelmaps[name]))
+
+        with open(os.path.join(partial, ENTRY_METADATA), "w") as fh:
+            json.dump({"result": result.to_dict(), "labelmaps": names}, fh, default=_json_default)
+
+        os.rename(partial, entry)
+        self.entries.append(entry)
+        return self._load_entry(entry)
+
+    def pop(self):
+        shutil.rmtree(self.entries.pop(), ignore_errors=True)
+
+    def clear(self):
+        self.entries.clear()
+        shutil.rmtree(self.session_dir, ignore_errors=True)
+
+    def close(self):
+        """Remove the session on clean shutdown."""
+        self.entries.clear()
+        self._finalizer()
+
+    @staticmethod
+    def _load_entry(entry: str) -> Result:
+        with open(os.path.join(entry, ENTRY_METADATA)) as fh:
+            metadata = json.load(fh)
+
+        labelmaps = SpooledLabelmaps(entry, metadata["labelmaps"]) if metadata["labelmaps"] else None
+        return Result(**metadata["result"], labelmaps=labelmaps)
+
+    def interrupted_sessions(self) -> List[str]:
+        """Sessions with staged results whose plugin is no longer running."""
+        if not os.path.isdir(self.root):
+            return []
+
+        sessions = []
+        for name in sorted(os.listdir(self.root)):
+            session = os.path.join(self.root, name)
+            if not name.startswith(SESSION_PREFIX) or session == self.session_dir:
+                continue
+
+            try:
+                with open(os.path.join(session, OWNER_FILE)) as fh:
+                    if _is_running(int(fh.read().strip())):
+                        continue
+            except (OSError, ValueError):
+                pass
+
+            sessions.append(session)
+
+        return sessions
+
+    @staticmethod
+    def _session_entries(session: str) -> List[str]:
+        return [os.path.join(session, name) for name in sorted(os.listdir(session))
+                if name.isdigit() and os.path.isfile(os.path.join(session, name, ENTRY_METADATA))]
+
+    def count_recoverable(self, sessions: Sequence[str]) -> int:
+        return sum(len(self._session_entries(session)) for session in sessions)
+
+    def recover(self, sessions: Sequence[str]) -> List[Result]:
+        """Move the complete entries of interrupted sessions into this session, oldest first."""
+        recovered = []
+        for session in sessions:
+            for entry in self._session_entries(session):
+                self._ensure_session()
+                target = self._next_entry()
+                os.rename(entry, target)
+                self.entries.append(target)
+                recovered.append(self._load_entry(target))
+
+        self.discard(sessions)
+        return recovered
+
+    @staticmethod
+    def discard(sessions: Sequence[str]):
+        for session in sessions:
+            shutil.rmtree(session, ignore_errors=True)
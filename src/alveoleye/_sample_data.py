@@ -1,21 +1,22 @@
 """
-This module is an example of a barebones sample data provider for napari.
+Sample data provider for napari.
 
 It implements the "sample data" specification.
 see: https://napari.org/stable/plugins/guides.html?#sample-data
 
-Replace code below according to your needs.
+The sample is a procedurally generated lung section (see
+alveoleye.lungcv.synthetic), so the plugin can be tried without real data.
 """
 from __future__ import annotations
 
-import numpy
-
 
 def make_sample_data():
-    """Generates an image"""
+    """Generates a synthetic lung section"""
+    from alveoleye.lungcv.synthetic import SAMPLE_DATA_SIZE, generate_section
+
+    section = generate_section(SAMPLE_DATA_SIZE, seed=0)
+
     # Return list of tuples
     # [(data1, add_image_kwargs1), (data2, add_image_kwargs2)]
-    # Check the documentation for more information about the
-    # add_image_kwargs
     # https://napari.org/stable/api/napari.Viewer.html#napari.Viewer.add_image
-    return [(numpy.random.rand(512, 512), {})]
+    return [(section.image, {"name": "synthetic lung section", "rgb": True})]
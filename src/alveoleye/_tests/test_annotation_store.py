@@ -0,0 +1,89 @@
+"""Tests for the compiled instance annotation store.
+
+Tests cover:
+- Samples read from the store matching samples decoded from RGB masks
+- LungDataset picking up DATASET/instance_store automatically
+- Masks edited after compiling falling back to decoding
+- Stores compiled with other classes being ignored
+"""
+
+import json
+import os
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from alveoleye.lungcv.mrcnn.annotation_store import compile_annotation_store, open_annotation_store
+from alveoleye.lungcv.mrcnn.dataset import LungDataset
+
+
+@pytest.fixture
+def busy_dataset(mock_dataset):
+    """mock_dataset with a train mask holding several blobs, a tiny one and a one-pixel line."""
+    mask = np.zeros((64, 64, 3), dtype=np.uint8)
+    mask[2:12, 2:12] = [255, 0, 0]
+    mask[2:12, 20:26] = [255, 0, 0]
+    mask[30:33, 30:33] = [255, 0, 0]  # below MIN_BLOB_SIZE
+    mask[50, 5:40] = [0, 255, 0]  # too thin for a box
+    mask[40:60, 45:60] = [0, 255, 0]
+    Image.fromarray(mask).save(mock_dataset / "masks" / "train" / "img_1.png")
+    return mock_dataset
+
+
+def _decode_both(root, idx):
+    from_store = LungDataset(str(root), None, train=True, cache_bytes=0)
+    decoded = LungDataset(str(root), None, train=True, cache_bytes=0, annotation_store=None)
+    return from_store, from_store.load_sample(idx), decoded.load_sample(idx)
+
+
+class TestAnnotationStore:
+    def test_compile_records_every_mask(self, busy_dataset):
+        store = compile_annotation_store(busy_dataset)
+
+        record = store.records["masks/train/img_1.png"]
+        class_ids = store.class_ids[record["offset"]:record["offset"] + record["count"]]
+
+        assert len(store) == 4
+        # The thin line is stored; only LungDataset drops it for its box
+        assert sorted(class_ids.tolist()) == [1, 1, 2, 2]
+
+    @pytest.mark.parametrize("idx", [0, 1])
+    def test_store_matches_decoding(self, busy_dataset, idx):
+        compile_annotation_store(busy_dataset)
+        dataset, stored, decoded = _decode_both(busy_dataset, idx)
+
+        assert dataset.annotation_store is not None
+        for name in ("image", "boxes", "labels", "masks"):
+            np.testing.assert_array_equal(getattr(stored, name), getattr(decoded, name))
+
+    def test_edited_mask_is_decoded(self, busy_dataset, monkeypatch):
+        compile_annotation_store(busy_dataset)
+        mask_path = busy_dataset / "masks" / "train" / "img_0.png"
+        Image.fromarray(np.zeros((64, 64, 3), dtype=np.uint8)).save(mask_path)
+        os.utime(mask_path, ns=(1, 1))
+
+        dataset, stored, decoded = _decode_both(busy_dataset, 0)
+
+        assert dataset.annotation_store.get(str(mask_path)) is None
+        assert len(stored.labels) == len(decoded.labels) == 0
+
+    def test_other_classes_ignore_store(self, busy_dataset):
+        compile_annotation_store(busy_dataset)
+        (busy_dataset / "classes.json").write_text(json.dumps({"vessel": "[0 255 0]"}))
+
+        dataset = LungDataset(str(busy_dataset), None, train=True)
+
+        assert dataset.annotation_store is None
+
+    def test_missing_store(self, busy_dataset):
+        assert open_annotation_store(busy_dataset) is None
+        with pytest.raises(FileNotFoundError):
+            LungDataset(str(busy_dataset), None, train=True, annotation_store=str(busy_dataset / "missing"))
+
+    def test_refuses_to_replace_other_directories(self, busy_dataset):
+        (busy_dataset / "notes").mkdir()
+        (busy_dataset / "notes" / "todo.txt").write_text("keep me")
+
+        with pytest.raises(FileExistsError):
+            compile_annotation_store(busy_dataset, output=busy_dataset / "notes")
@@ -111,6 +111,40 @@ class TestCalculateMeanLinearIntercept(unittest.TestCase):
         self.assertGreater(result[0], 0)  # Expecting non-zero average length
         self.assertTrue(np.any(result[1] == self.labels["MLI_LINES_INSIDE"]))  # Ensure lines inside are labeled
 
+    def test_known_chord_lengths(self):
+        labelmap = np.zeros((5, 12), dtype=np.uint8)
+        labelmap[2] = [1, 1, 1, 0, 1, 0, 1, 1, 1, 1, 1, 0]
+        average_length, chords_layer, chords, stdev = calculate_mean_linear_intercept(labelmap, 1, 2, 2.0, self.labels)
+
+        # Runs of 3 and 5 are kept, the single pixel run is dropped
+        self.assertEqual(chords, 2)
+        self.assertAlmostEqual(average_length, 8.0)
+        self.assertAlmostEqual(stdev, 2.0)
+        self.assertEqual(chords_layer[2, 4], 0)
+        self.assertEqual(chords_layer[2, 0], self.labels["MLI_LINES_INSIDE"])
+
+    def test_vertical_orientation_matches_transposed(self):
+        labelmap = (np.random.default_rng(0).random((40, 60)) > 0.4).astype(np.uint8)
+        vertical = calculate_mean_linear_intercept(labelmap, 7, 2, 1, self.labels, orientation="vertical")
+        horizontal = calculate_mean_linear_intercept(labelmap.T, 7, 2, 1, self.labels)
+
+        self.assertAlmostEqual(vertical[0], horizontal[0])
+        self.assertEqual(vertical[2], horizontal[2])
+        np.testing.assert_array_equal(vertical[1], horizontal[1].T)
+
+    def test_more_lines_than_rows(self):
+        labelmap = np.ones((10, 10), dtype=np.uint8)
+        result = calculate_mean_linear_intercept(labelmap, 2000, 1, 1, self.labels)
+
+        # 2000 evenly spaced lines collapse onto rows 0-8, each measured once
+        self.assertEqual(result[2], 9)
+        self.assertAlmostEqual(result[0], 10)
+
+    def test_invalid_orientation(self):
+        with self.assertRaises(ValueError):
+            calculate_mean_linear_intercept(np.ones((5, 5), dtype=np.uint8), 1, 1, 1, self.labels,
+                                            orientation="diagonal")
+
 
 if __name__ == '__main__':
     unittest.main()
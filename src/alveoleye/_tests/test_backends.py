@@ -0,0 +1,125 @@
+"""Tests for exported and quantized inference backends.
+
+Tests cover:
+- TorchScript exports matching the eager model
+- Quantized exports and the int8 backend running on the CPU
+- Parity reports against the eager model
+- Exports working on copies of the caller's model
+- Loading exports through the model registry and custom backends
+"""
+
+import numpy as np
+import pytest
+import torch
+from torchvision.models.detection import maskrcnn_resnet50_fpn
+
+from alveoleye._config_utils import Config
+from alveoleye.lungcv import backends
+from alveoleye.lungcv.model_operations import ModelRegistry
+
+
+@pytest.fixture(scope="module")
+def model():
+    """Small randomly initialized Mask R-CNN that keeps low-score detections."""
+    torch.manual_seed(0)
+    model = maskrcnn_resnet50_fpn(weights=None, weights_backbone=None, num_classes=3,
+                                  min_size=64, max_size=64, box_score_thresh=0.0,
+                                  box_detections_per_img=10, rpn_post_nms_top_n_test=100)
+    return model.eval()
+
+
+@pytest.fixture(scope="module")
+def exported(model, tmp_path_factory):
+    return backends.export_model(model, tmp_path_factory.mktemp("exported"), formats=("torchscript",),
+                                 quantize=True)
+
+
+@pytest.fixture
+def images():
+    rng = np.random.default_rng(0)
+    return [rng.integers(0, 256, size=(64, 64, 3), dtype=np.uint8) for _ in range(2)]
+
+
+class TestTorchScriptBackend:
+    def test_export_names(self, exported):
+        assert set(exported) == {"torchscript", "torchscript-int8"}
+        assert all(path.is_file() for path in exported.values())
+
+    @torch.no_grad()
+    def test_matches_eager(self, model, exported):
+        scripted = backends.load_backend("torchscript", exported["torchscript"], device=torch.device("cpu"))
+        images = [torch.rand(3, 64, 64)]
+
+        for actual, expected in zip(scripted(images), model(images)):
+            for name in ("boxes", "labels", "scores", "masks"):
+                torch.testing.assert_close(actual[name], expected[name])
+
+    def test_quantized_export_runs_on_cpu(self, exported):
+        quantized = backends.load_backend("torchscript", exported["torchscript-int8"], device=torch.device("cpu"))
+
+        assert isinstance(quantized, backends.CpuDetector)
+        with torch.no_grad():
+            output = quantized([torch.rand(3, 64, 64)])[0]
+        assert set(output) >= {"boxes", "labels", "scores", "masks"}
+
+    def test_parity(self, model, exported, images):
+        scripted = backends.load_backend("torchscript", exported["torchscript"], device=torch.device("cpu"))
+
+        report = backends.check_parity(model, scripted, images, Config.get_labels(), min_confidence=0)
+
+        assert report.agreements == [1.0, 1.0] and report.detection_differences == [0, 0]
+        assert report.passed() and report.speedup > 0
+
+    def test_quantized_model(self, model):
+        quantized = backends.quantize_model(model)
+
+        assert type(quantized.roi_heads.box_head.fc6).__module__.startswith("torch.ao.nn.quantized")
+        assert type(model.roi_heads.box_head.fc6) is torch.nn.Linear
+
+    def test_exports_leave_model_untouched(self, model):
+        parameter = next(model.parameters())
+        model.train()
+        try:
+            backends.script_model(model)
+            backends.quantize_model(model)
+            assert model.training and next(model.parameters()) is parameter
+        finally:
+            model.eval()
+
+
+class TestBackendRegistry:
+    def test_registry_loads_exports(self, exported):
+        registry = ModelRegistry()
+
+        first = registry.get(exported["torchscript"], device=torch.device("cpu"), backend="torchscript")
+        second = registry.get(exported["torchscript"], device=torch.device("cpu"), backend="torchscript")
+
+        assert first is second and isinstance(first, backends.ScriptedDetector)
+
+    def test_missing_export(self, tmp_path):
+        with pytest.raises(FileNotFoundError):
+            ModelRegistry().get(tmp_path / "missing.pt", backend="torchscript")
+
+    def test_custom_backend(self, exported, monkeypatch):
+        monkeypatch.setattr(backends, "_BACKENDS", dict(backends._BACKENDS))
+        backends.register_backend("identity", lambda path, num_classes, device: torch.nn.Identity())
+
+        assert isinstance(backends.load_backend("identity", exported["torchscript"]), torch.nn.Identity)
+        with pytest.raises(ValueError):
+            backends.load_backend("tensorrt", exported["torchscript"])
+
+    def test_unknown_format(self, model, tmp_path):
+        with pytest.raises(ValueError):
+            backends.export_model(model, tmp_path, formats=("tflite",))
+
+
+class TestOnnxBackend:
+    def test_matches_eager(self, model, tmp_path, images):
+        pytest.importorskip("onnx")
+        pytest.importorskip("onnxruntime")
+
+        paths = backends.export_model(model, tmp_path, formats=("onnx",))
+        onnx_model = backends.load_backend("onnx", paths["onnx"])
+
+        report = backends.check_parity(model, onnx_model, images, Config.get_labels(), min_confidence=0)
+        assert report.passed()
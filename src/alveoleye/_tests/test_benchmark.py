@@ -0,0 +1,145 @@
+"""Tests for the offline benchmark suite.
+
+Tests cover:
+- Every benchmark case running on a small synthetic section
+- Synthetic sections being reproducible from their seed
+- Argument validation of run_benchmarks
+- Baseline round trips and the stored baseline
+- Regression detection, noise floors and cases missing from the baseline
+"""
+
+import os
+
+import numpy as np
+import pytest
+
+from alveoleye._config_utils import Config
+from alveoleye.lungcv import benchmark
+
+
+@pytest.fixture(autouse=True)
+def default_config():
+    Config.load()
+
+
+def _result(case="convert_to_grayscale", megapixels=1, seconds=0.1, peak_rss_mb=500.0, allocated_mb=10.0):
+    return benchmark.BenchmarkResult(case, megapixels, seconds, seconds, peak_rss_mb, allocated_mb)
+
+
+class TestSyntheticSection:
+    def test_reproducible(self):
+        first, second = benchmark.SyntheticSection(0.02, seed=3), benchmark.SyntheticSection(0.02, seed=3)
+
+        assert first.image.shape == (first.side, first.side, 3)
+        np.testing.assert_array_equal(first.image, second.image)
+        np.testing.assert_array_equal(first.labelmap, second.labelmap)
+
+    def test_labelmap_contains_instances(self):
+        section = benchmark.SyntheticSection(0.05)
+        labels = section.labels
+
+        assert np.any(section.labelmap == labels["AIRWAY_EPITHELIUM"])
+        assert np.any(section.labelmap == labels["VESSEL_ENDOTHELIUM"])
+        assert np.any(section.labelmap == labels["ALVEOLI"])
+
+    def test_close_removes_dataset(self):
+        section = benchmark.SyntheticSection(0.02)
+        root = section.dataset_root
+
+        section.close()
+
+        assert not os.path.exists(root)
+
+
+class TestRunBenchmarks:
+    def test_all_cases(self):
+        reported = []
+
+        results = benchmark.run_benchmarks(megapixels=(0.02,), repeats=1, isolate=False, progress=reported.append)
+
+        assert [result.case for result in results] == list(benchmark.CASES)
+        assert reported == results
+        for result in results:
+            assert 0 < result.min_seconds <= result.seconds
+            assert result.allocated_mb >= 0
+
+    def test_skips_sizes_above_case_limit(self):
+        results = benchmark.run_benchmarks(["compute_batch_metrics"], megapixels=(0.01, 1000), repeats=1,
+                                           isolate=False)
+
+        assert [result.key for result in results] == ["compute_batch_metrics@0.01MP"]
+
+    def test_isolated(self):
+        results = benchmark.run_benchmarks(["convert_to_grayscale"], megapixels=(0.01,), repeats=1)
+
+        assert len(results) == 1
+        assert results[0].peak_rss_mb is None or results[0].peak_rss_mb > 0
+
+    def test_unknown_case(self):
+        with pytest.raises(ValueError):
+            benchmark.run_benchmarks(["convert_to_grey"], isolate=False)
+
+    def test_invalid_repeats(self):
+        with pytest.raises(ValueError):
+            benchmark.run_benchmarks(repeats=0, isolate=False)
+
+
+class TestBaseline:
+    def test_round_trip(self, tmp_path):
+        results = [_result(), _result("apply_dynamic_threshold", 4)]
+
+        path = benchmark.save_baseline(results, tmp_path / "baseline.json")
+        baseline = benchmark.load_baseline(path)
+
+        assert baseline["machine"] == benchmark.machine_info()
+        assert set(baseline["results"]) == {"convert_to_grayscale@1MP", "apply_dynamic_threshold@4MP"}
+        assert benchmark.compare_to_baseline(results, baseline) == []
+
+    def test_unsupported_version(self, tmp_path):
+        path = tmp_path / "baseline.json"
+        path.write_text('{"version": 0, "results": {}}')
+
+        with pytest.raises(ValueError):
+            benchmark.load_baseline(path)
+
+    def test_stored_baseline(self):
+        baseline = benchmark.load_baseline()
+
+        assert baseline["results"]
+        for key in baseline["results"]:
+            assert key.split("@")[0] in benchmark.CASES
+
+
+class TestCompareToBaseline:
+    @pytest.fixture
+    def baseline(self, tmp_path):
+        return benchmark.load_baseline(benchmark.save_baseline([_result()], tmp_path / "baseline.json"))
+
+    def test_slowdown(self, baseline):
+        regressions = benchmark.compare_to_baseline([_result(seconds=0.2)], baseline)
+
+        assert [(r.key, r.metric) for r in regressions] == [("convert_to_grayscale@1MP", "seconds")]
+        assert regressions[0].ratio == pytest.approx(2.0)
+
+    def test_memory_growth(self, baseline):
+        regressions = benchmark.compare_to_baseline([_result(peak_rss_mb=700.0, allocated_mb=30.0)], baseline)
+
+        assert {r.metric for r in regressions} == {"peak_rss_mb", "allocated_mb"}
+
+    def test_within_threshold(self, baseline):
+        assert benchmark.compare_to_baseline([_result(seconds=0.12)], baseline, threshold=0.25) == []
+        assert benchmark.compare_to_baseline([_result(seconds=0.12)], baseline, threshold=0.1)
+
+    def test_noise_floor(self, tmp_path):
+        baseline = benchmark.load_baseline(
+            benchmark.save_baseline([_result(seconds=0.001, allocated_mb=0.1)], tmp_path / "baseline.json"))
+
+        assert benchmark.compare_to_baseline([_result(seconds=0.003, allocated_mb=0.5)], baseline) == []
+
+    def test_missing_case(self, baseline):
+        results = [_result("remove_small_components", seconds=10.0), _result(megapixels=4, seconds=10.0)]
+
+        assert benchmark.compare_to_baseline(results, baseline) == []
+
+    def test_missing_peak_rss(self, baseline):
+        assert benchmark.compare_to_baseline([_result(peak_rss_mb=None)], baseline) == []
@@ -0,0 +1,274 @@
+"""Tests for export and snapshot image writing.
+
+Tests cover:
+- LUT rendering matching per-label colorizing
+- Palette images decoding to the same colors as RGB images
+- Labels outside the colormap rendering black
+- Exports streaming the same files into the folder and the archive
+- Compressed, tiled and pyramidal TIFF labelmaps in their smallest dtype
+- The background snapshot writer matching save_image's names and pixels
+"""
+
+import io
+import json
+import zipfile
+
+import numpy as np
+import pytest
+import tifffile
+from PIL import Image
+
+from alveoleye._export_operations import (
+    TIFF_TILE_SIZE,
+    SnapshotWriter,
+    _labelmap_bytes,
+    _norm_to_rgb,
+    available_tiff_codecs,
+    build_color_lut,
+    export_results,
+    labelmap_to_image,
+    load_image_specific_colormap,
+    make_save_image_callback,
+    render_labelmap,
+    save_image,
+)
+from alveoleye._config_utils import Config
+from alveoleye._models import Result
+
+
+def _colorize_by_label(lm, colormap):
+    rgb_image = np.zeros(lm.shape + (3,), dtype=np.uint8)
+    for label, color in colormap.items():
+        rgb_image[lm == label] = color
+    return rgb_image
+
+
+@pytest.fixture(autouse=True)
+def default_config():
+    # Other tests load temporary configs into the shared Config
+    Config.load()
+
+
+@pytest.fixture
+def colormap():
+    return _norm_to_rgb(Config.get_label_indexed_colormap())
+
+
+@pytest.fixture
+def labelmap():
+    # Includes 10 and 300, which have no color
+    rng = np.random.default_rng(0)
+    lm = rng.integers(0, 11, size=(48, 64)).astype(np.uint16)
+    lm[0, :5] = 300
+    return lm
+
+
+class TestLabelmapRendering:
+    @pytest.mark.parametrize("dtype", [np.uint8, np.int32, np.int64, np.float32])
+    def test_lut_matches_per_label(self, colormap, labelmap, dtype):
+        lm = (labelmap % 11).astype(dtype)
+
+        rendered = render_labelmap(lm, build_color_lut(colormap))
+
+        np.testing.assert_array_equal(rendered, _colorize_by_label(lm, colormap))
+
+    def test_out_of_range_labels_are_black(self, colormap, labelmap):
+        lm = labelmap.astype(np.int32)
+        lm[1, :3] = -1
+
+        rendered = render_labelmap(lm, build_color_lut(colormap))
+
+        np.testing.assert_array_equal(rendered, _colorize_by_label(lm, colormap))
+        assert (rendered[0, :5] == 0).all() and (rendered[1, :3] == 0).all()
+
+    def test_palette_image_decodes_to_rgb(self, colormap, labelmap, tmp_path):
+        lm = labelmap % 11
+        image = labelmap_to_image(lm, build_color_lut(colormap))
+        image.save(tmp_path / "lm.png")
+
+        assert image.mode == "P"
+        decoded = np.asarray(Image.open(tmp_path / "lm.png").convert("RGB"))
+        np.testing.assert_array_equal(decoded, _colorize_by_label(lm, colormap))
+
+    def test_wide_labels_fall_back_to_rgb(self, colormap, labelmap):
+        image = labelmap_to_image(labelmap, build_color_lut(colormap))
+
+        assert image.mode == "RGB"
+        np.testing.assert_array_equal(np.asarray(image), _colorize_by_label(labelmap, colormap))
+
+    def test_snapshot_colors(self, labelmap, tmp_path):
+        step = "GENERATE_PROCESSING_LABELMAP_AIRWAY"
+        lm = labelmap % 11
+
+        save_image(lm, step, str(tmp_path))
+
+        (path,) = tmp_path.iterdir()
+        decoded = np.asarray(Image.open(path).convert("RGB"))
+        np.testing.assert_array_equal(decoded, _colorize_by_label(lm, load_image_specific_colormap(step)))
+
+
+class TestSnapshotWriter:
+    def test_matches_save_image(self, labelmap, tmp_path):
+        step = "GENERATE_PROCESSING_LABELMAP_AIRWAY"
+        lm = labelmap % 11
+        (tmp_path / "sync").mkdir()
+        (tmp_path / "async").mkdir()
+
+        for _ in range(3):
+            save_image(lm, step, str(tmp_path / "sync"))
+        with SnapshotWriter(str(tmp_path / "async")) as writer:
+            for _ in range(3):
+                writer(lm, step)
+
+        names = sorted(path.name for path in (tmp_path / "sync").iterdir())
+        assert sorted(path.name for path in (tmp_path / "async").iterdir()) == names
+        for name in names:
+            np.testing.assert_array_equal(np.asarray(Image.open(tmp_path / "async" / name).convert("RGB")),
+                                          np.asarray(Image.open(tmp_path / "sync" / name).convert("RGB")))
+
+    def test_continues_existing_numbering(self, tmp_path):
+        step = "CONVERT_TO_GRAYSCALE"
+        name = Config.get_snapshot_names()[step]
+        (tmp_path / "snapshots").mkdir()
+        (tmp_path / "snapshots" / f"{name}.png").write_bytes(b"")
+
+        with make_save_image_callback(str(tmp_path)) as writer:
+            writer(np.zeros((4, 4), np.uint8), step)
+
+        assert (tmp_path / "snapshots" / f"{name}(1).png").stat().st_size > 0
+
+    def test_copies_reused_buffers(self, tmp_path):
+        data = np.full((8, 8), 7, np.uint8)
+
+        with SnapshotWriter(str(tmp_path), fmt="npy") as writer:
+            writer(data, "CONVERT_TO_GRAYSCALE")
+            data[:] = 0
+
+        (path,) = tmp_path.iterdir()
+        assert path.suffix == ".npy"
+        assert (np.load(path) == 7).all()
+
+    def test_errors(self, tmp_path):
+        writer = SnapshotWriter(str(tmp_path))
+
+        with pytest.raises(ValueError):
+            writer([1, 2, 3], "CONVERT_TO_GRAYSCALE")
+        with pytest.raises(ValueError):
+            SnapshotWriter(str(tmp_path), fmt="jpeg2000")
+
+        writer.get_colormap_function = lambda step: {"not": "a colormap"}
+        writer(np.zeros((4, 4), np.uint8), "CONVERT_TO_GRAYSCALE")
+        with pytest.raises(Exception):
+            writer.flush()
+        writer.flush()
+
+
+def _results(count=5):
+    rng = np.random.default_rng(1)
+    return [Result(image_file_name=f"img_{i}.tif", asvd=0.5 + i, mli=10.0 * i,
+                   labelmaps={"processing": rng.integers(0, 10, size=(32, 40)).astype(np.uint8),
+                              "assessments": rng.integers(0, 10, size=(32, 40)).astype(np.int32)})
+            for i in range(count)]
+
+
+class TestExportResults:
+    @pytest.mark.parametrize("export_as_rgb, ext", [(False, "tif"), (True, "png"), (True, "jpg")])
+    def test_archive_matches_folder(self, tmp_path, export_as_rgb, ext):
+        progress = []
+
+        info = export_results(_results(), str(tmp_path), "study", labelmap_ext=ext, zip_it=True,
+                              export_as_rgb=export_as_rgb, progress=lambda *p: progress.append(p))
+
+        files = sorted(p for p in (tmp_path / "study").rglob("*") if p.is_file())
+        with zipfile.ZipFile(info["archive"]) as archive:
+            names = sorted(archive.namelist())
+            assert names == sorted(f"study/{p.relative_to(tmp_path / 'study').as_posix()}" for p in files)
+            for path in files:
+                assert archive.read(f"study/{path.relative_to(tmp_path / 'study').as_posix()}") == path.read_bytes()
+
+        assert len(files) == 11
+        assert progress == [(i, 11) for i in range(1, 12)]
+
+    def test_labelmaps_round_trip(self, tmp_path):
+        results = _results()
+
+        info = export_results(results, str(tmp_path), "study")
+
+        for idx, result in enumerate(results, start=1):
+            for name, lm in result.labelmaps.items():
+                written = tifffile.imread(f"{info['labelmaps']}/{idx}/{name}.tif")
+                assert written.dtype == np.uint8
+                np.testing.assert_array_equal(written, lm)
+
+    def test_metrics(self, tmp_path):
+        info = export_results(_results(3), str(tmp_path), "study", metrics_format="json", zip_it=False)
+
+        payload = json.loads(open(info["metrics"]).read())
+
+        assert info["archive"] is None
+        assert [payload[str(i)]["asvd"] for i in (1, 2, 3)] == [0.5, 1.5, 2.5]
+        assert payload["2"]["case_id"] == 2
+
+    def test_unique_folders(self, tmp_path):
+        first = export_results(_results(1), str(tmp_path), "study", zip_it=True)
+        second = export_results(_results(1), str(tmp_path), "study", zip_it=True)
+
+        assert second["export_folder"].endswith("study(1)")
+        assert second["archive"].endswith("study(1).zip") and first["archive"] != second["archive"]
+
+
+class TestTiffLabelmaps:
+    @pytest.mark.parametrize("dtype, values, expected", [
+        (np.int64, (0, 9), np.uint8),
+        (np.int32, (0, 300), np.uint16),
+        (np.int64, (-1, 9), np.int8),
+        (bool, (0, 1), np.uint8),
+    ])
+    def test_minimal_dtype(self, dtype, values, expected):
+        lm = np.zeros((16, 16), dtype=dtype)
+        lm[0, 0], lm[-1, -1] = values
+
+        written = tifffile.imread(io.BytesIO(_labelmap_bytes(lm, "tif")))
+
+        assert written.dtype == expected
+        np.testing.assert_array_equal(written, lm)
+
+    @pytest.mark.parametrize("ext", ["tif", "ome.tif"])
+    def test_tiled_pyramid(self, ext):
+        rng = np.random.default_rng(0)
+        lm = np.repeat(rng.integers(0, 10, size=(300, 150)), 4, axis=0).repeat(8, axis=1)  # 1200 x 1200
+
+        data = _labelmap_bytes(lm, ext, codec="deflate", pyramid=True)
+
+        with tifffile.TiffFile(io.BytesIO(data)) as tif:
+            levels = tif.series[0].levels
+            assert tif.is_ome == (ext == "ome.tif")
+            assert tif.pages[0].is_tiled and tif.pages[0].tilewidth == TIFF_TILE_SIZE
+            assert [level.shape for level in levels] == [(1200, 1200), (600, 600), (300, 300)]
+            np.testing.assert_array_equal(levels[0].asarray(), lm)
+            np.testing.assert_array_equal(levels[2].asarray(), lm[::4, ::4])
+        assert len(data) < lm.size // 10
+
+    def test_png_labelmap(self):
+        lm = np.arange(64, dtype=np.int64).reshape(8, 8)
+
+        image = Image.open(io.BytesIO(_labelmap_bytes(lm, "png")))
+
+        assert image.format == "PNG"
+        np.testing.assert_array_equal(np.asarray(image), lm)
+
+    def test_unavailable_codec(self, tmp_path):
+        with pytest.raises(ValueError):
+            export_results(_results(1), str(tmp_path), "study", tiff_codec="jpeg2000")
+
+        if "lzw" not in available_tiff_codecs():
+            with pytest.raises(ValueError):
+                export_results(_results(1), str(tmp_path), "study", tiff_codec="lzw")
+
+        assert not list(tmp_path.iterdir())
+
+    def test_uncompressed_export(self, tmp_path):
+        info = export_results(_results(1), str(tmp_path), "study", tiff_codec="none")
+
+        with tifffile.TiffFile(f"{info['labelmaps']}/1/processing.tif") as tif:
+            assert tif.pages[0].compression == 1
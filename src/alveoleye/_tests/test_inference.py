@@ -0,0 +1,193 @@
+"""Tests for headless batch inference.
+
+Tests cover:
+- Image discovery from directories and glob patterns
+- postprocess_and_assess on a synthetic section
+- run_batch_inference writing metrics.csv without a model, reporting failed images to progress
+- Metrics matching the CombinedWorker (widget) pipeline on a colored section
+- CLI argument parsing and validation
+"""
+
+import csv
+
+import cv2
+import numpy as np
+import pytest
+import torch
+
+from alveoleye.lungcv.inference import (
+    InferenceParameters,
+    collect_image_paths,
+    postprocess_and_assess,
+    run_batch_inference,
+)
+from alveoleye.lungcv.postprocessor import get_dynamic_threshold_value
+from alveoleye.paper_scripts._combined_workers import CombinedWorker
+from alveoleye.lungcv.inference_cli import (
+    build_parameters_from_args,
+    create_parser,
+    validate_arguments,
+)
+
+LABELS = {
+    "BLOCKER": 1, "AIRWAY_EPITHELIUM": 2, "VESSEL_ENDOTHELIUM": 3, "AIRWAY_LUMEN": 4,
+    "VESSEL_LUMEN": 5, "PARENCHYMA": 6, "ALVEOLI": 7, "MLI_LINES_INSIDE": 8, "MLI_LINES_OUTSIDE": 9,
+}
+
+
+def _make_section(seed: int = 0, size: int = 128) -> np.ndarray:
+    """Dark tissue background with bright circular air spaces (BGR)."""
+    rng = np.random.default_rng(seed)
+    image = np.full((size, size, 3), 80, dtype=np.uint8)
+    for _ in range(12):
+        center = tuple(int(v) for v in rng.integers(10, size - 10, 2))
+        cv2.circle(image, center, int(rng.integers(5, 12)), (230, 230, 230), -1)
+    return image
+
+
+@pytest.fixture
+def sections_dir(tmp_path):
+    directory = tmp_path / "sections"
+    (directory / "nested").mkdir(parents=True)
+    for i in range(3):
+        cv2.imwrite(str(directory / f"{i}.png"), _make_section(i))
+    cv2.imwrite(str(directory / "nested" / "3.png"), _make_section(3))
+    (directory / "notes.txt").write_text("not an image")
+    return directory
+
+
+class TestCollectImagePaths:
+    def test_directory(self, sections_dir):
+        paths = collect_image_paths([str(sections_dir)])
+        assert [p.rsplit("/", 1)[-1] for p in paths] == ["0.png", "1.png", "2.png"]
+
+    def test_recursive(self, sections_dir):
+        assert len(collect_image_paths([str(sections_dir)], recursive=True)) == 4
+
+    def test_glob_and_duplicates(self, sections_dir):
+        paths = collect_image_paths([str(sections_dir / "*.png"), str(sections_dir / "0.png")])
+        assert len(paths) == 3
+
+
+class TestPostprocessAndAssess:
+    def test_metrics_present(self):
+        image = _make_section()
+        params = InferenceParameters(use_computer_vision=False, alveoli_minimum_size=5,
+                                     parenchyma_minimum_size=5)
+        metrics = postprocess_and_assess(image, np.zeros(image.shape[:2], np.uint8), params, LABELS)
+
+        assert 0 < metrics["asvd"] < 100
+        assert metrics["chords"] >= 0
+        assert isinstance(metrics["threshold_value"], int)
+        assert metrics["threshold_value"] == round(get_dynamic_threshold_value(cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)))
+
+    def test_manual_threshold_recorded(self):
+        image = _make_section()
+        params = InferenceParameters(use_computer_vision=False, manual_threshold=150, calculate_mli=False)
+        metrics = postprocess_and_assess(image, np.zeros(image.shape[:2], np.uint8), params, LABELS)
+
+        assert metrics["threshold_value"] == 150
+        assert "mli" not in metrics
+
+
+class TestRunBatchInference:
+    @pytest.mark.parametrize("workers", [0, 2])
+    def test_writes_metrics(self, sections_dir, tmp_path, workers):
+        params = InferenceParameters(use_computer_vision=False)
+        out = tmp_path / "out"
+        seen = []
+
+        metrics_path = run_batch_inference([str(sections_dir)], str(out), params, labels=LABELS,
+                                           decode_workers=2, postprocess_workers=workers,
+                                           progress=lambda done, total, path: seen.append((done, total)))
+
+        with open(metrics_path, newline="") as fh:
+            rows = list(csv.DictReader(fh))
+
+        assert len(rows) == 3
+        assert sorted(int(r["case_id"]) for r in rows) == [1, 2, 3]
+        assert {r["image_file_name"] for r in rows} == {"0.png", "1.png", "2.png"}
+        assert all(r["use_computer_vision"] == "False" for r in rows)
+        assert seen[-1] == (3, 3)
+
+    def test_failed_images_reported(self, sections_dir, tmp_path):
+        (sections_dir / "broken.png").write_bytes(b"not a png")
+        seen = []
+
+        metrics_path = run_batch_inference([str(sections_dir)], str(tmp_path / "out"),
+                                           InferenceParameters(use_computer_vision=False), labels=LABELS,
+                                           postprocess_workers=0,
+                                           progress=lambda done, total, path: seen.append((done, total)))
+
+        with open(metrics_path, newline="") as fh:
+            assert len(list(csv.DictReader(fh))) == 3
+        assert seen == [(1, 4), (2, 4), (3, 4), (4, 4)]
+
+    def test_matches_combined_worker(self, tmp_path):
+        # A weak blue channel makes BGR and RGB grayscale, and so the threshold, differ
+        rng = np.random.default_rng(0)
+        image = rng.integers(0, 256, (128, 128, 3), dtype=np.uint8)
+        image[:, :, 0] //= 4
+        image_path = tmp_path / "stained.png"
+        cv2.imwrite(str(image_path), image)
+        params = InferenceParameters(use_computer_vision=False, alveoli_minimum_size=250,
+                                     parenchyma_minimum_size=250, lines=3, min_length=20, scale=0.5)
+
+        metrics_path = run_batch_inference([str(image_path)], str(tmp_path / "out"), params, labels=LABELS,
+                                           postprocess_workers=0)
+        with open(metrics_path, newline="") as fh:
+            (row,) = list(csv.DictReader(fh))
+
+        worker = CombinedWorker()
+        worker.labels = LABELS
+        worker.set_stage_cache(None)
+        (tmp_path / "unused.pth").write_bytes(b"")
+        worker.set_weights_path(str(tmp_path / "unused.pth"))
+        worker.set_image_path(str(image_path))
+        worker.set_scale(0.5)
+        worker.set_model_output({"boxes": torch.zeros((0, 4)), "labels": torch.zeros(0, dtype=torch.int64),
+                                 "scores": torch.zeros(0), "masks": torch.zeros((0, 1) + image.shape[:2])})
+        worker.run_complete_pipline()
+
+        assert int(row["airspace_pixels"]) == worker.airspace_pixels
+        assert float(row["asvd"]) == pytest.approx(worker.asvd)
+        assert float(row["mli"]) == pytest.approx(worker.mli)
+
+    def test_no_images(self, tmp_path):
+        with pytest.raises(ValueError):
+            run_batch_inference([str(tmp_path)], str(tmp_path / "out"), InferenceParameters(), labels=LABELS)
+
+
+class TestInferenceCli:
+    def test_parse_defaults(self):
+        args = create_parser().parse_args(["sections", "--output-dir", "out"])
+        validate_arguments(args)
+        params = build_parameters_from_args(args)
+
+        assert params.use_computer_vision
+        assert params.manual_threshold is None
+        assert params.calculate_asvd and params.calculate_mli
+
+    def test_parse_overrides(self):
+        args = create_parser().parse_args(
+            ["a", "b", "--output-dir", "out", "--no-ai", "--manual-threshold", "150", "--lines", "7"]
+        )
+        params = build_parameters_from_args(args)
+
+        assert args.inputs == ["a", "b"]
+        assert not params.use_computer_vision
+        assert params.manual_threshold == 150
+        assert params.lines == 7
+
+    @pytest.mark.parametrize("extra", [
+        ["--min-confidence", "101"],
+        ["--manual-threshold", "300"],
+        ["--lines", "0"],
+        ["--workers", "-1"],
+        ["--no-asvd", "--no-mli"],
+        ["--weights", "missing.pth"],
+    ])
+    def test_invalid_arguments(self, extra):
+        args = create_parser().parse_args(["sections", "--output-dir", "out", *extra])
+        with pytest.raises(ValueError):
+            validate_arguments(args)
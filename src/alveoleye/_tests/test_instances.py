@@ -0,0 +1,68 @@
+"""Tests for single-pass instance extraction from RGB masks.
+
+Tests cover:
+- Boxes and areas from component stats matching the instance masks
+- Color tolerance and small-blob filtering
+- Many small fragments in one mask
+- Empty masks
+"""
+
+import cv2
+import numpy as np
+
+from alveoleye.lungcv.mrcnn.instances import MIN_BLOB_SIZE, extract_instances, rgb_mask_to_instances
+
+CLASSES = {"[255 0 0]": 1, "[0 0 255]": 2}
+
+
+def _fragmented_mask(count=300, size=(400, 500), seed=0):
+    rng = np.random.default_rng(seed)
+    mask = np.zeros(size + (3,), dtype=np.uint8)
+    for _ in range(count):
+        color = (255, 0, 0) if rng.random() < 0.5 else (0, 0, 255)
+        center = (int(rng.integers(size[1])), int(rng.integers(size[0])))
+        cv2.circle(mask, center, int(rng.integers(1, 8)), color, -1)
+    return mask
+
+
+class TestExtractInstances:
+    def test_stats_match_masks(self):
+        instances = extract_instances(_fragmented_mask(), CLASSES)
+        masks = instances.masks()
+
+        assert len(masks) == len(instances.class_ids) > 50
+        for mask, box, area in zip(masks, instances.boxes, instances.areas):
+            rows, cols = np.nonzero(mask)
+            assert box.tolist() == [cols.min(), rows.min(), cols.max(), rows.max()]
+            assert area == len(rows) > MIN_BLOB_SIZE
+
+    def test_masks_partition_label_image(self):
+        instances = extract_instances(_fragmented_mask(), CLASSES)
+        masks = instances.masks()
+
+        assert (masks.sum(axis=0) == (instances.label_image > 0)).all()
+        np.testing.assert_array_equal(instances.masks([2, 0]), masks[[2, 0]])
+
+    def test_tolerance_and_small_blobs(self):
+        mask = np.zeros((40, 40, 3), dtype=np.uint8)
+        mask[2:10, 2:10] = [245, 8, 3]  # within tolerance of the airway color
+        mask[20:30, 20:30] = [0, 0, 200]  # outside tolerance of the vessel color
+        mask[35:38, 35:38] = [255, 0, 0]  # too small
+
+        masks, labels = rgb_mask_to_instances(mask, CLASSES)
+
+        assert labels == [1]
+        assert masks.shape == (1, 40, 40) and masks[0].sum() == 64
+
+    def test_classes_keep_their_order(self):
+        mask = np.zeros((40, 40, 3), dtype=np.uint8)
+        mask[2:10, 2:10] = [0, 0, 255]
+        mask[20:30, 20:30] = [255, 0, 0]
+
+        assert extract_instances(mask, CLASSES).class_ids.tolist() == [1, 2]
+
+    def test_empty_mask(self):
+        instances = extract_instances(np.zeros((12, 16, 3), dtype=np.uint8), CLASSES)
+
+        assert instances.boxes.shape == (0, 4)
+        assert instances.masks().shape == (0, 12, 16)
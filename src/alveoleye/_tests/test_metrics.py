@@ -18,6 +18,8 @@ from alveoleye.lungcv.mrcnn.metrics import (
     compute_batch_metrics,
     _compute_precision_recall_f1,
     _compute_iou,
+    _build_class_map,
+    _compute_counts_for_image,
 )
 
 
@@ -504,3 +506,71 @@ class TestComputeBatchMetrics:
         assert abs(metrics.precision - 1.0) < 0.01
         assert abs(metrics.recall - 0.5) < 0.01
         assert abs(metrics.f1_score - 2/3) < 0.01
+
+
+class TestConfusionCounts:
+    """Tests for the confusion-matrix pixel counts."""
+
+    def test_last_mask_wins_overlaps(self):
+        """Overlapping masks take the class of the last one, as painting in order would."""
+        masks = torch.zeros(40, 4, 4, dtype=torch.bool)
+        masks[:, 0, 0] = True
+        masks[3, 1, 1] = True
+        labels = torch.arange(40) % 3 + 1
+
+        covered, class_map = _build_class_map(masks, labels)
+
+        assert class_map[0, 0] == labels[39]
+        assert class_map[1, 1] == labels[3]
+        assert covered.sum() == 2 and class_map.sum() == labels[39] + labels[3]
+
+    def test_counts_match_confusion(self):
+        """TP/FP/FN come from the (gt class, pred class) pixel matrix."""
+        H, W = 8, 8
+        gt_masks = torch.zeros(2, H, W)
+        gt_masks[0, :4] = 1.0  # 32 px of class 1
+        gt_masks[1, 4:, :4] = 1.0  # 16 px of class 2
+        pred_masks = torch.zeros(1, 1, H, W)
+        pred_masks[0, 0, 2:6] = 1.0  # 32 px predicted as class 1
+        counts = _compute_counts_for_image(pred_masks, torch.tensor([1]), gt_masks, torch.tensor([1, 2]), 0.5)
+
+        by_class = counts.confusion.sum(dim=(0, 1))
+        assert by_class[1, 1] == 16  # rows 2-3
+        assert by_class[2, 1] == 8  # rows 4-5, left half
+        assert by_class[0, 1] == 8  # rows 4-5, right half
+        assert by_class[1, 0] == 16
+        assert counts.seen.tolist() == [False, True, True]
+
+    def test_accumulator_grows_with_classes(self):
+        """Images with higher class IDs extend the accumulated matrix."""
+        H, W = 16, 16
+        predictions, targets = [], []
+        for label in (1, 5):
+            masks = torch.zeros(1, H, W)
+            masks[0, :8] = 1.0
+            predictions.append({'masks': masks.unsqueeze(1), 'labels': torch.tensor([label])})
+            targets.append({'masks': masks.clone(), 'labels': torch.tensor([label])})
+
+        metrics = compute_batch_metrics(predictions, targets)
+
+        assert metrics.f1_score == 1.0
+        assert sorted(metrics.per_class) == [1, 5]
+
+    def test_overlapping_false_positives_counted_once(self):
+        """Pixels covered by several predictions on an empty image count once."""
+        H, W = 16, 16
+        pred_masks = torch.zeros(2, 1, H, W)
+        pred_masks[:, 0, :4, :4] = 1.0
+        predictions = [
+            {'masks': pred_masks, 'labels': torch.tensor([1, 1])},
+            {'masks': pred_masks[:1], 'labels': torch.tensor([1])},
+        ]
+        targets = [
+            {'masks': torch.empty(0, H, W), 'labels': torch.empty(0, dtype=torch.long)},
+            {'masks': pred_masks[:1, 0].clone(), 'labels': torch.tensor([1])},
+        ]
+
+        metrics = compute_batch_metrics(predictions, targets)
+
+        # 16 TP in the second image, 16 (not 32) FP in the first
+        assert metrics.precision == 0.5
@@ -0,0 +1,208 @@
+"""Tests for inference-side model operations.
+
+Tests cover:
+- ModelRegistry hits, LRU eviction and explicit eviction
+- Reloading when the checkpoint changes on disk
+- Batched run_predictions grouping and ordering
+- Low-resolution mask outputs giving the same processing labelmap
+"""
+
+import os
+
+import numpy as np
+import pytest
+import torch
+from PIL import Image
+
+from alveoleye.lungcv import model_operations
+from alveoleye.lungcv.model_operations import ModelRegistry, run_prediction, run_predictions
+from alveoleye.lungcv.postprocessor import LOW_RES_MASKS_KEY, generate_processing_labelmap
+
+
+@pytest.fixture
+def fake_loader(monkeypatch):
+    """Replace the expensive model construction with a counting stub."""
+    calls = []
+
+    def _fake_init(weights_path, num_classes, device):
+        calls.append((str(weights_path), num_classes, str(device)))
+        return torch.nn.Identity()
+
+    monkeypatch.setattr(model_operations, "init_trained_model", _fake_init)
+    return calls
+
+
+@pytest.fixture
+def weights_file(tmp_path):
+    path = tmp_path / "weights.pth"
+    path.write_bytes(b"v1")
+    return path
+
+
+class TestModelRegistry:
+    """Tests for the process-wide trained model cache."""
+
+    def test_reuses_model_for_unchanged_checkpoint(self, fake_loader, weights_file):
+        registry = ModelRegistry()
+        first = registry.get(weights_file, device=torch.device("cpu"))
+        second = registry.get(weights_file, device=torch.device("cpu"))
+
+        assert first is second
+        assert len(fake_loader) == 1
+
+    def test_reloads_when_checkpoint_changes(self, fake_loader, weights_file):
+        registry = ModelRegistry()
+        first = registry.get(weights_file, device=torch.device("cpu"))
+
+        weights_file.write_bytes(b"version two")
+        stat = weights_file.stat()
+        os.utime(weights_file, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+
+        second = registry.get(weights_file, device=torch.device("cpu"))
+
+        assert first is not second
+        assert len(fake_loader) == 2
+        # The stale entry is replaced rather than kept alongside the new one
+        assert len(registry) == 1
+
+    def test_num_classes_is_part_of_key(self, fake_loader, weights_file):
+        registry = ModelRegistry()
+        registry.get(weights_file, num_classes=3, device=torch.device("cpu"))
+        registry.get(weights_file, num_classes=4, device=torch.device("cpu"))
+
+        assert len(fake_loader) == 2
+        assert len(registry) == 2
+
+    def test_lru_bound(self, fake_loader, tmp_path):
+        registry = ModelRegistry(max_size=2)
+        paths = []
+        for i in range(3):
+            path = tmp_path / f"w{i}.pth"
+            path.write_bytes(b"x")
+            paths.append(path)
+
+        registry.get(paths[0], device=torch.device("cpu"))
+        registry.get(paths[1], device=torch.device("cpu"))
+        registry.get(paths[0], device=torch.device("cpu"))  # refresh 0
+        registry.get(paths[2], device=torch.device("cpu"))  # evicts 1
+
+        assert len(registry) == 2
+        registry.get(paths[0], device=torch.device("cpu"))
+        assert len(fake_loader) == 3
+        registry.get(paths[1], device=torch.device("cpu"))
+        assert len(fake_loader) == 4
+
+    def test_explicit_eviction(self, fake_loader, tmp_path):
+        registry = ModelRegistry()
+        a, b = tmp_path / "a.pth", tmp_path / "b.pth"
+        a.write_bytes(b"a")
+        b.write_bytes(b"b")
+        registry.get(a, device=torch.device("cpu"))
+        registry.get(b, device=torch.device("cpu"))
+
+        assert registry.evict(a) == 1
+        assert len(registry) == 1
+        assert registry.evict() == 1
+        assert len(registry) == 0
+
+    def test_invalid_size(self):
+        with pytest.raises(ValueError):
+            ModelRegistry(max_size=0)
+
+
+class _RecordingModel(torch.nn.Module):
+    """Stand-in detector that echoes each image's mean and records batch shapes."""
+
+    def __init__(self):
+        super().__init__()
+        self.batches = []
+
+    def forward(self, images):
+        self.batches.append([tuple(img.shape) for img in images])
+        return [{"scores": img.mean().reshape(1)} for img in images]
+
+
+class TestRunPredictions:
+    """Tests for batched multi-image inference."""
+
+    def test_groups_same_size_and_keeps_order(self, tmp_path):
+        arrays = [
+            np.full((8, 8, 3), 10, np.uint8),
+            np.full((6, 4, 3), 20, np.uint8),
+            np.full((8, 8, 3), 30, np.uint8),
+            np.full((6, 4, 3), 40, np.uint8),
+            np.full((8, 8, 3), 50, np.uint8),
+        ]
+        path = tmp_path / "img.png"
+        Image.fromarray(arrays[1]).save(path)
+        images = arrays[:1] + [path] + arrays[2:]
+
+        model = _RecordingModel()
+        predictions = run_predictions(images, model, batch_size=2)
+
+        means = [round(p["scores"].item() * 255) for p in predictions]
+        assert means == [10, 20, 30, 40, 50]
+        # Two 8x8 batches (2 + 1) and one 6x4 batch of 2
+        assert [len(b) for b in model.batches] == [2, 1, 2]
+        assert all(len(set(b)) == 1 for b in model.batches)
+
+    def test_empty_input(self):
+        assert run_predictions([], _RecordingModel()) == []
+
+    def test_invalid_batch_size(self):
+        with pytest.raises(ValueError):
+            run_predictions([np.zeros((2, 2, 3), np.uint8)], _RecordingModel(), batch_size=0)
+
+
+@pytest.fixture(scope="module")
+def model():
+    """Small randomly initialized Mask R-CNN that keeps low-score detections."""
+    from torchvision.models.detection import maskrcnn_resnet50_fpn
+
+    torch.manual_seed(0)
+    model = maskrcnn_resnet50_fpn(weights=None, weights_backbone=None, num_classes=3,
+                                  min_size=64, max_size=64, box_score_thresh=0.0,
+                                  box_detections_per_img=10, rpn_post_nms_top_n_test=100)
+    return model.eval()
+
+
+class TestLowResMasks:
+    """Tests for predictions that keep the mask head resolution."""
+
+    def test_same_labelmap_as_pasted_masks(self, model):
+        image = np.random.default_rng(0).integers(0, 256, size=(80, 96, 3), dtype=np.uint8)
+        labels = {"AIRWAY_EPITHELIUM": 1, "VESSEL_ENDOTHELIUM": 2}
+
+        full = run_prediction(image, model)
+        low_res = run_prediction(image, model, low_res_masks=True)
+
+        assert "masks" not in low_res and low_res[LOW_RES_MASKS_KEY].shape == (len(full["scores"]), 28, 28)
+        torch.testing.assert_close(low_res["boxes"], full["boxes"])
+        np.testing.assert_array_equal(generate_processing_labelmap(low_res, image.shape, 0, labels),
+                                      generate_processing_labelmap(full, image.shape, 0, labels))
+
+    def test_full_masks_without_flag(self, model):
+        run_predictions([np.zeros((64, 64, 3), np.uint8)], model, low_res_masks=True)
+
+        assert isinstance(model.transform, model_operations.LowResMaskTransform)
+        assert "masks" in run_prediction(np.zeros((64, 64, 3), np.uint8), model)
+
+    def test_installed_transform_is_scriptable(self, model):
+        from alveoleye.lungcv import backends
+
+        assert model_operations.install_low_res_masks(model)
+
+        backends.script_model(model)
+        assert isinstance(model.transform, model_operations.LowResMaskTransform)
+
+    def test_registry_installs_transform(self, model, monkeypatch, weights_file):
+        monkeypatch.setattr(model_operations, "init_trained_model", lambda *args: model)
+
+        loaded = ModelRegistry().get(weights_file, device=torch.device("cpu"))
+
+        assert isinstance(loaded.transform, model_operations.LowResMaskTransform)
+
+    def test_ignored_without_eager_transform(self):
+        model = _RecordingModel()
+
+        assert run_predictions([np.zeros((4, 4, 3), np.uint8)], model, low_res_masks=True)[0]["scores"].shape == (1,)
@@ -0,0 +1,134 @@
+"""Tests for the persistent model output cache.
+
+Tests cover:
+- Round trips with uint8 and float16 mask encodings
+- predict only running the model for cache misses, returning stored precision
+- Keys following image and weights content
+- Size-based LRU eviction and the in-memory size total
+"""
+
+import os
+
+import numpy as np
+import pytest
+import torch
+from PIL import Image
+
+from alveoleye.lungcv import output_cache as output_cache_module
+from alveoleye.lungcv.output_cache import ModelOutputCache, hash_image
+
+
+def _output(seed=0, count=3, size=16):
+    generator = torch.Generator().manual_seed(seed)
+    return {
+        "boxes": torch.rand((count, 4), generator=generator) * size,
+        "labels": torch.randint(1, 3, (count,), generator=generator),
+        "scores": torch.rand(count, generator=generator),
+        "masks": torch.rand((count, 1, size, size), generator=generator),
+    }
+
+
+@pytest.fixture
+def weights(tmp_path):
+    path = tmp_path / "weights.pth"
+    path.write_bytes(b"weights v1")
+    return path
+
+
+@pytest.fixture
+def fake_model(monkeypatch):
+    """Count images reaching the model and return a seeded output per image."""
+    seen = []
+
+    def _predict(images, model, batch_size):
+        seen.extend(images)
+        return [_output(seed=len(seen) + i) for i in range(len(images))]
+
+    monkeypatch.setattr(output_cache_module.model_operations, "get_trained_model", lambda *a, **k: None)
+    monkeypatch.setattr(output_cache_module.model_operations, "run_predictions", _predict)
+    return seen
+
+
+class TestRoundTrip:
+    @pytest.mark.parametrize("mask_dtype, tolerance", [("uint8", 0.5 / 255), ("float16", 1e-3)])
+    def test_load_matches_saved(self, tmp_path, mask_dtype, tolerance):
+        cache = ModelOutputCache(tmp_path / "cache", mask_dtype=mask_dtype)
+        output = _output()
+        cache.save("k" * 64, output)
+        loaded = cache.load("k" * 64)
+
+        torch.testing.assert_close(loaded["boxes"], output["boxes"])
+        assert torch.equal(loaded["labels"], output["labels"])
+        torch.testing.assert_close(loaded["scores"], output["scores"])
+        assert loaded["masks"].dtype == torch.float32
+        assert (loaded["masks"] - output["masks"]).abs().max() <= tolerance
+
+    def test_miss_returns_none(self, tmp_path):
+        assert ModelOutputCache(tmp_path).load("0" * 64) is None
+
+    def test_invalid_mask_dtype(self, tmp_path):
+        with pytest.raises(ValueError):
+            ModelOutputCache(tmp_path, mask_dtype="float64")
+
+
+class TestPredict:
+    def test_only_misses_reach_model(self, tmp_path, weights, fake_model):
+        cache = ModelOutputCache(tmp_path / "cache")
+        images = [np.full((4, 4, 3), value, np.uint8) for value in range(3)]
+
+        first = cache.predict(images[:2], weights)
+        second = cache.predict(images, weights)
+
+        assert len(fake_model) == 3
+        torch.testing.assert_close(second[0]["scores"], first[0]["scores"])
+        assert torch.equal(second[0]["masks"], first[0]["masks"])
+
+    def test_new_weights_invalidate(self, tmp_path, weights, fake_model):
+        cache = ModelOutputCache(tmp_path / "cache")
+        image = np.zeros((4, 4, 3), np.uint8)
+
+        cache.predict([image], weights)
+        weights.write_bytes(b"weights v2, retrained")
+        cache.predict([image], weights)
+
+        assert len(fake_model) == 2
+
+    def test_image_hash_follows_file_bytes(self, tmp_path):
+        first, second = tmp_path / "a.png", tmp_path / "b.png"
+        Image.fromarray(np.zeros((4, 4, 3), np.uint8)).save(first)
+        Image.fromarray(np.zeros((4, 4, 3), np.uint8)).save(second)
+
+        assert hash_image(first) == hash_image(second)
+        assert hash_image(first) != hash_image(np.zeros((4, 4, 3), np.uint8))
+
+
+class TestEviction:
+    def test_least_recently_used_removed(self, tmp_path):
+        cache = ModelOutputCache(tmp_path, max_bytes=10 ** 9)
+        for index, key in enumerate(("a" * 64, "b" * 64, "c" * 64)):
+            cache.save(key, _output(seed=index))
+            path = cache._path(key)
+            os.utime(path, ns=(index * 10 ** 9, index * 10 ** 9))
+
+        entry_size = max(size for _, size, _ in cache.entries())
+        cache.load("a" * 64)  # refresh the oldest entry
+        cache.max_bytes = 2 * entry_size
+
+        assert cache.trim() == 1
+        assert "a" * 64 in cache and "b" * 64 not in cache and "c" * 64 in cache
+
+    def test_save_trims_only_past_budget(self, tmp_path, monkeypatch):
+        cache = ModelOutputCache(tmp_path, max_bytes=10 ** 9)
+        trims = []
+        trim = cache.trim
+        monkeypatch.setattr(cache, "trim", lambda: trims.append(1) or trim())
+
+        for index in range(3):
+            cache.save(f"{index}" * 64, _output(seed=index))
+        cache.save("0" * 64, _output(seed=3))
+
+        assert trims == [] and cache._size == cache.size
+        cache.max_bytes = cache.size - 1
+        cache.save("3" * 64, _output(seed=4))
+
+        assert len(trims) == 1 and cache._size == cache.size <= cache.max_bytes
@@ -0,0 +1,166 @@
+"""Tests for the cached pipeline stage graph.
+
+Tests cover:
+- StageCache hits, byte budget and LRU eviction
+- Chained keys invalidating only downstream stages
+- Randomized MLI never being cached
+- Batched inference only running the model for uncached images
+"""
+
+import cv2
+import numpy as np
+import pytest
+import torch
+
+from alveoleye.lungcv import pipeline
+from alveoleye.lungcv.pipeline import StageCache
+
+LABELS = {
+    "BLOCKER": 1, "AIRWAY_EPITHELIUM": 2, "VESSEL_ENDOTHELIUM": 3, "AIRWAY_LUMEN": 4,
+    "VESSEL_LUMEN": 5, "PARENCHYMA": 6, "ALVEOLI": 7, "MLI_LINES_INSIDE": 8, "MLI_LINES_OUTSIDE": 9,
+}
+
+
+def _make_section(size=96):
+    rng = np.random.default_rng(0)
+    image = np.full((size, size, 3), 80, dtype=np.uint8)
+    for _ in range(10):
+        center = tuple(int(v) for v in rng.integers(8, size - 8, 2))
+        cv2.circle(image, center, int(rng.integers(4, 10)), (230, 230, 230), -1)
+    return image
+
+
+def _counting(monkeypatch, name):
+    calls = []
+    original = getattr(pipeline, name)
+
+    def _wrapped(*args, **kwargs):
+        calls.append(name)
+        return original(*args, **kwargs)
+
+    monkeypatch.setattr(pipeline, name, _wrapped)
+    return calls
+
+
+def _run(cache, image, parenchyma_minimum_size=5, lines=3):
+    image_key = pipeline.array_key(image)
+    processing_labelmap = np.zeros(image.shape[:2], dtype=np.uint8)
+
+    threshold_key, thresholded = pipeline.run_threshold(image_key, image, None, cache=cache)
+    cleanup_key, cleaned = pipeline.run_component_cleanup(threshold_key, thresholded, parenchyma_minimum_size, 5,
+                                                          cache=cache)
+    key, labelmap = pipeline.run_postprocessing_labelmap(pipeline.array_key(processing_labelmap),
+                                                         processing_labelmap, cleanup_key, cleaned, LABELS,
+                                                         cache=cache)
+    asvd = pipeline.run_asvd(key, labelmap, LABELS, cache=cache)[1]
+    mli = pipeline.run_mli(key, labelmap, lines, 2, 1.0, LABELS, cache=cache)[1]
+    return asvd, mli
+
+
+class TestStageCache:
+    def test_hit_and_miss(self):
+        cache = StageCache()
+        calls = []
+
+        for _ in range(2):
+            key, value = pipeline.run_stage("s", ["in"], {"p": 1}, lambda: calls.append(1) or np.ones(3), cache)
+
+        assert len(calls) == 1
+        assert (cache.hits, cache.misses) == (1, 1)
+        assert key in cache
+
+    def test_outputs_are_read_only(self):
+        cache = StageCache()
+        value = pipeline.run_stage("s", [], {}, lambda: np.zeros(4), cache)[1]
+
+        with pytest.raises(ValueError):
+            value[0] = 1
+
+    def test_byte_budget_evicts_least_recent(self):
+        cache = StageCache(max_bytes=300)
+        for name in "abc":
+            cache.store(name, np.zeros(100, dtype=np.uint8))
+        cache.lookup("a")
+        cache.store("d", np.zeros(100, dtype=np.uint8))
+
+        assert "a" in cache and "b" not in cache
+        assert cache.size == 300
+
+    def test_oversized_results_are_not_stored(self):
+        cache = StageCache(max_bytes=10)
+        cache.store("big", np.zeros(11, dtype=np.uint8))
+
+        assert len(cache) == 0
+
+    def test_array_key_tracks_content(self):
+        image = np.zeros((4, 4), dtype=np.uint8)
+        edited = image.copy()
+        edited[0, 0] = 1
+
+        assert pipeline.array_key(image) == pipeline.array_key(image.copy())
+        assert pipeline.array_key(image) != pipeline.array_key(edited)
+        assert pipeline.array_key(image) != pipeline.array_key(image.reshape(2, 8))
+
+
+class TestIncrementalRerun:
+    def test_changing_lines_only_reruns_mli(self, monkeypatch):
+        cache = StageCache()
+        image = _make_section()
+        cleanup_calls = _counting(monkeypatch, "remove_small_components")
+        asvd_calls = _counting(monkeypatch, "calculate_airspace_volume_density")
+        mli_calls = _counting(monkeypatch, "calculate_mean_linear_intercept")
+
+        first = _run(cache, image, lines=3)
+        second = _run(cache, image, lines=3)
+        _run(cache, image, lines=7)
+
+        assert first[0] == second[0]
+        assert len(cleanup_calls) == 2
+        assert len(asvd_calls) == 1
+        assert len(mli_calls) == 2
+
+    def test_changing_cleanup_reuses_threshold(self, monkeypatch):
+        cache = StageCache()
+        image = _make_section()
+        threshold_calls = _counting(monkeypatch, "apply_dynamic_threshold")
+        mli_calls = _counting(monkeypatch, "calculate_mean_linear_intercept")
+
+        _run(cache, image, parenchyma_minimum_size=5)
+        _run(cache, image, parenchyma_minimum_size=50)
+
+        assert len(threshold_calls) == 1
+        assert len(mli_calls) == 2
+
+    def test_randomized_mli_is_not_cached(self, monkeypatch):
+        cache = StageCache()
+        labelmap = np.full((20, 20), LABELS["ALVEOLI"], dtype=np.uint8)
+        mli_calls = _counting(monkeypatch, "calculate_mean_linear_intercept")
+
+        for _ in range(2):
+            pipeline.run_mli("post", labelmap, 3, 2, 1.0, LABELS, randomized_distribution=True, cache=cache)
+
+        assert len(mli_calls) == 2
+
+
+class TestRunInferences:
+    def test_only_uncached_images_reach_the_model(self, monkeypatch, tmp_path):
+        weights = tmp_path / "weights.pth"
+        weights.write_bytes(b"w")
+        batches = []
+
+        def _predict(images, model, batch_size):
+            batches.append(len(images))
+            return [{"scores": torch.tensor([float(image.mean())])} for image in images]
+
+        monkeypatch.setattr(pipeline.model_operations, "get_trained_model", lambda weights, **kwargs: None)
+        monkeypatch.setattr(pipeline.model_operations, "run_predictions", _predict)
+
+        cache = StageCache()
+        images = [np.full((4, 4, 3), value, np.uint8) for value in (1, 2, 3)]
+        keys = [pipeline.array_key(image) for image in images]
+
+        pipeline.run_inferences(keys[:2], images[:2], str(weights), cache=cache)
+        results = pipeline.run_inferences(keys, images, str(weights), cache=cache)
+
+        assert batches == [2, 1]
+        assert [output["scores"].item() for _, output in results] == [1, 2, 3]
@@ -1,4 +1,5 @@
 import unittest
+import cv2
 import numpy as np
 import torch
 from alveoleye.lungcv.postprocessor import *
@@ -189,8 +190,8 @@ class TestCreateClassLabelmapFromModelTwo(unittest.TestCase):
         # Call the function with the empty model output
         result = extract_class_labelmap_from_model(model_output, shape=(3, 3), class_id=1, confidence_threshold=0.5)
 
-        # Expect an empty array as output
-        expected_output = np.array([], dtype=bool)
+        # Expect an all-False labelmap of the requested shape
+        expected_output = np.zeros((3, 3), dtype=bool)
         np.testing.assert_array_equal(result, expected_output)
 
     def test_no_masks_matching_class_id(self):
@@ -307,6 +308,25 @@ class TestCreateProcessingLabelmap(unittest.TestCase):
         result = generate_processing_labelmap(self.model_output, self.shape, self.confidence_threshold, different_labels)
         np.testing.assert_array_equal(result, expected_output)
 
+    def test_many_detections_match_per_instance_union(self):
+        generator = torch.Generator().manual_seed(0)
+        count = 100
+        model_output = {
+            "masks": torch.rand((count, 1, 16, 16), generator=generator),
+            "labels": torch.randint(1, 3, (count,), generator=generator),
+            "scores": torch.rand(count, generator=generator)
+        }
+
+        expected_output = np.zeros((16, 16), dtype=np.uint8)
+        for class_id, label in ((1, "AIRWAY_EPITHELIUM"), (2, "VESSEL_ENDOTHELIUM")):
+            for mask, mask_label, score in zip(model_output["masks"], model_output["labels"], model_output["scores"]):
+                if mask_label == class_id and score > 0.1:
+                    expected_output[mask[0].numpy() > 0.1] = self.labels[label]
+
+        result = generate_processing_labelmap(model_output, (16, 16, 3), 10, self.labels)
+        self.assertEqual(result.dtype, np.uint8)
+        np.testing.assert_array_equal(result, expected_output)
+
     def test_non_standard_shape(self):
         non_standard_shape = (2, 3)
 
@@ -315,6 +335,64 @@ class TestCreateProcessingLabelmap(unittest.TestCase):
             generate_processing_labelmap(self.model_output, non_standard_shape, self.confidence_threshold, self.labels)
 
 
+class TestLowResProcessingLabelmap(unittest.TestCase):
+    def setUp(self):
+        generator = torch.Generator().manual_seed(0)
+        count = 40
+        corners = torch.rand((count, 2), generator=generator) * torch.tensor([120, 96])
+        sizes = torch.rand((count, 2), generator=generator) * 50 + 1
+        # Clipped to the image like the boxes the model returns
+        boxes = torch.cat([corners, torch.minimum(corners + sizes, torch.tensor([120, 96]))], dim=1)
+        self.model_output = {
+            LOW_RES_MASKS_KEY: torch.rand((count, 28, 28), generator=generator),
+            "boxes": boxes,
+            "labels": torch.randint(1, 3, (count,), generator=generator),
+            "scores": torch.rand(count, generator=generator)
+        }
+        self.shape = (96, 120)
+        self.labels = {"AIRWAY_EPITHELIUM": 1, "VESSEL_ENDOTHELIUM": 2, "BLOCKER": 9}
+
+    def _pasted_output(self):
+        from torchvision.models.detection.roi_heads import paste_masks_in_image
+
+        model_output = {k: v for k, v in self.model_output.items() if k != LOW_RES_MASKS_KEY}
+        model_output["masks"] = paste_masks_in_image(self.model_output[LOW_RES_MASKS_KEY][:, None],
+                                                     self.model_output["boxes"], self.shape)
+        return model_output
+
+    def test_matches_pasted_masks(self):
+        for confidence_threshold in (10, 30, 70):
+            with self.subTest(confidence_threshold=confidence_threshold):
+                expected_steps, steps = {}, {}
+                expected = generate_processing_labelmap(self._pasted_output(), self.shape, confidence_threshold,
+                                                        self.labels, lambda d, s: expected_steps.update({s: d}))
+                result = generate_processing_labelmap(self.model_output, self.shape, confidence_threshold,
+                                                      self.labels, lambda d, s: steps.update({s: d}))
+
+                self.assertEqual(result.dtype, np.uint8)
+                self.assertTrue(result.any())
+                np.testing.assert_array_equal(result, expected)
+                for step, data in expected_steps.items():
+                    np.testing.assert_array_equal(steps[step], data)
+
+    def test_class_labelmap(self):
+        expected = extract_class_labelmap_from_model(self._pasted_output(), self.shape, 2, 0.3)
+        result = extract_class_labelmap_from_model(self.model_output, self.shape, 2, 0.3)
+
+        np.testing.assert_array_equal(result, expected)
+
+    def test_no_detections(self):
+        model_output = {
+            LOW_RES_MASKS_KEY: torch.zeros((0, 28, 28)),
+            "boxes": torch.zeros((0, 4)),
+            "labels": torch.tensor([], dtype=torch.int64),
+            "scores": torch.tensor([])
+        }
+
+        result = generate_processing_labelmap(model_output, self.shape, 30, self.labels)
+        np.testing.assert_array_equal(result, np.zeros(self.shape, dtype=np.uint8))
+
+
 class TestCreateCompleteClassLabelmap(unittest.TestCase):
     def setUp(self):
         # Define the labels
@@ -354,6 +432,27 @@ class TestCreateCompleteClassLabelmap(unittest.TestCase):
         self.assertTrue(np.any(result == self.epithelium_label))
 
 
+    def test_many_small_vessels_fill_their_own_lumens(self):
+        class_epithelium_labelmap = np.zeros((120, 120), dtype=np.uint8)
+        thresholded_image = np.zeros((120, 120), dtype=np.uint8)
+        centers = [(20 + 25 * i, 20 + 25 * j) for i in range(4) for j in range(4)]
+
+        for index, center in enumerate(centers):
+            cv2.circle(class_epithelium_labelmap, center, 9, self.epithelium_label, 2)
+            if index % 2 == 0:
+                cv2.circle(thresholded_image, center, 6, 255, -1)
+
+        result = generate_complete_class_labelmap(class_epithelium_labelmap, thresholded_image,
+                                                  self.epithelium_label, self.lumen_label)
+
+        for index, (x, y) in enumerate(centers):
+            expected = self.lumen_label if index % 2 == 0 else 0
+            self.assertEqual(result[y, x], expected)
+
+        # Lumen never leaks outside the thresholded spaces
+        self.assertFalse(np.any((result == self.lumen_label) & (thresholded_image == 0)))
+
+
 class TestPostprocessingLabelmapOne(unittest.TestCase):
     def setUp(self):
         # Define labels
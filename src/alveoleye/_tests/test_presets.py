@@ -0,0 +1,142 @@
+"""Tests for the inference presets.
+
+Tests cover:
+- Presets setting the transform, RPN and ROI head knobs of eager and scripted models
+- Models without these knobs only accepting the full preset
+- Preset copies and registry entries sharing weights without retuning the loaded model
+- Preset benchmarks against the full preset
+- Preset-specific keys in the stage and output caches
+"""
+
+import numpy as np
+import pytest
+import torch
+from torchvision.models.detection import maskrcnn_resnet50_fpn
+
+from alveoleye._config_utils import Config
+from alveoleye.lungcv import backends, model_operations, pipeline, presets
+from alveoleye.lungcv.output_cache import ModelOutputCache
+
+
+@pytest.fixture(scope="module")
+def model():
+    """Small randomly initialized Mask R-CNN that keeps low-score detections."""
+    torch.manual_seed(0)
+    model = maskrcnn_resnet50_fpn(weights=None, weights_backbone=None, num_classes=3,
+                                  min_size=64, max_size=64, box_score_thresh=0.0,
+                                  box_detections_per_img=10, rpn_post_nms_top_n_test=100)
+    return model.eval()
+
+
+def _settings(detector):
+    return (detector.transform.min_size, detector.transform.max_size,
+            detector.rpn._pre_nms_top_n["testing"], detector.rpn._post_nms_top_n["testing"],
+            detector.roi_heads.detections_per_img, detector.roi_heads.score_thresh)
+
+
+def _expected(name):
+    preset = presets.INFERENCE_PRESETS[name]
+    return ((preset.min_size,), preset.max_size, preset.rpn_pre_nms_top_n, preset.rpn_post_nms_top_n,
+            preset.detections_per_img, preset.score_thresh)
+
+
+class TestApplyPreset:
+    @pytest.mark.parametrize("name", presets.available_presets())
+    def test_eager_model(self, model, name):
+        assert presets.apply_inference_preset(model, name) is model
+        assert _settings(model) == _expected(name)
+        assert model.rpn._pre_nms_top_n["training"] == 2000
+
+    def test_full_matches_torchvision_defaults(self):
+        defaults = maskrcnn_resnet50_fpn(weights=None, weights_backbone=None, num_classes=3)
+
+        assert _settings(defaults) == _expected("full")
+
+    @torch.no_grad()
+    def test_scripted_model(self, model):
+        presets.apply_inference_preset(model, "full")
+        scripted = backends.ScriptedDetector(backends.script_model(model))
+        images = [torch.rand(3, 48, 48)]
+
+        presets.apply_inference_preset(scripted, "fast")
+        presets.apply_inference_preset(model, "fast")
+
+        assert _settings(scripted.module) == _expected("fast")
+        for actual, expected in zip(scripted(images), model(images)):
+            torch.testing.assert_close(actual["boxes"], expected["boxes"])
+            assert len(actual["scores"]) <= presets.INFERENCE_PRESETS["fast"].detections_per_img
+
+    def test_model_without_knobs(self):
+        graph = torch.nn.Identity()
+
+        assert presets.apply_inference_preset(graph, "full") is graph
+        with pytest.raises(ValueError):
+            presets.apply_inference_preset(graph, "fast")
+
+    def test_unknown_preset(self, model):
+        with pytest.raises(ValueError):
+            presets.apply_inference_preset(model, "fastest")
+
+
+class TestWithPreset:
+    def test_copy_shares_weights(self, model):
+        presets.apply_inference_preset(model, "full")
+
+        fast = presets.with_inference_preset(model, "fast")
+
+        assert _settings(fast) == _expected("fast") and _settings(model) == _expected("full")
+        assert fast.backbone is model.backbone and fast.rpn.head is model.rpn.head
+        assert type(fast.transform) is type(model.transform)
+
+    def test_scripted_model(self, model):
+        presets.apply_inference_preset(model, "full")
+        scripted = backends.ScriptedDetector(backends.script_model(model))
+
+        fast = presets.with_inference_preset(scripted, "fast")
+
+        assert _settings(fast.module) == _expected("fast") and _settings(scripted.module) == _expected("full")
+
+    def test_registry_entry_per_preset(self, model, monkeypatch, tmp_path):
+        presets.apply_inference_preset(model, "full")
+        weights = tmp_path / "model.pth"
+        weights.write_bytes(b"weights")
+        monkeypatch.setattr(model_operations, "init_trained_model", lambda *args: model)
+        registry = model_operations.ModelRegistry()
+
+        full = registry.get(weights, device=torch.device("cpu"))
+        fast = registry.get(weights, device=torch.device("cpu"), preset="fast")
+
+        assert full is model and _settings(model) == _expected("full")
+        assert registry.get(weights, device=torch.device("cpu"), preset="fast") is fast
+        assert _settings(fast) == _expected("fast") and len(registry) == 1
+        with pytest.raises(ValueError):
+            registry.get(weights, device=torch.device("cpu"), preset="fastest")
+
+
+class TestBenchmarkPresets:
+    def test_reports(self, model):
+        Config.load()
+        presets.apply_inference_preset(model, "balanced")
+        image = np.random.default_rng(0).integers(0, 256, size=(48, 48, 3), dtype=np.uint8)
+
+        reports = presets.benchmark_presets(model, [image], Config.get_labels(), presets=["full", "fast"])
+
+        assert list(reports) == ["full", "fast"]
+        assert reports["full"].agreements == [1.0] and reports["full"].detection_differences == [0]
+        assert 0.0 <= reports["fast"].min_agreement <= 1.0
+        assert all(len(report.candidate_seconds) == 1 for report in reports.values())
+        assert _settings(model) == _expected("balanced")
+
+
+class TestPresetCacheKeys:
+    def test_stage_cache(self, tmp_path):
+        weights = tmp_path / "model.pth"
+        weights.write_bytes(b"weights")
+
+        assert pipeline.inference_params(str(weights), "fast") != pipeline.inference_params(str(weights))
+
+    def test_output_cache(self):
+        full = ModelOutputCache.make_key("image", "weights")
+
+        assert ModelOutputCache.make_key("image", "weights", "full") == full
+        assert ModelOutputCache.make_key("image", "weights", "fast") != full
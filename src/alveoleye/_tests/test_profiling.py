@@ -0,0 +1,213 @@
+"""Tests for the stage profiler.
+
+Tests cover:
+- Stages and callback steps being recorded with their timings and data sizes
+- Steps being forwarded to the wrapped callback, outside the step timings
+- Pipeline stages and cache hits recording into the active profiler
+- Worker methods running with their profiler
+- JSON and Chrome trace export
+- The training ProfilerCallback
+"""
+
+import json
+import threading
+import time
+
+import numpy as np
+import pytest
+import torch
+
+from alveoleye.lungcv import pipeline, profiling
+from alveoleye.lungcv.mrcnn.callbacks import CallbackList, ProfilerCallback, TrainingState
+from alveoleye.lungcv.pipeline import StageCache
+from alveoleye.lungcv.profiling import StageProfiler
+
+
+def _names(profiler, category=None):
+    return [event.name for event in profiler.events if category in (None, event.category)]
+
+
+class TestStageProfiler:
+    def test_stage_and_steps(self):
+        profiler = StageProfiler()
+
+        with profiler.stage("outer", size=3):
+            time.sleep(0.02)
+            profiler(np.zeros((4, 5), np.uint16), "FIRST")
+            profiler(torch.zeros(2, 3), "SECOND")
+
+        first, second, outer = profiler.events
+        assert (first.name, second.name, outer.name) == ("FIRST", "SECOND", "outer")
+        assert first.category == profiling.STEP_CATEGORY and outer.category == profiling.STAGE_CATEGORY
+        assert first.wall_seconds >= 0.02 > second.wall_seconds
+        assert first.depth == 1 and outer.depth == 0
+        assert first.args == {"shape": [4, 5], "dtype": "uint16", "nbytes": 40}
+        assert second.args == {"shape": [2, 3], "dtype": "float32", "nbytes": 24}
+        assert outer.args == {"size": 3}
+        assert outer.wall_seconds >= first.wall_seconds + second.wall_seconds
+
+    def test_forwarded_callback_is_not_timed(self):
+        seen = []
+
+        def slow_callback(data, step_name):
+            seen.append(step_name)
+            time.sleep(0.03)
+
+        profiler = StageProfiler()
+        callback = profiler.wrap(slow_callback)
+
+        with profiler.stage("outer"):
+            callback(None, "FIRST")
+            callback(None, "SECOND")
+
+        assert seen == ["FIRST", "SECOND"]
+        assert profiler.events[1].wall_seconds < 0.03
+        assert profiler.wrap(callback) is callback and profiler.wrap(profiler) is profiler
+
+    def test_end_without_stage(self):
+        with pytest.raises(RuntimeError):
+            StageProfiler().end()
+
+    def test_threads_have_separate_stacks(self):
+        profiler = StageProfiler()
+
+        def work():
+            with profiler.stage("thread"):
+                profiler(None, "STEP")
+
+        with profiler.stage("main"):
+            thread = threading.Thread(target=work, name="worker")
+            thread.start()
+            thread.join()
+
+        depths = {(event.name, event.thread): event.depth for event in profiler.events}
+        assert depths == {("STEP", "worker"): 1, ("thread", "worker"): 0, ("main", "MainThread"): 0}
+
+    def test_peak_memory_delta(self, monkeypatch):
+        rss = [100 * 2 ** 20]
+        monkeypatch.setattr(profiling, "_read_rss", lambda: rss[0])
+        profiler = StageProfiler(sample_interval=0.001)
+
+        with profiler.activate(), profiler.stage("allocate"):
+            rss[0] += 64 * 2 ** 20
+            time.sleep(0.05)
+            rss[0] -= 64 * 2 ** 20
+
+        assert profiler.events[0].peak_rss_delta_mb == 64
+
+    def test_summary(self):
+        profiler = StageProfiler()
+        for _ in range(3):
+            with profiler.stage("repeat"):
+                pass
+
+        summary = profiler.summary()
+        assert summary["repeat"]["count"] == 3
+        assert summary["repeat"]["wall_seconds"] == pytest.approx(sum(e.wall_seconds for e in profiler.events))
+
+
+class TestInstrumentation:
+    def test_no_active_profiler(self):
+        assert profiling.active_profiler() is None
+
+        with profiling.profile_stage("ignored") as args:
+            args["cached"] = True
+        profiling.record_step(None, "IGNORED")
+
+    def test_activation_nests(self):
+        outer, inner = StageProfiler(), StageProfiler()
+
+        with outer.activate():
+            with inner.activate():
+                assert profiling.active_profiler() is inner
+            assert profiling.active_profiler() is outer
+        assert profiling.active_profiler() is None
+
+    def test_pipeline_stages(self):
+        image = np.full((64, 64, 3), 80, np.uint8)
+        image[16:48, 16:48] = 230
+        profiler = StageProfiler()
+        cache = StageCache()
+
+        with profiler.activate():
+            for _ in range(2):
+                pipeline.run_threshold(pipeline.array_key(image), image, None, profiler, cache=cache)
+
+        assert _names(profiler) == ["CONVERT_TO_GRAYSCALE", "APPLY_DYNAMIC_THRESHOLD", "threshold", "threshold"]
+        assert [event.args["cached"] for event in profiler.events[2:]] == [False, True]
+        assert profiler.events[0].args["shape"] == [64, 64]
+
+    def test_profiled_worker(self):
+        seen = []
+
+        class Worker:
+            def __init__(self):
+                self.profiler = None
+                self.callback = lambda data, step_name: seen.append(step_name)
+
+            @profiling.profiled_worker
+            def run(self):
+                with profiling.profile_stage("inner"):
+                    self.callback(None, "STEP")
+                return profiling.active_profiler()
+
+        worker = Worker()
+        assert worker.run() is None and seen == ["STEP"]
+
+        worker.profiler = StageProfiler()
+        callback = worker.callback
+        assert worker.run() is worker.profiler
+        assert worker.callback is callback
+        assert seen == ["STEP", "STEP"]
+        assert _names(worker.profiler) == ["STEP", "inner", "Worker.run"]
+
+
+class TestExport:
+    def _profile(self):
+        profiler = StageProfiler()
+        with profiler.stage("stage", key="value"):
+            profiler(np.zeros(3), "STEP")
+        return profiler
+
+    def test_json(self, tmp_path):
+        paths = self._profile().save(tmp_path / "nested", "run")
+
+        assert [path.name for path in paths] == ["run.profile.json", "run.trace.json"]
+        profile = json.loads(paths[0].read_text())
+        assert profile["version"] == profiling.PROFILE_FORMAT_VERSION
+        assert [event["name"] for event in profile["events"]] == ["STEP", "stage"]
+        assert set(profile["summary"]) == {"STEP", "stage"}
+
+    def test_chrome_trace(self):
+        trace = self._profile().to_chrome_trace()
+        events = [event for event in trace["traceEvents"] if event["ph"] == "X"]
+
+        assert [event["name"] for event in events] == ["stage", "STEP"]
+        stage, step = events
+        assert stage["ts"] <= step["ts"] and step["ts"] + step["dur"] <= stage["ts"] + stage["dur"] + 1
+        assert stage["args"]["key"] == "value" and "cpu_ms" in step["args"]
+        assert any(event["ph"] == "M" and event["name"] == "thread_name" for event in trace["traceEvents"])
+        json.dumps(trace)
+
+
+def test_profiler_callback(tmp_path):
+    state = TrainingState(epoch=0, total_epochs=2, model=None, optimizer=None, train_metrics={},
+                          val_metrics={}, best_val_loss=float("inf"), device=torch.device("cpu"))
+    callback = ProfilerCallback(save_dir=str(tmp_path))
+    callbacks = CallbackList([callback])
+
+    callbacks.on_train_start(state)
+    for epoch in range(2):
+        state.epoch = epoch
+        callbacks.on_epoch_start(state)
+        profiling.record_step(torch.zeros(1), "TRAIN_STEP")
+        callbacks.on_validation_start(state)
+        callbacks.on_epoch_end(state)
+    callbacks.on_train_end(state)
+
+    assert profiling.active_profiler() is None
+    assert callback.profiler.depth == 0
+    assert _names(callback.profiler, profiling.STAGE_CATEGORY) == [
+        "train_one_epoch", "validate", "epoch", "train_one_epoch", "validate", "epoch", "train"]
+    assert _names(callback.profiler, profiling.STEP_CATEGORY) == ["TRAIN_STEP", "TRAIN_STEP"]
+    assert (tmp_path / "training.trace.json").exists()
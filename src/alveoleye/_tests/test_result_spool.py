@@ -0,0 +1,137 @@
+"""Tests for the on-disk spool of staged export results.
+
+Tests cover:
+- Spooled results keeping metadata in memory and labelmaps on disk
+- Removing and clearing staged results
+- Recovering complete entries of interrupted sessions
+- Sessions of running or unverifiable owners never counting as interrupted
+- Sessions being removed on clean shutdown but kept after a crash
+- Exporting straight from the spool
+"""
+
+import os
+import subprocess
+import sys
+
+import numpy as np
+import pytest
+import tifffile
+
+from alveoleye._export_operations import export_results
+from alveoleye._models import Result
+from alveoleye import _result_spool
+from alveoleye._result_spool import OWNER_FILE, ResultSpool, SpooledLabelmaps
+
+
+def _labelmaps(seed=0):
+    rng = np.random.default_rng(seed)
+    return {
+        "Initial Image": rng.integers(0, 256, size=(24, 32, 3)).astype(np.uint8),
+        "Postprocessing": rng.integers(0, 10, size=(24, 32)).astype(np.int64),
+    }
+
+
+def _crash(spool):
+    # Owner pid that cannot be running
+    with open(os.path.join(spool.session_dir, OWNER_FILE), "w") as fh:
+        fh.write("999999999")
+
+
+class TestResultSpool:
+    def test_add_keeps_labelmaps_on_disk(self, tmp_path):
+        spool = ResultSpool(tmp_path)
+        labelmaps = _labelmaps()
+
+        result = spool.add(Result(image_file_name="a.tif", asvd=np.float64(0.25), chords=np.int64(3)), labelmaps)
+
+        assert isinstance(result.labelmaps, SpooledLabelmaps)
+        assert result == Result(image_file_name="a.tif", asvd=0.25, chords=3)
+        for name, lm in labelmaps.items():
+            assert isinstance(result.labelmaps[name], np.memmap)
+            np.testing.assert_array_equal(result.labelmaps[name], lm)
+        assert result.labelmaps["Postprocessing"].dtype == np.uint8
+
+    def test_pop_and_clear(self, tmp_path):
+        spool = ResultSpool(tmp_path)
+        for i in range(3):
+            spool.add(Result(asvd=float(i)), _labelmaps(i))
+
+        spool.pop()
+        assert sorted(os.listdir(spool.session_dir)) == ["000000", "000001", OWNER_FILE]
+
+        spool.clear()
+        assert len(spool) == 0 and not os.path.exists(spool.session_dir)
+        assert spool.add(Result(asvd=1.0)).labelmaps is None
+
+    def test_recover_interrupted_session(self, tmp_path):
+        crashed = ResultSpool(tmp_path)
+        for i in range(3):
+            crashed.add(Result(asvd=float(i)), _labelmaps(i))
+        os.makedirs(os.path.join(crashed.session_dir, "000003.tmp"))  # interrupted while writing
+        _crash(crashed)
+        live = ResultSpool(tmp_path)
+        live.add(Result(asvd=9.0))
+
+        spool = ResultSpool(tmp_path)
+        sessions = spool.interrupted_sessions()
+        assert sessions == [crashed.session_dir]
+        assert spool.count_recoverable(sessions) == 3
+
+        recovered = spool.recover(sessions)
+
+        assert [r.asvd for r in recovered] == [0.0, 1.0, 2.0] and len(spool) == 3
+        np.testing.assert_array_equal(recovered[2].labelmaps["Postprocessing"], _labelmaps(2)["Postprocessing"])
+        assert not os.path.exists(crashed.session_dir)
+        assert os.path.exists(live.session_dir)
+
+    def test_running_sessions_are_not_interrupted(self, tmp_path):
+        other = ResultSpool(tmp_path)
+        other.add(Result(image_file_name="a.tif"), _labelmaps())
+        with open(os.path.join(other.session_dir, OWNER_FILE), "w") as fh:
+            fh.write(str(os.getppid()))
+
+        assert ResultSpool(tmp_path).interrupted_sessions() == []
+
+    def test_unknown_liveness_counts_as_running(self, monkeypatch):
+        monkeypatch.setattr(_result_spool.os, "name", "java")
+
+        assert _result_spool._is_running(999999999)
+
+    def test_close_removes_session(self, tmp_path):
+        spool = ResultSpool(tmp_path)
+        spool.add(Result(image_file_name="a.tif"), _labelmaps())
+        spool.close()
+
+        assert not os.path.exists(spool.session_dir) and len(spool) == 0
+
+    @pytest.mark.parametrize("exit_call, interrupted", [("sys.exit(0)", 0), ("os._exit(0)", 1)])
+    def test_only_crashed_sessions_are_interrupted(self, tmp_path, exit_call, interrupted):
+        script = (
+            "import os, sys\n"
+            "from alveoleye._models import Result\n"
+            "from alveoleye._result_spool import ResultSpool\n"
+            f"spool = ResultSpool({str(tmp_path)!r})\n"
+            "spool.add(Result(image_file_name='a.tif'))\n"
+            f"{exit_call}\n"
+        )
+        subprocess.run([sys.executable, "-c", script], check=True)
+
+        spool = ResultSpool(tmp_path)
+        sessions = spool.interrupted_sessions()
+        assert len(sessions) == interrupted
+        assert spool.count_recoverable(sessions) == interrupted
+
+    def test_export_from_spool(self, tmp_path):
+        spool = ResultSpool(tmp_path / "spool")
+        results = [spool.add(Result(asvd=float(i)), _labelmaps(i)) for i in range(2)]
+
+        info = export_results(results, str(tmp_path), "study")
+
+        written = tifffile.imread(os.path.join(info["labelmaps"], "2", "Postprocessing.tif"))
+        np.testing.assert_array_equal(written, _labelmaps(1)["Postprocessing"])
+
+    def test_missing_labelmap(self, tmp_path):
+        labelmaps = SpooledLabelmaps(str(tmp_path), ["Postprocessing"])
+
+        with pytest.raises(KeyError):
+            labelmaps["missing"]
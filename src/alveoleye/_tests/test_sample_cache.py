@@ -0,0 +1,177 @@
+"""Tests for the decoded training sample cache.
+
+Tests cover:
+- Repeated dataset indices sharing one decoded sample
+- Transforms never modifying cached samples
+- Byte budget and LRU eviction, in process and in a shared directory
+- Shared entries being memory-mapped and read-only
+- Shared directories only being walked past the budget or at the rescan interval
+"""
+
+import json
+import os
+import pickle
+
+import cv2
+import numpy as np
+import pytest
+
+from alveoleye.lungcv.mrcnn.dataset import LungDataset
+from alveoleye.lungcv.mrcnn import sample_cache
+from alveoleye.lungcv.mrcnn.sample_cache import DecodedSample, DecodedSampleCache
+
+CLASSES = {"airway": "[255 0 0]", "vessel": "[0 0 255]"}
+
+
+@pytest.fixture
+def dataset_root(tmp_path):
+    """Flat dataset of three images, each with one airway and one vessel."""
+    (tmp_path / "images").mkdir()
+    (tmp_path / "masks").mkdir()
+    (tmp_path / "classes.json").write_text(json.dumps(CLASSES))
+
+    for index in range(3):
+        image = np.full((40, 50, 3), 40 * index, dtype=np.uint8)
+        mask = np.zeros((40, 50, 3), dtype=np.uint8)
+        cv2.rectangle(mask, (5, 5), (15, 15), (255, 0, 0), -1)
+        cv2.circle(mask, (35, 25), 6, (0, 0, 255), -1)
+        cv2.imwrite(str(tmp_path / "images" / f"{index}.png"), image)
+        cv2.imwrite(str(tmp_path / "masks" / f"{index}.png"), mask[..., ::-1])
+
+    return tmp_path
+
+
+def _sample(fill=0, size=10):
+    return DecodedSample(
+        np.full((size, size, 3), fill, dtype=np.uint8),
+        np.zeros((1, 4), dtype=np.float32),
+        np.ones(1, dtype=np.int64),
+        np.ones((1, size, size), dtype=np.uint8),
+    )
+
+
+def _flip_transform(img, target):
+    target["boxes"][:, 0] += 1
+    target["masks"][:] = 0
+    return img, target
+
+
+class TestLungDatasetCache:
+    def test_repeated_indices_decode_once(self, dataset_root, monkeypatch):
+        dataset = LungDataset(str(dataset_root), None, train=True, val_split=0.34, n_repeat_images=3)
+        decoded = []
+        original = dataset._decode_sample
+        monkeypatch.setattr(dataset, "_decode_sample", lambda *paths: decoded.append(paths) or original(*paths))
+
+        for index in range(len(dataset)):
+            dataset[index]
+
+        assert len(dataset) == 6
+        assert len(decoded) == 2
+        assert dataset.sample_cache.hits == 4
+
+    def test_transforms_do_not_modify_cache(self, dataset_root):
+        dataset = LungDataset(str(dataset_root), _flip_transform, train=True, val_split=0.34)
+
+        _, first = dataset[0]
+        _, second = dataset[0]
+
+        assert first["boxes"][0, 0] == second["boxes"][0, 0]
+        assert dataset.load_sample(0).masks.any()
+
+    def test_targets_match_uncached(self, dataset_root):
+        cached = LungDataset(str(dataset_root), None, train=True, val_split=0.34)
+        uncached = LungDataset(str(dataset_root), None, train=True, val_split=0.34, cache_bytes=0)
+
+        for _ in range(2):
+            image, target = cached[1]
+        expected_image, expected = uncached[1]
+
+        assert len(uncached.sample_cache) == 0
+        assert np.array_equal(np.asarray(image), np.asarray(expected_image))
+        assert sorted(target["labels"].tolist()) == [1, 2]
+        for name in ("boxes", "labels", "masks", "area", "image_id"):
+            assert target[name].equal(expected[name])
+
+    def test_datasets_share_cache(self, dataset_root):
+        cache = DecodedSampleCache()
+        train = LungDataset(str(dataset_root), None, train=True, val_split=0.34, sample_cache=cache)
+        again = LungDataset(str(dataset_root), None, train=True, val_split=0.34, sample_cache=cache)
+
+        train[0]
+        again[0]
+
+        assert (cache.hits, cache.misses) == (1, 1)
+
+
+class TestInProcessCache:
+    def test_byte_budget_evicts_least_recent(self):
+        entry_bytes = _sample().nbytes
+        cache = DecodedSampleCache(max_bytes=2 * entry_bytes)
+        cache.put("a", _sample(1))
+        cache.put("b", _sample(2))
+        cache.get("a")
+        cache.put("c", _sample(3))
+
+        assert "a" in cache and "b" not in cache and "c" in cache
+        assert cache.size == 2 * entry_bytes
+
+    def test_entries_are_read_only(self):
+        cache = DecodedSampleCache()
+        stored = cache.put("a", _sample())
+
+        with pytest.raises(ValueError):
+            stored.image[0, 0, 0] = 1
+
+    def test_pickling_drops_entries(self):
+        cache = DecodedSampleCache()
+        cache.put("a", _sample())
+
+        restored = pickle.loads(pickle.dumps(cache))
+
+        assert len(restored) == 0 and restored.max_bytes == cache.max_bytes
+
+
+class TestSharedCache:
+    def test_entries_are_memory_mapped(self, tmp_path):
+        writer = DecodedSampleCache(shared_dir=tmp_path)
+        reader = DecodedSampleCache(shared_dir=tmp_path)
+        writer.put("a", _sample(7))
+
+        loaded = reader.get("a")
+
+        assert isinstance(loaded.image, np.memmap)
+        assert loaded.image[0, 0, 0] == 7
+        with pytest.raises(ValueError):
+            loaded.masks[0, 0, 0] = 0
+
+    def test_byte_budget_evicts_least_recent(self, tmp_path):
+        cache = DecodedSampleCache(shared_dir=tmp_path)
+        for index, key in enumerate("abc"):
+            cache.put(key, _sample(index))
+            os.utime(tmp_path / key, ns=(index * 10 ** 9, index * 10 ** 9))
+
+        entry_size = max(size for _, size, _ in cache.entries())
+        cache.get("a")  # refresh the oldest entry
+        cache.max_bytes = 2 * entry_size
+
+        assert cache.trim() == 1
+        assert "a" in cache and "b" not in cache and "c" in cache
+
+    def test_put_walks_directory_only_when_needed(self, tmp_path, monkeypatch):
+        monkeypatch.setattr(sample_cache, "SHARED_RESCAN_INTERVAL", 3)
+        cache = DecodedSampleCache(shared_dir=tmp_path)
+        scans = []
+        entries = cache.entries
+        monkeypatch.setattr(cache, "entries", lambda: scans.append(1) or entries())
+
+        cache.put("a", _sample(0))
+        cache.put("b", _sample(1))
+        assert len(scans) == 1 and cache._shared_size == cache.size
+
+        cache.put("c", _sample(2))
+        assert len(scans) == 3
+
+        cache.max_bytes = cache.size
+        cache.put("d", _sample(3))
+        assert len(scans) == 5 and len(cache) == 3 and cache._shared_size == cache.max_bytes
@@ -0,0 +1,128 @@
+"""Tests for the synthetic lung-section generator.
+
+Tests cover:
+- Sections being reproducible from their seed and differing between seeds
+- Strip-wise generation matching across strip borders
+- Instances lying inside the section, clear of each other, and matching the class map
+- Writing flat and split datasets that LungDataset loads
+- The napari sample data hook
+"""
+
+import json
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from alveoleye import make_sample_data
+from alveoleye.lungcv import synthetic
+from alveoleye.lungcv.mrcnn.dataset import LungDataset
+from alveoleye.lungcv.mrcnn.instances import load_class_colors
+
+
+class TestGenerateSection:
+    def test_reproducible(self):
+        first = synthetic.generate_section(300, 200, seed=4)
+        second = synthetic.generate_section(300, 200, seed=4)
+
+        assert first.image.shape == (200, 300, 3) and first.image.dtype == np.uint8
+        assert first.class_map.shape == (200, 300)
+        np.testing.assert_array_equal(first.image, second.image)
+        np.testing.assert_array_equal(first.class_map, second.class_map)
+        assert first.instances == second.instances
+
+    def test_seeds_differ(self):
+        first = synthetic.generate_section(256, seed=0)
+        second = synthetic.generate_section(256, seed=1)
+
+        assert not np.array_equal(first.image, second.image)
+
+    def test_tissue_and_airspace(self):
+        gray = synthetic.generate_section(512, seed=0).image.mean(axis=2)
+
+        assert 0.1 < np.mean(gray < 220) < 0.6
+
+    def test_strips_are_seamless(self, monkeypatch):
+        whole = synthetic.generate_section(256, seed=3).class_map
+        monkeypatch.setattr(synthetic, "STRIP_ROWS", 60)
+
+        np.testing.assert_array_equal(synthetic.generate_section(256, seed=3).class_map, whole)
+
+    def test_instances_match_class_map(self):
+        section = synthetic.generate_section(1024, seed=5, airways=2, vessels=3)
+
+        assert [instance.class_id for instance in section.instances] == [1, 1, 2, 2, 2]
+        for index, instance in enumerate(section.instances):
+            x, y = instance.center
+            assert instance.extent <= x < 1024 - instance.extent
+            assert instance.extent <= y < 1024 - instance.extent
+
+            ring = np.zeros(section.class_map.shape, dtype=np.uint8)
+            instance.draw_ring(ring, 1)
+            assert np.all(section.class_map[ring == 1] == instance.class_id)
+
+            for other in section.instances[index + 1:]:
+                assert np.hypot(x - other.center[0], y - other.center[1]) > instance.extent + other.extent
+
+    def test_counts_scale_with_area(self):
+        section = synthetic.generate_section(4000, 1000, seed=0)
+        counts = np.bincount([instance.class_id for instance in section.instances], minlength=3)
+
+        assert counts[1] >= 1 and counts[2] > counts[1]
+
+    def test_rgb_mask(self):
+        section = synthetic.generate_section(256, seed=0)
+        mask = section.rgb_mask()
+
+        np.testing.assert_array_equal(np.asarray(section.mask_image().convert("RGB")), mask)
+        assert np.all(mask[section.class_map == synthetic.AIRWAY_CLASS_ID] == (255, 0, 0))
+        assert np.all(mask[section.class_map == 0] == 0)
+
+    def test_invalid_geometry(self):
+        with pytest.raises(ValueError):
+            synthetic.generate_section(0)
+        with pytest.raises(ValueError):
+            synthetic.generate_section(64, airways=-1)
+
+
+class TestWriteSyntheticDataset:
+    @pytest.mark.parametrize("structure", ["flat", "split"])
+    def test_lung_dataset(self, tmp_path, structure):
+        root = synthetic.write_synthetic_dataset(tmp_path, 3, 256, seed=1, structure=structure,
+                                                 airways=1, vessels=1)
+
+        train = LungDataset(str(root), transforms=None, train=True, cache_bytes=0, annotation_store=None)
+        val = LungDataset(str(root), transforms=None, train=False, cache_bytes=0, annotation_store=None)
+
+        assert (len(train), len(val)) == (2, 1)
+        image, target = train[0]
+        assert sorted(target["labels"].tolist()) == [1, 2]
+        assert target["masks"].shape == (2, 256, 256)
+
+    def test_layout(self, tmp_path):
+        synthetic.write_synthetic_dataset(tmp_path, 4, 128, structure="split", val_split=0.5)
+
+        assert sorted(p.name for p in (tmp_path / "images" / "val").iterdir()) == [
+            "section_0002.png", "section_0003.png"]
+        assert load_class_colors(str(tmp_path)) == {"[255 0 0]": 1, "[0 255 0]": 2}
+        assert list(json.loads((tmp_path / "classes.json").read_text())) == list(synthetic.CLASS_COLORS)
+
+    def test_sections_differ(self, tmp_path):
+        synthetic.write_synthetic_dataset(tmp_path, 2, 128)
+        first, second = (np.asarray(Image.open(tmp_path / "images" / name))
+                         for name in ("section_0000.png", "section_0001.png"))
+
+        assert not np.array_equal(first, second)
+
+    def test_invalid_arguments(self, tmp_path):
+        with pytest.raises(ValueError):
+            synthetic.write_synthetic_dataset(tmp_path, 1, 128)
+        with pytest.raises(ValueError):
+            synthetic.write_synthetic_dataset(tmp_path, 2, 128, structure="nested")
+
+
+def test_make_sample_data():
+    [(image, kwargs)] = make_sample_data()
+
+    assert image.shape == (synthetic.SAMPLE_DATA_SIZE, synthetic.SAMPLE_DATA_SIZE, 3)
+    assert kwargs["rgb"]
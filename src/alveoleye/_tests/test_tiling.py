@@ -0,0 +1,114 @@
+"""Tests for tiled sliding-window inference.
+
+Tests cover:
+- Tile layout and core ownership covering the image exactly once
+- Stitched labelmaps matching single-pass generate_processing_labelmap
+- Objects in overlap regions being painted once
+"""
+
+import cv2
+import numpy as np
+import pytest
+import torch
+
+from alveoleye.lungcv import tiling
+from alveoleye.lungcv.model_operations import run_prediction
+from alveoleye.lungcv.postprocessor import generate_processing_labelmap
+
+LABELS = {"AIRWAY_EPITHELIUM": 2, "VESSEL_ENDOTHELIUM": 3}
+
+
+class _BlobDetector(torch.nn.Module):
+    """Stand-in detector reporting each bright blob as one instance.
+
+    Blobs with a bright red channel are airways (class 1), others vessels (class 2).
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.tile_shapes = []
+
+    def forward(self, images):
+        outputs = []
+        for image in images:
+            self.tile_shapes.append(tuple(image.shape[1:]))
+            array = (image.permute(1, 2, 0).numpy() * 255).astype(np.uint8)
+            count, components, stats, _ = cv2.connectedComponentsWithStats(
+                (array.max(axis=2) > 127).astype(np.uint8))
+
+            boxes, labels, masks = [], [], []
+            for component in range(1, count):
+                x, y, w, h = stats[component, :4]
+                boxes.append([x, y, x + w, y + h])
+                labels.append(1 if array[components == component, 0].mean() > 127 else 2)
+                masks.append(torch.from_numpy(components == component).float()[None])
+
+            outputs.append({
+                "boxes": torch.tensor(boxes, dtype=torch.float32).reshape(-1, 4),
+                "labels": torch.tensor(labels, dtype=torch.int64),
+                "scores": torch.full((len(labels),), 0.9),
+                "masks": torch.stack(masks) if masks else torch.zeros((0, 1, *image.shape[1:])),
+            })
+        return outputs
+
+
+def _make_image(height=300, width=260):
+    image = np.zeros((height, width, 3), dtype=np.uint8)
+    cv2.circle(image, (40, 40), 12, (255, 0, 0), -1)
+    cv2.circle(image, (130, 128), 10, (0, 255, 0), -1)  # straddles the tile seams
+    cv2.circle(image, (200, 250), 15, (255, 0, 0), -1)
+    cv2.rectangle(image, (90, 200), (110, 215), (0, 0, 255), -1)
+    return image
+
+
+class TestTileLayout:
+    def test_starts_cover_axis(self):
+        assert tiling.tile_starts(100, 128, 16) == [0]
+        assert tiling.tile_starts(300, 128, 32) == [0, 96, 172]
+
+    @pytest.mark.parametrize("height, width", [(300, 260), (128, 128), (50, 700)])
+    def test_cores_partition_image(self, height, width):
+        owners = np.zeros((height, width), dtype=int)
+        for (y0, x0, y1, x1), (cy0, cx0, cy1, cx1) in tiling.iter_tiles(height, width, 128, 32):
+            assert y0 <= cy0 < cy1 <= y1 and x0 <= cx0 < cx1 <= x1
+            owners[cy0:cy1, cx0:cx1] += 1
+
+        assert (owners == 1).all()
+
+    @pytest.mark.parametrize("tile_size, overlap", [(0, 0), (64, 64), (64, -1)])
+    def test_invalid_layout(self, tile_size, overlap):
+        with pytest.raises(ValueError):
+            list(tiling.iter_tiles(100, 100, tile_size, overlap))
+
+
+class TestTiledProcessingLabelmap:
+    def test_matches_single_pass(self):
+        image = _make_image()
+        model = _BlobDetector()
+
+        expected = generate_processing_labelmap(run_prediction(image, model), image.shape, 50, LABELS)
+        stitched = tiling.generate_tiled_processing_labelmap(image, model, 50, LABELS,
+                                                             tile_size=128, overlap=48)
+
+        np.testing.assert_array_equal(stitched, expected)
+        assert stitched.dtype == np.uint8
+        assert max(max(shape) for shape in model.tile_shapes[1:]) == 128
+
+    def test_overlap_instance_painted_once(self, monkeypatch):
+        image = np.zeros((128, 200, 3), dtype=np.uint8)
+        cv2.circle(image, (100, 64), 8, (255, 0, 0), -1)
+        paint = tiling.paint_tile_prediction
+        painted = []
+
+        def _record(labelmap, *args):
+            before = labelmap.copy()
+            paint(labelmap, *args)
+            painted.append(int((labelmap != before).sum()))
+
+        monkeypatch.setattr(tiling, "paint_tile_prediction", _record)
+        tiling.generate_tiled_processing_labelmap(image, _BlobDetector(), 50, LABELS,
+                                                  tile_size=128, overlap=56)
+
+        # Both tiles see the whole blob, only the owner paints it
+        assert len(painted) == 2
+        assert sorted(count > 0 for count in painted) == [False, True]
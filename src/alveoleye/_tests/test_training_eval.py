@@ -0,0 +1,81 @@
+"""Tests for streaming validation.
+
+Tests cover:
+- Losses and detections coming from one forward pass
+- Detections matching regular model inference
+- Streaming metrics matching metrics over all predictions at once
+"""
+
+import pytest
+import torch
+from torchvision.models.detection import maskrcnn_resnet50_fpn
+
+from alveoleye.lungcv.mrcnn.metrics import compute_batch_metrics
+from alveoleye.lungcv.mrcnn.utils import _forward_with_losses, eval_forward, eval_with_metrics
+
+LOSS_NAMES = {"loss_classifier", "loss_box_reg", "loss_objectness", "loss_rpn_box_reg"}
+
+
+@pytest.fixture(scope="module")
+def model():
+    """Small randomly initialized Mask R-CNN that keeps low-score detections."""
+    torch.manual_seed(0)
+    model = maskrcnn_resnet50_fpn(weights=None, weights_backbone=None, num_classes=3,
+                                  min_size=64, max_size=64, box_score_thresh=0.0,
+                                  box_detections_per_img=10, rpn_post_nms_top_n_test=100)
+    return model.eval()
+
+
+def _sample(offset):
+    generator = torch.Generator().manual_seed(offset)
+    mask = torch.zeros(1, 64, 64, dtype=torch.uint8)
+    mask[0, 10:30, 10 + offset:30 + offset] = 1
+    target = {
+        "boxes": torch.tensor([[10.0 + offset, 10.0, 29.0 + offset, 29.0]]),
+        "labels": torch.tensor([1 + offset % 2]),
+        "masks": mask,
+    }
+    return torch.rand(3, 64, 64, generator=generator), target
+
+
+@pytest.fixture
+def data_loader():
+    """Two collated batches, of two images and one image."""
+    return [tuple(zip(_sample(0), _sample(1))), tuple(zip(_sample(2)))]
+
+
+class TestStreamingValidation:
+    @torch.no_grad()
+    def test_detections_match_inference(self, model, data_loader):
+        images, targets = data_loader[0]
+
+        losses, detections = _forward_with_losses(model, list(images), list(targets), with_masks=True)
+        expected = model(list(images))
+
+        assert set(losses) == LOSS_NAMES
+        for detection, reference in zip(detections, expected):
+            for name in ("boxes", "labels", "scores", "masks"):
+                assert torch.equal(detection[name], reference[name])
+
+    def test_metrics_match_all_at_once(self, model, data_loader):
+        losses, metrics = eval_with_metrics(model, data_loader, "cpu")
+
+        with torch.no_grad():
+            predictions = [p for images, _ in data_loader for p in model(list(images))]
+        targets = [t for _, batch_targets in data_loader for t in batch_targets]
+
+        assert set(losses) == LOSS_NAMES
+        assert all(torch.isfinite(value) and value.dim() == 0 for value in losses.values())
+        assert metrics.to_dict() == compute_batch_metrics(predictions, targets).to_dict()
+
+    def test_losses_are_image_weighted_means(self, model, data_loader):
+        torch.manual_seed(1)
+        losses, detections = eval_forward(model, data_loader, "cpu")
+
+        torch.manual_seed(1)
+        per_batch = [_forward_with_losses(model, list(images), list(targets), with_masks=False)[0]
+                     for images, targets in data_loader]
+
+        assert len(detections) == 3
+        expected = (2 * per_batch[0]["loss_box_reg"] + per_batch[1]["loss_box_reg"]) / 3
+        torch.testing.assert_close(losses["loss_box_reg"], expected)
@@ -5,20 +5,8 @@ import traceback
 import numpy as np
 from qtpy.QtCore import QObject, Signal
 
-from alveoleye.lungcv import model_operations
-from alveoleye.lungcv.assessments import (
-    calculate_airspace_volume_density,
-    calculate_mean_linear_intercept,
-)
-from alveoleye.lungcv.postprocessor import (
-    apply_dynamic_threshold,
-    apply_manual_threshold,
-    convert_to_grayscale,
-    generate_postprocessing_labelmap,
-    generate_processing_labelmap,
-    invert_image_binary,
-    remove_small_components,
-)
+from alveoleye.lungcv import pipeline, tiling
+from alveoleye.lungcv.profiling import profiled_worker
 import alveoleye._export_operations as export_operations
 import alveoleye._layers_editor as layers_editor
 from alveoleye._models import Result
@@ -26,6 +14,7 @@ from alveoleye._models import Result
 
 class WorkerParent(QObject):
     finished = Signal()
+    snapshots_failed = Signal(str)
     layers_config_data = None
 
     def __init__(self):
@@ -34,6 +23,8 @@ class WorkerParent(QObject):
         self.layer_names = None
         self.labels = None
         self.callback = None
+        self.flush_callback = None
+        self.profiler = None
         self.terminate = False
 
         with open(pathlib.Path(__file__).resolve().parent / "config.json", 'r') as config_file:
@@ -50,10 +41,24 @@ class WorkerParent(QObject):
 
     def set_callback(self, callback):
         self.callback = callback
+        # callbacks writing in the background (SnapshotWriter) are flushed before the worker finishes
+        self.flush_callback = getattr(callback, "flush", None)
+
+    def set_profiler(self, profiler):
+        self.profiler = profiler
 
     def cancel(self):
         self.terminate = True
 
+    def finish(self):
+        if self.flush_callback is not None:
+            try:
+                self.flush_callback()
+            except Exception as e:
+                self.snapshots_failed.emit(str(e))
+
+        self.finished.emit()
+
 
 class ProcessingWorker(WorkerParent):
     results_ready = Signal(dict, np.ndarray)
@@ -64,6 +69,7 @@ class ProcessingWorker(WorkerParent):
         self.image_shape = None
         self.use_ai = None
         self.weights = None
+        self.preset = "full"
         self.confidence_threshold_value = None
 
     def set_image_path(self, image_path):
@@ -78,9 +84,13 @@ class ProcessingWorker(WorkerParent):
     def set_weights(self, weights):
         self.weights = weights
 
+    def set_preset(self, preset):
+        self.preset = preset
+
     def set_confidence_threshold_value(self, confidence_threshold_value):
         self.confidence_threshold_value = confidence_threshold_value
 
+    @profiled_worker
     def run(self):
         try:
             if not self.terminate and (not self.use_ai or self.confidence_threshold_value == 100):
@@ -90,22 +100,30 @@ class ProcessingWorker(WorkerParent):
                 self.results_ready.emit(model_output, inference_labelmap)
             else:
                 if not self.terminate:
-                    model = model_operations.init_trained_model(self.weights)
-
-                if not self.terminate:
-                    model_output = model_operations.run_prediction(self.image_path, model)
+                    image_key = pipeline.file_key(self.image_path)
+
+                if not self.terminate and tiling.should_tile(self.image_shape):
+                    # Large scans are stitched tile by tile; no full-size model output is kept
+                    model_output = {}
+                    inference_labelmap = pipeline.run_tiled_processing_labelmap(
+                        image_key, self.image_path, self.weights, self.confidence_threshold_value, self.labels,
+                        preset=self.preset)[1]
+
+                elif not self.terminate:
+                    inference_key, model_output = pipeline.run_inference(image_key, self.image_path, self.weights,
+                                                                          preset=self.preset, low_res_masks=True)
+                    inference_labelmap = pipeline.run_processing_labelmap(
+                        inference_key, model_output, self.image_shape, self.confidence_threshold_value,
+                        self.labels)[1]
 
                 if not self.terminate:
-                    inference_labelmap = generate_processing_labelmap(model_output, self.image_shape,
-                                                                      self.confidence_threshold_value, self.labels)
-
-                if not self.terminate:
-                    self.results_ready.emit(model_output, inference_labelmap)
+                    # The layer is editable, the cached labelmap is not
+                    self.results_ready.emit(model_output, inference_labelmap.copy())
 
         except Exception as e:
             print(f"Error in processing: {e}")
         finally:
-            self.finished.emit()
+            self.finish()
 
 
 class PostprocessingWorker(WorkerParent):
@@ -131,12 +149,7 @@ class PostprocessingWorker(WorkerParent):
     def set_parenchyma_minimum_size(self, parenchyma_minimum_size):
         self.parenchyma_minimum_size = parenchyma_minimum_size
 
-    def threshold_according_to_method(self, image, callback):
-        if self.thresholding_check_box_value:
-            return apply_manual_threshold(image, self.manual_threshold_value, callback)
-
-        return apply_dynamic_threshold(image, callback)
-
+    @profiled_worker
     def run(self):
         try:
             if not self.terminate:
@@ -144,32 +157,26 @@ class PostprocessingWorker(WorkerParent):
                                                           self.callback)
 
             if not self.terminate:
-                grayscaled = convert_to_grayscale(image, self.callback)
-
-            if not self.terminate:
-                thresholded = self.threshold_according_to_method(grayscaled, self.callback)
-
-            if not self.terminate:
-                parenchyma_cleaned = remove_small_components(thresholded, self.parenchyma_minimum_size, self.callback)
+                manual_threshold = self.manual_threshold_value if self.thresholding_check_box_value else None
+                threshold_key, thresholded = pipeline.run_threshold(pipeline.array_key(image), image,
+                                                                    manual_threshold, self.callback)
 
             if not self.terminate:
-                inverted = invert_image_binary(parenchyma_cleaned, self.callback)
-
-            if not self.terminate:
-                alveoli_cleaned = remove_small_components(inverted, self.alveoli_minimum_size, self.callback)
-
-            if not self.terminate:
-                inverted_back = invert_image_binary(alveoli_cleaned, self.callback)
+                cleanup_key, inverted_back = pipeline.run_component_cleanup(
+                    threshold_key, thresholded, self.parenchyma_minimum_size, self.alveoli_minimum_size,
+                    self.callback)
 
             if not self.terminate:
                 masks_labelmap = layers_editor.get_layers_by_names(self.napari_viewer,
                                                                    self.layer_names["PROCESSING_LAYER"], self.callback)
 
             if not self.terminate:
-                labelmap = generate_postprocessing_labelmap(masks_labelmap, inverted_back, self.labels, self.callback)
+                labelmap = pipeline.run_postprocessing_labelmap(pipeline.array_key(masks_labelmap), masks_labelmap,
+                                                                cleanup_key, inverted_back, self.labels,
+                                                                self.callback)[1]
 
             if not self.terminate:
-                self.results_ready.emit(labelmap)
+                self.results_ready.emit(labelmap.copy())
 
         except Exception as e:
             import traceback
@@ -177,7 +184,7 @@ class PostprocessingWorker(WorkerParent):
             print(f"Error in post-processing: {e}")
             traceback.print_exc()
         finally:
-            self.finished.emit()
+            self.finish()
 
 
 class AssessmentsWorker(WorkerParent):
@@ -206,6 +213,7 @@ class AssessmentsWorker(WorkerParent):
     def set_scale_spin_box_value(self, scale_spin_box_value):
         self.scale_spin_box_value = scale_spin_box_value
 
+    @profiled_worker
     def run(self):
         mli = ""
         asvd = ""
@@ -220,17 +228,21 @@ class AssessmentsWorker(WorkerParent):
                 labelmap = layers_editor.get_layers_by_names(self.napari_viewer, self.layer_names["POSTPROCESSING_LAYER"],
                                                              self.callback)
 
+            if not self.terminate:
+                labelmap_key = pipeline.array_key(labelmap)
+
             if not self.terminate:
                 if self.asvd_check_box_state:
-                    asvd, airspace_pixels, non_airspace_pixels = calculate_airspace_volume_density(labelmap,
-                                                                                                   self.labels)
+                    asvd, airspace_pixels, non_airspace_pixels = pipeline.run_asvd(labelmap_key, labelmap,
+                                                                                   self.labels)[1]
 
             if not self.terminate:
                 if self.mli_check_box_state:
-                    mli, assessments_layer, chords, stdev_chord_lengths = calculate_mean_linear_intercept(
-                        labelmap, self.lines_spin_box_value, self.min_length_spin_box_value,
+                    mli, assessments_layer, chords, stdev_chord_lengths = pipeline.run_mli(
+                        labelmap_key, labelmap, self.lines_spin_box_value, self.min_length_spin_box_value,
                         self.scale_spin_box_value, self.labels, False, self.callback
-                    )
+                    )[1]
+                    assessments_layer = assessments_layer.copy()
 
             if not self.terminate:
                 self.results_ready.emit(str(asvd), str(mli), str(chords), str(stdev_chord_lengths),
@@ -240,11 +252,12 @@ class AssessmentsWorker(WorkerParent):
         except Exception as e:
             print(f"Error in metrics calculation: {e}")
         finally:
-            self.finished.emit()
+            self.finish()
 
 
 class ExportWorker(WorkerParent):
     results_ready = Signal(dict, str)
+    progress = Signal(int, int)
 
     def __init__(self):
         super().__init__()
@@ -255,6 +268,8 @@ class ExportWorker(WorkerParent):
         self.metrics_ext = "csv"
         self.labelmap_ext = "tif"
         self.zip_it = False
+        self.tiff_codec = export_operations.DEFAULT_TIFF_CODEC
+        self.tiff_pyramid = False
         self.accumulated_results: list[Result] = []
 
     def set_parent_folder(self, f: str):
@@ -275,9 +290,16 @@ class ExportWorker(WorkerParent):
     def set_exp_rgb(self, r: bool):
         self.exp_rgb_colors = r
 
+    def set_tiff_codec(self, c: str):
+        self.tiff_codec = c
+
+    def set_tiff_pyramid(self, p: bool):
+        self.tiff_pyramid = p
+
     def set_accumulated_results(self, res: list[Result]):
         self.accumulated_results = res
 
+    @profiled_worker
     def run(self):
         try:
             if self.terminate:
@@ -291,6 +313,9 @@ class ExportWorker(WorkerParent):
                 labelmap_ext=self.labelmap_ext,
                 export_as_rgb=self.exp_rgb_colors,
                 zip_it=self.zip_it,
+                progress=self.progress.emit,
+                tiff_codec=self.tiff_codec,
+                tiff_pyramid=self.tiff_pyramid,
             )
 
             self.results_ready.emit(info, "")
@@ -298,4 +323,4 @@ class ExportWorker(WorkerParent):
             traceback.print_exc()
             self.results_ready.emit({}, str(e))
         finally:
-            self.finished.emit()
+            self.finish()
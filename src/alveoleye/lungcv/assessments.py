@@ -2,7 +2,6 @@ import random
 
 import cv2
 import numpy as np
-from scipy import ndimage
 
 
 def calculate_airspace_volume_density(labelmap, labels):
@@ -19,8 +18,16 @@ def calculate_airspace_volume_density(labelmap, labels):
 
 
 def calculate_mean_linear_intercept(labelmap, num_lines, min_length, scale, labels, randomized_distribution=False,
-                                    callback=None):
+                                    callback=None, orientation="horizontal"):
+    if orientation not in ("horizontal", "vertical"):
+        raise ValueError(f"orientation must be 'horizontal' or 'vertical', got {orientation!r}")
+
     labelmap = np.squeeze(labelmap)
+
+    # Vertical test lines are measured as rows of the transposed labelmap
+    if orientation == "vertical":
+        labelmap = labelmap.T
+
     labelmap_shape = labelmap.shape
 
     if randomized_distribution:
@@ -31,38 +38,59 @@ def calculate_mean_linear_intercept(labelmap, num_lines, min_length, scale, labe
     test_lines_labelmap = np.zeros(labelmap_shape, dtype=np.uint8)
     test_lines_labelmap[line_y_coordinates, :] = labels["MLI_LINES_OUTSIDE"]
 
-    chords_labelmap = np.where(labelmap != labels["ALVEOLI"], 0, test_lines_labelmap)
-
-    counter = 0
-    total_area = 0
-    chord_lengths = []
+    line_rows = np.unique(line_y_coordinates)
+    chord_lengths, kept_chords = measure_chords(labelmap[line_rows] == labels["ALVEOLI"], min_length)
 
-    for i in range(chords_labelmap.shape[0]):
-        labeled, num_components = ndimage.label(chords_labelmap[i])
-
-        for component_label in range(1, num_components + 1):
-            component_mask = (labeled == component_label)
-            component_area = np.sum(component_mask)
-
-            if component_area >= min_length:
-                counter += 1
-                total_area += component_area
-                chord_lengths.append(component_area * scale)
-            else:
-                chords_labelmap[i][component_mask] = 0
+    chords_labelmap = np.zeros(labelmap_shape, dtype=np.uint8)
+    chords_labelmap[line_rows] = np.where(kept_chords, labels["MLI_LINES_OUTSIDE"], 0)
 
+    counter = len(chord_lengths)
+    total_area = int(chord_lengths.sum())
     average_length = total_area * scale / counter if counter > 0 else 0
 
-    chord_lengths = np.array(chord_lengths)
+    chord_lengths = chord_lengths * scale
     stdev_chord_lengths = "NA" if len(chord_lengths) == 0 else np.std(chord_lengths)
 
     kernel = np.array([[0, 1, 0], [0, 1, 0], [0, 1, 0]], np.uint8)
     chords_highlighted_labelmap = cv2.dilate(chords_labelmap, kernel, iterations=6)
     chords_highlighted_labelmap = np.where(chords_labelmap, labels["MLI_LINES_INSIDE"], chords_highlighted_labelmap)
 
+    if orientation == "vertical":
+        test_lines_labelmap = test_lines_labelmap.T
+        chords_labelmap = chords_labelmap.T
+        chords_highlighted_labelmap = chords_highlighted_labelmap.T
+
     if callback:
         callback(test_lines_labelmap, "CALCULATE_MEAN_LINEAR_INTERCEPT_LINES")
         callback(chords_labelmap, "CALCULATE_MEAN_LINEAR_INTERCEPT_CHORDS")
         callback(chords_highlighted_labelmap, "CALCULATE_MEAN_LINEAR_INTERCEPT_HIGHLIGHTED_CHORDS")
 
     return average_length, chords_highlighted_labelmap.astype(int), counter, stdev_chord_lengths
+
+
+def measure_chords(line_rows, min_length):
+    """Run-length encode binary test lines and keep the runs of at least min_length.
+
+    Returns the kept run lengths (in pixels, row-major order) and a boolean
+    array shaped like line_rows marking the pixels of the kept runs.
+    """
+    num_rows, width = line_rows.shape
+
+    # Pad each row with a zero on both sides so every run opens and closes within its row
+    padded = np.zeros((num_rows, width + 2), dtype=np.int8)
+    padded[:, 1:-1] = line_rows
+    edges = np.diff(padded, axis=1).ravel()
+
+    starts = np.flatnonzero(edges == 1)
+    ends = np.flatnonzero(edges == -1)
+    lengths = ends - starts
+
+    keep = lengths >= min_length
+    starts, ends = starts[keep], ends[keep]
+
+    markers = np.zeros(edges.size + 1, dtype=np.int32)
+    markers[starts] = 1
+    markers[ends] = -1
+    kept_chords = np.cumsum(markers[:-1]).reshape(num_rows, width + 1)[:, :width] > 0
+
+    return lengths[keep], kept_chords
@@ -0,0 +1,449 @@
+"""Inference backends for CPU deployment of the Mask R-CNN model.
+
+The eager MaskRCNN built by init_trained_model is the reference model. This
+module exports it as a scripted TorchScript artifact and an ONNX graph,
+optionally with dynamic int8 quantization, and loads those artifacts behind
+the call interface of the eager model: model(images) takes a list of
+[3, H, W] float tensors and returns one dict of boxes, labels, scores and
+masks per image. run_prediction, run_predictions and tiling therefore work
+unchanged with every backend.
+
+Backends:
+    eager: The torchvision MaskRCNN loaded from a checkpoint.
+    int8: The eager model with dynamically quantized linear layers (CPU).
+    torchscript: A scripted model written by export_model (either precision).
+    onnx: An ONNX graph run with onnxruntime (optional dependency).
+
+Further runtimes are added with register_backend. Every exported artifact
+should be checked against the eager model with check_parity before use.
+
+Example:
+    from alveoleye.lungcv import backends, model_operations
+
+    model = model_operations.init_trained_model("model.pth", device=torch.device("cpu"))
+    paths = backends.export_model(model, "exported/", formats=("torchscript",), quantize=True)
+
+    scripted = model_operations.get_trained_model(paths["torchscript-int8"], backend="torchscript")
+    report = backends.check_parity(model, scripted, ["section.png"], labels)
+"""
+
+import copy
+import time
+import warnings
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+import torch
+from PIL import Image
+from torchvision.models.detection.transform import GeneralizedRCNNTransform
+
+from alveoleye.lungcv import model_operations
+from alveoleye.lungcv.postprocessor import generate_processing_labelmap
+
+# =============================================================================
+# Constants
+# =============================================================================
+
+# Backend used when none is requested
+DEFAULT_BACKEND = "eager"
+
+# Export formats and the file names export_model writes them to
+EXPORT_FILE_NAMES = {
+    "torchscript": "model.torchscript.pt",
+    "torchscript-int8": "model.int8.torchscript.pt",
+    "onnx": "model.onnx",
+    "onnx-int8": "model.int8.onnx",
+}
+
+# ONNX opset supported by the torchvision detection ops
+ONNX_OPSET_VERSION = 17
+
+# Output names of the exported ONNX graph, in order
+ONNX_OUTPUT_NAMES = ("boxes", "labels", "scores", "masks")
+
+# Size of the dummy image traced through the model for ONNX export
+DEFAULT_EXPORT_IMAGE_SIZE = (512, 512)
+
+# Minimum fraction of labelmap pixels that must match the eager model
+DEFAULT_PARITY_THRESHOLD = 0.99
+
+# Minimum confidence in percent used for parity labelmaps (widget default)
+DEFAULT_PARITY_CONFIDENCE = 30
+
+
+# =============================================================================
+# Runtime Adapters
+# =============================================================================
+
+class ScriptedDetector(torch.nn.Module):
+    """Adapter returning only the detections of a scripted MaskRCNN.
+
+    Scripted detection models always return a (losses, detections) tuple.
+    """
+
+    def __init__(self, module: torch.nn.Module) -> None:
+        super().__init__()
+        self.module = module
+
+    def forward(self, images: List[torch.Tensor]) -> List[Dict[str, torch.Tensor]]:
+        return self.module(images)[1]
+
+
+class CpuDetector(torch.nn.Module):
+    """Adapter for CPU-only models (quantized) that moves inputs to the CPU."""
+
+    def __init__(self, module: torch.nn.Module) -> None:
+        super().__init__()
+        self.module = module
+
+    def forward(self, images: List[torch.Tensor]) -> List[Dict[str, torch.Tensor]]:
+        return self.module([image.cpu() for image in images])
+
+
+class OnnxDetector:
+    """Adapter running an exported ONNX graph with onnxruntime, one image at a time.
+
+    Args:
+        path: Path to the .onnx file.
+        providers: onnxruntime execution providers (CPU by default).
+    """
+
+    def __init__(self, path: Union[str, Path], providers: Optional[Sequence[str]] = None) -> None:
+        onnxruntime = _import_optional("onnxruntime")
+        self.session = onnxruntime.InferenceSession(
+            str(path), providers=list(providers or ["CPUExecutionProvider"])
+        )
+        self.input_name = self.session.get_inputs()[0].name
+
+    def eval(self) -> "OnnxDetector":
+        return self
+
+    def __call__(self, images: List[torch.Tensor]) -> List[Dict[str, torch.Tensor]]:
+        outputs = []
+        for image in images:
+            values = self.session.run(None, {self.input_name: image.detach().cpu().numpy()})
+            outputs.append({name: torch.from_numpy(value) for name, value in zip(ONNX_OUTPUT_NAMES, values)})
+        return outputs
+
+
+class _SingleImageDetector(torch.nn.Module):
+    """Export wrapper with a tensor-only signature, as ONNX requires."""
+
+    def __init__(self, model: torch.nn.Module) -> None:
+        super().__init__()
+        self.model = model
+
+    def forward(self, image: torch.Tensor) -> Tuple[torch.Tensor, ...]:
+        output = self.model([image])[0]
+        return tuple(output[name] for name in ONNX_OUTPUT_NAMES)
+
+
+def _import_optional(name: str) -> Any:
+    try:
+        return __import__(name)
+    except ImportError as e:
+        raise ImportError(
+            f"{name} is required for ONNX models. "
+            f"Install it with: pip install {name}"
+        ) from e
+
+
+# =============================================================================
+# Backend Registry
+# =============================================================================
+
+BackendLoader = Callable[[Path, int, torch.device], Any]
+
+_BACKENDS: Dict[str, BackendLoader] = {}
+
+
+def register_backend(name: str, loader: BackendLoader) -> None:
+    """Register a loader for a backend name.
+
+    Args:
+        name: Backend name accepted by load_backend and get_trained_model.
+        loader: Callable receiving (model_path, num_classes, device) and
+            returning a model with the eager call interface.
+    """
+    _BACKENDS[name] = loader
+
+
+def available_backends() -> List[str]:
+    """Names of all registered backends."""
+    return list(_BACKENDS)
+
+
+def resolve_model_path(backend: str, model_path: Optional[Union[str, Path]]) -> Path:
+    """Resolve the file a backend loads from.
+
+    Checkpoint backends fall back to the default weights like
+    init_trained_model; exported artifacts must exist.
+
+    Raises:
+        FileNotFoundError: If an exported artifact does not exist.
+    """
+    if backend in ("eager", "int8"):
+        return model_operations.resolve_weights_path(model_path)
+
+    if model_path is None or not Path(model_path).is_file():
+        raise FileNotFoundError(f"The {backend} backend needs an exported model file, got: {model_path}")
+
+    return Path(model_path).resolve()
+
+
+def load_backend(
+    backend: str,
+    model_path: Path,
+    num_classes: int = model_operations.DEFAULT_NUM_CLASSES,
+    device: Optional[torch.device] = None,
+) -> Any:
+    """Load a model through a registered backend.
+
+    Args:
+        backend: Registered backend name.
+        model_path: Checkpoint or exported artifact (see resolve_model_path).
+        num_classes: Number of output classes including background.
+        device: Device for backends that support it. Defaults to get_device().
+
+    Returns:
+        Model with the eager call interface, in eval mode.
+
+    Raises:
+        ValueError: If the backend is not registered.
+    """
+    if backend not in _BACKENDS:
+        raise ValueError(f"Unknown backend {backend!r}, expected one of {available_backends()}")
+
+    device = device if device is not None else model_operations.get_device()
+    return _BACKENDS[backend](Path(model_path), num_classes, device).eval()
+
+
+def _load_eager(model_path: Path, num_classes: int, device: torch.device) -> torch.nn.Module:
+    return model_operations.init_trained_model(model_path, num_classes, device)
+
+
+def _load_int8(model_path: Path, num_classes: int, device: torch.device) -> torch.nn.Module:
+    model = model_operations.init_trained_model(model_path, num_classes, torch.device("cpu"))
+    return CpuDetector(quantize_model(model))
+
+
+def _load_torchscript(model_path: Path, num_classes: int, device: torch.device) -> torch.nn.Module:
+    module = torch.jit.load(str(model_path), map_location="cpu")
+
+    # Quantized artifacts only run on the CPU
+    if any(".quantized." in submodule._c.qualified_name for submodule in module.modules()):
+        return CpuDetector(ScriptedDetector(module))
+
+    return ScriptedDetector(module).to(device)
+
+
+def _load_onnx(model_path: Path, num_classes: int, device: torch.device) -> OnnxDetector:
+    return OnnxDetector(model_path)
+
+
+register_backend("eager", _load_eager)
+register_backend("int8", _load_int8)
+register_backend("torchscript", _load_torchscript)
+register_backend("onnx", _load_onnx)
+
+
+# =============================================================================
+# Export
+# =============================================================================
+
+def _cpu_copy(model: torch.nn.Module) -> torch.nn.Module:
+    """Copy of a model on the CPU in eval mode; the model itself stays on its device."""
+    return copy.deepcopy(model).cpu().eval()
+
+
+def quantize_model(model: torch.nn.Module) -> torch.nn.Module:
+    """Return a CPU copy of the model with int8 dynamically quantized linear layers.
+
+    Dynamic quantization covers the fully connected box head, the largest
+    matrix multiplications per detection; convolutions stay in float.
+    """
+    return torch.ao.quantization.quantize_dynamic(_cpu_copy(model), {torch.nn.Linear}, dtype=torch.qint8,
+                                                  inplace=True)
+
+
+def script_model(model: torch.nn.Module) -> torch.jit.ScriptModule:
+    """Script a CPU copy of a MaskRCNN (float or quantized) for CPU inference."""
+    model = _cpu_copy(model)
+
+    # LowResMaskTransform reads a thread-local flag, which TorchScript cannot compile
+    transform = model_operations._eager_transform(model)
+    if isinstance(transform, model_operations.LowResMaskTransform):
+        transform.__class__ = GeneralizedRCNNTransform
+
+    with warnings.catch_warnings():
+        # Scripted RCNNs warn that they return a (losses, detections) tuple
+        warnings.simplefilter("ignore", UserWarning)
+        return torch.jit.script(model)
+
+
+def export_onnx(
+    model: torch.nn.Module,
+    path: Union[str, Path],
+    image_size: Tuple[int, int] = DEFAULT_EXPORT_IMAGE_SIZE,
+) -> Path:
+    """Export a CPU copy of a MaskRCNN to an ONNX graph taking one [3, H, W] image of any size."""
+    _import_optional("onnx")
+
+    dynamic_axes = {"image": {1: "height", 2: "width"}}
+    dynamic_axes.update({name: {0: "detections"} for name in ONNX_OUTPUT_NAMES})
+
+    torch.onnx.export(
+        _SingleImageDetector(_cpu_copy(model)),
+        (torch.rand(3, *image_size),),
+        str(path),
+        opset_version=ONNX_OPSET_VERSION,
+        input_names=["image"],
+        output_names=list(ONNX_OUTPUT_NAMES),
+        dynamic_axes=dynamic_axes,
+    )
+    return Path(path)
+
+
+def quantize_onnx(path: Union[str, Path], output: Union[str, Path]) -> Path:
+    """Write a copy of an ONNX graph with int8 dynamically quantized weights."""
+    _import_optional("onnxruntime")
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    quantize_dynamic(str(path), str(output), weight_type=QuantType.QInt8)
+    return Path(output)
+
+
+def export_model(
+    model: torch.nn.Module,
+    output_dir: Union[str, Path],
+    formats: Sequence[str] = ("torchscript", "onnx"),
+    quantize: bool = False,
+    image_size: Tuple[int, int] = DEFAULT_EXPORT_IMAGE_SIZE,
+) -> Dict[str, Path]:
+    """Export a trained model to deployable artifacts.
+
+    Args:
+        model: Trained MaskRCNN (see init_trained_model).
+        output_dir: Directory receiving the files in EXPORT_FILE_NAMES.
+        formats: Any of "torchscript" and "onnx".
+        quantize: Also write int8 dynamically quantized variants.
+        image_size: Size of the dummy image used for ONNX export.
+
+    Returns:
+        Mapping from export name (e.g. "torchscript-int8") to written file.
+
+    Raises:
+        ValueError: If a format is unknown.
+    """
+    unknown = set(formats) - {"torchscript", "onnx"}
+    if unknown:
+        raise ValueError(f"Unknown export formats: {sorted(unknown)}")
+
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    paths = {}
+
+    if "torchscript" in formats:
+        paths["torchscript"] = output_dir / EXPORT_FILE_NAMES["torchscript"]
+        script_model(model).save(str(paths["torchscript"]))
+
+        if quantize:
+            paths["torchscript-int8"] = output_dir / EXPORT_FILE_NAMES["torchscript-int8"]
+            script_model(quantize_model(model)).save(str(paths["torchscript-int8"]))
+
+    if "onnx" in formats:
+        paths["onnx"] = export_onnx(model, output_dir / EXPORT_FILE_NAMES["onnx"], image_size)
+
+        if quantize:
+            paths["onnx-int8"] = quantize_onnx(paths["onnx"], output_dir / EXPORT_FILE_NAMES["onnx-int8"])
+
+    return paths
+
+
+# =============================================================================
+# Parity
+# =============================================================================
+
+@dataclass
+class ParityReport:
+    """Agreement and latency of a backend against the eager model.
+
+    Attributes:
+        agreements: Fraction of processing labelmap pixels equal to the
+            eager model's, per image.
+        detection_differences: Candidate minus eager detection count, per image.
+        reference_seconds: Eager inference time per image.
+        candidate_seconds: Candidate inference time per image.
+    """
+    agreements: List[float] = field(default_factory=list)
+    detection_differences: List[int] = field(default_factory=list)
+    reference_seconds: List[float] = field(default_factory=list)
+    candidate_seconds: List[float] = field(default_factory=list)
+
+    @property
+    def min_agreement(self) -> float:
+        return min(self.agreements, default=1.0)
+
+    @property
+    def mean_agreement(self) -> float:
+        return float(np.mean(self.agreements)) if self.agreements else 1.0
+
+    @property
+    def speedup(self) -> float:
+        """Eager time divided by candidate time over all images."""
+        return sum(self.reference_seconds) / max(sum(self.candidate_seconds), 1e-9)
+
+    def passed(self, threshold: float = DEFAULT_PARITY_THRESHOLD) -> bool:
+        """Whether every image's labelmap agrees with the eager one on at least threshold of its pixels."""
+        return self.min_agreement >= threshold
+
+
+def _timed_labelmap(image: np.ndarray, model: Any, min_confidence: float, labels: Dict[str, int]):
+    start = time.perf_counter()
+    output = model_operations.run_prediction(image, model)
+    elapsed = time.perf_counter() - start
+
+    output = {k: v.cpu() for k, v in output.items()}
+    return generate_processing_labelmap(output, image.shape, min_confidence, labels), len(output["scores"]), elapsed
+
+
+def check_parity(
+    reference: Any,
+    candidate: Any,
+    images: Sequence[Union[str, Path, np.ndarray]],
+    labels: Dict[str, int],
+    min_confidence: float = DEFAULT_PARITY_CONFIDENCE,
+) -> ParityReport:
+    """Compare a backend with the eager model on sample images.
+
+    Both models run the widget's processing step on each image; the
+    resulting processing labelmaps are compared pixel by pixel, since they
+    are what the downstream ASVD and MLI assessments consume.
+
+    Args:
+        reference: Eager MaskRCNN.
+        candidate: Model loaded through another backend.
+        images: Image paths or decoded RGB [H, W, 3] arrays.
+        labels: Label values (the Labels section of config.json).
+        min_confidence: Minimum confidence in percent.
+
+    Returns:
+        ParityReport with per-image agreement and timings.
+    """
+    report = ParityReport()
+
+    for image in images:
+        if not isinstance(image, np.ndarray):
+            image = np.array(Image.open(image).convert("RGB"))
+
+        expected, expected_count, reference_seconds = _timed_labelmap(image, reference, min_confidence, labels)
+        actual, actual_count, candidate_seconds = _timed_labelmap(image, candidate, min_confidence, labels)
+
+        report.agreements.append(float(np.mean(expected == actual)))
+        report.detection_differences.append(actual_count - expected_count)
+        report.reference_seconds.append(reference_seconds)
+        report.candidate_seconds.append(candidate_seconds)
+
+    return report
@@ -0,0 +1,460 @@
+"""Offline benchmarks of the postprocessing, assessment and data loading hot paths.
+
+Each benchmark case times one step of the pipeline on a synthetic lung
+section of a given size (in megapixels): the postprocessing chain from
+convert_to_grayscale to generate_postprocessing_labelmap, the ASVD and MLI
+assessments, the training metrics of compute_batch_metrics and
+LungDataset.__getitem__. Everything runs on the CPU without network access
+or real data.
+
+For every case and size the suite reports:
+    seconds: Median wall time over the repeats.
+    peak_rss_mb: High-water resident set size of the process running the
+        case, inputs included.
+    allocated_mb: Peak memory allocated by the step itself, as traced by
+        tracemalloc (NumPy and Python allocations; not torch tensors).
+
+Cases run in a fresh process each by default, so their peak RSS does not
+include the memory of earlier cases. Results are compared with a stored
+baseline (benchmark_baseline.json next to this module, or any file written
+by save_baseline); a case regresses when a metric grows by more than the
+regression threshold. Baselines are only comparable on the machine they
+were recorded on.
+
+Example:
+    from alveoleye.lungcv import benchmark
+
+    results = benchmark.run_benchmarks(megapixels=(1, 4))
+    regressions = benchmark.compare_to_baseline(results, benchmark.load_baseline())
+"""
+
+import gc
+import json
+import multiprocessing
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import asdict, dataclass
+from functools import cached_property, partial
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Union
+
+import cv2
+import numpy as np
+import torch
+
+from alveoleye.lungcv import synthetic
+from alveoleye.lungcv.assessments import calculate_airspace_volume_density, calculate_mean_linear_intercept
+from alveoleye.lungcv.inference import (
+    DEFAULT_ALVEOLI_MINIMUM_SIZE,
+    DEFAULT_LINES,
+    DEFAULT_MIN_LENGTH,
+    DEFAULT_PARENCHYMA_MINIMUM_SIZE,
+    DEFAULT_SCALE,
+)
+from alveoleye.lungcv.postprocessor import (
+    apply_dynamic_threshold,
+    convert_to_grayscale,
+    generate_postprocessing_labelmap,
+    invert_image_binary,
+    remove_small_components,
+)
+
+# =============================================================================
+# Constants
+# =============================================================================
+
+# Synthetic image sizes in megapixels
+DEFAULT_MEGAPIXELS = (1, 4, 16, 100)
+
+# Timed runs per case and size; the median is reported
+DEFAULT_REPEATS = 3
+
+# Relative growth of a metric over the baseline that counts as a regression
+DEFAULT_REGRESSION_THRESHOLD = 0.25
+
+# Differences below these floors are measurement noise, never regressions
+NOISE_FLOORS = {"seconds": 0.005, "peak_rss_mb": 8.0, "allocated_mb": 1.0}
+
+# Baseline stored with the package
+BASELINE_PATH = Path(__file__).with_name("benchmark_baseline.json")
+
+# Version of the baseline file layout
+BASELINE_FORMAT_VERSION = 1
+
+# =============================================================================
+# Synthetic Inputs
+# =============================================================================
+
+def _labels() -> Dict[str, int]:
+    from alveoleye._config_utils import Config
+
+    return Config.get_labels()
+
+
+class SyntheticSection:
+    """Synthetic lung section of a given size and the pipeline intermediates derived from it.
+
+    The section comes from alveoleye.lungcv.synthetic; its airway and
+    vessel rings are also painted into a processing labelmap as if the
+    model had found them. Intermediates are computed on first access.
+
+    Args:
+        megapixels: Image size; the image is square.
+        seed: Seed of the section.
+    """
+
+    def __init__(self, megapixels: float, seed: int = 0):
+        self.megapixels = megapixels
+        self.seed = seed
+        self.side = max(int(round((megapixels * 1e6) ** 0.5)), 32)
+
+    @cached_property
+    def labels(self) -> Dict[str, int]:
+        return _labels()
+
+    @cached_property
+    def _section(self) -> synthetic.SyntheticLungSection:
+        return synthetic.generate_section(self.side, seed=self.seed)
+
+    @property
+    def _instances(self) -> List[synthetic.SyntheticInstance]:
+        return self._section.instances
+
+    @cached_property
+    def image(self) -> np.ndarray:
+        # BGR like cv2.imread, converted in place
+        image = self._section.image
+        return cv2.cvtColor(image, cv2.COLOR_RGB2BGR, dst=image)
+
+    @cached_property
+    def processing_labelmap(self) -> np.ndarray:
+        lut = np.zeros(256, dtype=np.uint8)
+        lut[synthetic.AIRWAY_CLASS_ID] = self.labels["AIRWAY_EPITHELIUM"]
+        lut[synthetic.VESSEL_CLASS_ID] = self.labels["VESSEL_ENDOTHELIUM"]
+        return cv2.LUT(self._section.class_map, lut)
+
+    @cached_property
+    def grayscale(self) -> np.ndarray:
+        return convert_to_grayscale(self.image)
+
+    @cached_property
+    def thresholded(self) -> np.ndarray:
+        return apply_dynamic_threshold(self.grayscale)
+
+    @cached_property
+    def cleaned(self) -> np.ndarray:
+        parenchyma_cleaned = remove_small_components(self.thresholded.copy(), DEFAULT_PARENCHYMA_MINIMUM_SIZE)
+        alveoli_cleaned = remove_small_components(invert_image_binary(parenchyma_cleaned),
+                                                  DEFAULT_ALVEOLI_MINIMUM_SIZE)
+        return invert_image_binary(alveoli_cleaned)
+
+    @cached_property
+    def labelmap(self) -> np.ndarray:
+        return generate_postprocessing_labelmap(self.processing_labelmap, self.cleaned, self.labels)
+
+    @cached_property
+    def instance_masks(self) -> torch.Tensor:
+        masks = np.zeros((len(self._instances), self.side, self.side), dtype=np.uint8)
+        for mask, instance in zip(masks, self._instances):
+            instance.draw_ring(mask, 1)
+        return torch.from_numpy(masks)
+
+    @cached_property
+    def dataset_root(self) -> str:
+        """Flat LungDataset directory of two sections this size (the flat layout needs a validation image)."""
+        root = tempfile.mkdtemp(prefix="alveoleye-benchmark-")
+        synthetic.write_synthetic_dataset(root, 2, self.side, seed=self.seed)
+        return root
+
+    def close(self) -> None:
+        """Remove the dataset directory, if one was written."""
+        if "dataset_root" in self.__dict__:
+            shutil.rmtree(self.__dict__.pop("dataset_root"), ignore_errors=True)
+
+
+# =============================================================================
+# Cases
+# =============================================================================
+
+@dataclass(frozen=True)
+class BenchmarkCase:
+    """A timed step of the pipeline.
+
+    Attributes:
+        name: Case name used on the command line and in baselines.
+        setup: Returns a zero-argument callable running the step once on a
+            section; called before every timed run and not timed itself.
+        max_megapixels: Largest size the case runs at, for steps whose
+            inputs grow much faster than the image.
+    """
+    name: str
+    setup: Callable[[SyntheticSection], Callable[[], Any]]
+    max_megapixels: float = float("inf")
+
+
+def _batch_metrics_step(section: SyntheticSection) -> Callable[[], Any]:
+    from alveoleye.lungcv.mrcnn.metrics import compute_batch_metrics
+
+    labels = torch.tensor([instance.class_id for instance in section._instances])
+    targets = [{"masks": section.instance_masks, "labels": labels}]
+    predictions = [{"masks": section.instance_masks[:, None].float() * 0.9, "labels": labels}]
+    return partial(compute_batch_metrics, predictions, targets)
+
+
+def _dataset_step(section: SyntheticSection) -> Callable[[], Any]:
+    from alveoleye.lungcv.mrcnn.dataset import LungDataset
+
+    dataset = LungDataset(section.dataset_root, transforms=None, train=True, cache_bytes=0, annotation_store=None)
+    return partial(dataset.__getitem__, 0)
+
+
+# Benchmark cases in pipeline order
+CASES = {case.name: case for case in (
+    BenchmarkCase("convert_to_grayscale", lambda s: partial(convert_to_grayscale, s.image)),
+    BenchmarkCase("apply_dynamic_threshold", lambda s: partial(apply_dynamic_threshold, s.grayscale)),
+    BenchmarkCase("remove_small_components",
+                  lambda s: partial(remove_small_components, s.thresholded.copy(), DEFAULT_PARENCHYMA_MINIMUM_SIZE)),
+    BenchmarkCase("generate_postprocessing_labelmap",
+                  lambda s: partial(generate_postprocessing_labelmap, s.processing_labelmap, s.cleaned, s.labels)),
+    BenchmarkCase("calculate_mean_linear_intercept",
+                  lambda s: partial(calculate_mean_linear_intercept, s.labelmap, DEFAULT_LINES, DEFAULT_MIN_LENGTH,
+                                    DEFAULT_SCALE, s.labels)),
+    BenchmarkCase("calculate_airspace_volume_density",
+                  lambda s: partial(calculate_airspace_volume_density, s.labelmap, s.labels)),
+    BenchmarkCase("compute_batch_metrics", _batch_metrics_step, max_megapixels=16),
+    BenchmarkCase("LungDataset.__getitem__", _dataset_step, max_megapixels=16),
+)}
+
+
+# =============================================================================
+# Measurement
+# =============================================================================
+
+@dataclass
+class BenchmarkResult:
+    """Measurements of one case at one size.
+
+    Attributes:
+        case: Case name.
+        megapixels: Synthetic image size.
+        seconds: Median wall time of the timed runs.
+        min_seconds: Fastest timed run.
+        peak_rss_mb: High-water RSS of the process, inputs included (None
+            where the platform does not report it).
+        allocated_mb: Peak memory allocated by one run of the step.
+    """
+    case: str
+    megapixels: float
+    seconds: float
+    min_seconds: float
+    peak_rss_mb: Optional[float]
+    allocated_mb: float
+
+    @property
+    def key(self) -> str:
+        return baseline_key(self.case, self.megapixels)
+
+
+def baseline_key(case: str, megapixels: float) -> str:
+    return f"{case}@{megapixels:g}MP"
+
+
+def _peak_rss_mb() -> Optional[float]:
+    try:
+        import resource
+    except ImportError:
+        return None
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return peak / (1024 * 1024 if sys.platform == "darwin" else 1024)
+
+
+def measure_case(name: str, megapixels: float, repeats: int = DEFAULT_REPEATS, seed: int = 0) -> BenchmarkResult:
+    """Time one case at one size in the current process."""
+    case = CASES[name]
+    section = SyntheticSection(megapixels, seed)
+
+    try:
+        # Build the inputs and warm up caches outside the timed runs
+        case.setup(section)()
+        gc.collect()
+
+        times = []
+        for _ in range(repeats):
+            step = case.setup(section)
+            start = time.perf_counter()
+            step()
+            times.append(time.perf_counter() - start)
+            del step
+
+        peak_rss_mb = _peak_rss_mb()
+
+        step = case.setup(section)
+        tracemalloc.start()
+        try:
+            baseline_bytes = tracemalloc.get_traced_memory()[0]
+            step()
+            allocated = tracemalloc.get_traced_memory()[1] - baseline_bytes
+        finally:
+            tracemalloc.stop()
+    finally:
+        section.close()
+
+    return BenchmarkResult(
+        case=name,
+        megapixels=megapixels,
+        seconds=statistics.median(times),
+        min_seconds=min(times),
+        peak_rss_mb=peak_rss_mb,
+        allocated_mb=max(allocated, 0) / 2 ** 20,
+    )
+
+
+def run_benchmarks(
+    cases: Optional[Iterable[str]] = None,
+    megapixels: Sequence[float] = DEFAULT_MEGAPIXELS,
+    repeats: int = DEFAULT_REPEATS,
+    seed: int = 0,
+    isolate: bool = True,
+    progress: Optional[Callable[[BenchmarkResult], None]] = None,
+) -> List[BenchmarkResult]:
+    """Run benchmark cases at each size.
+
+    Args:
+        cases: Case names (all cases if None).
+        megapixels: Synthetic image sizes; cases skip sizes above their
+            max_megapixels.
+        repeats: Timed runs per case and size.
+        seed: Seed of the synthetic sections.
+        isolate: Run every case and size in a fresh process so peak RSS is
+            per case. Without it, peak RSS only ever grows, and a size that
+            does not fit in memory takes the whole run down.
+        progress: Called with each result as it completes.
+
+    Returns:
+        One BenchmarkResult per case and size, sizes in the inner loop.
+        Sizes that ran out of memory are skipped with a warning.
+
+    Raises:
+        ValueError: If a case is unknown or repeats is below 1.
+    """
+    names = list(cases) if cases is not None else list(CASES)
+    unknown = [name for name in names if name not in CASES]
+    if unknown:
+        raise ValueError(f"Unknown benchmark cases {unknown}, expected some of {list(CASES)}")
+    if repeats < 1:
+        raise ValueError(f"repeats must be at least 1, got {repeats}")
+
+    results = []
+    for name in names:
+        for size in megapixels:
+            if size > CASES[name].max_megapixels:
+                continue
+
+            try:
+                if isolate:
+                    with ProcessPoolExecutor(1, mp_context=multiprocessing.get_context("spawn")) as executor:
+                        result = executor.submit(measure_case, name, size, repeats, seed).result()
+                else:
+                    result = measure_case(name, size, repeats, seed)
+            except (BrokenProcessPool, MemoryError):
+                print(f"[!] Skipped {baseline_key(name, size)}: ran out of memory")
+                continue
+
+            results.append(result)
+            if progress is not None:
+                progress(result)
+
+    return results
+
+
+# =============================================================================
+# Baselines
+# =============================================================================
+
+@dataclass
+class Regression:
+    """A metric of a case that grew past the regression threshold."""
+    key: str
+    metric: str
+    baseline: float
+    current: float
+
+    @property
+    def ratio(self) -> float:
+        return self.current / self.baseline if self.baseline else float("inf")
+
+
+def machine_info() -> Dict[str, Any]:
+    """Where a baseline was recorded; baselines only compare on the same machine."""
+    return {
+        "platform": platform.platform(),
+        "processor": platform.processor() or platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "opencv": cv2.__version__,
+        "torch": torch.__version__,
+    }
+
+
+def save_baseline(results: Sequence[BenchmarkResult], path: Union[str, Path] = BASELINE_PATH) -> Path:
+    """Write results as a baseline JSON file."""
+    payload = {
+        "version": BASELINE_FORMAT_VERSION,
+        "machine": machine_info(),
+        "results": {result.key: asdict(result) for result in results},
+    }
+
+    path = Path(path)
+    path.write_text(json.dumps(payload, indent=2) + "\n")
+    return path
+
+
+def load_baseline(path: Union[str, Path] = BASELINE_PATH) -> Dict[str, Any]:
+    """Read a baseline written by save_baseline.
+
+    Raises:
+        FileNotFoundError: If there is no baseline at path.
+        ValueError: If the file has another layout version.
+    """
+    payload = json.loads(Path(path).read_text())
+    if payload.get("version") != BASELINE_FORMAT_VERSION:
+        raise ValueError(f"Unsupported baseline version {payload.get('version')!r} in {path}")
+    return payload
+
+
+def compare_to_baseline(
+    results: Sequence[BenchmarkResult],
+    baseline: Dict[str, Any],
+    threshold: float = DEFAULT_REGRESSION_THRESHOLD,
+) -> List[Regression]:
+    """Metrics that grew by more than threshold over the baseline.
+
+    Cases and sizes missing from the baseline are not compared, and growth
+    below NOISE_FLOORS is ignored.
+    """
+    regressions = []
+    for result in results:
+        recorded = baseline["results"].get(result.key)
+        if recorded is None:
+            continue
+
+        for metric, floor in NOISE_FLOORS.items():
+            current, previous = getattr(result, metric), recorded.get(metric)
+            if current is None or previous is None:
+                continue
+
+            if current > previous * (1 + threshold) and current - previous > floor:
+                regressions.append(Regression(result.key, metric, previous, current))
+
+    return regressions
@@ -0,0 +1,158 @@
+"""Command-line interface for the offline benchmark suite.
+
+Times the postprocessing, assessment and data loading hot paths on
+synthetic sections (see alveoleye.lungcv.benchmark) and compares the
+results with a stored baseline. Exits with status 2 when a case regressed
+by more than the threshold.
+
+Usage:
+    alveoleye-benchmark
+    alveoleye-benchmark --megapixels 1 4 --cases calculate_mean_linear_intercept
+
+Example:
+    # Record a baseline on this machine, then check a change against it
+    alveoleye-benchmark --save-baseline baseline.json
+    alveoleye-benchmark --baseline baseline.json --threshold 0.1
+"""
+
+import argparse
+import json
+import sys
+import time
+from dataclasses import asdict
+
+from alveoleye.lungcv import benchmark
+
+
+def create_parser() -> argparse.ArgumentParser:
+    """Create the argument parser for the benchmark CLI.
+
+    Returns:
+        Configured ArgumentParser instance
+    """
+    parser = argparse.ArgumentParser(
+        description="Benchmark the AlveolEye postprocessing and assessment hot paths",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+
+    parser.add_argument(
+        "--cases",
+        type=str,
+        nargs="+",
+        default=list(benchmark.CASES),
+        choices=list(benchmark.CASES),
+        help="Benchmark cases to run",
+    )
+    parser.add_argument(
+        "--megapixels",
+        type=float,
+        nargs="+",
+        default=list(benchmark.DEFAULT_MEGAPIXELS),
+        help="Synthetic image sizes in megapixels",
+    )
+    parser.add_argument(
+        "--repeats",
+        type=int,
+        default=benchmark.DEFAULT_REPEATS,
+        help="Timed runs per case and size",
+    )
+    parser.add_argument(
+        "--seed",
+        type=int,
+        default=0,
+        help="Seed of the synthetic sections",
+    )
+    parser.add_argument(
+        "--in-process",
+        action="store_true",
+        help="Run all cases in this process (faster; peak RSS is then cumulative)",
+    )
+    parser.add_argument(
+        "--output",
+        type=str,
+        default=None,
+        help="Write the results as JSON to this file",
+    )
+
+    baseline_group = parser.add_argument_group("Baseline")
+    baseline_group.add_argument(
+        "--baseline",
+        type=str,
+        default=str(benchmark.BASELINE_PATH),
+        help="Baseline JSON to compare against",
+    )
+    baseline_group.add_argument(
+        "--no-compare",
+        action="store_true",
+        help="Skip the baseline comparison",
+    )
+    baseline_group.add_argument(
+        "--threshold",
+        type=float,
+        default=benchmark.DEFAULT_REGRESSION_THRESHOLD,
+        help="Relative growth over the baseline that counts as a regression",
+    )
+    baseline_group.add_argument(
+        "--save-baseline",
+        type=str,
+        default=None,
+        help="Write the results as a new baseline to this file",
+    )
+
+    return parser
+
+
+def _format_mb(value) -> str:
+    return "-" if value is None else f"{value:.1f}"
+
+
+def _print_result(result: benchmark.BenchmarkResult) -> None:
+    print(f"{result.case:<36} {result.megapixels:>6g} {1000 * result.seconds:>11.1f} "
+          f"{_format_mb(result.peak_rss_mb):>10} {_format_mb(result.allocated_mb):>10}")
+
+
+def main() -> None:
+    """Main entry point for the CLI."""
+    args = create_parser().parse_args()
+    start_time = time.time()
+
+    print(f"{'case':<36} {'MP':>6} {'ms':>11} {'peak MB':>10} {'alloc MB':>10}")
+
+    try:
+        if args.repeats < 1:
+            raise ValueError("repeats must be at least 1")
+
+        results = benchmark.run_benchmarks(args.cases, args.megapixels, args.repeats, args.seed,
+                                           isolate=not args.in_process, progress=_print_result)
+
+        if args.output:
+            with open(args.output, "w") as fh:
+                json.dump([asdict(result) for result in results], fh, indent=2)
+
+        if args.save_baseline:
+            print(f"[+] Saved baseline to {benchmark.save_baseline(results, args.save_baseline)}")
+
+        regressions = []
+        if not args.no_compare:
+            baseline = benchmark.load_baseline(args.baseline)
+            if baseline["machine"] != benchmark.machine_info():
+                print("[!] Baseline was recorded on another machine or environment")
+            regressions = benchmark.compare_to_baseline(results, baseline, args.threshold)
+    except KeyboardInterrupt:
+        print("\n[CLI] Benchmark interrupted by user")
+        sys.exit(130)
+    except Exception as e:
+        print(f"\nError during benchmark: {e}", file=sys.stderr)
+        sys.exit(1)
+
+    print(f"Elapsed time: {time.time() - start_time:.2f} seconds")
+
+    if regressions:
+        for regression in regressions:
+            print(f"[-] {regression.key} {regression.metric}: {regression.baseline:.4g} -> "
+                  f"{regression.current:.4g} ({regression.ratio:.2f}x)", file=sys.stderr)
+        sys.exit(2)
+
+
+if __name__ == "__main__":
+    main()
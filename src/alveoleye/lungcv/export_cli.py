@@ -0,0 +1,159 @@
+"""Command-line interface for exporting the model to CPU inference backends.
+
+Writes a scripted TorchScript artifact and/or an ONNX graph of a trained
+checkpoint, optionally with int8 dynamically quantized variants, and checks
+each one against the eager model on sample images. Exported files are used
+with ``alveoleye-infer --backend torchscript|onnx --weights FILE``.
+
+Usage:
+    alveoleye-export-model --weights model.pth --output-dir exported
+
+Example:
+    # TorchScript float and int8, checked on a few sections
+    alveoleye-export-model --weights model.pth --output-dir exported \
+        --formats torchscript --quantize --parity-images samples/
+
+    # ONNX graph (needs onnx and onnxruntime)
+    alveoleye-export-model --weights model.pth --output-dir exported --formats onnx
+"""
+
+import argparse
+import sys
+import time
+
+import torch
+
+from alveoleye.lungcv import backends, model_operations
+from alveoleye.lungcv.inference import collect_image_paths
+
+# Backend that loads each export name
+EXPORT_BACKENDS = {
+    "torchscript": "torchscript",
+    "torchscript-int8": "torchscript",
+    "onnx": "onnx",
+    "onnx-int8": "onnx",
+}
+
+
+def create_parser() -> argparse.ArgumentParser:
+    """Create the argument parser for the model export CLI.
+
+    Returns:
+        Configured ArgumentParser instance
+    """
+    parser = argparse.ArgumentParser(
+        description="Export the AlveolEye model to TorchScript/ONNX for CPU inference",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+
+    parser.add_argument(
+        "--weights",
+        type=str,
+        default=None,
+        help="Path to model weights (default weights if omitted)",
+    )
+    parser.add_argument(
+        "--output-dir",
+        type=str,
+        required=True,
+        help="Directory to write the exported models into",
+    )
+    parser.add_argument(
+        "--formats",
+        type=str,
+        nargs="+",
+        default=["torchscript", "onnx"],
+        choices=["torchscript", "onnx"],
+        help="Export formats",
+    )
+    parser.add_argument(
+        "--quantize",
+        action="store_true",
+        help="Also write int8 dynamically quantized variants",
+    )
+    parser.add_argument(
+        "--num-classes",
+        type=int,
+        default=model_operations.DEFAULT_NUM_CLASSES,
+        help="Number of output classes including background",
+    )
+
+    parity_group = parser.add_argument_group("Parity check")
+    parity_group.add_argument(
+        "--parity-images",
+        type=str,
+        nargs="+",
+        default=None,
+        help="Image directories, glob patterns or files to compare each export with the eager model on",
+    )
+    parity_group.add_argument(
+        "--parity-threshold",
+        type=float,
+        default=backends.DEFAULT_PARITY_THRESHOLD,
+        help="Minimum fraction of matching labelmap pixels per image",
+    )
+    parity_group.add_argument(
+        "--min-confidence",
+        type=float,
+        default=backends.DEFAULT_PARITY_CONFIDENCE,
+        help="Minimum confidence in percent for the compared labelmaps",
+    )
+
+    return parser
+
+
+def _print_report(name: str, report: backends.ParityReport, threshold: float) -> None:
+    status = "[+]" if report.passed(threshold) else "[-]"
+    fewest = min(report.detection_differences, default=0)
+    most = max(report.detection_differences, default=0)
+    print(f"{status} {name}: min agreement {report.min_agreement:.4f}, mean {report.mean_agreement:.4f}, "
+          f"detections {fewest:+d}..{most:+d}, "
+          f"{1000 * sum(report.candidate_seconds) / max(len(report.candidate_seconds), 1):.0f} ms/image "
+          f"({report.speedup:.2f}x eager)")
+
+
+def main() -> None:
+    """Main entry point for the CLI."""
+    args = create_parser().parse_args()
+    start_time = time.time()
+
+    try:
+        cpu = torch.device("cpu")
+        model = model_operations.init_trained_model(args.weights, args.num_classes, cpu)
+        paths = backends.export_model(model, args.output_dir, args.formats, args.quantize)
+
+        for name, path in paths.items():
+            print(f"[+] Saved {name} model to {path}")
+
+        failed = []
+        if args.parity_images:
+            from alveoleye._config_utils import Config
+
+            images = collect_image_paths(args.parity_images)
+            if not images:
+                raise ValueError("No images found for --parity-images")
+
+            labels = Config.get_labels()
+            for name, path in paths.items():
+                candidate = backends.load_backend(EXPORT_BACKENDS[name], path, args.num_classes, cpu)
+                report = backends.check_parity(model, candidate, images, labels, args.min_confidence)
+                _print_report(name, report, args.parity_threshold)
+
+                if not report.passed(args.parity_threshold):
+                    failed.append(name)
+    except KeyboardInterrupt:
+        print("\n[CLI] Export interrupted by user")
+        sys.exit(130)
+    except Exception as e:
+        print(f"\nError during export: {e}", file=sys.stderr)
+        sys.exit(1)
+
+    print(f"Elapsed time: {time.time() - start_time:.2f} seconds")
+
+    if failed:
+        print(f"[-] Parity check failed for: {', '.join(failed)}", file=sys.stderr)
+        sys.exit(2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,414 @@
+"""Headless batch inference over directories of lung sections.
+
+This module runs the same processing -> postprocessing -> assessments
+pipeline as the napari widget, without a viewer, over many images. Work is
+streamed through three stages:
+
+1. A thread pool decodes images from disk ahead of the model.
+2. A single inference stage runs the Mask R-CNN model and reduces its output
+   to a processing labelmap (the model is loaded once for the whole run).
+3. A process pool runs the OpenCV postprocessing and the ASVD/MLI
+   assessments, which are CPU bound and release the model stage early.
+
+Rows are appended to ``metrics.csv`` as soon as each image finishes, so an
+interrupted run keeps everything completed so far.
+
+Example:
+    from alveoleye.lungcv.inference import InferenceParameters, run_batch_inference
+
+    params = InferenceParameters(min_confidence=40, lines=10)
+    run_batch_inference(["sections/"], "out/", params)
+"""
+
+import csv
+import glob
+import os
+from concurrent.futures import (
+    ALL_COMPLETED,
+    FIRST_COMPLETED,
+    Executor,
+    Future,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+    wait,
+)
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from alveoleye._models import Result
+from alveoleye.lungcv import model_operations, tiling
+from alveoleye.lungcv.assessments import (
+    calculate_airspace_volume_density,
+    calculate_mean_linear_intercept,
+)
+from alveoleye.lungcv.postprocessor import (
+    apply_dynamic_threshold,
+    apply_manual_threshold,
+    convert_to_grayscale,
+    generate_postprocessing_labelmap,
+    generate_processing_labelmap,
+    get_dynamic_threshold_value,
+    invert_image_binary,
+    remove_small_components,
+)
+
+# =============================================================================
+# Constants
+# =============================================================================
+
+# Image formats accepted by the processing widget
+INFERENCE_IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".bmp", ".tiff", ".tif")
+
+# Defaults mirror the widget defaults in config.json
+DEFAULT_MIN_CONFIDENCE = 30
+DEFAULT_ALVEOLI_MINIMUM_SIZE = 500
+DEFAULT_PARENCHYMA_MINIMUM_SIZE = 250
+DEFAULT_LINES = 3
+DEFAULT_MIN_LENGTH = 20
+DEFAULT_SCALE = 1.0
+
+# Default number of decoder threads
+DEFAULT_DECODE_WORKERS = 4
+
+# Name of the incrementally written metrics file
+METRICS_FILE_NAME = "metrics.csv"
+
+
+# =============================================================================
+# Parameters
+# =============================================================================
+
+@dataclass
+class InferenceParameters:
+    """Pipeline parameters, matching the inputs recorded in a Result.
+
+    Attributes:
+        use_computer_vision: Run the model; if False an empty processing
+            labelmap is used, as with the widget checkbox unticked.
+        weights: Path to model weights (None uses the default weights).
+        min_confidence: Minimum confidence in percent (0-100).
+        manual_threshold: Fixed threshold value, or None for the dynamic
+            (Otsu-based) threshold.
+        alveoli_minimum_size: Remove small particles below this size.
+        parenchyma_minimum_size: Remove small holes below this size.
+        calculate_asvd: Compute airspace volume density.
+        calculate_mli: Compute mean linear intercept.
+        lines: Number of MLI test lines.
+        min_length: Minimum MLI chord length in pixels.
+        scale: Physical length of one pixel.
+        tile_size: Run the model on overlapping tiles of this size, or None
+            to process each image in a single pass.
+        tile_overlap: Overlap between neighbouring tiles in pixels.
+        backend: Inference backend (see alveoleye.lungcv.backends). The
+            torchscript and onnx backends take an exported model as weights.
+        preset: Inference preset trading accuracy for speed (see
+            alveoleye.lungcv.presets); onnx models only support "full".
+        low_res_masks: Rasterize the mask head outputs straight into the
+            processing labelmap instead of pasting full-size float masks
+            first. The labelmap is the same either way.
+    """
+    use_computer_vision: bool = True
+    weights: Optional[str] = None
+    min_confidence: float = DEFAULT_MIN_CONFIDENCE
+    manual_threshold: Optional[int] = None
+    alveoli_minimum_size: int = DEFAULT_ALVEOLI_MINIMUM_SIZE
+    parenchyma_minimum_size: int = DEFAULT_PARENCHYMA_MINIMUM_SIZE
+    calculate_asvd: bool = True
+    calculate_mli: bool = True
+    lines: int = DEFAULT_LINES
+    min_length: float = DEFAULT_MIN_LENGTH
+    scale: float = DEFAULT_SCALE
+    tile_size: Optional[int] = None
+    tile_overlap: int = tiling.DEFAULT_TILE_OVERLAP
+    backend: str = "eager"
+    preset: str = "full"
+    low_res_masks: bool = True
+
+    @property
+    def needs_model(self) -> bool:
+        """Whether the model stage has to run at all."""
+        return self.use_computer_vision and self.min_confidence != 100
+
+
+# =============================================================================
+# Input Discovery
+# =============================================================================
+
+def collect_image_paths(inputs: Iterable[str], recursive: bool = False) -> List[str]:
+    """Expand directories, glob patterns and files into a sorted image list.
+
+    Args:
+        inputs: Directories, glob patterns or individual image files.
+        recursive: Descend into subdirectories of directory inputs.
+
+    Returns:
+        De-duplicated list of image paths, in sorted order.
+    """
+    found = []
+
+    for item in inputs:
+        if os.path.isdir(item):
+            pattern = os.path.join(item, "**", "*") if recursive else os.path.join(item, "*")
+            candidates = glob.glob(pattern, recursive=recursive)
+        else:
+            candidates = glob.glob(item, recursive=recursive) or [item]
+
+        found.extend(
+            path for path in candidates
+            if os.path.isfile(path) and path.lower().endswith(INFERENCE_IMAGE_EXTENSIONS)
+        )
+
+    return sorted(set(found))
+
+
+# =============================================================================
+# Pipeline Stages
+# =============================================================================
+
+def decode_image(image_path: str) -> np.ndarray:
+    """Decode an image the way the widget does (RGB, like the napari image layer)."""
+    image = cv2.imread(image_path, cv2.IMREAD_COLOR)
+
+    if image is None:
+        raise ValueError(f"cv2.imread failed for: {image_path}")
+
+    return cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+
+
+def run_inference_stage(
+    image: np.ndarray,
+    model: Any,
+    params: InferenceParameters,
+    labels: Dict[str, int],
+) -> np.ndarray:
+    """Run the model on a decoded RGB image and return the processing labelmap."""
+    if model is None or not params.needs_model:
+        return np.zeros(image.shape[:2], dtype=np.uint8)
+
+    if params.tile_size is not None:
+        return tiling.generate_tiled_processing_labelmap(
+            image, model, params.min_confidence, labels,
+            tile_size=params.tile_size, overlap=params.tile_overlap,
+        )
+
+    model_output = model_operations.run_prediction(image, model, low_res_masks=params.low_res_masks)
+
+    return generate_processing_labelmap(model_output, image.shape, params.min_confidence, labels)
+
+
+def postprocess_and_assess(
+    image: np.ndarray,
+    inference_labelmap: np.ndarray,
+    params: InferenceParameters,
+    labels: Dict[str, int],
+) -> Dict[str, Any]:
+    """Run postprocessing and assessments for one decoded RGB image.
+
+    This is the CPU-bound half of the pipeline and is safe to run in a
+    separate process.
+
+    Returns:
+        Dict with the computed threshold value and metric fields of a Result.
+    """
+    grayscaled = convert_to_grayscale(image)
+
+    if params.manual_threshold is not None:
+        threshold_value = params.manual_threshold
+        thresholded = apply_manual_threshold(grayscaled, threshold_value)
+    else:
+        dynamic_threshold_value = get_dynamic_threshold_value(grayscaled)
+        threshold_value = round(dynamic_threshold_value)
+        thresholded = apply_dynamic_threshold(grayscaled, threshold_value=dynamic_threshold_value)
+
+    parenchyma_cleaned = remove_small_components(thresholded, params.parenchyma_minimum_size)
+    inverted = invert_image_binary(parenchyma_cleaned)
+    alveoli_cleaned = remove_small_components(inverted, params.alveoli_minimum_size)
+    inverted_back = invert_image_binary(alveoli_cleaned)
+
+    labelmap = generate_postprocessing_labelmap(inference_labelmap, inverted_back, labels)
+
+    metrics: Dict[str, Any] = {"threshold_value": threshold_value}
+
+    if params.calculate_asvd:
+        asvd, airspace_pixels, non_airspace_pixels = calculate_airspace_volume_density(labelmap, labels)
+        metrics.update(asvd=asvd, airspace_pixels=airspace_pixels, non_airspace_pixels=non_airspace_pixels)
+
+    if params.calculate_mli:
+        mli, _, chords, stdev = calculate_mean_linear_intercept(
+            labelmap, params.lines, params.min_length, params.scale, labels
+        )
+        metrics.update(mli=mli, chords=chords, stdev=stdev)
+
+    return metrics
+
+
+def build_result(image_path: str, params: InferenceParameters, metrics: Dict[str, Any]) -> Result:
+    """Combine the run parameters and one image's metrics into a Result."""
+    weights_name = os.path.basename(str(params.weights)) if params.weights else None
+
+    return Result(
+        image_file_name=os.path.basename(image_path),
+        use_computer_vision=params.use_computer_vision,
+        weights_file_name=weights_name,
+        min_confidence=params.min_confidence,
+        used_manual_threshold=params.manual_threshold is not None,
+        threshold_value=metrics.get("threshold_value"),
+        remove_small_particles=params.alveoli_minimum_size,
+        remove_small_holes=params.parenchyma_minimum_size,
+        calculate_asvd=params.calculate_asvd,
+        calculate_mli=params.calculate_mli,
+        lines=params.lines,
+        min_length=params.min_length,
+        scale=params.scale,
+        asvd=metrics.get("asvd"),
+        airspace_pixels=metrics.get("airspace_pixels"),
+        non_airspace_pixels=metrics.get("non_airspace_pixels"),
+        mli=metrics.get("mli"),
+        stdev=metrics.get("stdev"),
+        chords=metrics.get("chords"),
+    )
+
+
+# =============================================================================
+# Executors
+# =============================================================================
+
+class _SerialExecutor(Executor):
+    """Executor that runs work inline; used when no worker processes are requested."""
+
+    def submit(self, fn, *args, **kwargs) -> Future:
+        future: Future = Future()
+        try:
+            future.set_result(fn(*args, **kwargs))
+        except BaseException as e:
+            future.set_exception(e)
+        return future
+
+
+def _prefetch(
+    decoder: Executor,
+    image_paths: List[str],
+    depth: int,
+) -> Iterator[Tuple[int, str, Future]]:
+    """Yield decode futures in input order, keeping at most depth in flight."""
+    queued: List[Tuple[int, str, Future]] = []
+    position = 0
+
+    while position < len(image_paths) or queued:
+        while position < len(image_paths) and len(queued) < depth:
+            path = image_paths[position]
+            queued.append((position, path, decoder.submit(decode_image, path)))
+            position += 1
+
+        yield queued.pop(0)
+
+
+# =============================================================================
+# Batch Runner
+# =============================================================================
+
+def run_batch_inference(
+    inputs: Iterable[str],
+    output_dir: str,
+    params: InferenceParameters,
+    labels: Optional[Dict[str, int]] = None,
+    decode_workers: int = DEFAULT_DECODE_WORKERS,
+    postprocess_workers: Optional[int] = None,
+    recursive: bool = False,
+    progress: Optional[Callable[[int, int, str], None]] = None,
+) -> str:
+    """Run the full pipeline over many images and write metrics.csv.
+
+    Args:
+        inputs: Directories, glob patterns or image files.
+        output_dir: Directory that receives metrics.csv.
+        params: Pipeline parameters shared by every image.
+        labels: Label values; defaults to the Labels section of config.json.
+        decode_workers: Number of decoder threads.
+        postprocess_workers: Number of postprocessing processes. None uses
+            os.cpu_count(); 0 runs postprocessing inline.
+        recursive: Descend into subdirectories of directory inputs.
+        progress: Optional callable receiving (completed, total, image_path)
+            after every image, including images that failed.
+
+    Returns:
+        Path to the written metrics file.
+
+    Raises:
+        ValueError: If no images match the inputs.
+    """
+    image_paths = collect_image_paths(inputs, recursive)
+    if not image_paths:
+        raise ValueError("No images found for the given inputs")
+
+    if labels is None:
+        from alveoleye._config_utils import Config
+        labels = Config.get_labels()
+
+    os.makedirs(output_dir, exist_ok=True)
+    metrics_path = os.path.join(output_dir, METRICS_FILE_NAME)
+    fieldnames = ["case_id"] + list(Result().to_dict())
+
+    model = None
+    if params.needs_model:
+        model = model_operations.get_trained_model(params.weights, backend=params.backend,
+                                                   preset=params.preset)
+
+    if postprocess_workers is None:
+        postprocess_workers = os.cpu_count() or 1
+
+    pool: Executor = ProcessPoolExecutor(postprocess_workers) if postprocess_workers > 0 else _SerialExecutor()
+    max_pending = max(1, 2 * postprocess_workers)
+    total = len(image_paths)
+    completed = 0
+
+    with ThreadPoolExecutor(max(1, decode_workers)) as decoder, pool, \
+            open(metrics_path, "w", newline="") as fh:
+        writer = csv.DictWriter(fh, fieldnames=fieldnames)
+        writer.writeheader()
+        fh.flush()
+
+        pending: Dict[Future, Tuple[int, str]] = {}
+
+        def _drain(return_when) -> None:
+            nonlocal completed
+            done, _ = wait(pending, return_when=return_when)
+
+            for future in done:
+                idx, path = pending.pop(future)
+                completed += 1
+
+                try:
+                    metrics = future.result()
+                except Exception as e:
+                    print(f"[-] Error in post-processing {path}: {e}")
+                else:
+                    writer.writerow({"case_id": idx + 1, **build_result(path, params, metrics).to_dict()})
+                    fh.flush()
+
+                if progress:
+                    progress(completed, total, path)
+
+        for idx, path, decoded in _prefetch(decoder, image_paths, max(1, 2 * decode_workers)):
+            try:
+                image = decoded.result()
+                inference_labelmap = run_inference_stage(image, model, params, labels)
+            except Exception as e:
+                completed += 1
+                print(f"[-] Error in processing {path}: {e}")
+                if progress:
+                    progress(completed, total, path)
+                continue
+
+            pending[pool.submit(postprocess_and_assess, image, inference_labelmap, params, labels)] = (idx, path)
+
+            if len(pending) >= max_pending:
+                _drain(FIRST_COMPLETED)
+
+        if pending:
+            _drain(ALL_COMPLETED)
+
+    return metrics_path
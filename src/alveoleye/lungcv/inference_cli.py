@@ -0,0 +1,304 @@
+"""Command-line interface for headless batch inference.
+
+Runs the processing, postprocessing and assessment steps of the napari
+widget over a directory (or glob) of images and writes metrics.csv.
+
+Usage:
+    alveoleye-infer /path/to/sections --output-dir results
+    alveoleye-infer "study/**/*.tif" --recursive --output-dir results --lines 10
+
+Example:
+    # Default weights and widget defaults
+    alveoleye-infer sections/ --output-dir out
+
+    # Whole-slide scans, stitched from 1024 px tiles
+    alveoleye-infer slides/ --output-dir out --tile-size 1024
+
+    # Manual threshold, custom weights, 8 postprocessing processes
+    alveoleye-infer sections/ --output-dir out --weights model.pth \
+        --manual-threshold 180 --workers 8
+
+    # Quantized TorchScript model written by alveoleye-export-model
+    alveoleye-infer sections/ --output-dir out --backend torchscript \
+        --weights exported/model.int8.torchscript.pt
+
+    # Smaller model inputs and fewer proposals for quick screening
+    alveoleye-infer sections/ --output-dir out --preset fast
+"""
+
+import argparse
+import os
+import sys
+import time
+
+from alveoleye.lungcv.backends import DEFAULT_BACKEND, available_backends
+from alveoleye.lungcv.presets import DEFAULT_PRESET, available_presets
+from alveoleye.lungcv.inference import (
+    DEFAULT_ALVEOLI_MINIMUM_SIZE,
+    DEFAULT_DECODE_WORKERS,
+    DEFAULT_LINES,
+    DEFAULT_MIN_CONFIDENCE,
+    DEFAULT_MIN_LENGTH,
+    DEFAULT_PARENCHYMA_MINIMUM_SIZE,
+    DEFAULT_SCALE,
+    InferenceParameters,
+    run_batch_inference,
+)
+from alveoleye.lungcv.tiling import DEFAULT_TILE_OVERLAP
+
+
+def create_parser() -> argparse.ArgumentParser:
+    """Create the argument parser for the inference CLI.
+
+    Returns:
+        Configured ArgumentParser instance
+    """
+    parser = argparse.ArgumentParser(
+        description="Run the AlveolEye pipeline over a directory of lung sections",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+
+    parser.add_argument(
+        "inputs",
+        type=str,
+        nargs="+",
+        help="Image directories, glob patterns or image files",
+    )
+    parser.add_argument(
+        "--output-dir",
+        type=str,
+        required=True,
+        help="Directory to write metrics.csv into",
+    )
+    parser.add_argument(
+        "--recursive",
+        action="store_true",
+        help="Descend into subdirectories of input directories",
+    )
+
+    # Processing
+    processing_group = parser.add_argument_group("Processing")
+    processing_group.add_argument(
+        "--weights",
+        type=str,
+        default=None,
+        help="Path to model weights (default weights if omitted)",
+    )
+    processing_group.add_argument(
+        "--backend",
+        type=str,
+        default=DEFAULT_BACKEND,
+        choices=available_backends(),
+        help="Inference backend; torchscript and onnx load an exported model from --weights",
+    )
+    processing_group.add_argument(
+        "--preset",
+        type=str,
+        default=DEFAULT_PRESET,
+        choices=available_presets(),
+        help="Inference preset; balanced and fast run on smaller images with fewer proposals",
+    )
+    processing_group.add_argument(
+        "--full-res-masks",
+        action="store_true",
+        help="Paste full-size instance masks before building the labelmap (slower, same result)",
+    )
+    processing_group.add_argument(
+        "--no-ai",
+        action="store_true",
+        help="Skip the model and use an empty processing labelmap",
+    )
+    processing_group.add_argument(
+        "--min-confidence",
+        type=float,
+        default=DEFAULT_MIN_CONFIDENCE,
+        help="Minimum confidence in percent",
+    )
+    processing_group.add_argument(
+        "--tile-size",
+        type=int,
+        default=None,
+        help="Run the model on overlapping tiles of this size (whole image if omitted)",
+    )
+    processing_group.add_argument(
+        "--tile-overlap",
+        type=int,
+        default=DEFAULT_TILE_OVERLAP,
+        help="Overlap between neighbouring tiles in pixels",
+    )
+
+    # Postprocessing
+    postprocessing_group = parser.add_argument_group("Postprocessing")
+    postprocessing_group.add_argument(
+        "--manual-threshold",
+        type=int,
+        default=None,
+        help="Fixed threshold value (dynamic threshold if omitted)",
+    )
+    postprocessing_group.add_argument(
+        "--alveoli-min-size",
+        type=int,
+        default=DEFAULT_ALVEOLI_MINIMUM_SIZE,
+        help="Remove small particles below this size",
+    )
+    postprocessing_group.add_argument(
+        "--parenchyma-min-size",
+        type=int,
+        default=DEFAULT_PARENCHYMA_MINIMUM_SIZE,
+        help="Remove small holes below this size",
+    )
+
+    # Assessments
+    assessments_group = parser.add_argument_group("Assessments")
+    assessments_group.add_argument(
+        "--no-asvd",
+        action="store_true",
+        help="Skip airspace volume density",
+    )
+    assessments_group.add_argument(
+        "--no-mli",
+        action="store_true",
+        help="Skip mean linear intercept",
+    )
+    assessments_group.add_argument(
+        "--lines",
+        type=int,
+        default=DEFAULT_LINES,
+        help="Number of MLI test lines",
+    )
+    assessments_group.add_argument(
+        "--min-length",
+        type=float,
+        default=DEFAULT_MIN_LENGTH,
+        help="Minimum MLI chord length in pixels",
+    )
+    assessments_group.add_argument(
+        "--scale",
+        type=float,
+        default=DEFAULT_SCALE,
+        help="Physical length of one pixel",
+    )
+
+    # Parallelism
+    parallel_group = parser.add_argument_group("Parallelism")
+    parallel_group.add_argument(
+        "--decode-workers",
+        type=int,
+        default=DEFAULT_DECODE_WORKERS,
+        help="Number of image decoding threads",
+    )
+    parallel_group.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        help="Number of postprocessing processes (default: CPU count, 0 runs inline)",
+    )
+
+    return parser
+
+
+def validate_arguments(args) -> None:
+    """Validate CLI arguments before running.
+
+    Args:
+        args: Parsed argparse Namespace
+
+    Raises:
+        ValueError: If any argument is invalid
+    """
+    if args.weights and not os.path.isfile(args.weights):
+        raise ValueError(f"Weights file does not exist: {args.weights}")
+
+    if args.backend not in ("eager", "int8") and not args.weights:
+        raise ValueError(f"The {args.backend} backend needs --weights pointing to an exported model")
+
+    if args.backend == "onnx" and args.preset != DEFAULT_PRESET:
+        raise ValueError(f"The onnx backend only supports the {DEFAULT_PRESET} preset")
+
+    if not 0 <= args.min_confidence <= 100:
+        raise ValueError("min_confidence must be between 0 and 100")
+
+    if args.manual_threshold is not None and not 0 <= args.manual_threshold <= 255:
+        raise ValueError("manual_threshold must be between 0 and 255")
+
+    if args.tile_size is not None and args.tile_size < 1:
+        raise ValueError("tile_size must be at least 1")
+
+    if args.tile_size is not None and not 0 <= args.tile_overlap < args.tile_size:
+        raise ValueError("tile_overlap must be non-negative and smaller than tile_size")
+
+    if args.lines < 1:
+        raise ValueError("lines must be at least 1")
+
+    if args.decode_workers < 1:
+        raise ValueError("decode_workers must be at least 1")
+
+    if args.workers is not None and args.workers < 0:
+        raise ValueError("workers must be non-negative")
+
+    if args.no_asvd and args.no_mli:
+        raise ValueError("At least one of ASVD or MLI must be calculated")
+
+
+def build_parameters_from_args(args) -> InferenceParameters:
+    """Build InferenceParameters from parsed CLI arguments."""
+    return InferenceParameters(
+        use_computer_vision=not args.no_ai,
+        weights=args.weights,
+        min_confidence=args.min_confidence,
+        manual_threshold=args.manual_threshold,
+        alveoli_minimum_size=args.alveoli_min_size,
+        parenchyma_minimum_size=args.parenchyma_min_size,
+        calculate_asvd=not args.no_asvd,
+        calculate_mli=not args.no_mli,
+        lines=args.lines,
+        min_length=args.min_length,
+        scale=args.scale,
+        tile_size=args.tile_size,
+        tile_overlap=args.tile_overlap,
+        backend=args.backend,
+        preset=args.preset,
+        low_res_masks=not args.full_res_masks,
+    )
+
+
+def _print_progress(completed: int, total: int, image_path: str) -> None:
+    print(f"[+] Processed {completed}/{total} images", end="\r")
+
+
+def main() -> None:
+    """Main entry point for the CLI."""
+    parser = create_parser()
+    args = parser.parse_args()
+
+    try:
+        validate_arguments(args)
+    except ValueError as e:
+        print(f"\033[91mError:\033[0m {e}", file=sys.stderr)
+        sys.exit(1)
+
+    start_time = time.time()
+
+    try:
+        metrics_path = run_batch_inference(
+            args.inputs,
+            args.output_dir,
+            build_parameters_from_args(args),
+            decode_workers=args.decode_workers,
+            postprocess_workers=args.workers,
+            recursive=args.recursive,
+            progress=_print_progress,
+        )
+    except KeyboardInterrupt:
+        print("\n[CLI] Inference interrupted by user")
+        sys.exit(130)
+    except Exception as e:
+        print(f"\nError during inference: {e}", file=sys.stderr)
+        sys.exit(1)
+
+    print(f"\n[+] Saved metrics to {metrics_path}")
+    print(f"Elapsed time: {time.time() - start_time:.2f} seconds")
+
+
+if __name__ == "__main__":
+    main()
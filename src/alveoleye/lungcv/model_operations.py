@@ -4,17 +4,25 @@ This module provides functions for initializing, loading, and running
 inference with Mask R-CNN models for lung tissue segmentation.
 """
 
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
 from pathlib import Path
-from typing import Any, Dict, Optional, Union, List
+from typing import Any, Dict, Optional, Sequence, Tuple, Union, List
 from packaging.version import Version
 
+import numpy as np
 import torch
 from PIL import Image
 from torchvision.models.detection import MaskRCNN, maskrcnn_resnet50_fpn, MaskRCNN_ResNet50_FPN_Weights
 from torchvision.models.detection.faster_rcnn import FastRCNNPredictor
 from torchvision.models.detection.mask_rcnn import MaskRCNNPredictor
+from torchvision.models.detection.transform import GeneralizedRCNNTransform, resize_boxes
 from torchvision.transforms import v2 as T
 
+from alveoleye.lungcv.postprocessor import LOW_RES_MASKS_KEY
+from alveoleye.lungcv.profiling import profiled
+
 # =============================================================================
 # Constants
 # =============================================================================
@@ -34,6 +42,12 @@ MASK_PREDICTOR_HIDDEN_LAYER = 256
 # Default augmentation probability
 DEFAULT_AUGMENTATION_PROBABILITY = 0.15
 
+# Default number of trained models kept in the process-wide registry
+DEFAULT_MODEL_CACHE_SIZE = 2
+
+# Default number of images per forward pass in run_predictions
+DEFAULT_PREDICTION_BATCH_SIZE = 4
+
 
 # =============================================================================
 # Device Utilities
@@ -224,27 +238,16 @@ def init_untrained_model(num_classes: int = DEFAULT_NUM_CLASSES) -> MaskRCNN:
     return model
 
 
-def init_trained_model(
-    model_path: Optional[Union[str, Path]] = None,
-    num_classes: int = DEFAULT_NUM_CLASSES,
-) -> MaskRCNN:
-    """Initialize a trained Mask R-CNN model.
-
-    Loads model weights from the specified path, or downloads default
-    weights from Google Drive if not available locally.
+def resolve_weights_path(model_path: Optional[Union[str, Path]] = None) -> Path:
+    """Resolve the weights file to load, downloading the defaults if needed.
 
     Args:
         model_path: Path to model weights file. If None or doesn't exist,
                    uses/downloads default weights.
-        num_classes: Number of output classes including background.
 
     Returns:
-        Trained MaskRCNN model ready for inference.
+        Absolute path to an existing weights file.
     """
-    device = get_device()
-    model = init_untrained_model(num_classes)
-
-    # Determine weights path
     weights_path = Path(model_path) if model_path else DEFAULT_WEIGHTS_PATH
 
     if not weights_path.exists():
@@ -273,6 +276,35 @@ def init_trained_model(
                     url=DEFAULT_WEIGHTS_DRIVE_URL,
                     output=str(weights_path)
                 )
+
+    return weights_path.resolve()
+
+
+def init_trained_model(
+    model_path: Optional[Union[str, Path]] = None,
+    num_classes: int = DEFAULT_NUM_CLASSES,
+    device: Optional[torch.device] = None,
+) -> MaskRCNN:
+    """Initialize a trained Mask R-CNN model.
+
+    Loads model weights from the specified path, or downloads default
+    weights from Google Drive if not available locally. This always
+    builds a fresh model; use get_trained_model to reuse a cached one.
+
+    Args:
+        model_path: Path to model weights file. If None or doesn't exist,
+                   uses/downloads default weights.
+        num_classes: Number of output classes including background.
+        device: Device to place the model on. Defaults to get_device().
+
+    Returns:
+        Trained MaskRCNN model ready for inference.
+    """
+    device = device if device is not None else get_device()
+    model = init_untrained_model(num_classes)
+
+    weights_path = resolve_weights_path(model_path)
+
     # Load weights robustly, avoiding unpickling full DDP-wrapped models
     checkpoint = load_checkpoint(weights_path, device)
     
@@ -307,35 +339,315 @@ def init_trained_model(
     return model
 
 
+# =============================================================================
+# Model Registry
+# =============================================================================
+
+ModelKey = Tuple[str, int, int, int, str, str]
+
+
+class ModelRegistry:
+    """Bounded LRU cache of trained models.
+
+    Models are keyed by the resolved weights path, the checkpoint's
+    modification time and size, the number of classes, the device and the
+    inference backend, so a checkpoint that is overwritten on disk is
+    reloaded on next access while an unchanged one is reused. Each entry
+    holds the loaded model, which runs the "full" inference preset, and a
+    weight-sharing view per other preset asked for (see
+    alveoleye.lungcv.presets.with_inference_preset); the loaded model is
+    never retuned, so callers asking for different presets, from any
+    thread, each run their own.
+
+    Attributes:
+        max_size: Maximum number of models kept alive at once.
+    """
+
+    def __init__(self, max_size: int = DEFAULT_MODEL_CACHE_SIZE) -> None:
+        if max_size < 1:
+            raise ValueError(f"max_size must be at least 1, got {max_size}")
+
+        self.max_size = max_size
+        self._models: "OrderedDict[ModelKey, Dict[str, MaskRCNN]]" = OrderedDict()
+        self._lock = threading.RLock()
+
+    @staticmethod
+    def make_key(
+        weights_path: Path,
+        num_classes: int,
+        device: torch.device,
+        backend: str = "eager",
+    ) -> ModelKey:
+        """Build the cache key for an already resolved weights file."""
+        stat = weights_path.stat()
+        return str(weights_path), stat.st_mtime_ns, stat.st_size, num_classes, str(device), backend
+
+    def get(
+        self,
+        model_path: Optional[Union[str, Path]] = None,
+        num_classes: int = DEFAULT_NUM_CLASSES,
+        device: Optional[torch.device] = None,
+        backend: str = "eager",
+        preset: str = "full",
+    ) -> MaskRCNN:
+        """Return a cached model, loading it on a miss.
+
+        Args:
+            model_path: Path to model weights file (see init_trained_model),
+                or to an exported model for the torchscript and onnx backends.
+            num_classes: Number of output classes including background.
+            device: Device for the model. Defaults to get_device().
+            backend: Inference backend (see alveoleye.lungcv.backends).
+            preset: Inference preset (see alveoleye.lungcv.presets).
+
+        Returns:
+            Trained model in eval mode, with the MaskRCNN call interface.
+        """
+        from alveoleye.lungcv.presets import DEFAULT_PRESET, get_preset, with_inference_preset
+
+        get_preset(preset)
+        device = device if device is not None else get_device()
+
+        if backend == "eager":
+            weights_path = resolve_weights_path(model_path)
+        else:
+            from alveoleye.lungcv import backends
+            weights_path = backends.resolve_model_path(backend, model_path)
+
+        key = self.make_key(weights_path, num_classes, device, backend)
+
+        with self._lock:
+            presets = self._models.get(key)
+            if presets is not None:
+                self._models.move_to_end(key)
+            else:
+                # Drop entries for an older version of the same checkpoint
+                self._evict_matching(lambda k: k[0] == key[0] and k[1:3] != key[1:3])
+
+                if backend == "eager":
+                    model = init_trained_model(weights_path, num_classes, device)
+                else:
+                    model = backends.load_backend(backend, weights_path, num_classes, device)
+                install_low_res_masks(model)
+                presets = self._models[key] = {DEFAULT_PRESET: model}
+
+                while len(self._models) > self.max_size:
+                    self._models.popitem(last=False)
+
+            if preset not in presets:
+                presets[preset] = with_inference_preset(presets[DEFAULT_PRESET], preset)
+
+            return presets[preset]
+
+    def warm_up(
+        self,
+        model_path: Optional[Union[str, Path]] = None,
+        num_classes: int = DEFAULT_NUM_CLASSES,
+        device: Optional[torch.device] = None,
+        image_size: Tuple[int, int] = (256, 256),
+    ) -> MaskRCNN:
+        """Load a model into the cache and run one dummy forward pass.
+
+        The first forward pass pays for lazy allocations (cuDNN autotuning,
+        allocator growth); doing it ahead of time keeps the first real
+        prediction from being slower than the rest.
+
+        Args:
+            model_path: Path to model weights file.
+            num_classes: Number of output classes including background.
+            device: Device for the model. Defaults to get_device().
+            image_size: (height, width) of the dummy input.
+
+        Returns:
+            The cached MaskRCNN model.
+        """
+        device = device if device is not None else get_device()
+        model = self.get(model_path, num_classes, device)
+
+        with torch.no_grad():
+            model([torch.zeros((3, *image_size), device=device)])
+
+        return model
+
+    def evict(self, model_path: Optional[Union[str, Path]] = None) -> int:
+        """Remove cached models.
+
+        Args:
+            model_path: If given, only models loaded from this weights file
+                are removed; otherwise the whole cache is cleared.
+
+        Returns:
+            Number of models removed.
+        """
+        if model_path is None:
+            return self._evict_matching(lambda k: True)
+
+        target = str(Path(model_path).resolve())
+        return self._evict_matching(lambda k: k[0] == target)
+
+    def _evict_matching(self, predicate) -> int:
+        with self._lock:
+            stale = [k for k in self._models if predicate(k)]
+            for k in stale:
+                del self._models[k]
+
+        if stale and torch.cuda.is_available():
+            torch.cuda.empty_cache()
+
+        return len(stale)
+
+    def __contains__(self, key: ModelKey) -> bool:
+        return key in self._models
+
+    def __len__(self) -> int:
+        return len(self._models)
+
+
+# Process-wide registry shared by the GUI workers and the paper scripts
+MODEL_REGISTRY = ModelRegistry()
+
+
+@profiled("load_model")
+def get_trained_model(
+    model_path: Optional[Union[str, Path]] = None,
+    num_classes: int = DEFAULT_NUM_CLASSES,
+    device: Optional[torch.device] = None,
+    backend: str = "eager",
+    preset: str = "full",
+) -> MaskRCNN:
+    """Return a trained model from the process-wide registry.
+
+    Reloads only when the checkpoint at model_path has changed since it was
+    last loaded. Every inference preset (see alveoleye.lungcv.presets) has
+    its own registry entry sharing the loaded weights. See ModelRegistry.get
+    for the arguments.
+    """
+    return MODEL_REGISTRY.get(model_path, num_classes, device, backend, preset)
+
+
 # =============================================================================
 # Inference
 # =============================================================================
 
+ImageInput = Union[str, Path, np.ndarray]
+
+
+def _load_image_tensor(image: ImageInput) -> torch.Tensor:
+    """Convert a path or decoded RGB [H, W, 3] array to a uint8 [3, H, W] tensor."""
+    if isinstance(image, np.ndarray):
+        return torch.from_numpy(np.ascontiguousarray(image)).permute(2, 0, 1)
+
+    return T.PILToTensor()(Image.open(image).convert("RGB"))
+
+
+def _image_size(image: ImageInput) -> Tuple[int, int]:
+    """Return (height, width) without decoding the pixel data of files."""
+    if isinstance(image, np.ndarray):
+        return image.shape[0], image.shape[1]
+
+    with Image.open(image) as im:
+        width, height = im.size
+
+    return height, width
+
+
+# Whether the current thread asked for low-resolution mask outputs
+_LOW_RES_MASKS = threading.local()
+
+
+class LowResMaskTransform(GeneralizedRCNNTransform):
+    """GeneralizedRCNNTransform that can leave masks at the mask head resolution.
+
+    Within run_prediction(s)(..., low_res_masks=True) the postprocess only
+    rescales the boxes to the original image and returns the [N, M, M] mask
+    probabilities under LOW_RES_MASKS_KEY instead of pasting [N, 1, H, W]
+    float masks; everywhere else it behaves exactly like its base class.
+    """
+
+    def postprocess(self, result, image_shapes, original_image_sizes):
+        if self.training or not getattr(_LOW_RES_MASKS, "enabled", False):
+            return super().postprocess(result, image_shapes, original_image_sizes)
+
+        for prediction, image_shape, original_size in zip(result, image_shapes, original_image_sizes):
+            prediction["boxes"] = resize_boxes(prediction["boxes"], image_shape, original_size)
+            if "masks" in prediction:
+                prediction[LOW_RES_MASKS_KEY] = prediction.pop("masks")[:, 0]
+
+        return result
+
+
+def _eager_transform(model: Any) -> Optional[GeneralizedRCNNTransform]:
+    """The transform of an eager model or of an adapter around one, None for other backends."""
+    while not hasattr(model, "transform") and isinstance(getattr(model, "module", None), torch.nn.Module):
+        model = model.module
+
+    transform = getattr(model, "transform", None)
+    return transform if isinstance(transform, GeneralizedRCNNTransform) else None
+
+
+def install_low_res_masks(model: Any) -> bool:
+    """Let an eager model (or an adapter around one) return low-resolution masks.
+
+    Switches its transform to LowResMaskTransform once; the transform only
+    changes its output in threads that ask for low-resolution masks, so the
+    model behaves as before everywhere else. The registry installs it on
+    every model it loads, so the class never changes under a running call.
+
+    Returns:
+        Whether the model supports low-resolution masks.
+    """
+    transform = _eager_transform(model)
+    if type(transform) is GeneralizedRCNNTransform:
+        transform.__class__ = LowResMaskTransform
+
+    return isinstance(transform, LowResMaskTransform)
+
+
+@contextmanager
+def _mask_resolution(model: Any, low_res_masks: bool):
+    """Ask model for low-resolution masks in this thread, where the model supports it."""
+    previous = getattr(_LOW_RES_MASKS, "enabled", False)
+    _LOW_RES_MASKS.enabled = low_res_masks and install_low_res_masks(model)
+
+    try:
+        yield
+    finally:
+        _LOW_RES_MASKS.enabled = previous
+
+
+@profiled("predict")
 def run_prediction(
-    image_path: Union[str, Path],
+    image: ImageInput,
     model: MaskRCNN,
+    low_res_masks: bool = False,
 ) -> Dict[str, Any]:
     """Run inference on a single image.
 
     Args:
-        image_path: Path to the input image.
+        image: Path to the input image, or an already decoded RGB
+               array of shape [H, W, 3].
         model: Trained MaskRCNN model.
+        low_res_masks: Return the mask head probabilities [N, M, M] under
+               "mask_probs" instead of full-size masks, for
+               generate_processing_labelmap to rasterize box by box.
+               Ignored by backends without an eager transform
+               (TorchScript, ONNX), which always return full-size masks.
 
     Returns:
         Dictionary containing prediction results with keys:
         - boxes: Bounding boxes [N, 4]
         - labels: Class labels [N]
         - scores: Confidence scores [N]
-        - masks: Segmentation masks [N, 1, H, W]
+        - masks: Segmentation masks [N, 1, H, W] (or mask_probs, see above)
     """
     device = get_device()
 
-    image = T.PILToTensor()(Image.open(image_path).convert("RGB"))
+    image = _load_image_tensor(image)
     eval_transform = get_transform(train=False)
 
     model.eval()
 
-    with torch.no_grad():
+    with torch.no_grad(), _mask_resolution(model, low_res_masks):
         x = eval_transform(image)
         x = x.to(device)
         predictions = model([x])
@@ -345,3 +657,60 @@ def run_prediction(
     torch.cuda.empty_cache()
 
     return prediction
+
+
+@profiled("predict")
+def run_predictions(
+    images: Sequence[ImageInput],
+    model: MaskRCNN,
+    batch_size: int = DEFAULT_PREDICTION_BATCH_SIZE,
+    low_res_masks: bool = False,
+) -> List[Dict[str, Any]]:
+    """Run inference on several images, batching images of the same size.
+
+    Images are grouped by (height, width) and each group is sent through the
+    model batch_size images at a time, so the backbone runs once per batch
+    without padding. Images are decoded only when their batch is run, and
+    one eval transform is shared by all of them.
+
+    Args:
+        images: Paths to input images and/or decoded RGB [H, W, 3] arrays.
+        model: Trained MaskRCNN model.
+        batch_size: Maximum number of images per forward pass.
+        low_res_masks: Keep masks at the mask head resolution (see
+            run_prediction).
+
+    Returns:
+        Predictions in the same order as images, each with the keys returned
+        by run_prediction. Tensors are moved to the CPU so that device memory
+        is bounded by one batch.
+    """
+    if batch_size < 1:
+        raise ValueError(f"batch_size must be at least 1, got {batch_size}")
+
+    device = get_device()
+    eval_transform = get_transform(train=False)
+
+    groups: "OrderedDict[Tuple[int, int], List[int]]" = OrderedDict()
+    for idx, image in enumerate(images):
+        groups.setdefault(_image_size(image), []).append(idx)
+
+    predictions: List[Optional[Dict[str, Any]]] = [None] * len(images)
+
+    model.eval()
+
+    with torch.no_grad(), _mask_resolution(model, low_res_masks):
+        for indices in groups.values():
+            for start in range(0, len(indices), batch_size):
+                batch_indices = indices[start:start + batch_size]
+                batch = [eval_transform(_load_image_tensor(images[i])).to(device) for i in batch_indices]
+
+                outputs = model(batch)
+                del batch
+
+                for i, output in zip(batch_indices, outputs):
+                    predictions[i] = {k: v.cpu() for k, v in output.items()}
+
+    torch.cuda.empty_cache()
+
+    return predictions
@@ -22,6 +22,7 @@ from alveoleye.lungcv.mrcnn.callbacks import (
     EarlyStoppingCallback,
     ModelCheckpointCallback,
     LambdaCallback,
+    ProfilerCallback,
 )
 
 # Augmentation utilities
@@ -41,6 +42,8 @@ from alveoleye.lungcv.mrcnn.engine import train_one_epoch, evaluate
 
 # Dataset (lung segmentation)
 from alveoleye.lungcv.mrcnn.dataset import LungDataset
+from alveoleye.lungcv.mrcnn.sample_cache import DecodedSampleCache
+from alveoleye.lungcv.mrcnn.annotation_store import AnnotationStore, compile_annotation_store
 
 # COCO dataset utilities
 from alveoleye.lungcv.mrcnn.coco_utils import (
@@ -88,6 +91,7 @@ __all__ = [
     "EarlyStoppingCallback",
     "ModelCheckpointCallback",
     "LambdaCallback",
+    "ProfilerCallback",
     # Augmentation utilities
     "build_transforms",
     "get_available_augmentations",
@@ -99,6 +103,9 @@ __all__ = [
     "evaluate",
     # Datasets
     "LungDataset",
+    "DecodedSampleCache",
+    "AnnotationStore",
+    "compile_annotation_store",
     "CocoDetection",
     "ConvertCocoPolysToMask",
     "get_coco",
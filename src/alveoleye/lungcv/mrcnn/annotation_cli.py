@@ -0,0 +1,87 @@
+"""Command-line interface for compiling a dataset's instance store.
+
+Decodes every RGB mask of a training dataset once and writes the instances
+to a memory-mappable store that LungDataset reads instead of the masks.
+Rerun it whenever masks or classes.json change; masks edited since the last
+compile are decoded on the fly until then.
+
+Usage:
+    alveoleye-compile-annotations /path/to/dataset
+
+Example:
+    # Store in dataset/instance_store, picked up automatically by training
+    alveoleye-compile-annotations training_dataset
+
+    # JPEG masks, store elsewhere (pass it to LungDataset(annotation_store=...))
+    alveoleye-compile-annotations training_dataset --img-extension .jpg \
+        --output /scratch/lung_instances
+"""
+
+import argparse
+import sys
+import time
+
+from alveoleye.lungcv.mrcnn.annotation_store import DEFAULT_STORE_DIRNAME, compile_annotation_store
+
+
+def create_parser() -> argparse.ArgumentParser:
+    """Create the argument parser for the annotation compiler.
+
+    Returns:
+        Configured ArgumentParser instance
+    """
+    parser = argparse.ArgumentParser(
+        description="Compile a training dataset's RGB masks into an instance store",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+
+    parser.add_argument(
+        "dataset_path",
+        type=str,
+        help="Dataset directory with masks/ and classes.json",
+    )
+    parser.add_argument(
+        "--output",
+        type=str,
+        default=None,
+        help=f"Store directory (default: DATASET_PATH/{DEFAULT_STORE_DIRNAME})",
+    )
+    parser.add_argument(
+        "--img-extension",
+        type=str,
+        default=".png",
+        help="Mask file extension",
+    )
+
+    return parser
+
+
+def _print_progress(done: int, total: int) -> None:
+    print(f"\r[+] Compiled {done}/{total} masks", end="", flush=True)
+
+
+def main() -> None:
+    """Main entry point for the CLI."""
+    args = create_parser().parse_args()
+    start_time = time.time()
+
+    try:
+        store = compile_annotation_store(
+            args.dataset_path,
+            output=args.output,
+            img_extension=args.img_extension,
+            progress=_print_progress,
+        )
+    except KeyboardInterrupt:
+        print("\n[CLI] Compilation interrupted by user")
+        sys.exit(130)
+    except Exception as e:
+        print(f"\nError during compilation: {e}", file=sys.stderr)
+        sys.exit(1)
+
+    print(f"\n[+] Saved {len(store.class_ids)} instances from {len(store)} masks to {store.path}")
+    print(f"Elapsed time: {time.time() - start_time:.2f} seconds")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,229 @@
+"""Precompiled, memory-mappable instance annotations for LungDataset.
+
+Turning an RGB annotation mask into instance masks (color matching,
+connected components, blob filtering and box computation) is pure
+preprocessing: its result only changes when the mask or classes.json
+changes. compile_annotation_store runs it once per dataset and writes the
+result to a store directory, which LungDataset then reads instead of
+decoding masks on every cache miss, across epochs and training runs.
+
+Store layout:
+    instance_store/
+    ├── manifest.json      Class colors, decoding settings and, per mask,
+    │                      its file stamp, shape and instance range
+    ├── boxes.npy          (M, 4) int32 xmin, ymin, xmax, ymax of all instances
+    ├── areas.npy          (M,) int64 pixel counts
+    ├── class_ids.npy      (M,) int64 class IDs
+    └── labels/
+        └── 000000.npy     (H, W) instance label image per mask, 0 is background
+
+Instance i of a mask is the region where its label image equals i + 1;
+instances never overlap (see alveoleye.lungcv.mrcnn.instances).
+
+Example:
+    from alveoleye.lungcv.mrcnn.annotation_store import compile_annotation_store
+
+    compile_annotation_store("training_dataset")
+    # LungDataset("training_dataset", ...) now picks up training_dataset/instance_store
+"""
+
+import json
+import os
+import shutil
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Union
+
+import numpy as np
+
+from alveoleye.lungcv.mrcnn.instances import (
+    COLOR_TOLERANCE,
+    MIN_BLOB_SIZE,
+    MaskInstances,
+    extract_instances,
+    load_class_colors,
+    load_rgb_mask,
+)
+
+# =============================================================================
+# Constants
+# =============================================================================
+
+# Directory name of the store inside a dataset root, picked up automatically
+DEFAULT_STORE_DIRNAME = "instance_store"
+
+# Bumped whenever the stored layout changes, so stale stores are never read
+STORE_FORMAT_VERSION = 1
+
+MANIFEST_NAME = "manifest.json"
+
+
+# =============================================================================
+# Reading
+# =============================================================================
+
+def _file_stamp(path: Union[str, Path]) -> Dict[str, int]:
+    stat = os.stat(path)
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+def _decoding_settings() -> Dict[str, int]:
+    return {"color_tolerance": COLOR_TOLERANCE, "min_blob_size": MIN_BLOB_SIZE}
+
+
+class AnnotationStore:
+    """Read access to a compiled instance store.
+
+    Args:
+        path: Store directory written by compile_annotation_store.
+        root: Dataset root the masks are looked up against (default: the
+            root it was compiled from), so datasets can be moved with their store.
+
+    Raises:
+        FileNotFoundError: If path holds no store.
+        ValueError: If the store was written in another format version.
+    """
+
+    def __init__(self, path: Union[str, Path], root: Optional[Union[str, Path]] = None):
+        self.path = Path(path)
+
+        with open(self.path / MANIFEST_NAME, "r") as f:
+            manifest = json.load(f)
+
+        if manifest.get("version") != STORE_FORMAT_VERSION:
+            raise ValueError(
+                f"Instance store {self.path} has format version {manifest.get('version')}, "
+                f"expected {STORE_FORMAT_VERSION}. Recompile it."
+            )
+
+        self.root = os.path.realpath(root if root is not None else manifest["root"])
+        self.class_colors: Dict[str, int] = manifest["class_colors"]
+        self.settings: Dict[str, int] = manifest["settings"]
+        self.records: Dict[str, Dict[str, int]] = manifest["masks"]
+
+        self.boxes = np.load(self.path / "boxes.npy", mmap_mode="r")
+        self.areas = np.load(self.path / "areas.npy", mmap_mode="r")
+        self.class_ids = np.load(self.path / "class_ids.npy", mmap_mode="r")
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    def is_compatible(self, class_colors: Dict[str, int]) -> bool:
+        """Whether the store was compiled with these classes and the current decoding settings."""
+        return self.class_colors == class_colors and self.settings == _decoding_settings()
+
+    def get(self, mask_path: Union[str, Path]) -> Optional[MaskInstances]:
+        """Stored instances of a mask, or None if it is missing or changed since compiling."""
+        key = os.path.relpath(os.path.realpath(mask_path), self.root)
+        record = self.records.get(key)
+
+        try:
+            if record is None or _file_stamp(mask_path) != {"size": record["size"], "mtime_ns": record["mtime_ns"]}:
+                return None
+        except FileNotFoundError:
+            return None
+
+        start, stop = record["offset"], record["offset"] + record["count"]
+        label_image = np.load(self.path / "labels" / f"{record['index']:06d}.npy", mmap_mode="r")
+
+        return MaskInstances(label_image, self.boxes[start:stop], self.areas[start:stop],
+                             self.class_ids[start:stop])
+
+
+def open_annotation_store(root: Union[str, Path], path: Optional[Union[str, Path]] = None
+                          ) -> Optional[AnnotationStore]:
+    """Open a dataset's store, by default root/instance_store; None if there is none."""
+    path = Path(path) if path is not None else Path(root) / DEFAULT_STORE_DIRNAME
+
+    if not (path / MANIFEST_NAME).is_file():
+        return None
+
+    return AnnotationStore(path, root=root)
+
+
+# =============================================================================
+# Compiling
+# =============================================================================
+
+def _find_masks(root: Path, img_extension: str) -> List[Path]:
+    masks_dir = root / "masks"
+    return sorted(path for path in masks_dir.rglob(f"*{img_extension}") if path.is_file())
+
+
+def compile_annotation_store(
+    root: Union[str, Path],
+    output: Optional[Union[str, Path]] = None,
+    img_extension: str = ".png",
+    progress: Optional[Callable[[int, int], None]] = None,
+) -> AnnotationStore:
+    """Decode every mask of a dataset once and write the instances to a store.
+
+    Args:
+        root: Dataset root with masks/ and classes.json (flat or split structure).
+        output: Store directory (default: root/instance_store). Replaced if it exists.
+        img_extension: Mask file extension.
+        progress: Optional callable receiving (masks done, total masks).
+
+    Returns:
+        The compiled AnnotationStore.
+
+    Raises:
+        FileNotFoundError: If root has no masks/ directory.
+        FileExistsError: If output is a non-empty directory other than a store.
+    """
+    root = Path(root).resolve()
+    output = Path(output) if output is not None else root / DEFAULT_STORE_DIRNAME
+
+    if not (root / "masks").is_dir():
+        raise FileNotFoundError(f"No masks/ directory in {root}")
+    if output.exists() and any(output.iterdir()) and not (output / MANIFEST_NAME).is_file():
+        raise FileExistsError(f"{output} exists and is not an instance store; refusing to replace it")
+
+    class_colors = load_class_colors(str(root))
+    mask_paths = _find_masks(root, img_extension)
+
+    # Build next to the destination and swap it in at the end, so readers never see a partial store
+    building = output.with_name(output.name + ".building")
+    shutil.rmtree(building, ignore_errors=True)
+    (building / "labels").mkdir(parents=True)
+
+    records = {}
+    boxes, areas, class_ids = [], [], []
+    offset = 0
+
+    for index, mask_path in enumerate(mask_paths):
+        instances = extract_instances(load_rgb_mask(str(mask_path)), class_colors)
+        boxes.append(instances.boxes)
+        areas.append(instances.areas)
+        class_ids.append(instances.class_ids)
+
+        np.save(building / "labels" / f"{index:06d}.npy", instances.label_image)
+        records[str(mask_path.relative_to(root))] = {
+            "index": index,
+            "offset": offset,
+            "count": len(instances.class_ids),
+            "height": instances.label_image.shape[0],
+            "width": instances.label_image.shape[1],
+            **_file_stamp(mask_path),
+        }
+        offset += len(instances.class_ids)
+
+        if progress is not None:
+            progress(index + 1, len(mask_paths))
+
+    np.save(building / "boxes.npy", np.concatenate(boxes or [np.zeros((0, 4), dtype=np.int32)]))
+    np.save(building / "areas.npy", np.concatenate(areas or [np.zeros(0, dtype=np.int64)]))
+    np.save(building / "class_ids.npy", np.concatenate(class_ids or [np.zeros(0, dtype=np.int64)]))
+
+    with open(building / MANIFEST_NAME, "w") as f:
+        json.dump({
+            "version": STORE_FORMAT_VERSION,
+            "root": str(root),
+            "class_colors": class_colors,
+            "settings": _decoding_settings(),
+            "masks": records,
+        }, f, indent=1)
+
+    shutil.rmtree(output, ignore_errors=True)
+    os.replace(building, output)
+
+    return AnnotationStore(output, root=root)
@@ -67,6 +67,7 @@ from alveoleye.lungcv.mrcnn.callbacks import (
 from alveoleye.lungcv.mrcnn.optimizers import create_optimizer, create_scheduler
 from alveoleye.lungcv.mrcnn.augmentations import build_transforms
 from alveoleye.lungcv.mrcnn.dataset import LungDataset, DEFAULT_SEED
+from alveoleye.lungcv.mrcnn.sample_cache import DecodedSampleCache
 from alveoleye.lungcv.mrcnn.utils import collate_fn, eval_forward, eval_with_metrics, SmoothedValue, _safe_torch_save, is_main_process, setup_for_distributed, get_rank
 from alveoleye.lungcv.mrcnn.metrics import SegmentationMetrics
 from alveoleye.lungcv.mrcnn.engine import train_one_epoch
@@ -467,6 +468,10 @@ def _run_training(
     dataset_path = str(config.data.dataset_path)
     # Use default seed if not specified to ensure reproducible train/val splits
     dataset_seed = config.seed if config.seed is not None else DEFAULT_SEED
+    sample_cache = DecodedSampleCache(
+        max_bytes=config.data.cache_bytes,
+        shared_dir=config.data.shared_cache_dir,
+    )
     dataset = LungDataset(
         root=dataset_path,
         transforms=train_transforms,
@@ -475,6 +480,8 @@ def _run_training(
         img_extension=config.data.img_extension,
         val_split=config.data.val_split,
         seed=dataset_seed,
+        sample_cache=sample_cache,
+        annotation_store=config.data.annotation_store,
     )
     dataset_val = LungDataset(
         root=dataset_path,
@@ -484,6 +491,8 @@ def _run_training(
         img_extension=config.data.img_extension,
         val_split=config.data.val_split,
         seed=dataset_seed,
+        sample_cache=sample_cache,
+        annotation_store=config.data.annotation_store,
     )
 
     # Apply image selection
@@ -528,6 +537,8 @@ def _run_training(
         collate_fn=collate_fn,
         pin_memory=config.data.pin_memory and torch.cuda.is_available(),
         sampler=train_sampler,
+        # Keep workers (and their sample caches) alive across epochs
+        persistent_workers=config.data.num_workers > 0,
     )
 
     val_batch_size = config.data.val_batch_size or config.data.batch_size
@@ -539,6 +550,8 @@ def _run_training(
         collate_fn=collate_fn,
         pin_memory=config.data.pin_memory and torch.cuda.is_available(),
         sampler=val_sampler,
+        # Keep workers (and their sample caches) alive across epochs
+        persistent_workers=config.data.num_workers > 0,
     )
 
     # Initialize model
@@ -744,6 +757,7 @@ def _run_training(
             train_loss = 0.0
 
         # Run validation
+        callbacks.on_validation_start(state)
         val_seg_metrics: Optional[SegmentationMetrics] = None
         if compute_metrics:
             val_metrics_raw, val_seg_metrics = eval_with_metrics(model, data_loader_val, device)
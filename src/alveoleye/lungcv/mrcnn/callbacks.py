@@ -10,9 +10,11 @@ Classes:
     EarlyStoppingCallback: Stop training when validation loss stops improving
     ModelCheckpointCallback: Save model checkpoints during training
     LambdaCallback: Simple callback using lambda functions
+    ProfilerCallback: Record a per-stage time and memory profile of training
 """
 
 from abc import ABC
+from contextlib import ExitStack
 from dataclasses import dataclass
 from typing import Dict, Any, Optional, List, Callable
 import os
@@ -20,6 +22,7 @@ import os
 import torch
 
 from alveoleye.lungcv.mrcnn.utils import _safe_torch_save
+from alveoleye.lungcv.profiling import StageProfiler
 
 
 @dataclass
@@ -72,6 +75,10 @@ class Callback(ABC):
         """Called at the beginning of each epoch."""
         pass
 
+    def on_validation_start(self, state: TrainingState) -> None:
+        """Called after the training pass of each epoch, before validation."""
+        pass
+
     def on_epoch_end(self, state: TrainingState) -> None:
         """Called at the end of each epoch."""
         pass
@@ -102,6 +109,11 @@ class CallbackList:
         for cb in self.callbacks:
             cb.on_epoch_start(state)
 
+    def on_validation_start(self, state: TrainingState) -> None:
+        """Call on_validation_start for all callbacks."""
+        for cb in self.callbacks:
+            cb.on_validation_start(state)
+
     def on_epoch_end(self, state: TrainingState) -> None:
         """Call on_epoch_end for all callbacks."""
         for cb in self.callbacks:
@@ -216,6 +228,7 @@ class LambdaCallback(Callback):
         on_train_end: Function called at end of training
         on_train_start: Function called at start of training
         on_epoch_start: Function called at start of each epoch
+        on_validation_start: Function called before validation in each epoch
 
     Example:
         callback = LambdaCallback(
@@ -230,11 +243,13 @@ class LambdaCallback(Callback):
         on_train_end: Optional[Callable[[TrainingState], None]] = None,
         on_train_start: Optional[Callable[[TrainingState], None]] = None,
         on_epoch_start: Optional[Callable[[TrainingState], None]] = None,
+        on_validation_start: Optional[Callable[[TrainingState], None]] = None,
     ):
         self._on_epoch_end = on_epoch_end
         self._on_train_end = on_train_end
         self._on_train_start = on_train_start
         self._on_epoch_start = on_epoch_start
+        self._on_validation_start = on_validation_start
 
     def on_epoch_end(self, state: TrainingState) -> None:
         if self._on_epoch_end:
@@ -251,3 +266,62 @@ class LambdaCallback(Callback):
     def on_epoch_start(self, state: TrainingState) -> None:
         if self._on_epoch_start:
             self._on_epoch_start(state)
+
+    def on_validation_start(self, state: TrainingState) -> None:
+        if self._on_validation_start:
+            self._on_validation_start(state)
+
+
+class ProfilerCallback(Callback):
+    """Record a per-stage time and memory profile of training.
+
+    Records the whole run as a "train" stage holding an "epoch" stage per
+    epoch, split into "train_one_epoch" and "validate" (validation and the
+    end-of-epoch logging). Inside train_one_epoch, every batch is recorded
+    as a LOAD_BATCH step (data loading and the copy to the device) and a
+    TRAIN_STEP step (forward, backward and optimizer step). The profile is
+    written as JSON and a Chrome trace when training ends.
+
+    Args:
+        save_dir: Directory to write the profile to
+        name: File name stem of the profile
+        profiler: Profiler to record into (a new one if None)
+
+    Example:
+        callback = ProfilerCallback(save_dir='profiles')
+    """
+
+    def __init__(self, save_dir: str = '.', name: str = 'training', profiler: Optional[StageProfiler] = None):
+        self.save_dir = save_dir
+        self.name = name
+        self.profiler = profiler if profiler is not None else StageProfiler()
+        self._activation = ExitStack()
+        self._epoch_depth = 0
+
+    def _end_stages(self, depth: int) -> None:
+        while self.profiler.depth > depth:
+            self.profiler.end()
+
+    def on_train_start(self, state: TrainingState) -> None:
+        self._activation.enter_context(self.profiler.activate())
+        self.profiler.begin('train', epochs=state.total_epochs - state.epoch)
+        self._epoch_depth = self.profiler.depth
+
+    def on_epoch_start(self, state: TrainingState) -> None:
+        self._end_stages(self._epoch_depth)
+        self.profiler.begin('epoch', epoch=state.epoch)
+        self.profiler.begin('train_one_epoch')
+
+    def on_validation_start(self, state: TrainingState) -> None:
+        self._end_stages(self._epoch_depth + 1)
+        self.profiler.begin('validate')
+
+    def on_epoch_end(self, state: TrainingState) -> None:
+        self._end_stages(self._epoch_depth)
+
+    def on_train_end(self, state: TrainingState) -> None:
+        self._end_stages(self._epoch_depth - 1)
+        self._activation.close()
+
+        paths = self.profiler.save(self.save_dir, self.name)
+        print(f"  [+] Training profile saved: {paths[0]}")
@@ -18,6 +18,9 @@ Example:
 
     # Resume from checkpoint
     alveoleye-train my_dataset --resume-from checkpoints/epoch_50.pth
+
+    # Profile time and memory per epoch, batch and validation
+    alveoleye-train my_dataset --epochs 2 --profile-dir profiles/
 """
 
 import argparse
@@ -39,6 +42,7 @@ from alveoleye.lungcv.mrcnn.config import (
     ImageSelectionConfig,
 )
 from alveoleye.lungcv.mrcnn.api import train
+from alveoleye.lungcv.mrcnn.callbacks import ProfilerCallback
 
 
 def create_parser() -> argparse.ArgumentParser:
@@ -151,6 +155,18 @@ def create_parser() -> argparse.ArgumentParser:
         default="auto",
         help="Target image size as 'HEIGHTxWIDTH' (e.g., '1440x1920'), 'auto' to detect, or 'none' to disable resizing",
     )
+    data_group.add_argument(
+        "--cache-mb",
+        type=int,
+        default=2048,
+        help="Memory budget in MB for decoded training samples, 0 to disable caching",
+    )
+    data_group.add_argument(
+        "--shared-cache-dir",
+        type=str,
+        default=None,
+        help="Directory (e.g. /dev/shm/alveoleye) for a sample cache shared by all data loading workers",
+    )
 
     # Image selection (mutually exclusive)
     selection_group = parser.add_mutually_exclusive_group()
@@ -276,6 +292,12 @@ def create_parser() -> argparse.ArgumentParser:
         default=10,
         help="Print progress every N batches",
     )
+    log_group.add_argument(
+        "--profile-dir",
+        type=str,
+        default=None,
+        help="Directory to save a per-stage time and memory profile (JSON and Chrome trace) to",
+    )
 
     # Resume training
     resume_group = parser.add_argument_group("Resume")
@@ -337,6 +359,8 @@ def build_config_from_args(args) -> TrainingConfig:
         image_selection=image_selection,
         val_split=args.val_split,
         target_size=target_size,
+        cache_bytes=args.cache_mb * 1024 ** 2,
+        shared_cache_dir=args.shared_cache_dir,
     )
 
     # Optimizer config
@@ -449,6 +473,10 @@ def load_config(args) -> TrainingConfig:
             config.data.num_workers = args.num_workers
         if args.val_split != defaults['val_split']:
             config.data.val_split = args.val_split
+        if args.cache_mb != defaults['cache_mb']:
+            config.data.cache_bytes = args.cache_mb * 1024 ** 2
+        if args.shared_cache_dir is not None:
+            config.data.shared_cache_dir = args.shared_cache_dir
 
         # Optimizer overrides
         if args.optimizer != defaults['optimizer']:
@@ -523,6 +551,7 @@ def run_training(args) -> None:
     result = train(
         config=config,
         resume_from=args.resume_from,
+        callbacks=[ProfilerCallback(save_dir=args.profile_dir)] if args.profile_dir else None,
     )
 
     # Save final model
@@ -185,6 +185,14 @@ class DataConfig:
         target_size: Target size (height, width) for resizing images. Required when batch_size > 1
                      with variable-sized images. Set to 'auto' to detect from dataset, or None
                      to disable resizing (default: 'auto')
+        cache_bytes: Byte budget of the decoded sample cache shared by the training and
+                     validation datasets, 0 to disable it (default: 2 GiB)
+        shared_cache_dir: Directory backing the sample cache with memory-mapped files so
+                          DataLoader workers share one decoded copy, e.g. '/dev/shm/alveoleye'
+                          (default: None for a per-process cache)
+        annotation_store: Instance store compiled with alveoleye-compile-annotations, 'auto' to
+                          use DATASET/instance_store when present, or None to always decode
+                          the RGB masks (default: 'auto')
     """
     dataset_path: Union[str, Path] = 'training_dataset'
     batch_size: int = 10
@@ -196,6 +204,9 @@ class DataConfig:
     image_selection: Optional[ImageSelectionConfig] = None
     val_split: float = 0.2
     target_size: Optional[Union[Tuple[int, int], Literal['auto']]] = 'auto'
+    cache_bytes: int = 2 * 1024 ** 3
+    shared_cache_dir: Optional[Union[str, Path]] = None
+    annotation_store: Optional[Union[str, Path]] = 'auto'
 
 
 @dataclass
@@ -26,29 +26,36 @@ Supports two dataset structures:
    └── classes.json
 """
 
-import json
 import logging
 import os
 import random
 from typing import Any, Dict, List, Optional, Tuple
 
-import cv2
 import numpy as np
 import torch
 from PIL import Image, ImageOps
 
 from alveoleye._dataset_utils import detect_dataset_structure
+from alveoleye.lungcv.mrcnn.annotation_store import AnnotationStore, open_annotation_store
+from alveoleye.lungcv.mrcnn.instances import (
+    COLOR_TOLERANCE,
+    MIN_BLOB_SIZE,
+    extract_instances,
+    load_class_colors,
+    load_rgb_mask,
+    rgb_mask_to_instances,
+)
+from alveoleye.lungcv.mrcnn.sample_cache import (
+    DEFAULT_SAMPLE_CACHE_BYTES,
+    DecodedSample,
+    DecodedSampleCache,
+    sample_key,
+)
 
 # =============================================================================
 # Constants
 # =============================================================================
 
-# Color tolerance for mask RGB matching (accounts for compression artifacts)
-COLOR_TOLERANCE = 15
-
-# Minimum blob size (in pixels) to include in masks
-MIN_BLOB_SIZE = 15
-
 # Minimum bounding box dimension (width/height) in pixels
 MIN_BOX_DIMENSION = 2
 
@@ -81,6 +88,8 @@ class LungDataset(torch.utils.data.Dataset):
         imgs: List of image filenames.
         masks: List of mask filenames.
         class_dict: Mapping of RGB color strings to class IDs.
+        sample_cache: Cache of decoded samples, keyed by image/mask files.
+        annotation_store: Compiled instance store read instead of decoding masks, if any.
     """
 
     def __init__(
@@ -93,6 +102,10 @@ class LungDataset(torch.utils.data.Dataset):
         n_repeat_images: int = 1,
         val_split: float = DEFAULT_VAL_SPLIT,
         seed: int = DEFAULT_SEED,
+        cache_bytes: int = DEFAULT_SAMPLE_CACHE_BYTES,
+        shared_cache_dir: Optional[str] = None,
+        sample_cache: Optional[DecodedSampleCache] = None,
+        annotation_store: Optional[str] = "auto",
     ) -> None:
         """Initialize the LungDataset.
 
@@ -105,6 +118,15 @@ class LungDataset(torch.utils.data.Dataset):
             n_repeat_images: Number of times to repeat the dataset.
             val_split: Fraction for validation when using flat structure.
             seed: Random seed for reproducible splits.
+            cache_bytes: Byte budget of the decoded sample cache; 0 disables it.
+            shared_cache_dir: Optional directory (e.g. under /dev/shm) backing the
+                cache with memory-mapped files shared by DataLoader workers.
+            sample_cache: Existing cache to use instead of creating one from
+                cache_bytes and shared_cache_dir, e.g. to share it between the
+                training and validation datasets.
+            annotation_store: Directory of a store written by
+                compile_annotation_store, "auto" to use root/instance_store when
+                it exists, or None to always decode the RGB masks.
 
         Raises:
             ValueError: If dataset structure is invalid or image/mask counts don't match.
@@ -112,7 +134,9 @@ class LungDataset(torch.utils.data.Dataset):
         self.root = root
         self.transforms = transforms
         self.train = train
-        self._loaded_images: Dict[int, Tuple[Image.Image, Dict[str, Any]]] = {}
+        self.sample_cache = sample_cache if sample_cache is not None else DecodedSampleCache(
+            max_bytes=cache_bytes, shared_dir=shared_cache_dir,
+        )
 
         # Detect dataset structure using shared utility
         structure = detect_dataset_structure(root, img_extension)
@@ -147,6 +171,8 @@ class LungDataset(torch.utils.data.Dataset):
         # Load class definitions
         self.class_dict = self._load_classes(self.root)
 
+        self.annotation_store = self._open_annotation_store(annotation_store)
+
         logger.info(
             f"Loaded {'training' if train else 'validation'} dataset: "
             f"{len(self.imgs)} images from {root}"
@@ -226,16 +252,28 @@ class LungDataset(torch.utils.data.Dataset):
         Returns:
             Dictionary mapping RGB color strings to class IDs (1-indexed).
         """
-        classes_path = os.path.join(root, "classes.json")
-
-        with open(classes_path, "r") as f:
-            colors = json.load(f)
-
-        class_colors = {}
-        for number, name in enumerate(colors):
-            class_colors[colors[name]] = number + 1
+        return load_class_colors(root)
+
+    def _open_annotation_store(self, path: Optional[str]) -> Optional[AnnotationStore]:
+        """Open the compiled instance store, if any, and check it matches classes.json."""
+        if path is None:
+            return None
+
+        store = open_annotation_store(self.root, None if path == "auto" else path)
+        if store is None:
+            if path != "auto":
+                raise FileNotFoundError(f"No instance store found at {path}")
+            return None
+
+        if not store.is_compatible(self.class_dict):
+            logger.warning(
+                f"Instance store {store.path} was compiled with other classes or settings; "
+                "decoding RGB masks instead. Recompile it with alveoleye-compile-annotations."
+            )
+            return None
 
-        return class_colors
+        logger.info(f"Reading instances from {store.path}")
+        return store
 
     def _get_image_paths(self, idx: int) -> Tuple[str, str]:
         """Get image and mask paths for an index."""
@@ -308,69 +346,55 @@ class LungDataset(torch.utils.data.Dataset):
 
         return img, target
 
-    def __getitem__(self, idx: int) -> Tuple[Any, Dict[str, Any]]:
-        """Get a single training example.
-
-        Args:
-            idx: Index of the example to retrieve.
-
-        Returns:
-            Tuple of (image, target) where target contains boxes, labels,
-            masks, and other detection annotations.
-        """
-        # Check cache
-        if idx in self._loaded_images:
-            img, target = self._loaded_images[idx]
-            if self.transforms is not None:
-                img, target = self.transforms(img, target)
-            # Always sanitize after transforms, even on cache hits
-            img, target = self._sanitize_after_transforms(img, target)
-            return img, target
+    def _decode_sample(self, img_path: str, mask_path: str) -> DecodedSample:
+        """Decode an image/mask pair into the image, instance boxes, labels and masks."""
+        img = np.asarray(Image.open(img_path).convert("RGB"))
 
-        # Load image and mask
-        img_path, mask_path = self._get_image_paths(idx)
+        instances = self.annotation_store.get(mask_path) if self.annotation_store is not None else None
+        if instances is None:
+            logger.debug(f"Loading mask: {mask_path}")
+            instances = extract_instances(load_rgb_mask(mask_path), self.class_dict)
 
-        img = Image.open(img_path).convert("RGB")
+        # Filter boxes with dimensions too small
+        widths = instances.boxes[:, 2] - instances.boxes[:, 0]
+        heights = instances.boxes[:, 3] - instances.boxes[:, 1]
+        keep = np.flatnonzero((widths >= MIN_BOX_DIMENSION) & (heights >= MIN_BOX_DIMENSION))
 
-        masks, labels = self._rgb_to_class_mask_list(mask_path, self.class_dict)
+        # Masks are (N, H, W), including (0, H, W) when empty, as Mask R-CNN requires
+        boxes = instances.boxes[keep].astype(np.float32).reshape(-1, 4)
+        labels = instances.class_ids[keep].astype(np.int64)
+        masks = instances.masks(keep)
 
-        # Calculate bounding boxes and filter invalid ones
-        num_objs = len(labels)
-        keep_indices = []
-        final_boxes = []
+        return DecodedSample(img, boxes, labels, masks)
 
-        for i in range(num_objs):
-            pos = np.nonzero(masks[i])
-            if len(pos[0]) == 0 or len(pos[1]) == 0:
-                continue
+    def load_sample(self, idx: int) -> DecodedSample:
+        """Decoded (read-only) arrays of an example, served from the sample cache when possible."""
+        img_path, mask_path = self._get_image_paths(idx)
+        key = sample_key(img_path, mask_path)
 
-            xmin = np.min(pos[1])
-            xmax = np.max(pos[1])
-            ymin = np.min(pos[0])
-            ymax = np.max(pos[0])
+        sample = self.sample_cache.get(key)
+        if sample is None:
+            sample = self.sample_cache.put(key, self._decode_sample(img_path, mask_path))
 
-            # Filter boxes with dimensions too small
-            if (xmax - xmin < MIN_BOX_DIMENSION) or (ymax - ymin < MIN_BOX_DIMENSION):
-                continue
+        return sample
 
-            final_boxes.append([xmin, ymin, xmax, ymax])
-            keep_indices.append(i)
+    def __getitem__(self, idx: int) -> Tuple[Any, Dict[str, Any]]:
+        """Get a single training example.
 
-        # Apply exclusions
-        boxes = np.array(final_boxes)
-        labels = np.array([labels[i] for i in keep_indices])
-        masks = np.array([masks[i] for i in keep_indices])
+        Args:
+            idx: Index of the example to retrieve.
 
-        # If masks is empty, np.array([]) creates a 1D array of shape (0,)
-        # Mask R-CNN transform requires (N, H, W), so we need (0, H, W)
-        if len(masks) == 0:
-            width, height = img.size
-            masks = np.zeros((0, height, width), dtype=np.uint8)
+        Returns:
+            Tuple of (image, target) where target contains boxes, labels,
+            masks, and other detection annotations.
+        """
+        sample = self.load_sample(idx)
 
-        # Convert to tensors
-        boxes = torch.as_tensor(boxes, dtype=torch.float32) if len(boxes) > 0 else torch.zeros((0, 4), dtype=torch.float32)
-        labels = torch.as_tensor(labels, dtype=torch.int64)
-        masks = torch.as_tensor(masks, dtype=torch.uint8)
+        # Build fresh objects on every access so transforms never modify the cache
+        img = Image.fromarray(np.array(sample.image))
+        boxes = torch.from_numpy(np.array(sample.boxes))
+        labels = torch.from_numpy(np.array(sample.labels))
+        masks = torch.from_numpy(np.array(sample.masks))
 
         image_id = torch.tensor([idx])
 
@@ -390,70 +414,11 @@ class LungDataset(torch.utils.data.Dataset):
             "iscrowd": iscrowd,
         }
 
-        # Cache the loaded data
-        self._loaded_images[idx] = (img, target)
-
         if self.transforms is not None:
             img, target = self.transforms(img, target)
 
             # Final sanitization: clamp and filter out degenerate boxes created by transforms
-            if target is not None and "boxes" in target:
-                # Get image dimensions (C, H, W)
-                if isinstance(img, torch.Tensor):
-                    _, H, W = torch.tensor(img.shape).tolist() if img.ndim == 3 else (None, *img.size[::-1])
-                    if img.ndim == 3:
-                        _, H, W = img.shape
-                    else:
-                        # PIL image fallback (shouldn't happen since we convert to tensor earlier)
-                        W, H = img.size  # type: ignore
-                else:
-                    # PIL image
-                    W, H = img.size  # type: ignore
-
-                boxes_t = target["boxes"]
-                if boxes_t.numel() > 0:
-                    # Clamp boxes within image bounds
-                    boxes_t[:, 0::2] = boxes_t[:, 0::2].clamp(min=0, max=W)
-                    boxes_t[:, 1::2] = boxes_t[:, 1::2].clamp(min=0, max=H)
-
-                    widths = boxes_t[:, 2] - boxes_t[:, 0]
-                    heights = boxes_t[:, 3] - boxes_t[:, 1]
-                    valid = (widths > 0) & (heights > 0)
-
-                    if not torch.all(valid):
-                        # Filter all fields consistently
-                        target["boxes"] = boxes_t[valid]
-                        if "labels" in target:
-                            target["labels"] = target["labels"][valid]
-                        if "masks" in target and isinstance(target["masks"], torch.Tensor):
-                            target["masks"] = target["masks"][valid]
-
-                        # Recompute helpers on filtered boxes
-                        boxes_t = target["boxes"]
-                        widths = boxes_t[:, 2] - boxes_t[:, 0]
-                        heights = boxes_t[:, 3] - boxes_t[:, 1]
-
-                    # Update area to match final boxes
-                    target["area"] = widths * heights if boxes_t.numel() > 0 else torch.zeros((0,), dtype=torch.float32)
-
-                    # Ensure iscrowd has the correct length
-                    n = target["boxes"].shape[0]
-                    target["iscrowd"] = torch.zeros((n,), dtype=torch.int64)
-
-                else:
-                    # No boxes left; ensure consistent empty shapes
-                    target["boxes"] = torch.zeros((0, 4), dtype=torch.float32)
-                    if "labels" in target:
-                        target["labels"] = torch.zeros((0,), dtype=torch.int64)
-                    if "masks" in target:
-                        # get H, W from image
-                        if isinstance(img, torch.Tensor) and img.ndim == 3:
-                            _, H, W = img.shape
-                        else:
-                            W, H = img.size  # type: ignore
-                        target["masks"] = torch.zeros((0, H, W), dtype=torch.uint8)
-                    target["area"] = torch.zeros((0,), dtype=torch.float32)
-                    target["iscrowd"] = torch.zeros((0,), dtype=torch.int64)
+            img, target = self._sanitize_after_transforms(img, target)
 
         return img, target
 
@@ -461,7 +426,7 @@ class LungDataset(torch.utils.data.Dataset):
         self,
         mask_path: str,
         class_colors: Dict[str, int],
-    ) -> Tuple[List[np.ndarray], List[int]]:
+    ) -> Tuple[np.ndarray, List[int]]:
         """Convert RGB mask to list of binary masks per instance.
 
         Args:
@@ -472,54 +437,11 @@ class LungDataset(torch.utils.data.Dataset):
             Tuple of (masks, labels) where masks is a list of binary masks
             and labels is the corresponding class IDs.
         """
-        mask_img = np.array(Image.open(mask_path).convert("RGB"))
-
-        # Handle RGBA images
-        if mask_img.shape[-1] == 4:
-            mask_img = mask_img[:, :, :3]
-
-        components = []
-        num_ids = []
-
         logger.debug(f"Loading mask: {mask_path}")
 
-        for color_str, class_id in class_colors.items():
-            # Parse color string "[R G B]" -> [R, G, B]
-            color_str = color_str.replace("[", "").replace("]", "")
-            color = [int(v) for v in color_str.split()]
-
-            # Create mask with color tolerance
-            lower = np.clip(np.array(color) - COLOR_TOLERANCE, 0, 255)
-            upper = np.clip(np.array(color) + COLOR_TOLERANCE, 0, 255)
-            mask = cv2.inRange(mask_img, lower, upper)
-            mask = np.where(mask == 255, 1, 0).astype(np.uint8)
-
-            # Find connected components
-            num_labels, labeled = cv2.connectedComponents(mask)
-
-            # Create individual masks for each blob
-            blob_masks = [
-                (labeled == i).astype(np.uint8)
-                for i in range(1, num_labels)
-            ]
-
-            # Filter small blobs
-            blob_masks = [
-                blob for blob in blob_masks
-                if np.sum(blob > 0) > MIN_BLOB_SIZE
-            ]
-
-            components.extend(blob_masks)
-            num_ids.extend([class_id] * len(blob_masks))
-
-        # Stack masks or return empty array
-        if components:
-            final_mask = np.stack(components, axis=0)
-        else:
-            final_mask = np.zeros((0,) + mask_img.shape[:2], dtype=np.uint8)
-
-        return final_mask, num_ids
+        return rgb_mask_to_instances(load_rgb_mask(mask_path), class_colors)
 
     def __len__(self) -> int:
         """Return the number of examples in the dataset."""
         return len(self.imgs)
+
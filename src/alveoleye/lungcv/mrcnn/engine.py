@@ -7,6 +7,7 @@ import torchvision.models.detection.mask_rcnn
 from alveoleye.lungcv.mrcnn.utils import MetricLogger, SmoothedValue, reduce_dict
 from alveoleye.lungcv.mrcnn.coco_eval import CocoEvaluator
 from alveoleye.lungcv.mrcnn.coco_utils import get_coco_api_from_dataset
+from alveoleye.lungcv.profiling import record_step
 
 
 def train_one_epoch(model, optimizer, data_loader, device, epoch, print_freq, scaler=None, gradient_clip_val=None):
@@ -18,6 +19,8 @@ def train_one_epoch(model, optimizer, data_loader, device, epoch, print_freq, sc
     for images, targets in metric_logger.log_every(data_loader, print_freq, header):
         images = list(image.to(device) for image in images)
         targets = [{k: v.to(device) if isinstance(v, torch.Tensor) else v for k, v in t.items()} for t in targets]
+        record_step(images, "LOAD_BATCH")
+
         with torch.cuda.amp.autocast(enabled=scaler is not None):
             loss_dict = model(images, targets)
             losses = sum(loss for loss in loss_dict.values())
@@ -49,6 +52,7 @@ def train_one_epoch(model, optimizer, data_loader, device, epoch, print_freq, sc
 
         metric_logger.update(loss=losses_reduced, **loss_dict_reduced)
         metric_logger.update(lr=optimizer.param_groups[0]["lr"])
+        record_step(losses, "TRAIN_STEP")
 
     return metric_logger
 
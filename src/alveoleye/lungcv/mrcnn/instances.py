@@ -0,0 +1,198 @@
+"""Instance extraction from RGB annotation masks.
+
+Annotation masks paint every class in its classes.json color. Each
+connected blob of a class color is one instance; blobs of at most
+MIN_BLOB_SIZE pixels are dropped as annotation noise.
+
+Extraction runs in a single pass over the image:
+
+1. Pixels are packed into 24-bit integers and mapped to class IDs with a
+   lookup table covering every color within COLOR_TOLERANCE of a class
+   color (compression artifacts), instead of one inRange per class.
+2. cv2.connectedComponentsWithStats labels each class's blobs and reports
+   their areas and bounding boxes, so no blob is rescanned.
+3. Small blobs are dropped and the survivors renumbered through a label
+   lookup table, giving one instance label image for the whole mask.
+
+Pixels whose color lies within tolerance of several class colors belong
+to the class listed first in classes.json.
+"""
+
+import json
+import os
+from functools import lru_cache
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+import cv2
+import numpy as np
+from PIL import Image
+
+# =============================================================================
+# Constants
+# =============================================================================
+
+# Color tolerance for mask RGB matching (accounts for compression artifacts)
+COLOR_TOLERANCE = 15
+
+# Minimum blob size (in pixels) to include in masks
+MIN_BLOB_SIZE = 15
+
+
+# =============================================================================
+# Instances
+# =============================================================================
+
+class MaskInstances(NamedTuple):
+    """Instances of one annotation mask.
+
+    Attributes:
+        label_image: (H, W) instance label image; instance i is label i + 1, 0 is background.
+        boxes: (N, 4) int32 xmin, ymin, xmax, ymax (inclusive).
+        areas: (N,) int64 pixel counts.
+        class_ids: (N,) int64 class IDs.
+    """
+    label_image: np.ndarray
+    boxes: np.ndarray
+    areas: np.ndarray
+    class_ids: np.ndarray
+
+    def masks(self, indices: Optional[np.ndarray] = None) -> np.ndarray:
+        """(K, H, W) uint8 binary masks of the selected instances (all by default)."""
+        if indices is None:
+            indices = np.arange(len(self.class_ids))
+
+        indices = np.asarray(indices, dtype=np.int64)
+        label_image = np.asarray(self.label_image)
+        masks = np.zeros((len(indices),) + label_image.shape, dtype=np.uint8)
+
+        # Scatter each labelled pixel into its mask instead of comparing every mask with the image
+        position = np.full(len(self.class_ids) + 1, -1, dtype=np.int64)
+        position[indices + 1] = np.arange(len(indices))
+        selected = position[label_image]
+        rows, cols = np.nonzero(selected >= 0)
+        masks[selected[rows, cols], rows, cols] = 1
+
+        return masks
+
+
+# =============================================================================
+# Loading
+# =============================================================================
+
+def load_class_colors(root: str) -> Dict[str, int]:
+    """Map the RGB color strings in a dataset's classes.json to class IDs (1-indexed)."""
+    classes_path = os.path.join(root, "classes.json")
+
+    with open(classes_path, "r") as f:
+        colors = json.load(f)
+
+    class_colors = {}
+    for number, name in enumerate(colors):
+        class_colors[colors[name]] = number + 1
+
+    return class_colors
+
+
+def load_rgb_mask(mask_path: str) -> np.ndarray:
+    """Load an annotation mask as an RGB (H, W, 3) uint8 array."""
+    mask_img = np.array(Image.open(mask_path).convert("RGB"))
+
+    # Handle RGBA images
+    if mask_img.shape[-1] == 4:
+        mask_img = mask_img[:, :, :3]
+
+    return mask_img
+
+
+# =============================================================================
+# Extraction
+# =============================================================================
+
+def _parse_color(color_str: str) -> List[int]:
+    # Parse color string "[R G B]" -> [R, G, B]
+    return [int(v) for v in color_str.replace("[", "").replace("]", "").split()]
+
+
+@lru_cache(maxsize=8)
+def _class_lookup(class_colors: Tuple[Tuple[str, int], ...], tolerance: int) -> np.ndarray:
+    """(2 ** 24,) uint8 table mapping packed RGB to an index into class_colors + 1, 0 for none."""
+    lookup = np.zeros(1 << 24, dtype=np.uint8)
+
+    # Fill in reverse so the first class wins where tolerance boxes overlap
+    for index in range(len(class_colors) - 1, -1, -1):
+        ranges = [np.arange(max(c - tolerance, 0), min(c + tolerance, 255) + 1)
+                  for c in _parse_color(class_colors[index][0])]
+        packed = (ranges[0][:, None, None] << 16) | (ranges[1][None, :, None] << 8) | ranges[2][None, None, :]
+        lookup[packed.ravel()] = index + 1
+
+    return lookup
+
+
+def extract_instances(mask_img: np.ndarray, class_colors: Dict[str, int]) -> MaskInstances:
+    """Split an RGB annotation mask into instances, one per connected blob of a class color.
+
+    Args:
+        mask_img: RGB mask, (H, W, 3) uint8.
+        class_colors: Dictionary mapping RGB color strings to class IDs.
+
+    Returns:
+        MaskInstances ordered by class (classes.json order), then by blob label.
+    """
+    colors = tuple(class_colors.items())
+    lookup = _class_lookup(colors, COLOR_TOLERANCE)
+
+    rgb = mask_img.astype(np.uint32)
+    class_map = lookup[(rgb[..., 0] << 16) | (rgb[..., 1] << 8) | rgb[..., 2]]
+
+    label_image = np.zeros(mask_img.shape[:2], dtype=np.int32)
+    boxes, areas, class_ids = [], [], []
+    count = 0
+
+    for index, (_, class_id) in enumerate(colors):
+        class_mask = (class_map == index + 1).view(np.uint8)
+        num_labels, labeled, stats, _ = cv2.connectedComponentsWithStats(class_mask, connectivity=8,
+                                                                         ltype=cv2.CV_32S)
+
+        # Filter small blobs through a label lookup table
+        kept = np.flatnonzero(stats[1:, cv2.CC_STAT_AREA] > MIN_BLOB_SIZE) + 1
+        if len(kept) == 0:
+            continue
+
+        relabel = np.zeros(num_labels, dtype=np.int32)
+        relabel[kept] = np.arange(count + 1, count + len(kept) + 1)
+        class_labels = relabel[labeled]
+        np.copyto(label_image, class_labels, where=class_labels > 0)
+
+        x, y = stats[kept, cv2.CC_STAT_LEFT], stats[kept, cv2.CC_STAT_TOP]
+        w, h = stats[kept, cv2.CC_STAT_WIDTH], stats[kept, cv2.CC_STAT_HEIGHT]
+        boxes.append(np.stack([x, y, x + w - 1, y + h - 1], axis=1))
+        areas.append(stats[kept, cv2.CC_STAT_AREA])
+        class_ids.extend([class_id] * len(kept))
+        count += len(kept)
+
+    dtype = np.uint16 if count < np.iinfo(np.uint16).max else np.uint32
+
+    return MaskInstances(
+        label_image.astype(dtype),
+        np.concatenate(boxes).astype(np.int32) if boxes else np.zeros((0, 4), dtype=np.int32),
+        np.concatenate(areas).astype(np.int64) if areas else np.zeros(0, dtype=np.int64),
+        np.array(class_ids, dtype=np.int64),
+    )
+
+
+def rgb_mask_to_instances(
+    mask_img: np.ndarray,
+    class_colors: Dict[str, int],
+) -> Tuple[np.ndarray, List[int]]:
+    """Split an RGB annotation mask into binary masks, one per connected blob.
+
+    Args:
+        mask_img: RGB mask, (H, W, 3) uint8.
+        class_colors: Dictionary mapping RGB color strings to class IDs.
+
+    Returns:
+        Tuple of (masks, labels) where masks is a (N, H, W) uint8 array of
+        binary masks and labels is the corresponding class IDs.
+    """
+    instances = extract_instances(mask_img, class_colors)
+    return instances.masks(), instances.class_ids.tolist()
@@ -26,11 +26,14 @@ Example:
 """
 
 from dataclasses import dataclass, field
-from typing import Dict, List, Tuple
+from typing import Dict, List, Optional, Tuple
 
 import torch
 from torch import Tensor
 
+# Masks reduced at once while building class maps (at most 255, indices are bytes)
+CLASS_MAP_CHUNK_SIZE = 32
+
 
 @dataclass
 class SegmentationMetrics:
@@ -66,16 +69,45 @@ class SegmentationMetrics:
         return result
 
 
-@dataclass
 class _PixelCounts:
-    """Internal container for raw pixel counts before metric computation."""
-    tp_agnostic: int = 0
-    fp_agnostic: int = 0
-    fn_agnostic: int = 0
-    tp_aware: int = 0
-    fp_aware: int = 0
-    fn_aware: int = 0
-    per_class: Dict[int, Dict[str, int]] = field(default_factory=dict)
+    """Internal accumulator of pixel counts before metric computation.
+
+    Holds a single confusion matrix of shape [2, 2, K, K] counting pixels by
+    (ground truth covered, prediction covered, ground truth class, predicted
+    class), where class 0 is background. Every metric is a sum over it, so
+    accumulating an image is one tensor addition. K grows only when a higher
+    class ID appears.
+    """
+
+    def __init__(self, num_classes: int = 1, device: Optional[torch.device] = None):
+        self.confusion = torch.zeros((2, 2, num_classes, num_classes), dtype=torch.long, device=device)
+        # Classes that appeared in any prediction or ground truth labels
+        self.seen = torch.zeros(num_classes, dtype=torch.bool, device=device)
+
+    @property
+    def num_classes(self) -> int:
+        return self.confusion.shape[-1]
+
+    def resize(self, num_classes: int) -> None:
+        """Grow the matrix to hold class IDs below num_classes."""
+        if num_classes <= self.num_classes:
+            return
+
+        confusion = self.confusion.new_zeros((2, 2, num_classes, num_classes))
+        confusion[:, :, :self.num_classes, :self.num_classes] = self.confusion
+        seen = self.seen.new_zeros(num_classes)
+        seen[:self.num_classes] = self.seen
+        self.confusion, self.seen = confusion, seen
+
+    def add(self, other: '_PixelCounts') -> None:
+        """Add another accumulator's counts (in-place)."""
+        self.resize(other.num_classes)
+        if self.confusion.device != other.confusion.device:
+            self.confusion, self.seen = self.confusion.to(other.confusion.device), self.seen.to(other.seen.device)
+
+        k = other.num_classes
+        self.confusion[:, :, :k, :k] += other.confusion
+        self.seen[:k] |= other.seen
 
 
 def _compute_precision_recall_f1(tp: int, fp: int, fn: int) -> Tuple[float, float, float]:
@@ -94,19 +126,32 @@ def _compute_iou(tp: int, fp: int, fn: int) -> float:
 
 def _counts_to_metrics(counts: _PixelCounts) -> SegmentationMetrics:
     """Convert raw pixel counts to SegmentationMetrics."""
-    prec_agnostic, rec_agnostic, f1_agnostic = _compute_precision_recall_f1(
-        counts.tp_agnostic, counts.fp_agnostic, counts.fn_agnostic
-    )
-    prec_aware, rec_aware, f1_aware = _compute_precision_recall_f1(
-        counts.tp_aware, counts.fp_aware, counts.fn_aware
-    )
-    iou_aware = _compute_iou(counts.tp_aware, counts.fp_aware, counts.fn_aware)
+    agnostic = counts.confusion.sum(dim=(2, 3))
+    by_class = counts.confusion.sum(dim=(0, 1))
+    diagonal = by_class.diagonal()
+
+    tp_aware = diagonal[1:].sum()
+    classes = counts.seen.nonzero().flatten()
+
+    # Move everything to the host in one transfer
+    values = torch.stack([
+        agnostic[1, 1], agnostic[0, 1], agnostic[1, 0],
+        tp_aware, by_class[:, 1:].sum() - tp_aware, by_class[1:, :].sum() - tp_aware,
+    ]).tolist()
+    per_class_values = torch.stack([
+        diagonal[classes],
+        by_class.sum(dim=0)[classes] - diagonal[classes],
+        by_class.sum(dim=1)[classes] - diagonal[classes],
+    ], dim=1).tolist()
+
+    tp_agnostic, fp_agnostic, fn_agnostic, tp, fp, fn = values
+    prec_agnostic, rec_agnostic, f1_agnostic = _compute_precision_recall_f1(tp_agnostic, fp_agnostic, fn_agnostic)
+    prec_aware, rec_aware, f1_aware = _compute_precision_recall_f1(tp, fp, fn)
+    iou_aware = _compute_iou(tp, fp, fn)
 
     per_class_metrics: Dict[int, Dict[str, float]] = {}
-    for cls_int, cls_counts in counts.per_class.items():
-        prec, rec, f1 = _compute_precision_recall_f1(
-            cls_counts['tp'], cls_counts['fp'], cls_counts['fn']
-        )
+    for cls_int, (cls_tp, cls_fp, cls_fn) in zip(classes.tolist(), per_class_values):
+        prec, rec, f1 = _compute_precision_recall_f1(cls_tp, cls_fp, cls_fn)
         per_class_metrics[cls_int] = {'precision': prec, 'recall': rec, 'f1': f1}
 
     return SegmentationMetrics(
@@ -121,6 +166,33 @@ def _counts_to_metrics(counts: _PixelCounts) -> SegmentationMetrics:
     )
 
 
+def _build_class_map(masks: Tensor, labels: Tensor) -> Tuple[Tensor, Tensor]:
+    """Coverage and class of every pixel, the last mask covering a pixel winning.
+
+    Args:
+        masks: Binary masks [N, H, W] (bool).
+        labels: Class labels [N].
+
+    Returns:
+        Tuple of (covered [H, W] bool, class_map [H, W] long).
+    """
+    count = masks.shape[0]
+    dtype = torch.int16 if count < torch.iinfo(torch.int16).max else torch.int32
+    last = torch.zeros(masks.shape[-2:], dtype=dtype, device=masks.device)
+
+    # Running max of (instance index + 1) over chunks of masks, bounding the temporary stack.
+    # Within a chunk, byte-sized local indices keep the multiply and reduction cheap.
+    local_ids = torch.arange(1, CLASS_MAP_CHUNK_SIZE + 1, dtype=torch.uint8, device=masks.device).view(-1, 1, 1)
+    for start in range(0, count, CLASS_MAP_CHUNK_SIZE):
+        chunk = masks[start:start + CLASS_MAP_CHUNK_SIZE]
+        local_last = (chunk.view(torch.uint8) * local_ids[:len(chunk)]).amax(dim=0).to(dtype)
+        torch.maximum(last, torch.where(local_last > 0, local_last + start, local_last), out=last)
+
+    lookup = torch.cat([labels.new_zeros(1), labels]).to(device=masks.device, dtype=torch.long)
+
+    return last > 0, lookup[last.long()]
+
+
 def _compute_counts_for_image(
     pred_masks: Tensor,
     pred_labels: Tensor,
@@ -131,17 +203,26 @@ def _compute_counts_for_image(
     """Compute raw pixel counts for a single image.
 
     This is the core logic shared by compute_pixel_metrics and compute_batch_metrics.
+    Either side may have no instances, in which case all its pixels are background.
     """
-    counts = _PixelCounts()
-
     # Normalize mask dimensions: [N, 1, H, W] -> [N, H, W]
     if pred_masks.dim() == 4:
         pred_masks = pred_masks.squeeze(1)
 
-    H, W = gt_masks.shape[-2:]
+    if gt_masks.dim() == 3:
+        H, W = gt_masks.shape[-2:]
+        device = gt_masks.device
+    else:
+        H, W = pred_masks.shape[-2:]
+        device = pred_masks.device
+
+    if pred_masks.dim() != 3:
+        pred_masks = torch.zeros((0, H, W), device=device)
+    if gt_masks.dim() != 3:
+        gt_masks = torch.zeros((0, H, W), device=device)
 
     # Resize pred_masks if needed
-    if pred_masks.shape[-2:] != (H, W):
+    if pred_masks.shape[-2:] != (H, W) and pred_masks.shape[0] > 0:
         pred_masks = torch.nn.functional.interpolate(
             pred_masks.unsqueeze(1).float(),
             size=(H, W),
@@ -149,45 +230,22 @@ def _compute_counts_for_image(
             align_corners=False,
         ).squeeze(1)
 
-    pred_masks_binary = pred_masks > threshold
-
-    # Class-agnostic: combine all masks
-    pred_combined = pred_masks_binary.any(dim=0)
-    gt_combined = gt_masks.any(dim=0)
-
-    counts.tp_agnostic = (pred_combined & gt_combined).sum().item()
-    counts.fp_agnostic = (pred_combined & ~gt_combined).sum().item()
-    counts.fn_agnostic = (~pred_combined & gt_combined).sum().item()
-
-    # Class-aware: build class maps
-    pred_class_map = torch.zeros(H, W, dtype=torch.long, device=pred_masks.device)
-    for mask, label in zip(pred_masks_binary, pred_labels):
-        pred_class_map[mask] = label.item()
-
-    gt_class_map = torch.zeros(H, W, dtype=torch.long, device=gt_masks.device)
-    for mask, label in zip(gt_masks, gt_labels):
-        gt_class_map[mask > 0] = label.item()
-
-    pred_has_class = pred_class_map > 0
-    gt_has_class = gt_class_map > 0
-    classes_match = pred_class_map == gt_class_map
+    pred_covered, pred_class_map = _build_class_map(pred_masks > threshold, pred_labels)
+    gt_covered, gt_class_map = _build_class_map(gt_masks > 0, gt_labels)
+    pred_class_map = pred_class_map.to(device)
+    pred_covered = pred_covered.to(device)
 
-    counts.tp_aware = (pred_has_class & gt_has_class & classes_match).sum().item()
-    counts.fp_aware = (pred_has_class & (~gt_has_class | ~classes_match)).sum().item()
-    counts.fn_aware = (gt_has_class & (~pred_has_class | ~classes_match)).sum().item()
+    labels = torch.cat([pred_labels.to(device=device, dtype=torch.long).flatten(),
+                        gt_labels.to(device=device, dtype=torch.long).flatten()])
+    num_classes = int(labels.max().item()) + 1 if labels.numel() > 0 else 1
 
-    # Per-class counts
-    all_classes = set(gt_labels.tolist()) | set(pred_labels.tolist())
-    for cls in all_classes:
-        cls_int = int(cls)
-        pred_cls_mask = pred_class_map == cls_int
-        gt_cls_mask = gt_class_map == cls_int
+    # One bincount over (gt covered, pred covered, gt class, pred class) pixel tuples
+    index = ((gt_covered.long() * 2 + pred_covered.long()) * num_classes + gt_class_map) * num_classes + pred_class_map
+    confusion = torch.bincount(index.flatten(), minlength=4 * num_classes ** 2)
 
-        counts.per_class[cls_int] = {
-            'tp': (pred_cls_mask & gt_cls_mask).sum().item(),
-            'fp': (pred_cls_mask & ~gt_cls_mask).sum().item(),
-            'fn': (~pred_cls_mask & gt_cls_mask).sum().item(),
-        }
+    counts = _PixelCounts(num_classes, device=device)
+    counts.confusion = confusion.view(2, 2, num_classes, num_classes)
+    counts.seen[labels] = True
 
     return counts
 
@@ -234,18 +292,49 @@ def compute_pixel_metrics(
 
 def _accumulate_counts(total: _PixelCounts, addition: _PixelCounts) -> None:
     """Add counts from one image to accumulated totals (in-place)."""
-    total.tp_agnostic += addition.tp_agnostic
-    total.fp_agnostic += addition.fp_agnostic
-    total.fn_agnostic += addition.fn_agnostic
-    total.tp_aware += addition.tp_aware
-    total.fp_aware += addition.fp_aware
-    total.fn_aware += addition.fn_aware
+    total.add(addition)
+
+
+class PixelMetricAccumulator:
+    """Streaming pixel-level metrics over any number of images.
+
+    Each update folds a batch of predictions into the running counts, so
+    callers can drop predictions (and their full-resolution masks) right
+    after the batch is evaluated.
+
+    Example:
+        accumulator = PixelMetricAccumulator(threshold=0.5)
+        for images, targets in data_loader:
+            accumulator.update(model(images), targets)
+        metrics = accumulator.compute()
+    """
+
+    def __init__(self, threshold: float = 0.5):
+        self.threshold = threshold
+        self.counts = _PixelCounts()
+
+    def update(
+        self,
+        batch_predictions: List[Dict[str, Tensor]],
+        batch_targets: List[Dict[str, Tensor]],
+    ) -> None:
+        """Add the pixel counts of a batch of images."""
+        for pred, target in zip(batch_predictions, batch_targets):
+            pred_masks = pred.get('masks', torch.empty(0))
+            pred_labels = pred.get('labels', torch.empty(0, dtype=torch.long))
+            gt_masks = target.get('masks', torch.empty(0))
+            gt_labels = target.get('labels', torch.empty(0, dtype=torch.long))
+
+            # Both empty - skip
+            if pred_masks.numel() == 0 and gt_masks.numel() == 0:
+                continue
+
+            img_counts = _compute_counts_for_image(pred_masks, pred_labels, gt_masks, gt_labels, self.threshold)
+            _accumulate_counts(self.counts, img_counts)
 
-    for cls_int, cls_counts in addition.per_class.items():
-        if cls_int not in total.per_class:
-            total.per_class[cls_int] = {'tp': 0, 'fp': 0, 'fn': 0}
-        for key in ('tp', 'fp', 'fn'):
-            total.per_class[cls_int][key] += cls_counts[key]
+    def compute(self) -> SegmentationMetrics:
+        """Metrics over every image added so far."""
+        return _counts_to_metrics(self.counts)
 
 
 def compute_batch_metrics(
@@ -263,48 +352,6 @@ def compute_batch_metrics(
     Returns:
         SegmentationMetrics aggregated over all images
     """
-    total_counts = _PixelCounts()
-
-    for pred, target in zip(batch_predictions, batch_targets):
-        pred_masks = pred.get('masks', torch.empty(0))
-        pred_labels = pred.get('labels', torch.empty(0, dtype=torch.long))
-        gt_masks = target.get('masks', torch.empty(0))
-        gt_labels = target.get('labels', torch.empty(0, dtype=torch.long))
-
-        # Both empty - skip
-        if pred_masks.numel() == 0 and gt_masks.numel() == 0:
-            continue
-
-        # Handle edge cases where only one side is empty
-        if pred_masks.numel() == 0:
-            # All false negatives
-            fn_pixels = int(gt_masks.sum().item())
-            total_counts.fn_agnostic += fn_pixels
-            total_counts.fn_aware += fn_pixels
-            for label in gt_labels.unique().tolist():
-                cls_int = int(label)
-                if cls_int not in total_counts.per_class:
-                    total_counts.per_class[cls_int] = {'tp': 0, 'fp': 0, 'fn': 0}
-                total_counts.per_class[cls_int]['fn'] += int(gt_masks[gt_labels == label].sum().item())
-            continue
-
-        if gt_masks.numel() == 0:
-            # All false positives
-            if pred_masks.dim() == 4:
-                pred_masks = pred_masks.squeeze(1)
-            pred_binary = pred_masks > threshold
-            fp_pixels = int(pred_binary.sum().item())
-            total_counts.fp_agnostic += fp_pixels
-            total_counts.fp_aware += fp_pixels
-            for label in pred_labels.unique().tolist():
-                cls_int = int(label)
-                if cls_int not in total_counts.per_class:
-                    total_counts.per_class[cls_int] = {'tp': 0, 'fp': 0, 'fn': 0}
-                total_counts.per_class[cls_int]['fp'] += int(pred_binary[pred_labels == label].sum().item())
-            continue
-
-        # Normal case: both have data
-        img_counts = _compute_counts_for_image(pred_masks, pred_labels, gt_masks, gt_labels, threshold)
-        _accumulate_counts(total_counts, img_counts)
-
-    return _counts_to_metrics(total_counts)
+    accumulator = PixelMetricAccumulator(threshold)
+    accumulator.update(batch_predictions, batch_targets)
+    return accumulator.compute()
@@ -0,0 +1,273 @@
+"""Bounded cache of decoded training samples.
+
+Decoding an image and splitting its RGB mask into instance masks dominates
+the cost of LungDataset.__getitem__. This module caches the decoded arrays
+(image, boxes, labels and instance masks) keyed by the underlying files, so
+repeated indices (n_repeat_images) and the train/val datasets share entries.
+
+Two backings are available:
+
+1. In-process (default): an LRU dictionary bounded by a byte budget. Every
+   DataLoader worker process holds its own copy.
+2. Shared: entries are written once as .npy files to a directory, ideally on
+   a RAM-backed filesystem such as /dev/shm, and read back memory-mapped.
+   All workers then map the same pages, so a decoded sample exists once no
+   matter how many workers read it. The directory is bounded by the same
+   byte budget with least recently used eviction. Each process keeps a
+   running byte count and only walks the directory once that count crosses
+   the budget, or every SHARED_RESCAN_INTERVAL inserts.
+
+Cached arrays are read-only; callers build fresh tensors from them so that
+transforms can never modify a cached sample.
+
+Example:
+    from alveoleye.lungcv.mrcnn.sample_cache import DecodedSampleCache
+
+    cache = DecodedSampleCache(max_bytes=4 * 1024 ** 3, shared_dir="/dev/shm/alveoleye")
+    dataset = LungDataset("dataset", transforms, train=True, sample_cache=cache)
+"""
+
+import hashlib
+import os
+import shutil
+import tempfile
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Optional, Tuple, Union
+
+import numpy as np
+
+# =============================================================================
+# Constants
+# =============================================================================
+
+# Default byte budget of a sample cache
+DEFAULT_SAMPLE_CACHE_BYTES = 2 * 1024 ** 3
+
+# Arrays stored per sample, in order
+SAMPLE_FIELDS = ("image", "boxes", "labels", "masks")
+
+# Inserts between rescans of a shared directory, which also picks up other workers' samples
+SHARED_RESCAN_INTERVAL = 64
+
+
+# =============================================================================
+# Samples
+# =============================================================================
+
+class DecodedSample(NamedTuple):
+    """Decoded arrays of one image/mask pair.
+
+    Attributes:
+        image: RGB image, uint8 (H, W, 3).
+        boxes: Instance boxes as xmin, ymin, xmax, ymax, float32 (N, 4).
+        labels: Instance class IDs, int64 (N,).
+        masks: Binary instance masks, uint8 (N, H, W).
+    """
+    image: np.ndarray
+    boxes: np.ndarray
+    labels: np.ndarray
+    masks: np.ndarray
+
+    @property
+    def nbytes(self) -> int:
+        return sum(array.nbytes for array in self)
+
+
+def sample_key(img_path: Union[str, Path], mask_path: Union[str, Path]) -> str:
+    """Key of an image/mask pair, following the files' paths, sizes and modification times."""
+    parts = []
+
+    for path in (img_path, mask_path):
+        stat = os.stat(path)
+        parts.append(f"{os.path.realpath(path)}:{stat.st_size}:{stat.st_mtime_ns}")
+
+    return hashlib.sha1("|".join(parts).encode()).hexdigest()
+
+
+def _freeze(sample: DecodedSample) -> DecodedSample:
+    for array in sample:
+        array.flags.writeable = False
+    return sample
+
+
+# =============================================================================
+# Cache
+# =============================================================================
+
+class DecodedSampleCache:
+    """LRU cache of decoded samples with a byte budget.
+
+    Args:
+        max_bytes: Byte budget; least recently used samples are evicted once
+            it is exceeded. Samples larger than the budget are never stored,
+            so 0 disables caching.
+        shared_dir: Optional directory for the shared, memory-mapped backing.
+            Point it at a RAM-backed filesystem (e.g. /dev/shm/...) to share
+            decoded samples between DataLoader worker processes.
+    """
+
+    def __init__(self, max_bytes: int = DEFAULT_SAMPLE_CACHE_BYTES,
+                 shared_dir: Optional[Union[str, Path]] = None):
+        if max_bytes < 0:
+            raise ValueError(f"max_bytes must be non-negative, got {max_bytes}")
+
+        self.max_bytes = max_bytes
+        self.shared_dir = Path(shared_dir).expanduser() if shared_dir is not None else None
+        self._entries: "OrderedDict[str, DecodedSample]" = OrderedDict()
+        self._size = 0
+        self._shared_size: Optional[int] = None
+        self._puts_since_scan = 0
+        self.hits = 0
+        self.misses = 0
+
+        if self.shared_dir is not None:
+            self.shared_dir.mkdir(parents=True, exist_ok=True)
+
+    def __getstate__(self) -> Dict:
+        # Worker processes start empty rather than receiving a pickled copy of every sample
+        state = self.__dict__.copy()
+        state["_entries"] = OrderedDict()
+        state["_size"] = 0
+        state["_shared_size"] = None
+        state["_puts_since_scan"] = 0
+        return state
+
+    def __len__(self) -> int:
+        if self.shared_dir is not None:
+            return len(self.entries())
+        return len(self._entries)
+
+    def __contains__(self, key: str) -> bool:
+        if self.shared_dir is not None:
+            return (self.shared_dir / key).is_dir()
+        return key in self._entries
+
+    @property
+    def size(self) -> int:
+        if self.shared_dir is not None:
+            return sum(size for _, size, _ in self.entries())
+        return self._size
+
+    def get(self, key: str) -> Optional[DecodedSample]:
+        """Return the cached sample for key, or None on a miss."""
+        sample = self._load_shared(key) if self.shared_dir is not None else self._entries.get(key)
+
+        if sample is None:
+            self.misses += 1
+            return None
+
+        if self.shared_dir is None:
+            self._entries.move_to_end(key)
+        self.hits += 1
+        return sample
+
+    def put(self, key: str, sample: DecodedSample) -> DecodedSample:
+        """Store a sample and return the read-only cached copy."""
+        if sample.nbytes > self.max_bytes:
+            return sample
+
+        if self.shared_dir is not None:
+            if self._shared_size is None:
+                self._shared_size = self.size
+            self._shared_size += self._save_shared(key, sample)
+            self._puts_since_scan += 1
+            if self._shared_size > self.max_bytes or self._puts_since_scan >= SHARED_RESCAN_INTERVAL:
+                self.trim()
+            return self._load_shared(key) or sample
+
+        sample = _freeze(DecodedSample(*(np.array(array) for array in sample)))
+        if key in self._entries:
+            self._size -= self._entries.pop(key).nbytes
+        self._entries[key] = sample
+        self._size += sample.nbytes
+        self.trim()
+        return sample
+
+    def trim(self) -> int:
+        """Evict least recently used samples until the budget is met; return how many."""
+        removed = 0
+
+        if self.shared_dir is None:
+            while self._size > self.max_bytes and self._entries:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= evicted.nbytes
+                removed += 1
+            return removed
+
+        entries = sorted(self.entries(), key=lambda entry: entry[2])
+        total = sum(size for _, size, _ in entries)
+
+        for path, size, _ in entries:
+            if total <= self.max_bytes:
+                break
+            # Workers still mapping the files keep their pages until they unmap them
+            shutil.rmtree(path, ignore_errors=True)
+            total -= size
+            removed += 1
+
+        self._shared_size = total
+        self._puts_since_scan = 0
+        return removed
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._size = 0
+
+        if self.shared_dir is not None:
+            for path, _, _ in self.entries():
+                shutil.rmtree(path, ignore_errors=True)
+            self._shared_size = 0
+
+    # =========================================================================
+    # Shared backing
+    # =========================================================================
+
+    def entries(self) -> List[Tuple[Path, int, int]]:
+        """(directory, size, last use in ns) of every sample in the shared directory."""
+        found = []
+
+        for path in self.shared_dir.iterdir():
+            if not path.is_dir() or path.name.startswith("."):
+                continue
+            try:
+                size = sum(file.stat().st_size for file in path.iterdir())
+                found.append((path, size, path.stat().st_mtime_ns))
+            except FileNotFoundError:
+                continue
+
+        return found
+
+    def _load_shared(self, key: str) -> Optional[DecodedSample]:
+        path = self.shared_dir / key
+
+        try:
+            sample = DecodedSample(*(np.load(path / f"{name}.npy", mmap_mode="r") for name in SAMPLE_FIELDS))
+            os.utime(path)
+        except (FileNotFoundError, ValueError, OSError):
+            return None
+
+        return sample
+
+    def _save_shared(self, key: str, sample: DecodedSample) -> int:
+        """Write a sample unless it is already stored; return the bytes added."""
+        path = self.shared_dir / key
+        if path.is_dir():
+            return 0
+
+        # Write into a hidden directory first so readers never see a partial sample
+        temporary_path = Path(tempfile.mkdtemp(dir=self.shared_dir, prefix=".tmp-"))
+        try:
+            for name, array in zip(SAMPLE_FIELDS, sample):
+                np.save(temporary_path / f"{name}.npy", np.ascontiguousarray(array))
+            size = sum(file.stat().st_size for file in temporary_path.iterdir())
+            os.rename(temporary_path, path)
+        except OSError:
+            # Another worker stored the same sample first
+            if not path.is_dir():
+                raise
+            return 0
+        finally:
+            shutil.rmtree(temporary_path, ignore_errors=True)
+
+        return size
@@ -12,7 +12,7 @@ from torch import Tensor
 from torchvision.models.detection.roi_heads import fastrcnn_loss
 from torchvision.models.detection.rpn import concat_box_prediction_layers
 
-from alveoleye.lungcv.mrcnn.metrics import SegmentationMetrics, compute_batch_metrics
+from alveoleye.lungcv.mrcnn.metrics import PixelMetricAccumulator, SegmentationMetrics
 
 
 class SmoothedValue:
@@ -304,27 +304,18 @@ def init_distributed_mode(args):
 
 
 @torch.no_grad()
-def eval_forward(model: List[Tensor],
-                 data_loader: Optional[List[Dict[str, Tensor]]],
-                 device) -> Tuple[Dict[str, Tensor], List[Dict[str, Tensor]]]:
-    """
-    Args:
-        images (list[Tensor]): images to be processed
-        targets (list[Dict[str, Tensor]]): ground-truth boxes present in the image (optional)
-    Returns:
-        result (list[BoxList] or dict[Tensor]): the output from the model.
-            It returns list[BoxList] contains additional fields
-            like `scores`, `labels` and `mask` (for Mask R-CNN models).
-    Originally from: https://discuss.pytorch.org/t/how-to-calculate-validation-loss-for-faster-rcnn/96307/17
-    """
-    images = list(image[0][0].to(device) for image in data_loader)
-    targets = [{k: v.to(device) if isinstance(v, torch.Tensor) else v for k, v in t[1][0].items()} for t in data_loader]
-    model.to(device)
-    model.eval()
+def _forward_with_losses(m, images: List[Tensor], targets: List[Dict[str, Tensor]],
+                         with_masks: bool) -> Tuple[Dict[str, Tensor], List[Dict[str, Tensor]]]:
+    """Validation losses and detections of one batch from a single backbone pass.
 
-    # Support both wrapped (DDP) and unwrapped models
-    m = model.module if hasattr(model, 'module') else model
+    Losses follow the training computation (RPN and box head, training-mode
+    proposal counts). With with_masks, detections come from the regular
+    inference path on the same features, masks included, pasted at the
+    original image sizes; otherwise they are box-only detections of the
+    sampled training proposals.
 
+    Originally from: https://discuss.pytorch.org/t/how-to-calculate-validation-loss-for-faster-rcnn/96307/17
+    """
     original_image_sizes: List[Tuple[int, int]] = []
     for img in images:
         val = img.shape[-2:]
@@ -350,8 +341,6 @@ def eval_forward(model: List[Tensor],
     features = m.backbone(images.tensors)
     if isinstance(features, torch.Tensor):
         features = OrderedDict([("0", features)])
-    m.rpn.training = True
-    # model.roi_heads.training=True
 
     # ####proposals, proposal_losses = model.rpn(images, features, targets)
     features_rpn = list(features.values())
@@ -367,9 +356,15 @@ def eval_forward(model: List[Tensor],
     # the proposals
     proposals = m.rpn.box_coder.decode(pred_bbox_deltas.detach(), anchors)
     proposals = proposals.view(num_images, -1, 4)
-    proposals, scores = m.rpn.filter_proposals(proposals, objectness, images.image_sizes, num_anchors_per_level)
 
-    proposal_losses = {}
+    # Training-mode proposal counts for the losses, inference counts for detections
+    m.rpn.training = True
+    try:
+        train_proposals, _ = m.rpn.filter_proposals(proposals, objectness, images.image_sizes,
+                                                     num_anchors_per_level)
+    finally:
+        m.rpn.training = False
+
     assert targets is not None
     labels, matched_gt_boxes = m.rpn.assign_targets_to_anchors(anchors, targets)
     regression_targets = m.rpn.box_coder.encode(matched_gt_boxes, anchors)
@@ -383,36 +378,91 @@ def eval_forward(model: List[Tensor],
 
     # ####detections, detector_losses = model.roi_heads(features, proposals, images.image_sizes, targets)
     image_shapes = images.image_sizes
-    proposals, matched_idxs, labels, regression_targets = m.roi_heads.select_training_samples(proposals, targets)
-    box_features = m.roi_heads.box_roi_pool(features, proposals, image_shapes)
+    sampled_proposals, matched_idxs, labels, regression_targets = m.roi_heads.select_training_samples(
+        train_proposals, targets)
+    box_features = m.roi_heads.box_roi_pool(features, sampled_proposals, image_shapes)
     box_features = m.roi_heads.box_head(box_features)
     class_logits, box_regression = m.roi_heads.box_predictor(box_features)
 
-    result: List[Dict[str, torch.Tensor]] = []
-    detector_losses = {}
     loss_classifier, loss_box_reg = fastrcnn_loss(class_logits, box_regression, labels, regression_targets)
     detector_losses = {"loss_classifier": loss_classifier, "loss_box_reg": loss_box_reg}
-    boxes, scores, labels = m.roi_heads.postprocess_detections(class_logits, box_regression,
-                                                                   proposals, image_shapes)
-    num_images = len(boxes)
-    for i in range(num_images):
-        result.append(
-            {
-                "boxes": boxes[i],
-                "labels": labels[i],
-                "scores": scores[i],
-            }
-        )
-    detections = result
-    detections = m.transform.postprocess(detections, images.image_sizes, original_image_sizes)
-    m.rpn.training = False
-    m.roi_heads.training = False
+
+    if with_masks:
+        proposals, _ = m.rpn.filter_proposals(proposals, objectness, image_shapes, num_anchors_per_level)
+        detections, _ = m.roi_heads(features, proposals, image_shapes)
+    else:
+        boxes, scores, labels = m.roi_heads.postprocess_detections(class_logits, box_regression,
+                                                                   sampled_proposals, image_shapes)
+        detections = [
+            {"boxes": boxes[i], "labels": labels[i], "scores": scores[i]}
+            for i in range(len(boxes))
+        ]
+
+    detections = m.transform.postprocess(detections, image_shapes, original_image_sizes)
     losses = {}
     losses.update(detector_losses)
     losses.update(proposal_losses)
     return losses, detections
 
 
+def _iter_device_batches(data_loader, device):
+    """Yield (images, targets) of each batch, moved to device."""
+    for images_tuple, targets_tuple in data_loader:
+        # batch is ((img1, img2, ...), (target1, target2, ...)) from collate_fn
+        images = [img.to(device) for img in images_tuple]
+        targets = [{k: v.to(device) if isinstance(v, torch.Tensor) else v
+                    for k, v in t.items()} for t in targets_tuple]
+        yield images, targets
+
+
+def _evaluate_streaming(model, data_loader, device, on_batch, with_masks: bool) -> Dict[str, Tensor]:
+    """Run validation batch by batch, returning image-weighted mean losses.
+
+    on_batch receives each batch's (detections, targets) and must not keep
+    them, so memory stays flat regardless of the validation set size.
+    """
+    model.to(device)
+    model.eval()
+
+    # Support both wrapped (DDP) and unwrapped models
+    m = model.module if hasattr(model, 'module') else model
+
+    loss_sums: Dict[str, Tensor] = {}
+    num_images = 0
+
+    for images, targets in _iter_device_batches(data_loader, device):
+        losses, detections = _forward_with_losses(m, images, targets, with_masks)
+        for name, value in losses.items():
+            weighted = value.detach() * len(images)
+            loss_sums[name] = loss_sums[name] + weighted if name in loss_sums else weighted
+        num_images += len(images)
+
+        on_batch(detections, targets)
+        del detections
+
+    return {name: total / num_images for name, total in loss_sums.items()}
+
+
+@torch.no_grad()
+def eval_forward(model, data_loader, device) -> Tuple[Dict[str, Tensor], List[Dict[str, Tensor]]]:
+    """Compute validation losses batch by batch.
+
+    Args:
+        model: The Mask R-CNN model
+        data_loader: Validation data loader
+        device: Device to run on
+
+    Returns:
+        Tuple of (losses_dict, detections) where losses are averaged over all
+        images and detections hold the boxes, labels and scores of each image.
+    """
+    all_detections: List[Dict[str, Tensor]] = []
+    losses = _evaluate_streaming(model, data_loader, device,
+                                 lambda detections, targets: all_detections.extend(detections),
+                                 with_masks=False)
+    return losses, all_detections
+
+
 @torch.no_grad()
 def eval_with_metrics(
     model,
@@ -422,6 +472,9 @@ def eval_with_metrics(
 ) -> Tuple[Dict[str, Tensor], SegmentationMetrics]:
     """Evaluate model and compute both losses and pixel-level metrics.
 
+    Losses and mask predictions come from the same forward pass; each batch
+    is folded into running metric counts and its predictions dropped.
+
     Args:
         model: The Mask R-CNN model
         data_loader: Validation data loader
@@ -431,24 +484,7 @@ def eval_with_metrics(
     Returns:
         Tuple of (losses_dict, SegmentationMetrics)
     """
-    losses, _ = eval_forward(model, data_loader, device)
-
-    model.eval()
-    batch_predictions = []
-    batch_targets = []
-
-    # Match the data access pattern from eval_forward
-    for batch in data_loader:
-        # batch is ((img1, img2, ...), (target1, target2, ...)) from collate_fn
-        images_tuple, targets_tuple = batch
-        images = [img.to(device) for img in images_tuple]
-        targets = [{k: v.to(device) if isinstance(v, torch.Tensor) else v
-                    for k, v in t.items()} for t in targets_tuple]
-
-        predictions = model(images)
-        batch_predictions.extend(predictions)
-        batch_targets.extend(targets)
-
-    metrics = compute_batch_metrics(batch_predictions, batch_targets, threshold=threshold)
+    accumulator = PixelMetricAccumulator(threshold)
+    losses = _evaluate_streaming(model, data_loader, device, accumulator.update, with_masks=True)
 
-    return losses, metrics
+    return losses, accumulator.compute()
@@ -0,0 +1,300 @@
+"""Persistent on-disk cache of raw Mask R-CNN outputs.
+
+Inference dominates the cost of every parameter sweep, while the confidence
+threshold and all postprocessing settings only consume the raw model output.
+This cache stores that output (boxes, labels, scores and masks) in a
+content-addressed directory, keyed by a hash of the image bytes and a hash
+of the weights file, so sweeps never run the model twice for the same
+image and checkpoint, even across processes and sessions.
+
+Masks are stored quantized to uint8 (default) or as float16 in uncompressed
+.npz files. The directory is bounded by a byte budget with least recently
+used eviction; reading an entry refreshes its recency. The directory size is
+scanned once and then tracked in memory, so writes only walk the directory
+when the budget is actually exceeded.
+
+Example:
+    from alveoleye.lungcv.output_cache import ModelOutputCache
+
+    cache = ModelOutputCache("~/.cache/alveoleye/outputs", max_bytes=20 * 1024 ** 3)
+    outputs = cache.predict(image_paths, weights="model.pth")
+"""
+
+import hashlib
+import os
+import tempfile
+import threading
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+import torch
+
+from alveoleye.lungcv import model_operations
+
+# =============================================================================
+# Constants
+# =============================================================================
+
+# Default byte budget of a cache directory
+DEFAULT_OUTPUT_CACHE_BYTES = 10 * 1024 ** 3
+
+# Supported on-disk mask encodings
+MASK_DTYPES = ("uint8", "float16")
+
+# Bumped whenever the stored layout changes, so stale entries are never read
+CACHE_FORMAT_VERSION = 1
+
+# Read size when hashing files
+HASH_CHUNK_SIZE = 1024 * 1024
+
+_weights_hashes: Dict[Tuple[str, int, int], str] = {}
+_weights_hashes_lock = threading.Lock()
+
+
+# =============================================================================
+# Hashing
+# =============================================================================
+
+def hash_file(path: Union[str, Path]) -> str:
+    """SHA-256 of a file's bytes."""
+    digest = hashlib.sha256()
+
+    with open(path, "rb") as handle:
+        for chunk in iter(lambda: handle.read(HASH_CHUNK_SIZE), b""):
+            digest.update(chunk)
+
+    return digest.hexdigest()
+
+
+def hash_image(image: model_operations.ImageInput) -> str:
+    """Hash of an image file's bytes, or of a decoded array's shape and pixels."""
+    if isinstance(image, np.ndarray):
+        array = np.ascontiguousarray(image)
+        digest = hashlib.sha256(f"{array.shape}{array.dtype}".encode())
+        digest.update(memoryview(array).cast("B"))
+        return digest.hexdigest()
+
+    return hash_file(image)
+
+
+def hash_weights(weights: Optional[Union[str, Path]] = None) -> str:
+    """Hash of a weights file, memoized per path, size and modification time."""
+    path = model_operations.resolve_weights_path(weights)
+    stat = path.stat()
+    stamp = (str(path), stat.st_size, stat.st_mtime_ns)
+
+    with _weights_hashes_lock:
+        cached = _weights_hashes.get(stamp)
+
+    if cached is None:
+        cached = hash_file(path)
+        with _weights_hashes_lock:
+            _weights_hashes[stamp] = cached
+
+    return cached
+
+
+# =============================================================================
+# Cache
+# =============================================================================
+
+class ModelOutputCache:
+    """Content-addressed directory of raw model outputs with LRU eviction.
+
+    Args:
+        directory: Cache directory, created if missing.
+        max_bytes: Byte budget; the least recently used entries are removed
+            once the directory grows past it.
+        mask_dtype: "uint8" to quantize masks to 1/255 steps, or "float16".
+    """
+
+    def __init__(self, directory: Union[str, Path], max_bytes: int = DEFAULT_OUTPUT_CACHE_BYTES,
+                 mask_dtype: str = "uint8"):
+        if max_bytes < 0:
+            raise ValueError(f"max_bytes must be non-negative, got {max_bytes}")
+        if mask_dtype not in MASK_DTYPES:
+            raise ValueError(f"mask_dtype must be one of {MASK_DTYPES}, got {mask_dtype!r}")
+
+        self.directory = Path(directory).expanduser()
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.mask_dtype = mask_dtype
+        # Running byte total of the directory, scanned on first write
+        self._size: Optional[int] = None
+
+    @staticmethod
+    def make_key(image_hash: str, weights_hash: str, preset: str = "full") -> str:
+        # Outputs of the default preset keep the keys they had before presets existed
+        suffix = "" if preset == "full" else f":{preset}"
+        return hashlib.sha256(f"v{CACHE_FORMAT_VERSION}:{image_hash}:{weights_hash}{suffix}".encode()).hexdigest()
+
+    def _path(self, key: str) -> Path:
+        return self.directory / key[:2] / f"{key}.npz"
+
+    def __contains__(self, key: str) -> bool:
+        return self._path(key).exists()
+
+    def load(self, key: str, device: Optional[torch.device] = None) -> Optional[Dict[str, torch.Tensor]]:
+        """Return the cached output for key, or None on a miss."""
+        path = self._path(key)
+
+        try:
+            with np.load(path) as stored:
+                masks = stored["masks"]
+                output = {
+                    "boxes": torch.from_numpy(stored["boxes"]),
+                    "labels": torch.from_numpy(stored["labels"]),
+                    "scores": torch.from_numpy(stored["scores"]),
+                    "masks": torch.from_numpy(_decode_masks(masks)),
+                }
+            os.utime(path)
+        except (FileNotFoundError, KeyError, ValueError, OSError):
+            return None
+
+        if device is not None:
+            output = {name: value.to(device) for name, value in output.items()}
+
+        return output
+
+    def save(self, key: str, output: Dict[str, Any]) -> Dict[str, torch.Tensor]:
+        """Store a model output, evicting old entries past the byte budget.
+
+        Returns:
+            The output as load will return it, with masks at the stored
+            precision.
+        """
+        path = self._path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+
+        arrays = {
+            "boxes": _to_numpy(output["boxes"]).astype(np.float32),
+            "labels": _to_numpy(output["labels"]).astype(np.int64),
+            "scores": _to_numpy(output["scores"]).astype(np.float32),
+            "masks": _encode_masks(_to_numpy(output["masks"]), self.mask_dtype),
+        }
+
+        if self._size is None:
+            self._size = self.size
+        try:
+            replaced_size = path.stat().st_size
+        except FileNotFoundError:
+            replaced_size = 0
+
+        # Write to a temporary file first so readers never see a partial entry
+        handle, temporary_path = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+        try:
+            with os.fdopen(handle, "wb") as temporary_file:
+                np.savez(temporary_file, **arrays)
+            os.replace(temporary_path, path)
+        except BaseException:
+            if os.path.exists(temporary_path):
+                os.remove(temporary_path)
+            raise
+
+        self._size += path.stat().st_size - replaced_size
+        if self._size > self.max_bytes:
+            self.trim()
+
+        stored = {
+            "boxes": torch.from_numpy(arrays["boxes"]),
+            "labels": torch.from_numpy(arrays["labels"]),
+            "scores": torch.from_numpy(arrays["scores"]),
+            "masks": torch.from_numpy(_decode_masks(arrays["masks"])),
+        }
+        return {name: value.to(_to_device(output)) for name, value in stored.items()}
+
+    def entries(self) -> List[Tuple[Path, int, int]]:
+        """(path, size, last use in ns) of every stored entry."""
+        found = []
+
+        for path in self.directory.glob("*/*.npz"):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            found.append((path, stat.st_size, stat.st_mtime_ns))
+
+        return found
+
+    @property
+    def size(self) -> int:
+        return sum(size for _, size, _ in self.entries())
+
+    def trim(self) -> int:
+        """Remove least recently used entries until the budget is met; return how many."""
+        entries = sorted(self.entries(), key=lambda entry: entry[2])
+        total = sum(size for _, size, _ in entries)
+        removed = 0
+
+        for path, size, _ in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                pass
+            total -= size
+            removed += 1
+
+        self._size = total
+        return removed
+
+    def clear(self) -> None:
+        for path, _, _ in self.entries():
+            path.unlink(missing_ok=True)
+        self._size = 0
+
+    def predict(
+        self,
+        images: Sequence[model_operations.ImageInput],
+        weights: Optional[Union[str, Path]] = None,
+        batch_size: int = model_operations.DEFAULT_PREDICTION_BATCH_SIZE,
+        device: Optional[torch.device] = None,
+        preset: str = "full",
+    ) -> List[Dict[str, torch.Tensor]]:
+        """Model outputs for images, running the model only for cache misses.
+
+        The model is loaded through the model registry, and only if at least
+        one image is missing from the cache. Outputs are cached per
+        inference preset.
+        """
+        weights_hash = hash_weights(weights)
+        keys = [self.make_key(hash_image(image), weights_hash, preset) for image in images]
+        outputs: List[Optional[Dict[str, torch.Tensor]]] = [self.load(key, device) for key in keys]
+        missing = [index for index, output in enumerate(outputs) if output is None]
+
+        if missing:
+            model = model_operations.get_trained_model(weights, device=device, preset=preset)
+            predictions = model_operations.run_predictions([images[index] for index in missing], model, batch_size)
+
+            # Misses return the stored precision too, so results never depend on cache state
+            for index, prediction in zip(missing, predictions):
+                outputs[index] = self.save(keys[index], prediction)
+
+        return outputs
+
+
+def _to_numpy(value: Any) -> np.ndarray:
+    if isinstance(value, torch.Tensor):
+        return value.detach().cpu().numpy()
+    return np.asarray(value)
+
+
+def _to_device(output: Dict[str, Any]) -> torch.device:
+    masks = output["masks"]
+    return masks.device if isinstance(masks, torch.Tensor) else torch.device("cpu")
+
+
+def _encode_masks(masks: np.ndarray, mask_dtype: str) -> np.ndarray:
+    if mask_dtype == "float16":
+        return masks.astype(np.float16)
+
+    return np.rint(np.clip(masks, 0, 1) * 255).astype(np.uint8)
+
+
+def _decode_masks(masks: np.ndarray) -> np.ndarray:
+    if masks.dtype == np.uint8:
+        return masks.astype(np.float32) / 255
+
+    return masks.astype(np.float32)
@@ -0,0 +1,382 @@
+"""Stage graph with per-stage result caching for the AlveolEye pipeline.
+
+The pipeline is split into stages, each memoized by a key derived from the
+keys of its inputs and its own parameters:
+
+    image ─► inference ─► processing_labelmap ─┐
+      │                                        ├─► postprocessing_labelmap ─► asvd
+      └────► threshold ─► component_cleanup ───┘                            └► mli
+
+Because keys are chained, changing one parameter changes the key of its
+stage and of everything downstream of it, and nothing else. Re-running the
+pipeline after changing only ``lines`` recomputes the MLI stage alone;
+changing ``alveoli_minimum_size`` reuses inference and thresholding.
+
+Root inputs are keyed by ``file_key`` (path, size and mtime) or by
+``array_key`` (content hash), the latter for arrays such as napari layers
+that the user may have edited. The process-wide ``STAGE_CACHE`` is shared by
+the GUI workers and the paper scripts' CombinedWorker; passing ``cache=None``
+to any stage bypasses it. The inference stage can additionally be backed by
+a persistent ModelOutputCache on disk.
+
+Cached numpy outputs are made read-only so an accidental in-place edit
+cannot corrupt them; copy before handing them to code that mutates arrays.
+Intermediate snapshot callbacks only fire when a stage actually computes.
+"""
+
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import cv2
+import numpy as np
+import torch
+
+from alveoleye.lungcv import model_operations, tiling
+from alveoleye.lungcv.assessments import (
+    calculate_airspace_volume_density,
+    calculate_mean_linear_intercept,
+)
+from alveoleye.lungcv.output_cache import ModelOutputCache
+from alveoleye.lungcv.postprocessor import (
+    apply_dynamic_threshold,
+    apply_manual_threshold,
+    convert_to_grayscale,
+    generate_postprocessing_labelmap,
+    generate_processing_labelmap,
+    invert_image_binary,
+    remove_small_components,
+)
+from alveoleye.lungcv.profiling import profile_stage
+
+# =============================================================================
+# Constants
+# =============================================================================
+
+# Default memory budget of the process-wide stage cache
+DEFAULT_STAGE_CACHE_BYTES = 1024 ** 3
+
+# Stages and the stages they consume, in execution order
+STAGE_GRAPH: Dict[str, Tuple[str, ...]] = {
+    "inference": (),
+    "processing_labelmap": ("inference",),
+    "threshold": (),
+    "component_cleanup": ("threshold",),
+    "postprocessing_labelmap": ("processing_labelmap", "component_cleanup"),
+    "asvd": ("postprocessing_labelmap",),
+    "mli": ("postprocessing_labelmap",),
+}
+
+
+# =============================================================================
+# Keys
+# =============================================================================
+
+def make_key(stage: str, inputs: Sequence[str], params: Dict[str, Any]) -> str:
+    """Key of a stage result from its input keys and parameters."""
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(stage.encode())
+
+    for input_key in inputs:
+        digest.update(b"\0" + input_key.encode())
+
+    for name in sorted(params):
+        digest.update(f"\0{name}={params[name]!r}".encode())
+
+    return f"{stage}:{digest.hexdigest()}"
+
+
+def array_key(array: np.ndarray) -> str:
+    """Content key of an array (shape, dtype and bytes)."""
+    array = np.ascontiguousarray(array)
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(f"{array.shape}{array.dtype}".encode())
+    digest.update(memoryview(array).cast("B"))
+
+    return f"array:{digest.hexdigest()}"
+
+
+def file_key(path: str) -> str:
+    """Key of a file on disk; changes when the file is rewritten."""
+    stat = os.stat(path)
+
+    return f"file:{os.path.abspath(path)}:{stat.st_size}:{stat.st_mtime_ns}"
+
+
+def _nbytes(value: Any) -> int:
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, torch.Tensor):
+        return value.element_size() * value.nelement()
+    if isinstance(value, dict):
+        return sum(_nbytes(item) for item in value.values())
+    if isinstance(value, (list, tuple)):
+        return sum(_nbytes(item) for item in value)
+    return 0
+
+
+def _freeze(value: Any) -> None:
+    if isinstance(value, np.ndarray):
+        value.flags.writeable = False
+    elif isinstance(value, (list, tuple)):
+        for item in value:
+            _freeze(item)
+
+
+# =============================================================================
+# Cache
+# =============================================================================
+
+class StageCache:
+    """Thread-safe LRU of stage results, bounded by their total size in bytes.
+
+    Results larger than the whole budget are returned but not stored.
+    """
+
+    def __init__(self, max_bytes: int = DEFAULT_STAGE_CACHE_BYTES):
+        if max_bytes < 0:
+            raise ValueError(f"max_bytes must be non-negative, got {max_bytes}")
+
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[str, Tuple[Any, int]]" = OrderedDict()
+        self._size = 0
+        self._lock = threading.RLock()
+
+    def lookup(self, key: str) -> Tuple[bool, Any]:
+        """Return (found, value), refreshing the entry's recency on a hit."""
+        with self._lock:
+            entry = self._entries.get(key)
+
+            if entry is None:
+                self.misses += 1
+                return False, None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return True, entry[0]
+
+    def store(self, key: str, value: Any) -> None:
+        size = _nbytes(value)
+
+        if size > self.max_bytes:
+            return
+
+        _freeze(value)
+
+        with self._lock:
+            if key in self._entries:
+                self._size -= self._entries.pop(key)[1]
+
+            self._entries[key] = (value, size)
+            self._size += size
+
+            while self._size > self.max_bytes:
+                self._size -= self._entries.popitem(last=False)[1][1]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    @property
+    def size(self) -> int:
+        """Total size of the cached results in bytes."""
+        return self._size
+
+    def __contains__(self, key: str) -> bool:
+        with self._lock:
+            return key in self._entries
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+
+STAGE_CACHE = StageCache()
+
+
+def run_stage(
+    stage: str,
+    inputs: Sequence[str],
+    params: Dict[str, Any],
+    compute: Callable[[], Any],
+    cache: Optional[StageCache] = STAGE_CACHE,
+) -> Tuple[str, Any]:
+    """Return (key, result) of a stage, computing it only on a cache miss."""
+    key = make_key(stage, inputs, params)
+
+    with profile_stage(stage) as profile_args:
+        if cache is None:
+            return key, compute()
+
+        found, value = cache.lookup(key)
+        profile_args["cached"] = found
+        if found:
+            return key, value
+
+        value = compute()
+        cache.store(key, value)
+
+    return key, value
+
+
+# =============================================================================
+# Stages
+# =============================================================================
+
+def _weights_key(weights: Optional[str]) -> str:
+    return file_key(str(model_operations.resolve_weights_path(weights)))
+
+
+def inference_params(weights: Optional[str], preset: str = "full") -> Dict[str, Any]:
+    return {"weights": _weights_key(weights), "device": str(model_operations.get_device()), "preset": preset}
+
+
+def run_inference(image_key: str, image, weights: Optional[str] = None,
+                  cache: Optional[StageCache] = STAGE_CACHE,
+                  output_cache: Optional[ModelOutputCache] = None,
+                  preset: str = "full", low_res_masks: bool = False) -> Tuple[str, Dict[str, Any]]:
+    """Raw model output for an image path or RGB array.
+
+    With an output_cache, misses are served from (and saved to) disk first;
+    the disk cache holds full-size masks, so low_res_masks only applies
+    without one.
+    """
+    low_res_masks = low_res_masks and output_cache is None
+    params = inference_params(weights, preset)
+    if low_res_masks:
+        params["low_res_masks"] = True
+
+    def compute():
+        if output_cache is not None:
+            return output_cache.predict([image], weights, preset=preset)[0]
+
+        model = model_operations.get_trained_model(weights, preset=preset)
+        return model_operations.run_prediction(image, model, low_res_masks=low_res_masks)
+
+    return run_stage("inference", [image_key], params, compute, cache)
+
+
+def run_inferences(image_keys: Sequence[str], images: Sequence[Any], weights: Optional[str] = None,
+                   batch_size: int = model_operations.DEFAULT_PREDICTION_BATCH_SIZE,
+                   cache: Optional[StageCache] = STAGE_CACHE,
+                   output_cache: Optional[ModelOutputCache] = None,
+                   preset: str = "full") -> List[Tuple[str, Dict[str, Any]]]:
+    """Batched run_inference; only images missing from the cache go through the model."""
+    params = inference_params(weights, preset)
+    keys = [make_key("inference", [image_key], params) for image_key in image_keys]
+    outputs: List[Any] = [None] * len(keys)
+    missing = []
+
+    for index, key in enumerate(keys):
+        found, value = cache.lookup(key) if cache is not None else (False, None)
+        if found:
+            outputs[index] = value
+        else:
+            missing.append(index)
+
+    with profile_stage("inferences", images=len(keys), cached=len(keys) - len(missing)):
+        if missing:
+            missing_images = [images[index] for index in missing]
+
+            if output_cache is not None:
+                predictions = output_cache.predict(missing_images, weights, batch_size, preset=preset)
+            else:
+                model = model_operations.get_trained_model(weights, preset=preset)
+                predictions = model_operations.run_predictions(missing_images, model, batch_size)
+
+            for index, prediction in zip(missing, predictions):
+                outputs[index] = prediction
+                if cache is not None:
+                    cache.store(keys[index], prediction)
+
+    return list(zip(keys, outputs))
+
+
+def run_processing_labelmap(inference_key: str, model_output: Dict[str, Any], shape: Tuple[int, ...],
+                            confidence_threshold: float, labels: Dict[str, int], callback=None,
+                            cache: Optional[StageCache] = STAGE_CACHE) -> Tuple[str, np.ndarray]:
+    params = {"confidence_threshold": confidence_threshold, "labels": sorted(labels.items())}
+
+    return run_stage("processing_labelmap", [inference_key], params,
+                     lambda: generate_processing_labelmap(model_output, shape, confidence_threshold, labels, callback),
+                     cache)
+
+
+def run_tiled_processing_labelmap(image_key: str, image_path: str, weights: Optional[str],
+                                  confidence_threshold: float, labels: Dict[str, int],
+                                  tile_size: int = tiling.DEFAULT_TILE_SIZE,
+                                  overlap: int = tiling.DEFAULT_TILE_OVERLAP, callback=None,
+                                  cache: Optional[StageCache] = STAGE_CACHE,
+                                  preset: str = "full") -> Tuple[str, np.ndarray]:
+    """Processing labelmap of a large image, stitched from tiles without a full-size model output."""
+    params = dict(inference_params(weights, preset), confidence_threshold=confidence_threshold,
+                  labels=sorted(labels.items()), tile_size=tile_size, overlap=overlap)
+
+    def compute():
+        model = model_operations.get_trained_model(weights, preset=preset)
+        image = cv2.imread(image_path, cv2.IMREAD_COLOR)[:, :, ::-1]
+        return tiling.generate_tiled_processing_labelmap(image, model, confidence_threshold, labels,
+                                                         tile_size, overlap, callback=callback)
+
+    return run_stage("processing_labelmap", [image_key], params, compute, cache)
+
+
+def run_threshold(image_key: str, image: np.ndarray, manual_threshold: Optional[int] = None, callback=None,
+                  cache: Optional[StageCache] = STAGE_CACHE) -> Tuple[str, np.ndarray]:
+    """Grayscale and threshold an image; manual_threshold None uses the dynamic threshold."""
+    def compute():
+        grayscaled = convert_to_grayscale(image, callback)
+
+        if manual_threshold is not None:
+            return apply_manual_threshold(grayscaled, manual_threshold, callback)
+
+        return apply_dynamic_threshold(grayscaled, callback)
+
+    return run_stage("threshold", [image_key], {"manual_threshold": manual_threshold}, compute, cache)
+
+
+def run_component_cleanup(threshold_key: str, thresholded: np.ndarray, parenchyma_minimum_size: int,
+                          alveoli_minimum_size: int, callback=None,
+                          cache: Optional[StageCache] = STAGE_CACHE) -> Tuple[str, np.ndarray]:
+    """Remove small parenchyma and alveoli components from a thresholded image."""
+    def compute():
+        # remove_small_components edits its input in place
+        parenchyma_cleaned = remove_small_components(thresholded.copy(), parenchyma_minimum_size, callback)
+        inverted = invert_image_binary(parenchyma_cleaned, callback)
+        alveoli_cleaned = remove_small_components(inverted, alveoli_minimum_size, callback)
+        return invert_image_binary(alveoli_cleaned, callback)
+
+    params = {"parenchyma_minimum_size": parenchyma_minimum_size, "alveoli_minimum_size": alveoli_minimum_size}
+
+    return run_stage("component_cleanup", [threshold_key], params, compute, cache)
+
+
+def run_postprocessing_labelmap(processing_key: str, processing_labelmap: np.ndarray, cleanup_key: str,
+                                cleaned: np.ndarray, labels: Dict[str, int], callback=None,
+                                cache: Optional[StageCache] = STAGE_CACHE) -> Tuple[str, np.ndarray]:
+    return run_stage("postprocessing_labelmap", [processing_key, cleanup_key], {"labels": sorted(labels.items())},
+                     lambda: generate_postprocessing_labelmap(processing_labelmap, cleaned, labels, callback),
+                     cache)
+
+
+def run_asvd(postprocessing_key: str, labelmap: np.ndarray, labels: Dict[str, int],
+             cache: Optional[StageCache] = STAGE_CACHE) -> Tuple[str, Tuple[float, int, int]]:
+    return run_stage("asvd", [postprocessing_key], {"labels": sorted(labels.items())},
+                     lambda: calculate_airspace_volume_density(labelmap, labels), cache)
+
+
+def run_mli(postprocessing_key: str, labelmap: np.ndarray, num_lines: int, min_length: float, scale: float,
+            labels: Dict[str, int], randomized_distribution: bool = False, callback=None,
+            cache: Optional[StageCache] = STAGE_CACHE) -> Tuple[str, Tuple[Any, np.ndarray, int, Any]]:
+    """Mean linear intercept; randomized line placement is never cached."""
+    params = {"num_lines": num_lines, "min_length": min_length, "scale": scale, "labels": sorted(labels.items())}
+
+    return run_stage("mli", [postprocessing_key], params,
+                     lambda: calculate_mean_linear_intercept(labelmap, num_lines, min_length, scale, labels,
+                                                             randomized_distribution, callback),
+                     None if randomized_distribution else cache)
@@ -1,5 +1,20 @@
 import cv2
 import numpy as np
+import torch
+import torch.nn.functional as F
+from torchvision.models.detection.roi_heads import expand_boxes
+
+# Number of instance masks reduced at once when building class labelmaps
+MASK_REDUCTION_CHUNK_SIZE = 32
+
+# Model output key of [N, M, M] mask head probabilities that were not pasted into the image
+LOW_RES_MASKS_KEY = "mask_probs"
+
+# Padding torchvision adds around mask head outputs before pasting them
+MASK_PASTE_PADDING = 1
+
+# Offset added to Otsu's value by the dynamic threshold
+DYNAMIC_THRESHOLD_OFFSET = 20
 
 
 def convert_to_grayscale(image, callback=None):
@@ -11,8 +26,13 @@ def convert_to_grayscale(image, callback=None):
     return grayscaled
 
 
-def apply_dynamic_threshold(grayscale_image, callback=None):
-    threshold_value = cv2.threshold(grayscale_image, 0, 255, cv2.THRESH_OTSU)[0] + 20
+def get_dynamic_threshold_value(grayscale_image):
+    return cv2.threshold(grayscale_image, 0, 255, cv2.THRESH_OTSU)[0] + DYNAMIC_THRESHOLD_OFFSET
+
+
+def apply_dynamic_threshold(grayscale_image, callback=None, threshold_value=None):
+    if threshold_value is None:
+        threshold_value = get_dynamic_threshold_value(grayscale_image)
     thresholded = cv2.threshold(grayscale_image, threshold_value, 255, cv2.THRESH_BINARY)[1]
 
     if callback:
@@ -59,12 +79,36 @@ def generate_processing_labelmap(model_output, shape, confidence_threshold, labe
     if len(shape) == 3:
         shape = shape[:2]
 
-    airway_epithelium_labelmap = extract_class_labelmap_from_model(model_output, shape, 1, confidence_threshold)
-    vessel_epithelium_labelmap = extract_class_labelmap_from_model(model_output, shape, 2, confidence_threshold)
-
-    final_labelmap = np.zeros(shape, dtype="uint8")
-    final_labelmap = np.where(airway_epithelium_labelmap, labels["AIRWAY_EPITHELIUM"], final_labelmap)
-    final_labelmap = np.where(vessel_epithelium_labelmap, labels["VESSEL_ENDOTHELIUM"], final_labelmap)
+    low_res = LOW_RES_MASKS_KEY in model_output
+    masks = None if low_res else stack_instance_masks(model_output["masks"], shape)
+
+    if low_res:
+        # Rasterized box by box; no full-size instance masks are materialized
+        final_labelmap = np.zeros(shape, dtype="uint8")
+        paste_low_res_class_masks(final_labelmap, model_output, 1, confidence_threshold, labels["AIRWAY_EPITHELIUM"])
+        paste_low_res_class_masks(final_labelmap, model_output, 2, confidence_threshold, labels["VESSEL_ENDOTHELIUM"])
+
+        if callback:
+            airway_epithelium_labelmap = np.zeros(shape, dtype=bool)
+            vessel_epithelium_labelmap = np.zeros(shape, dtype=bool)
+            paste_low_res_class_masks(airway_epithelium_labelmap, model_output, 1, confidence_threshold, True)
+            paste_low_res_class_masks(vessel_epithelium_labelmap, model_output, 2, confidence_threshold, True)
+    elif masks is None:
+        final_labelmap = np.zeros(shape, dtype="uint8")
+        airway_epithelium_labelmap = vessel_epithelium_labelmap = np.zeros(shape, dtype=bool)
+    else:
+        airway_epithelium_mask = reduce_class_mask(model_output, masks, 1, confidence_threshold)
+        vessel_epithelium_mask = reduce_class_mask(model_output, masks, 2, confidence_threshold)
+
+        # Compose on the masks' device so only the final H x W uint8 map is transferred
+        final_mask = torch.zeros(shape, dtype=torch.uint8, device=masks.device)
+        final_mask[airway_epithelium_mask] = labels["AIRWAY_EPITHELIUM"]
+        final_mask[vessel_epithelium_mask] = labels["VESSEL_ENDOTHELIUM"]
+        final_labelmap = final_mask.cpu().numpy()
+
+        if callback:
+            airway_epithelium_labelmap = airway_epithelium_mask.cpu().numpy()
+            vessel_epithelium_labelmap = vessel_epithelium_mask.cpu().numpy()
 
     if callback:
         callback(airway_epithelium_labelmap, "GENERATE_PROCESSING_LABELMAP_AIRWAY")
@@ -75,13 +119,93 @@ def generate_processing_labelmap(model_output, shape, confidence_threshold, labe
 
 
 def extract_class_labelmap_from_model(model_output, shape, class_id, confidence_threshold):
-    model_output_mask = np.array([mask.cpu().numpy() for idx, mask in enumerate(model_output["masks"]) if (model_output["labels"][idx].cpu().numpy() == class_id and model_output["scores"][idx] > confidence_threshold)])
-    mask_with_confidence = (model_output_mask > confidence_threshold).any(axis=0)
+    if LOW_RES_MASKS_KEY in model_output:
+        class_labelmap = np.zeros(shape[:2], dtype=bool)
+        paste_low_res_class_masks(class_labelmap, model_output, class_id, confidence_threshold, True)
+        return class_labelmap
+
+    masks = stack_instance_masks(model_output["masks"], shape)
+
+    if masks is None:
+        return np.full(shape, False, dtype=bool)
+
+    return reduce_class_mask(model_output, masks, class_id, confidence_threshold).cpu().numpy()
+
+
+def reduce_class_mask(model_output, masks, class_id, confidence_threshold, instance_filter=None):
+    """Union of one class's confident [N, H, W] instance masks as an [H, W] bool tensor on their device."""
+    labels = torch.as_tensor(model_output["labels"], device=masks.device)
+    scores = torch.as_tensor(model_output["scores"], device=masks.device)
+
+    selected = (labels == class_id) & (scores > confidence_threshold)
+    if instance_filter is not None:
+        selected &= instance_filter.to(masks.device)
+
+    indices = torch.nonzero(selected).flatten()
+    class_mask = torch.zeros(masks.shape[1:], dtype=torch.bool, device=masks.device)
+
+    # A pixel is set if any instance exceeds the threshold there, i.e. if the
+    # per-pixel maximum does; reducing in chunks bounds the temporary copies
+    for start in range(0, len(indices), MASK_REDUCTION_CHUNK_SIZE):
+        chunk = masks.index_select(0, indices[start:start + MASK_REDUCTION_CHUNK_SIZE])
+        class_mask |= chunk.amax(dim=0) > confidence_threshold
+
+    return class_mask
+
+
+def paste_low_res_class_masks(target, model_output, class_id, confidence_threshold, value):
+    """Set target to value wherever a confident low-resolution instance mask of one class exceeds the threshold.
+
+    Follows torchvision's paste_masks_in_image (padded masks, expanded integer
+    boxes, bilinear resize to the box) but resizes and thresholds one box at
+    a time, so no full-size float mask is ever allocated.
+    """
+    labels = torch.as_tensor(model_output["labels"])
+    scores = torch.as_tensor(model_output["scores"])
+    selected = torch.nonzero((labels == class_id) & (scores > confidence_threshold)).flatten()
 
-    if mask_with_confidence is False:
-        mask_with_confidence = np.full(shape, False, dtype=bool)
+    if len(selected) == 0:
+        return
 
-    return mask_with_confidence
+    masks = torch.as_tensor(model_output[LOW_RES_MASKS_KEY])
+    masks = masks.index_select(0, selected.to(masks.device)).float()
+    boxes = torch.as_tensor(model_output["boxes"]).index_select(0, selected.to(masks.device))
+
+    scale = (masks.shape[-1] + 2 * MASK_PASTE_PADDING) / masks.shape[-1]
+    masks = F.pad(masks, (MASK_PASTE_PADDING,) * 4)
+    boxes = expand_boxes(boxes.float(), scale).to(dtype=torch.int64).tolist()
+    height, width = target.shape[:2]
+
+    for mask, (x0, y0, x1, y1) in zip(masks, boxes):
+        cx0, cx1 = max(x0, 0), min(x1 + 1, width)
+        cy0, cy1 = max(y0, 0), min(y1 + 1, height)
+        if cx0 >= cx1 or cy0 >= cy1:
+            continue
+
+        size = (max(y1 - y0 + 1, 1), max(x1 - x0 + 1, 1))
+        resized = F.interpolate(mask[None, None], size=size, mode="bilinear", align_corners=False)[0, 0]
+        confident = resized[cy0 - y0:cy1 - y0, cx0 - x0:cx1 - x0] > confidence_threshold
+
+        target[cy0:cy1, cx0:cx1][confident.cpu().numpy()] = value
+
+
+def stack_instance_masks(masks, shape):
+    """Normalize instance masks to an [N, H, W] tensor, or None if there are none."""
+    if len(masks) == 0:
+        return None
+
+    if not isinstance(masks, torch.Tensor):
+        if len({tuple(mask.shape) for mask in masks}) != 1:
+            raise ValueError("Instance masks must all have the same dimensions")
+        masks = torch.stack(list(masks))
+
+    if masks.dim() == 4:
+        masks = masks[:, 0]
+
+    if tuple(masks.shape[1:]) != tuple(shape[:2]):
+        raise ValueError(f"Mask dimensions {tuple(masks.shape[1:])} do not match image shape {tuple(shape[:2])}")
+
+    return masks
 
 
 def generate_postprocessing_labelmap(masks_labelmap, thresholded_labelmap, labels, callback=None):
@@ -118,7 +242,7 @@ def generate_complete_class_labelmap(class_epithelium_labelmap, thresholded_imag
     if class_epithelium_labelmap.ndim == 3 and class_epithelium_labelmap.shape[2] == 3:
         class_epithelium_labelmap = class_epithelium_labelmap[:, :, 0]
 
-    non_tissue_spaces = cv2.connectedComponents(thresholded_image)[1]
+    component_count, non_tissue_spaces = cv2.connectedComponents(thresholded_image)
 
     labelmap_without_overlap = class_epithelium_labelmap.copy()
     labelmap_with_overlap = np.where(thresholded_image, 0, class_epithelium_labelmap)
@@ -142,25 +266,38 @@ def generate_complete_class_labelmap(class_epithelium_labelmap, thresholded_imag
 
     contours = cv2.findContours(class_epithelium_labelmap, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)[0]
     kernel = np.ones((5, 5), np.uint8)
+    margin = kernel.shape[0] // 2
+
+    lumen_components = np.zeros(component_count, dtype=bool)
 
     for contour in contours:
-        mask = np.zeros_like(class_epithelium_labelmap, dtype=np.uint8)
-        cv2.drawContours(mask, [contour], -1, 255, thickness=cv2.FILLED)
+        # Work inside the contour's bounding box, padded so the erosion sees the
+        # background around it exactly as it would on the full image
+        x, y, w, h = cv2.boundingRect(contour)
+        x1, y1 = max(0, x - margin), max(0, y - margin)
+        x2, y2 = min(width, x + w + margin), min(height, y + h + margin)
+
+        mask = np.zeros((y2 - y1, x2 - x1), dtype=np.uint8)
+        cv2.drawContours(mask, [contour], -1, 255, thickness=cv2.FILLED, offset=(-x1, -y1))
 
         eroded_mask = cv2.erode(mask, kernel)
-        empty_spaces = cv2.bitwise_and(eroded_mask, cv2.bitwise_not(class_epithelium_labelmap))
 
-        empty_spaces = np.where(empty_spaces == 255, empty_spaces, 0)
+        if blocking:
+            labelmap_without_overlap[y1:y2, x1:x2][eroded_mask == 255] = lumen_label
+            continue
 
+        empty_spaces = ((eroded_mask == 255) & (class_epithelium_labelmap[y1:y2, x1:x2] == 0)).astype(np.uint8)
         centroids = cv2.connectedComponentsWithStats(empty_spaces, connectivity=8)[3]
 
-        if blocking:
-            labelmap_without_overlap[eroded_mask == 255] = lumen_label
-        else:
-            for centroid in centroids[1:]:
-                cx, cy = map(int, centroid)
-                component = non_tissue_spaces[cy, cx]
-                if component:
-                    labelmap_with_overlap[(non_tissue_spaces == component)] = lumen_label
-
-    return labelmap_without_overlap if blocking else labelmap_with_overlap
+        for centroid in centroids[1:]:
+            cx, cy = map(int, centroid)
+            lumen_components[non_tissue_spaces[y1 + cy, x1 + cx]] = True
+
+    if blocking:
+        return labelmap_without_overlap
+
+    # Fill every lumen component found above in one lookup-table pass
+    lumen_components[0] = False
+    labelmap_with_overlap[lumen_components[non_tissue_spaces]] = lumen_label
+
+    return labelmap_with_overlap
@@ -0,0 +1,106 @@
+"""Command-line interface for benchmarking the inference presets.
+
+Runs every inference preset on sample images and reports its latency and
+how closely its processing labelmaps agree with the "full" preset, so a
+preset can be checked on representative sections before it is used with
+``alveoleye-infer --preset`` or in the processing widget.
+
+Usage:
+    alveoleye-benchmark-presets sections/
+
+Example:
+    # Custom weights, int8 backend, only the faster presets
+    alveoleye-benchmark-presets sections/ --weights model.pth --backend int8 \
+        --presets balanced fast
+"""
+
+import argparse
+import sys
+import time
+
+from alveoleye.lungcv import model_operations, presets
+from alveoleye.lungcv.backends import DEFAULT_BACKEND, DEFAULT_PARITY_CONFIDENCE, available_backends
+from alveoleye.lungcv.inference import collect_image_paths
+
+
+def create_parser() -> argparse.ArgumentParser:
+    """Create the argument parser for the preset benchmark CLI.
+
+    Returns:
+        Configured ArgumentParser instance
+    """
+    parser = argparse.ArgumentParser(
+        description="Benchmark latency and mask agreement of the AlveolEye inference presets",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+
+    parser.add_argument(
+        "inputs",
+        nargs="+",
+        help="Image directories, glob patterns or image files",
+    )
+    parser.add_argument(
+        "--weights",
+        type=str,
+        default=None,
+        help="Path to model weights (default weights if omitted)",
+    )
+    parser.add_argument(
+        "--backend",
+        type=str,
+        default=DEFAULT_BACKEND,
+        choices=[name for name in available_backends() if name != "onnx"],
+        help="Inference backend",
+    )
+    parser.add_argument(
+        "--presets",
+        type=str,
+        nargs="+",
+        default=presets.available_presets(),
+        choices=presets.available_presets(),
+        help="Presets to compare with full",
+    )
+    parser.add_argument(
+        "--min-confidence",
+        type=float,
+        default=DEFAULT_PARITY_CONFIDENCE,
+        help="Minimum confidence in percent for the compared labelmaps",
+    )
+
+    return parser
+
+
+def main() -> None:
+    """Main entry point for the CLI."""
+    args = create_parser().parse_args()
+    start_time = time.time()
+
+    try:
+        from alveoleye._config_utils import Config
+
+        images = collect_image_paths(args.inputs)
+        if not images:
+            raise ValueError("No images found for the given inputs")
+
+        model = model_operations.get_trained_model(args.weights, backend=args.backend)
+        reports = presets.benchmark_presets(model, images, Config.get_labels(), args.min_confidence, args.presets)
+    except KeyboardInterrupt:
+        print("\n[CLI] Benchmark interrupted by user")
+        sys.exit(130)
+    except Exception as e:
+        print(f"\nError during benchmark: {e}", file=sys.stderr)
+        sys.exit(1)
+
+    print(f"{'preset':<10} {'ms/image':>9} {'speedup':>8} {'min agree':>10} {'mean agree':>11} {'detections':>12}")
+    for name, report in reports.items():
+        ms = 1000 * sum(report.candidate_seconds) / max(len(report.candidate_seconds), 1)
+        detections = (f"{min(report.detection_differences, default=0):+d}.."
+                      f"{max(report.detection_differences, default=0):+d}")
+        print(f"{name:<10} {ms:>9.0f} {report.speedup:>7.2f}x {report.min_agreement:>10.4f} "
+              f"{report.mean_agreement:>11.4f} {detections:>12}")
+
+    print(f"Elapsed time: {time.time() - start_time:.2f} seconds")
+
+
+if __name__ == "__main__":
+    main()
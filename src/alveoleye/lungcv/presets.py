@@ -0,0 +1,236 @@
+"""Inference presets trading Mask R-CNN accuracy for speed.
+
+A preset sets the inference-time knobs of a loaded MaskRCNN: the size the
+transform resizes images to, how many RPN proposals are kept before and
+after NMS, how many detections are returned per image and the box score
+threshold. "full" restores the torchvision defaults the model was trained
+with; "balanced" and "fast" shrink the input and the proposal budget.
+
+apply_inference_preset tunes a model in place; with_inference_preset
+returns a tuned view that shares the weights but has its own transform,
+RPN and ROI heads, so the model it was made from keeps its settings. The
+model registry keeps one such view per preset, so callers asking for
+different presets never run each other's. Every preset should be checked
+against "full" with benchmark_presets on representative sections before
+use.
+
+Example:
+    from alveoleye.lungcv import model_operations, presets
+
+    model = model_operations.get_trained_model("model.pth", preset="fast")
+    reports = presets.benchmark_presets(model, ["section.png"], labels)
+"""
+
+import copy
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Union
+
+import numpy as np
+import torch
+from PIL import Image
+
+from alveoleye.lungcv.backends import DEFAULT_PARITY_CONFIDENCE, ParityReport, _timed_labelmap
+
+# =============================================================================
+# Presets
+# =============================================================================
+
+@dataclass(frozen=True)
+class InferencePreset:
+    """Inference-time settings of a MaskRCNN.
+
+    Attributes:
+        min_size: Length the shorter image side is resized to.
+        max_size: Upper bound on the longer image side after resizing.
+        rpn_pre_nms_top_n: Proposals kept per feature level before NMS.
+        rpn_post_nms_top_n: Proposals kept after NMS.
+        detections_per_img: Maximum number of detections per image.
+        score_thresh: Minimum box score of returned detections.
+    """
+    min_size: int
+    max_size: int
+    rpn_pre_nms_top_n: int
+    rpn_post_nms_top_n: int
+    detections_per_img: int
+    score_thresh: float
+
+
+# Presets by name, slowest first; "full" matches the torchvision defaults
+INFERENCE_PRESETS = {
+    "full": InferencePreset(800, 1333, 1000, 1000, 100, 0.05),
+    "balanced": InferencePreset(600, 1000, 500, 500, 100, 0.05),
+    "fast": InferencePreset(400, 667, 300, 300, 50, 0.1),
+}
+
+# Preset used when none is requested
+DEFAULT_PRESET = "full"
+
+
+def available_presets() -> List[str]:
+    """Names of the inference presets, slowest first."""
+    return list(INFERENCE_PRESETS)
+
+
+def get_preset(name: str) -> InferencePreset:
+    """Look up a preset by name.
+
+    Raises:
+        ValueError: If no preset has that name.
+    """
+    try:
+        return INFERENCE_PRESETS[name]
+    except KeyError:
+        raise ValueError(f"Unknown inference preset {name!r}, expected one of {available_presets()}") from None
+
+
+def _detector(model: Any) -> Optional[Any]:
+    """The MaskRCNN behind a backend adapter, or None for models without one (ONNX)."""
+    while not hasattr(model, "roi_heads") and hasattr(model, "module"):
+        model = model.module
+
+    if all(hasattr(model, name) for name in ("transform", "rpn", "roi_heads")):
+        return model
+
+    return None
+
+
+def apply_inference_preset(model: Any, name: str = DEFAULT_PRESET) -> Any:
+    """Set the inference-time knobs of a model to a preset, in place.
+
+    Works on eager MaskRCNN models and on the int8 and TorchScript backend
+    adapters. Models without these knobs, such as ONNX graphs whose sizes
+    are fixed at export time, only accept the "full" preset.
+
+    Args:
+        model: Model returned by get_trained_model.
+        name: Preset name (see INFERENCE_PRESETS).
+
+    Returns:
+        The same model, for chaining.
+
+    Raises:
+        ValueError: If the preset is unknown or the model cannot be tuned.
+    """
+    preset = get_preset(name)
+    detector = _detector(model)
+
+    if detector is None:
+        if name != DEFAULT_PRESET:
+            raise ValueError(f"Inference preset {name!r} cannot be applied to {type(model).__name__}")
+        return model
+
+    detector.transform.min_size = (preset.min_size,)
+    detector.transform.max_size = preset.max_size
+
+    # Dicts keyed by "training"/"testing"; reassigned so scripted modules pick them up
+    rpn = detector.rpn
+    rpn._pre_nms_top_n = dict(rpn._pre_nms_top_n, testing=preset.rpn_pre_nms_top_n)
+    rpn._post_nms_top_n = dict(rpn._post_nms_top_n, testing=preset.rpn_post_nms_top_n)
+
+    detector.roi_heads.detections_per_img = preset.detections_per_img
+    detector.roi_heads.score_thresh = preset.score_thresh
+
+    return model
+
+
+def _shallow_copy(module: Any) -> Any:
+    """Copy of a module sharing its parameters, whose submodules can be replaced without touching the original."""
+    clone = copy.copy(module)
+    if isinstance(module, torch.nn.Module):
+        clone._modules = module._modules.copy()
+    return clone
+
+
+def with_inference_preset(model: Any, name: str = DEFAULT_PRESET) -> Any:
+    """A copy of a model tuned to a preset, leaving the model itself untouched.
+
+    Eager models and adapters around them are copied shallowly: the copy
+    shares every weight with the original and only gets its own transform,
+    RPN and ROI heads. TorchScript modules cannot share submodules with a
+    modified copy and are deep-copied. Models without these knobs are
+    returned as-is for the "full" preset.
+
+    Args:
+        model: Model returned by get_trained_model.
+        name: Preset name (see INFERENCE_PRESETS).
+
+    Returns:
+        The tuned copy.
+
+    Raises:
+        ValueError: If the preset is unknown or the model cannot be tuned.
+    """
+    get_preset(name)
+    detector = _detector(model)
+
+    if detector is None:
+        return apply_inference_preset(model, name)
+
+    if isinstance(detector, torch.jit.ScriptModule):
+        return apply_inference_preset(copy.deepcopy(model), name)
+
+    def copy_to_detector(module):
+        clone = _shallow_copy(module)
+        if module is detector:
+            for attribute in ("transform", "rpn", "roi_heads"):
+                setattr(clone, attribute, copy.copy(getattr(module, attribute)))
+        else:
+            clone.module = copy_to_detector(module.module)
+        return clone
+
+    return apply_inference_preset(copy_to_detector(model), name)
+
+
+# =============================================================================
+# Benchmark
+# =============================================================================
+
+def benchmark_presets(
+    model: Any,
+    images: Sequence[Union[str, Path, np.ndarray]],
+    labels: Dict[str, int],
+    min_confidence: float = DEFAULT_PARITY_CONFIDENCE,
+    presets: Optional[Sequence[str]] = None,
+) -> Dict[str, ParityReport]:
+    """Latency and labelmap agreement of each preset against "full".
+
+    Every image is run with the "full" preset first; its processing
+    labelmap is the reference the other presets are compared to, pixel by
+    pixel. Presets are applied to copies (see with_inference_preset), so the
+    model itself is not modified.
+
+    Args:
+        model: Model returned by get_trained_model (eager, int8 or TorchScript).
+        images: Image paths or decoded RGB [H, W, 3] arrays.
+        labels: Label values (the Labels section of config.json).
+        min_confidence: Minimum confidence in percent.
+        presets: Preset names to compare (all presets if None).
+
+    Returns:
+        ParityReport per preset name, with "full" as the reference.
+    """
+    names = list(presets) if presets is not None else available_presets()
+    for name in names:
+        get_preset(name)
+
+    reports = {name: ParityReport() for name in names}
+    reference = with_inference_preset(model, DEFAULT_PRESET)
+    candidates = {name: with_inference_preset(model, name) for name in names}
+
+    for image in images:
+        if not isinstance(image, np.ndarray):
+            image = np.array(Image.open(image).convert("RGB"))
+
+        expected, expected_count, reference_seconds = _timed_labelmap(image, reference, min_confidence, labels)
+
+        for name in names:
+            actual, actual_count, seconds = _timed_labelmap(image, candidates[name], min_confidence, labels)
+
+            report = reports[name]
+            report.agreements.append(float(np.mean(expected == actual)))
+            report.detection_differences.append(actual_count - expected_count)
+            report.reference_seconds.append(reference_seconds)
+            report.candidate_seconds.append(seconds)
+
+    return reports
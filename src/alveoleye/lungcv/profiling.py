@@ -0,0 +1,498 @@
+"""Per-stage timing and memory profiling of the AlveolEye pipeline.
+
+A StageProfiler records two kinds of events:
+
+    stage: A span opened with StageProfiler.stage (or begin/end). While a
+        profiler is active in a thread (StageProfiler.activate), every
+        pipeline stage run through pipeline.run_stage, model loading and
+        prediction record themselves as stages.
+    step: A named step reported through the pipeline's callback(data,
+        step_name) hook. The profiler is itself such a callback; a step
+        spans from the previous step (or the start of the enclosing stage)
+        to the callback, so CONVERT_TO_GRAYSCALE covers the grayscale
+        conversion, REMOVE_SMALL_COMPONENTS the component removal, and so
+        on. The step's data is described by shape, dtype and size.
+
+Every event has its wall time, the CPU time of the whole process (torch
+and OpenCV worker threads included, and so are other busy threads of the
+process), and its peak memory delta: the highest resident set size sampled
+during the event minus the RSS at its start. RSS is sampled in a background
+thread every PROFILER_SAMPLE_INTERVAL seconds while the profiler is active,
+and covers NumPy arrays and CPU torch tensors alike; steps shorter than the
+interval may miss their peak.
+
+Profiles export as JSON (events and a per-name summary) and in the Chrome
+trace event format, viewable in chrome://tracing or https://ui.perfetto.dev.
+
+Example:
+    from alveoleye.lungcv import pipeline
+    from alveoleye.lungcv.profiling import StageProfiler
+
+    profiler = StageProfiler()
+    with profiler.activate():
+        key, thresholded = pipeline.run_threshold(image_key, image, callback=profiler)
+    profiler.save_chrome_trace("threshold.trace.json")
+"""
+
+import functools
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional, Union
+
+import numpy as np
+
+# =============================================================================
+# Constants
+# =============================================================================
+
+# Seconds between RSS samples while a profiler is active
+PROFILER_SAMPLE_INTERVAL = 0.005
+
+# Version of the JSON profile layout
+PROFILE_FORMAT_VERSION = 1
+
+# Event categories
+STAGE_CATEGORY = "stage"
+STEP_CATEGORY = "step"
+
+
+# =============================================================================
+# Memory
+# =============================================================================
+
+def _make_rss_reader() -> Callable[[], Optional[int]]:
+    """Fastest available reader of the current RSS in bytes."""
+    try:
+        import psutil
+    except ImportError:
+        psutil = None
+
+    if psutil is not None:
+        process = psutil.Process()
+        return lambda: process.memory_info().rss
+
+    if sys.platform.startswith("linux"):
+        page_size = os.sysconf("SC_PAGE_SIZE")
+
+        def read_statm() -> Optional[int]:
+            with open("/proc/self/statm", "rb") as fh:
+                return int(fh.read().split()[1]) * page_size
+
+        return read_statm
+
+    return lambda: None
+
+
+_read_rss = _make_rss_reader()
+
+
+def current_rss_bytes() -> Optional[int]:
+    """Resident set size of this process, or None where it cannot be read."""
+    return _read_rss()
+
+
+# =============================================================================
+# Events
+# =============================================================================
+
+@dataclass
+class ProfileEvent:
+    """A timed stage or step.
+
+    Attributes:
+        name: Stage name or callback step name.
+        category: STAGE_CATEGORY or STEP_CATEGORY.
+        start: Seconds from the profiler's creation to the start of the event.
+        wall_seconds: Wall time of the event.
+        cpu_seconds: CPU time of the process during the event.
+        peak_rss_delta_mb: Highest sampled RSS during the event minus the RSS
+            at its start (None where RSS cannot be read).
+        thread: Name of the thread the event ran in.
+        depth: Number of stages enclosing the event.
+        args: Stage arguments, or shape/dtype/nbytes of a step's data.
+    """
+    name: str
+    category: str
+    start: float
+    wall_seconds: float
+    cpu_seconds: float
+    peak_rss_delta_mb: Optional[float]
+    thread: str
+    depth: int
+    args: Dict[str, Any] = field(default_factory=dict)
+
+
+@dataclass
+class _Span:
+    name: str
+    category: str
+    wall: float
+    cpu: float
+    rss: Optional[int]
+    peak: Optional[int]
+    args: Dict[str, Any]
+
+
+def describe_data(data: Any) -> Dict[str, Any]:
+    """Shape, dtype and size in bytes of a step's data (arrays, tensors, and dicts and lists of them)."""
+    if isinstance(data, np.ndarray):
+        return {"shape": list(data.shape), "dtype": str(data.dtype), "nbytes": int(data.nbytes)}
+
+    if hasattr(data, "element_size") and hasattr(data, "shape"):
+        # torch.Tensor, without importing torch here
+        return {"shape": list(data.shape), "dtype": str(data.dtype).replace("torch.", ""),
+                "nbytes": int(data.element_size() * data.numel())}
+
+    if isinstance(data, dict):
+        nbytes = sum(describe_data(value).get("nbytes", 0) for value in data.values())
+        return {"keys": sorted(map(str, data)), "nbytes": nbytes}
+
+    if isinstance(data, (list, tuple)):
+        nbytes = sum(describe_data(value).get("nbytes", 0) for value in data)
+        return {"length": len(data), "nbytes": nbytes}
+
+    return {"type": type(data).__name__} if data is not None else {}
+
+
+# =============================================================================
+# Profiler
+# =============================================================================
+
+# Profiler that pipeline stages in the current thread record into
+_ACTIVE = threading.local()
+
+
+class StageProfiler:
+    """Records stages and callback steps with their time and memory.
+
+    A profiler may be shared by several threads; each thread has its own
+    stack of open stages. Calling the profiler as callback(data, step_name)
+    records a step and forwards the call to the wrapped callback; the time
+    spent in the wrapped callback (saving snapshots, for example) is not
+    counted towards any step.
+
+    Args:
+        callback: Callback to forward steps to, if any.
+        sample_interval: Seconds between RSS samples while active.
+    """
+
+    def __init__(self, callback: Optional[Callable[[Any, str], None]] = None,
+                 sample_interval: float = PROFILER_SAMPLE_INTERVAL):
+        self.callback = callback
+        self.sample_interval = sample_interval
+        self.events: List[ProfileEvent] = []
+        self.origin = time.perf_counter()
+
+        self._lock = threading.Lock()
+        self._threads = threading.local()
+        self._open_spans: List[_Span] = []
+        self._active_count = 0
+        self._sampler: Optional[threading.Thread] = None
+        self._sampler_stop = threading.Event()
+
+    # -------------------------------------------------------------------------
+    # Recording
+    # -------------------------------------------------------------------------
+
+    def _stack(self) -> List[_Span]:
+        if not hasattr(self._threads, "stack"):
+            self._threads.stack = []
+            self._threads.step = None
+        return self._threads.stack
+
+    def _open(self, name: str, category: str, args: Dict[str, Any]) -> _Span:
+        rss = current_rss_bytes()
+        span = _Span(name, category, time.perf_counter(), time.process_time(), rss, rss, args)
+        with self._lock:
+            self._open_spans.append(span)
+        return span
+
+    def _close(self, span: _Span, depth: int, args: Optional[Dict[str, Any]] = None) -> ProfileEvent:
+        wall, cpu, rss = time.perf_counter(), time.process_time(), current_rss_bytes()
+
+        with self._lock:
+            self._open_spans.remove(span)
+            peak = max(value for value in (span.peak, rss) if value is not None) if rss is not None else None
+            delta = None if peak is None or span.rss is None else max(peak - span.rss, 0) / 2 ** 20
+            event = ProfileEvent(span.name, span.category, span.wall - self.origin, wall - span.wall,
+                                 cpu - span.cpu, delta, threading.current_thread().name, depth,
+                                 dict(span.args, **(args or {})))
+            self.events.append(event)
+
+        return event
+
+    def _restart_step(self) -> None:
+        self._stack()
+        if self._threads.step is not None:
+            with self._lock:
+                self._open_spans.remove(self._threads.step)
+        self._threads.step = self._open("", STEP_CATEGORY, {})
+
+    @property
+    def depth(self) -> int:
+        """Number of stages open in the current thread."""
+        return len(self._stack())
+
+    def begin(self, name: str, **args: Any) -> None:
+        """Open a stage in the current thread; stages nest and must be closed in order with end."""
+        self._stack().append(self._open(name, STAGE_CATEGORY, args))
+        self._restart_step()
+
+    def end(self, **args: Any) -> ProfileEvent:
+        """Close the innermost open stage of the current thread, adding args to it."""
+        stack = self._stack()
+        if not stack:
+            raise RuntimeError("No open stage to end")
+
+        event = self._close(stack.pop(), len(stack), args)
+        self._restart_step()
+        return event
+
+    @contextmanager
+    def stage(self, name: str, **args: Any) -> Iterator[Dict[str, Any]]:
+        """Record the enclosed code as a stage.
+
+        Yields a dict whose entries are added to the stage's args when it
+        closes, for facts only known inside the stage (a cache hit, say).
+        """
+        extra: Dict[str, Any] = {}
+        self.begin(name, **args)
+        try:
+            yield extra
+        finally:
+            self.end(**extra)
+
+    def step(self, data: Any, step_name: str, callback: Optional[Callable[[Any, str], None]] = None) -> None:
+        """Record a step that ended now, then call callback, whose time is not counted towards any step."""
+        stack = self._stack()
+        if self._threads.step is None:
+            self._restart_step()
+
+        span = self._threads.step
+        span.name, span.args = step_name, describe_data(data)
+        self._threads.step = None
+        self._close(span, len(stack))
+
+        if callback is not None:
+            callback(data, step_name)
+
+        self._restart_step()
+
+    def __call__(self, data: Any, step_name: str) -> None:
+        """Record a step and forward it to the profiler's callback."""
+        self.step(data, step_name, self.callback)
+
+    def wrap(self, callback: Optional[Callable[[Any, str], None]]) -> Callable[[Any, str], None]:
+        """A callback recording steps into this profiler before forwarding them to callback.
+
+        Wrapping an already wrapped callback returns it unchanged.
+        """
+        if callback is self or (isinstance(callback, _StepRecorder) and callback.profiler is self):
+            return callback
+        return _StepRecorder(self, callback)
+
+    # -------------------------------------------------------------------------
+    # Activation
+    # -------------------------------------------------------------------------
+
+    def _sample(self) -> None:
+        while not self._sampler_stop.wait(self.sample_interval):
+            rss = current_rss_bytes()
+            if rss is None:
+                return
+
+            with self._lock:
+                for span in self._open_spans:
+                    if span.peak is None or rss > span.peak:
+                        span.peak = rss
+
+    @contextmanager
+    def activate(self) -> Iterator["StageProfiler"]:
+        """Make this the profiler that pipeline stages in the current thread record into.
+
+        Activations nest; RSS is sampled while any activation is open.
+        """
+        previous = getattr(_ACTIVE, "profiler", None)
+        _ACTIVE.profiler = self
+
+        with self._lock:
+            self._active_count += 1
+            if self._sampler is None:
+                self._sampler_stop.clear()
+                self._sampler = threading.Thread(target=self._sample, name="alveoleye-profiler", daemon=True)
+                self._sampler.start()
+
+        try:
+            yield self
+        finally:
+            _ACTIVE.profiler = previous
+
+            with self._lock:
+                self._active_count -= 1
+                sampler = self._sampler if self._active_count == 0 else None
+                if sampler is not None:
+                    self._sampler = None
+                    self._sampler_stop.set()
+
+            if sampler is not None:
+                sampler.join()
+
+    # -------------------------------------------------------------------------
+    # Export
+    # -------------------------------------------------------------------------
+
+    def clear(self) -> None:
+        """Drop the recorded events."""
+        with self._lock:
+            self.events.clear()
+
+    def summary(self) -> Dict[str, Dict[str, Any]]:
+        """Totals per event name: count, wall and CPU seconds and the largest peak RSS delta."""
+        totals: Dict[str, Dict[str, Any]] = {}
+        for event in list(self.events):
+            total = totals.setdefault(event.name, {"category": event.category, "count": 0, "wall_seconds": 0.0,
+                                                   "cpu_seconds": 0.0, "max_peak_rss_delta_mb": None})
+            total["count"] += 1
+            total["wall_seconds"] += event.wall_seconds
+            total["cpu_seconds"] += event.cpu_seconds
+            if event.peak_rss_delta_mb is not None:
+                total["max_peak_rss_delta_mb"] = max(total["max_peak_rss_delta_mb"] or 0.0, event.peak_rss_delta_mb)
+
+        return dict(sorted(totals.items(), key=lambda item: -item[1]["wall_seconds"]))
+
+    def to_dict(self) -> Dict[str, Any]:
+        """The profile as a JSON-serializable dict."""
+        return {
+            "version": PROFILE_FORMAT_VERSION,
+            "events": [asdict(event) for event in list(self.events)],
+            "summary": self.summary(),
+        }
+
+    def to_chrome_trace(self) -> Dict[str, Any]:
+        """The profile in the Chrome trace event format (complete events, microseconds)."""
+        pid = os.getpid()
+        thread_ids: Dict[str, int] = {}
+        trace_events: List[Dict[str, Any]] = [
+            {"name": "process_name", "ph": "M", "pid": pid, "tid": 0, "args": {"name": "AlveolEye"}},
+        ]
+
+        for event in sorted(self.events, key=lambda event: (event.start, event.depth)):
+            if event.thread not in thread_ids:
+                thread_ids[event.thread] = len(thread_ids) + 1
+                trace_events.append({"name": "thread_name", "ph": "M", "pid": pid, "tid": thread_ids[event.thread],
+                                     "args": {"name": event.thread}})
+
+            trace_events.append({
+                "name": event.name,
+                "cat": event.category,
+                "ph": "X",
+                "ts": round(event.start * 1e6, 3),
+                "dur": round(event.wall_seconds * 1e6, 3),
+                "pid": pid,
+                "tid": thread_ids[event.thread],
+                "args": dict(event.args, cpu_ms=round(event.cpu_seconds * 1e3, 3),
+                             peak_rss_delta_mb=event.peak_rss_delta_mb),
+            })
+
+        return {"traceEvents": trace_events, "displayTimeUnit": "ms"}
+
+    def save_json(self, path: Union[str, Path]) -> Path:
+        """Write the profile as JSON."""
+        return _write_json(path, self.to_dict())
+
+    def save_chrome_trace(self, path: Union[str, Path]) -> Path:
+        """Write the profile as a Chrome trace."""
+        return _write_json(path, self.to_chrome_trace())
+
+    def save(self, directory: Union[str, Path], name: str) -> List[Path]:
+        """Write <name>.profile.json and <name>.trace.json into directory."""
+        directory = Path(directory)
+        os.makedirs(directory, exist_ok=True)
+        return [self.save_json(directory / f"{name}.profile.json"),
+                self.save_chrome_trace(directory / f"{name}.trace.json")]
+
+
+class _StepRecorder:
+    """Callback recording steps into a profiler, then forwarding them."""
+
+    def __init__(self, profiler: StageProfiler, callback: Optional[Callable[[Any, str], None]]):
+        self.profiler = profiler
+        self.callback = callback
+
+    def __call__(self, data: Any, step_name: str) -> None:
+        self.profiler.step(data, step_name, self.callback)
+
+
+def _write_json(path: Union[str, Path], payload: Dict[str, Any]) -> Path:
+    path = Path(path)
+    path.write_text(json.dumps(payload, indent=1))
+    return path
+
+
+# =============================================================================
+# Instrumentation
+# =============================================================================
+
+def active_profiler() -> Optional[StageProfiler]:
+    """The profiler activated in the current thread, if any."""
+    return getattr(_ACTIVE, "profiler", None)
+
+
+def profile_stage(name: str, **args: Any):
+    """Context recording a stage into the active profiler; does nothing without one.
+
+    Yields the stage's extra-args dict (see StageProfiler.stage).
+    """
+    profiler = active_profiler()
+    return profiler.stage(name, **args) if profiler is not None else nullcontext({})
+
+
+def record_step(data: Any, step_name: str) -> None:
+    """Record a step into the active profiler, if any, without a callback to forward to."""
+    profiler = active_profiler()
+    if profiler is not None:
+        profiler.step(data, step_name)
+
+
+def profiled(name: str) -> Callable:
+    """Decorator recording every call of a function as a stage of the active profiler."""
+    def decorator(function: Callable) -> Callable:
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with profile_stage(name):
+                return function(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def profiled_worker(method: Callable) -> Callable:
+    """Decorator for worker methods: runs them with the worker's profiler, if any.
+
+    The worker's profiler (its ``profiler`` attribute) is activated, the
+    method is recorded as a stage named after the worker class and method,
+    and the worker's ``callback`` is routed through the profiler for the
+    duration of the call, so every callback step is recorded too.
+    """
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        profiler = getattr(self, "profiler", None)
+        if profiler is None:
+            return method(self, *args, **kwargs)
+
+        callback = self.callback
+        self.callback = profiler.wrap(callback)
+        try:
+            with profiler.activate(), profiler.stage(f"{type(self).__name__}.{method.__name__}"):
+                return method(self, *args, **kwargs)
+        finally:
+            self.callback = callback
+
+    return wrapper
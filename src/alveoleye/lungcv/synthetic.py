@@ -0,0 +1,491 @@
+"""Procedural synthetic lung sections for load and scale testing.
+
+Generates H&E-like images of alveolar tissue with airways and vessels, and
+the matching annotation masks, from a seed alone, so inference,
+postprocessing, training data loading and export can be exercised at any
+size without real sections:
+
+1. Alveoli are the cells of a jittered-grid Voronoi tessellation; their
+   borders, dilated to septum thickness, are the tissue. Some neighbouring
+   cells are merged into one airspace, and a few are filled in completely,
+   like collapsed or tangentially cut alveoli.
+2. Airways are elliptical lumens lined by an epithelium ring; vessels are
+   lumens holding red blood cells inside an endothelium ring. Both sit in
+   a band of surrounding tissue and never overlap.
+3. Low-frequency shading and per-pixel noise mimic uneven staining.
+
+The epithelium and endothelium rings are also drawn into a class map (one
+class ID per pixel), which write_synthetic_dataset saves as masks in the
+classes.json colors of a LungDataset, in the flat or the split layout.
+
+Images are generated in strips of rows, so temporaries stay small and a
+10k x 10k section needs little more memory than its image and class map.
+The same seed, size and parameters always give the same section.
+
+Example:
+    from alveoleye.lungcv import synthetic
+
+    section = synthetic.generate_section(10_000, seed=7)
+    synthetic.write_synthetic_dataset("synthetic_dataset", count=8, width=4096)
+"""
+
+import json
+import os
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import List, Optional, Tuple, Union
+
+import cv2
+import numpy as np
+from PIL import Image
+
+from alveoleye.lungcv.mrcnn.dataset import DEFAULT_VAL_SPLIT
+
+# =============================================================================
+# Constants
+# =============================================================================
+
+# Mean spacing of alveolar centers, in pixels
+DEFAULT_ALVEOLUS_SIZE = 56
+
+# Width of the alveolar septa, in pixels
+DEFAULT_SEPTUM_THICKNESS = 5
+
+# Fraction of alveoli drawn filled with tissue
+DENSE_ALVEOLUS_FRACTION = 0.06
+
+# Fraction of alveoli sharing one airspace with their right neighbour, like alveolar ducts
+MERGED_ALVEOLUS_FRACTION = 0.15
+
+# Section area per airway and per vessel when their counts are not given, in pixels
+PIXELS_PER_AIRWAY = 6_000_000
+PIXELS_PER_VESSEL = 2_500_000
+
+# Attempts at placing an airway or vessel clear of the others before giving up on it
+PLACEMENT_ATTEMPTS = 50
+
+# Section area per instance over the square of the largest instance radius
+PLACEMENT_AREA_FACTOR = 16
+
+# Radius of a red blood cell, in pixels
+RED_BLOOD_CELL_RADIUS = 3
+
+# Rows generated at once; part of the definition of a section, since noise is drawn per strip
+STRIP_ROWS = 512
+
+# Annotated classes in class ID order (IDs start at 1) with their mask colors
+CLASS_COLORS = {
+    "airway_epithelium": (255, 0, 0),
+    "vessel_endothelium": (0, 255, 0),
+}
+
+# Class IDs of the annotated rings
+AIRWAY_CLASS_ID = 1
+VESSEL_CLASS_ID = 2
+
+# RGB colors of the tissue components
+AIRSPACE_COLOR = (246, 238, 244)
+SEPTUM_COLOR = (206, 132, 178)
+ADVENTITIA_COLOR = (218, 150, 190)
+EPITHELIUM_COLOR = (146, 70, 158)
+VESSEL_WALL_COLOR = (212, 116, 158)
+ENDOTHELIUM_COLOR = (168, 78, 138)
+PLASMA_COLOR = (236, 196, 206)
+BLOOD_COLOR = (194, 62, 90)
+
+# Relative amplitude of the low-frequency stain shading
+SHADING_AMPLITUDE = 0.06
+
+# Largest per-pixel intensity noise, in gray levels
+NOISE_AMPLITUDE = 10
+
+# Side of the section returned as napari sample data, in pixels
+SAMPLE_DATA_SIZE = 2048
+
+
+# =============================================================================
+# Sections
+# =============================================================================
+
+@dataclass(frozen=True)
+class SyntheticInstance:
+    """An airway or vessel of a synthetic section.
+
+    Attributes:
+        class_id: AIRWAY_CLASS_ID or VESSEL_CLASS_ID.
+        center: (x, y) center in pixels.
+        axes: Half-axes of the lining ring in pixels.
+        angle: Rotation of the ellipse in degrees.
+        thickness: Width of the lining ring in pixels.
+        wall: Width of the tissue band around the ring in pixels.
+        blood_cells: (x, y) centers of the red blood cells in the lumen.
+    """
+    class_id: int
+    center: Tuple[int, int]
+    axes: Tuple[int, int]
+    angle: float
+    thickness: int
+    wall: int
+    blood_cells: np.ndarray = field(default_factory=lambda: np.zeros((0, 2), dtype=np.int64), compare=False)
+
+    @property
+    def extent(self) -> int:
+        """Distance from the center to the outer edge of the wall."""
+        return max(self.axes) + self.thickness + self.wall
+
+    def _ellipse(self, patch: np.ndarray, grow: int, color, thickness: int) -> None:
+        center = (self.extent + 1, self.extent + 1)
+        axes = (max(self.axes[0] + grow, 1), max(self.axes[1] + grow, 1))
+        cv2.ellipse(patch, center, axes, self.angle, 0, 360, color, thickness)
+
+    def _paste(self, target: np.ndarray, patch: np.ndarray, where: np.ndarray, row_offset: int) -> None:
+        # Instances are drawn into their own patch and pasted, so their pixels do not
+        # depend on where the target is clipped
+        top, left = self.center[1] - self.extent - 1 - row_offset, self.center[0] - self.extent - 1
+        rows = slice(max(top, 0), min(top + len(patch), target.shape[0]))
+        cols = slice(max(left, 0), min(left + len(patch), target.shape[1]))
+        if rows.start >= rows.stop or cols.start >= cols.stop:
+            return
+
+        local = (slice(rows.start - top, rows.stop - top), slice(cols.start - left, cols.stop - left))
+        region = target[rows, cols]
+        region[where[local]] = patch[local][where[local]]
+
+    def draw_ring(self, target: np.ndarray, value, row_offset: int = 0) -> None:
+        """Draw the lining ring, the annotated part of the instance.
+
+        Args:
+            target: Image or mask the ring is drawn into, in place.
+            value: Pixel value or color of the ring.
+            row_offset: Section row of the first row of target.
+        """
+        ring = np.zeros((2 * self.extent + 3,) * 2, dtype=np.uint8)
+        self._ellipse(ring, 0, 1, self.thickness)
+        patch = np.empty(ring.shape + target.shape[2:], dtype=target.dtype)
+        patch[...] = value
+        self._paste(target, patch, ring.astype(bool), row_offset)
+
+    def draw_tissue(self, target: np.ndarray, row_offset: int = 0) -> None:
+        """Draw the wall, lumen and ring of the instance into an RGB image."""
+        is_airway = self.class_id == AIRWAY_CLASS_ID
+        side = 2 * self.extent + 3
+        patch = np.zeros((side, side, 3), dtype=np.uint8)
+        covered = np.zeros((side, side), dtype=np.uint8)
+
+        self._ellipse(covered, self.thickness + self.wall, 1, cv2.FILLED)
+        self._ellipse(patch, self.thickness + self.wall, ADVENTITIA_COLOR if is_airway else VESSEL_WALL_COLOR,
+                      cv2.FILLED)
+        self._ellipse(patch, -(self.thickness // 2 + 1), AIRSPACE_COLOR if is_airway else PLASMA_COLOR, cv2.FILLED)
+
+        offset = np.array(self.center) - self.extent - 1
+        for x, y in self.blood_cells - offset:
+            cv2.circle(patch, (int(x), int(y)), RED_BLOOD_CELL_RADIUS, BLOOD_COLOR, cv2.FILLED)
+
+        self._ellipse(patch, 0, EPITHELIUM_COLOR if is_airway else ENDOTHELIUM_COLOR, self.thickness)
+        self._paste(target, patch, covered.astype(bool), row_offset)
+
+
+@dataclass
+class SyntheticLungSection:
+    """A generated section and its annotation.
+
+    Attributes:
+        image: RGB image, uint8 [H, W, 3].
+        class_map: Class ID of every pixel (0 for unannotated), uint8 [H, W].
+        instances: The airways and vessels drawn into the section.
+    """
+    image: np.ndarray
+    class_map: np.ndarray
+    instances: List[SyntheticInstance]
+
+    def rgb_mask(self) -> np.ndarray:
+        """The annotation as an RGB mask in the CLASS_COLORS colors."""
+        return _mask_palette()[self.class_map]
+
+    def mask_image(self) -> Image.Image:
+        """The annotation as a palette image, which decodes to the RGB mask."""
+        mask = Image.fromarray(self.class_map, mode="P")
+        mask.putpalette(_mask_palette().ravel().tolist())
+        return mask
+
+
+def _mask_palette() -> np.ndarray:
+    palette = np.zeros((256, 3), dtype=np.uint8)
+    for class_id, color in enumerate(CLASS_COLORS.values(), start=1):
+        palette[class_id] = color
+    return palette
+
+
+def _ellipse_points(rng: np.random.Generator, count: int, axes: Tuple[float, float], angle: float) -> np.ndarray:
+    """Uniform random offsets inside a rotated ellipse."""
+    radius = np.sqrt(rng.random(count))
+    theta = rng.random(count) * 2 * np.pi
+    x, y = axes[0] * radius * np.cos(theta), axes[1] * radius * np.sin(theta)
+    cos, sin = np.cos(np.radians(angle)), np.sin(np.radians(angle))
+    return np.stack([x * cos - y * sin, x * sin + y * cos], axis=1)
+
+
+def _place_instances(
+    rng: np.random.Generator,
+    width: int,
+    height: int,
+    alveolus_size: int,
+    airways: int,
+    vessels: int,
+) -> List[SyntheticInstance]:
+    """Airways then vessels at random positions inside the section, clear of each other."""
+    instances = []
+    # Leave every instance a share of the section, so the requested counts fit
+    share = np.sqrt(width * height / (PLACEMENT_AREA_FACTOR * max(airways + vessels, 1)))
+    max_radius = max(int(min(min(width, height) / 4, share)), 8)
+
+    for class_id, count, radii in ((AIRWAY_CLASS_ID, airways, (3, 8)), (VESSEL_CLASS_ID, vessels, (1.5, 5))):
+        for _ in range(count):
+            for attempt in range(PLACEMENT_ATTEMPTS):
+                # Shrink instances that keep colliding
+                shrink = 1 - attempt / PLACEMENT_ATTEMPTS
+                major = max(int(min(rng.uniform(*radii) * alveolus_size, max_radius) * shrink), 8)
+                minor = max(int(major * rng.uniform(0.6, 1.0)), 4)
+                if class_id == AIRWAY_CLASS_ID:
+                    thickness, wall = max(major // 10, 3), max(major // 5, 4)
+                else:
+                    thickness, wall = max(major // 25, 2), max(major // 8, 3)
+                extent = major + thickness + wall
+
+                if 2 * extent >= min(width, height):
+                    continue
+                center = (int(rng.integers(extent, width - extent)), int(rng.integers(extent, height - extent)))
+
+                if any(np.hypot(center[0] - other.center[0], center[1] - other.center[1])
+                       <= extent + other.extent + alveolus_size // 2 for other in instances):
+                    continue
+
+                angle = float(rng.uniform(0, 180))
+                blood_cells = np.zeros((0, 2), dtype=np.int64)
+                if class_id == VESSEL_CLASS_ID:
+                    lumen = (major - thickness, minor - thickness)
+                    count_cells = int(rng.uniform(0.2, 0.8) * lumen[0] * lumen[1] / RED_BLOOD_CELL_RADIUS ** 2)
+                    offsets = _ellipse_points(rng, count_cells, lumen, angle)
+                    blood_cells = np.round(offsets + center).astype(np.int64)
+
+                instances.append(SyntheticInstance(class_id, center, (major, minor), angle, thickness, wall,
+                                                   blood_cells))
+                break
+
+    return instances
+
+
+def _shading(rng: np.random.Generator, alveolus_size: int) -> List[tuple]:
+    """Random plane waves whose sum is the stain shading."""
+    waves = []
+    for _ in range(3):
+        period = rng.uniform(5, 20) * alveolus_size
+        direction = rng.uniform(0, 2 * np.pi)
+        waves.append((2 * np.pi * np.cos(direction) / period, 2 * np.pi * np.sin(direction) / period,
+                      rng.uniform(0, 2 * np.pi)))
+    return waves
+
+
+def _render_strip(
+    top: int,
+    rows: int,
+    width: int,
+    points: np.ndarray,
+    owners: np.ndarray,
+    dense: np.ndarray,
+    alveolus_size: int,
+    septum_thickness: int,
+    instances: List[SyntheticInstance],
+    waves: List[tuple],
+    rng: np.random.Generator,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """RGB image and class map of the section rows [top, top + rows)."""
+    # Context around the strip so every pixel sees its nearest alveolar center
+    margin = 2 * alveolus_size
+    buffer_top = top - margin
+    buffer = np.ones((rows + 2 * margin, width + 2 * margin), dtype=np.uint8)
+
+    inside = ((points[:, 1] >= buffer_top) & (points[:, 1] < buffer_top + buffer.shape[0])
+              & (points[:, 0] >= -margin) & (points[:, 0] < width + margin))
+    local = points[inside] - (-margin, buffer_top)
+    buffer[local[:, 1], local[:, 0]] = 0
+
+    labels = cv2.distanceTransformWithLabels(buffer, cv2.DIST_L2, 5, labelType=cv2.DIST_LABEL_PIXEL)[1]
+    # Labels are per buffer; map them to global airspace IDs so strips agree on cell borders
+    lut = np.zeros(labels.max() + 1, dtype=np.int64)
+    lut[labels[local[:, 1], local[:, 0]]] = owners[inside]
+
+    pad = min(septum_thickness + 1, margin)
+    cells = lut[labels[margin - pad:margin + rows + pad, margin:margin + width]]
+    borders = np.zeros(cells.shape, dtype=np.uint8)
+    borders[:, 1:] |= cells[:, 1:] != cells[:, :-1]
+    borders[1:] |= cells[1:] != cells[:-1]
+    kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (septum_thickness, septum_thickness))
+    septa = cv2.dilate(borders, kernel)[pad:pad + rows]
+
+    tissue = septa.astype(bool) | dense[cells[pad:pad + rows]]
+    image = np.where(tissue[..., None], np.float32(SEPTUM_COLOR), np.float32(AIRSPACE_COLOR))
+
+    class_map = np.zeros((rows, width), dtype=np.uint8)
+    for instance in instances:
+        if abs(instance.center[1] - (top + rows / 2)) <= rows / 2 + instance.extent:
+            instance.draw_tissue(image, top)
+            instance.draw_ring(class_map, instance.class_id, top)
+
+    y = np.arange(top, top + rows, dtype=np.float32)[:, None]
+    x = np.arange(width, dtype=np.float32)[None, :]
+    shade = np.zeros((rows, width), dtype=np.float32)
+    for kx, ky, phase in waves:
+        shade += np.sin(ky * y + phase) * np.cos(kx * x) + np.cos(ky * y + phase) * np.sin(kx * x)
+    shade *= SHADING_AMPLITUDE / len(waves)
+    shade += 1
+    image *= shade[..., None]
+
+    image += rng.integers(-NOISE_AMPLITUDE, NOISE_AMPLITUDE + 1, size=(rows, width, 1)).astype(np.float32)
+    return np.clip(image, 0, 255).astype(np.uint8), class_map
+
+
+def generate_section(
+    width: int,
+    height: Optional[int] = None,
+    seed: int = 0,
+    alveolus_size: int = DEFAULT_ALVEOLUS_SIZE,
+    septum_thickness: int = DEFAULT_SEPTUM_THICKNESS,
+    airways: Optional[int] = None,
+    vessels: Optional[int] = None,
+) -> SyntheticLungSection:
+    """Generate a synthetic lung section.
+
+    Args:
+        width: Image width in pixels.
+        height: Image height in pixels (square if None).
+        seed: Seed of everything random in the section.
+        alveolus_size: Mean spacing of alveolar centers in pixels.
+        septum_thickness: Width of the alveolar septa in pixels.
+        airways: Number of airways (one per PIXELS_PER_AIRWAY, at least
+            one, if None). Fewer are placed if they do not fit.
+        vessels: Number of vessels (one per PIXELS_PER_VESSEL, at least
+            one, if None). Fewer are placed if they do not fit.
+
+    Returns:
+        The RGB image, its class map and the placed instances.
+
+    Raises:
+        ValueError: If a size or count is not positive.
+    """
+    height = width if height is None else height
+    if width < 1 or height < 1 or alveolus_size < 2 or septum_thickness < 1:
+        raise ValueError(f"Invalid section geometry: {width}x{height}, alveolus size {alveolus_size}, "
+                         f"septum thickness {septum_thickness}")
+
+    airways = max(round(width * height / PIXELS_PER_AIRWAY), 1) if airways is None else airways
+    vessels = max(round(width * height / PIXELS_PER_VESSEL), 1) if vessels is None else vessels
+    if airways < 0 or vessels < 0:
+        raise ValueError("Airway and vessel counts cannot be negative")
+
+    rng = np.random.default_rng([seed, 0])
+
+    # One alveolar center per grid cell, kept off the cell edges so no two share a pixel
+    grid_y, grid_x = np.mgrid[-1:height // alveolus_size + 2, -1:width // alveolus_size + 2]
+    jitter = rng.uniform(0.15, 0.85, size=grid_x.shape + (2,))
+    points = ((np.stack([grid_x, grid_y], axis=-1) + jitter) * alveolus_size).astype(np.int64).reshape(-1, 2)
+    dense = rng.random(len(points)) < DENSE_ALVEOLUS_FRACTION
+
+    # Airspace of every alveolus: its own index, or that of the right neighbour it merges with
+    columns = grid_x.shape[1]
+    merged = rng.random(len(points)) < MERGED_ALVEOLUS_FRACTION
+    merged[columns - 1::columns] = False
+    owners = np.arange(len(points)) + merged
+    while not np.array_equal(owners, owners[owners]):
+        owners = owners[owners]
+
+    instances = _place_instances(rng, width, height, alveolus_size, airways, vessels)
+    waves = _shading(rng, alveolus_size)
+
+    image = np.empty((height, width, 3), dtype=np.uint8)
+    class_map = np.empty((height, width), dtype=np.uint8)
+    for index, top in enumerate(range(0, height, STRIP_ROWS)):
+        rows = min(STRIP_ROWS, height - top)
+        image[top:top + rows], class_map[top:top + rows] = _render_strip(
+            top, rows, width, points, owners, dense, alveolus_size, septum_thickness, instances, waves,
+            np.random.default_rng([seed, 1, index]),
+        )
+
+    return SyntheticLungSection(image, class_map, instances)
+
+
+# =============================================================================
+# Datasets
+# =============================================================================
+
+def write_classes_json(root: Union[str, Path]) -> Path:
+    """Write the classes.json of the synthetic annotation colors."""
+    path = Path(root) / "classes.json"
+    with open(path, "w") as fh:
+        json.dump({name: f"[{r} {g} {b}]" for name, (r, g, b) in CLASS_COLORS.items()}, fh, indent=2)
+    return path
+
+
+def write_synthetic_dataset(
+    root: Union[str, Path],
+    count: int,
+    width: int,
+    height: Optional[int] = None,
+    seed: int = 0,
+    structure: str = "flat",
+    val_split: float = DEFAULT_VAL_SPLIT,
+    compress_level: int = 1,
+    **section_kwargs,
+) -> Path:
+    """Write synthetic sections as a LungDataset.
+
+    Every section gets its own seed derived from seed and its index, and
+    is written and released before the next is generated. Masks are saved
+    as palette PNGs, which decode to the RGB masks LungDataset expects.
+
+    Args:
+        root: Dataset directory, created if needed.
+        count: Number of sections.
+        width: Image width in pixels.
+        height: Image height in pixels (square if None).
+        seed: Seed of the dataset.
+        structure: "flat" (images/, masks/) or "split" (images/train,
+            images/val, ...), the layouts of LungDataset.
+        val_split: Fraction of sections in val/ for the split structure.
+        compress_level: PNG compression level (0-9); low levels write
+            large sections much faster.
+        **section_kwargs: Further arguments of generate_section.
+
+    Returns:
+        The dataset root.
+
+    Raises:
+        ValueError: If count is below 2 or structure is unknown.
+    """
+    if count < 2:
+        raise ValueError("A LungDataset needs at least two sections (training and validation)")
+    if structure not in ("flat", "split"):
+        raise ValueError(f"Unknown dataset structure {structure!r}, expected 'flat' or 'split'")
+
+    root = Path(root)
+    n_val = min(max(1, int(count * val_split)), count - 1)
+
+    for index in range(count):
+        if structure == "split":
+            folder = "val" if index >= count - n_val else "train"
+            images_dir, masks_dir = root / "images" / folder, root / "masks" / folder
+        else:
+            images_dir, masks_dir = root / "images", root / "masks"
+        os.makedirs(images_dir, exist_ok=True)
+        os.makedirs(masks_dir, exist_ok=True)
+
+        section_seed = int(np.random.SeedSequence([seed, index]).generate_state(1)[0])
+        section = generate_section(width, height, section_seed, **section_kwargs)
+
+        name = f"section_{index:04d}.png"
+        Image.fromarray(section.image).save(images_dir / name, compress_level=compress_level)
+        section.mask_image().save(masks_dir / name, compress_level=compress_level)
+        del section
+
+    write_classes_json(root)
+    return root
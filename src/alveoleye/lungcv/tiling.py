@@ -0,0 +1,202 @@
+"""Tiled sliding-window inference for large lung sections.
+
+Whole-slide-sized images do not fit through Mask R-CNN in one pass: the
+full-image [N, 1, H, W] float mask output alone grows with the image. This
+module runs the model on fixed-size overlapping tiles and rasterizes each
+tile's detections straight into the processing labelmap, so peak memory is
+bounded by the tile size rather than the image size.
+
+Duplicate instances in the overlap regions are resolved by ownership: every
+tile owns a core region (its area up to the midpoint of each overlap), and
+an instance is kept only by the tile whose core contains its box center.
+An object seen by two tiles is therefore painted exactly once, by the tile
+that sees it most completely.
+"""
+
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from alveoleye.lungcv import model_operations
+from alveoleye.lungcv.postprocessor import stack_instance_masks, reduce_class_mask
+
+# =============================================================================
+# Constants
+# =============================================================================
+
+# Default tile edge length in pixels
+DEFAULT_TILE_SIZE = 1024
+
+# Default overlap between neighbouring tiles in pixels
+DEFAULT_TILE_OVERLAP = 128
+
+# Number of tiles sent through the model per forward pass
+DEFAULT_TILE_BATCH_SIZE = 2
+
+# Images above this many pixels are processed tile by tile in the widget
+TILED_INFERENCE_MIN_PIXELS = 4096 * 4096
+
+# Model class ids painted into the processing labelmap, in paint order
+AIRWAY_CLASS_ID = 1
+VESSEL_CLASS_ID = 2
+
+
+# =============================================================================
+# Tile Layout
+# =============================================================================
+
+def tile_starts(length: int, tile_size: int, overlap: int) -> List[int]:
+    """Start offsets of tiles covering one axis.
+
+    Tiles are tile_size long and step by tile_size - overlap; the last tile is
+    shifted back to end exactly at length so every tile has the same size.
+    """
+    if length <= tile_size:
+        return [0]
+
+    stride = tile_size - overlap
+    starts = list(range(0, length - tile_size, stride))
+    starts.append(length - tile_size)
+
+    return starts
+
+
+def core_bounds(starts: List[int], tile_size: int, length: int) -> List[Tuple[int, int]]:
+    """Half-open core region owned by each tile along one axis.
+
+    Neighbouring tiles split their overlap at its midpoint.
+    """
+    cuts = [0]
+    for previous, current in zip(starts, starts[1:]):
+        cuts.append((previous + tile_size + current) // 2)
+    cuts.append(length)
+
+    return list(zip(cuts[:-1], cuts[1:]))
+
+
+def iter_tiles(
+    height: int,
+    width: int,
+    tile_size: int = DEFAULT_TILE_SIZE,
+    overlap: int = DEFAULT_TILE_OVERLAP,
+) -> Iterator[Tuple[Tuple[int, int, int, int], Tuple[int, int, int, int]]]:
+    """Yield (tile, core) windows as (y0, x0, y1, x1) in image coordinates.
+
+    Raises:
+        ValueError: If tile_size or overlap are out of range.
+    """
+    if tile_size < 1:
+        raise ValueError(f"tile_size must be at least 1, got {tile_size}")
+    if not 0 <= overlap < tile_size:
+        raise ValueError(f"overlap must be in [0, tile_size), got {overlap}")
+
+    y_starts = tile_starts(height, tile_size, overlap)
+    x_starts = tile_starts(width, tile_size, overlap)
+    y_cores = core_bounds(y_starts, tile_size, height)
+    x_cores = core_bounds(x_starts, tile_size, width)
+
+    for y0, (cy0, cy1) in zip(y_starts, y_cores):
+        for x0, (cx0, cx1) in zip(x_starts, x_cores):
+            tile = (y0, x0, min(y0 + tile_size, height), min(x0 + tile_size, width))
+            yield tile, (cy0, cx0, cy1, cx1)
+
+
+# =============================================================================
+# Stitching
+# =============================================================================
+
+def paint_tile_prediction(
+    labelmap: np.ndarray,
+    prediction: Dict[str, Any],
+    tile: Tuple[int, int, int, int],
+    core: Tuple[int, int, int, int],
+    confidence_threshold: float,
+    labels: Dict[str, int],
+) -> None:
+    """Rasterize one tile's owned detections into the global labelmap in place.
+
+    Args:
+        labelmap: Global processing labelmap [H, W] (uint8).
+        prediction: Model output for the tile (boxes, labels, scores, masks).
+        tile: Tile window (y0, x0, y1, x1).
+        core: Core region owned by the tile (y0, x0, y1, x1).
+        confidence_threshold: Threshold in [0, 1] for scores and mask pixels.
+        labels: Label values from config.json.
+    """
+    if len(prediction.get("scores", ())) == 0:
+        return
+
+    ty0, tx0, ty1, tx1 = tile
+    cy0, cx0, cy1, cx1 = core
+
+    boxes = prediction["boxes"]
+    centers_x = (boxes[:, 0] + boxes[:, 2]) / 2 + tx0
+    centers_y = (boxes[:, 1] + boxes[:, 3]) / 2 + ty0
+    owned = (centers_x >= cx0) & (centers_x < cx1) & (centers_y >= cy0) & (centers_y < cy1)
+
+    region = labelmap[ty0:ty1, tx0:tx1]
+    masks = stack_instance_masks(prediction["masks"], region.shape)
+
+    for class_id, label_name in ((AIRWAY_CLASS_ID, "AIRWAY_EPITHELIUM"), (VESSEL_CLASS_ID, "VESSEL_ENDOTHELIUM")):
+        class_mask = reduce_class_mask(prediction, masks, class_id, confidence_threshold, owned).cpu().numpy()
+
+        if class_id == AIRWAY_CLASS_ID:
+            # Vessel pixels already painted by a neighbouring tile take precedence,
+            # matching generate_processing_labelmap
+            class_mask &= region != labels["VESSEL_ENDOTHELIUM"]
+
+        region[class_mask] = labels[label_name]
+
+
+def generate_tiled_processing_labelmap(
+    image: np.ndarray,
+    model: Any,
+    confidence_threshold: float,
+    labels: Dict[str, int],
+    tile_size: int = DEFAULT_TILE_SIZE,
+    overlap: int = DEFAULT_TILE_OVERLAP,
+    batch_size: int = DEFAULT_TILE_BATCH_SIZE,
+    callback: Optional[Callable[[Any, str], None]] = None,
+) -> np.ndarray:
+    """Tiled equivalent of postprocessor.generate_processing_labelmap.
+
+    Args:
+        image: Decoded RGB image [H, W, 3].
+        model: Trained MaskRCNN model.
+        confidence_threshold: Minimum confidence in percent (0-100).
+        labels: Label values from config.json.
+        tile_size: Tile edge length in pixels.
+        overlap: Overlap between neighbouring tiles in pixels. Objects smaller
+            than the overlap are never split between tiles.
+        batch_size: Number of tiles per forward pass.
+        callback: Optional pipeline callback, called with the final labelmap.
+
+    Returns:
+        Processing labelmap [H, W] (uint8).
+    """
+    confidence_threshold = confidence_threshold / 100
+    height, width = image.shape[:2]
+    labelmap = np.zeros((height, width), dtype="uint8")
+
+    windows = list(iter_tiles(height, width, tile_size, overlap))
+
+    for start in range(0, len(windows), batch_size):
+        batch_windows = windows[start:start + batch_size]
+        tiles = [image[y0:y1, x0:x1] for (y0, x0, y1, x1), _ in batch_windows]
+
+        predictions = model_operations.run_predictions(tiles, model, batch_size)
+
+        for (tile, core), prediction in zip(batch_windows, predictions):
+            paint_tile_prediction(labelmap, prediction, tile, core, confidence_threshold, labels)
+
+        del predictions
+
+    if callback:
+        callback(labelmap, "GENERATE_PROCESSING_LABELMAP_COMBINED")
+
+    return labelmap
+
+
+def should_tile(shape: Tuple[int, ...], min_pixels: int = TILED_INFERENCE_MIN_PIXELS) -> bool:
+    """Whether an image of the given shape should go through tiled inference."""
+    return shape[0] * shape[1] > min_pixels
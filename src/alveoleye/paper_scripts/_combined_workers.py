@@ -3,19 +3,8 @@ import os
 from pathlib import Path
 import cv2
 
-from alveoleye.lungcv import model_operations
-from alveoleye.lungcv.assessments import (
-    calculate_airspace_volume_density,
-    calculate_mean_linear_intercept,
-)
-from alveoleye.lungcv.postprocessor import (
-    remove_small_components,
-    generate_postprocessing_labelmap,
-    generate_processing_labelmap,
-    apply_dynamic_threshold,
-    convert_to_grayscale,
-    invert_image_binary,
-)
+from alveoleye.lungcv import model_operations, pipeline
+from alveoleye.lungcv.profiling import profiled_worker
 
 
 class CombinedWorker:
@@ -37,7 +26,12 @@ class CombinedWorker:
         self.minimum_length = 20
         self.scale = 0.18872
         self.randomized_distribution = False
+        self.batch_size = model_operations.DEFAULT_PREDICTION_BATCH_SIZE
         self.callback = None
+        self.profiler = None
+        self.model_output = None
+        self.stage_cache = pipeline.STAGE_CACHE
+        self.output_cache = None
 
         self.shortened_image_path = None
         self.asvd = None
@@ -53,6 +47,10 @@ class CombinedWorker:
         self.number_of_chords = None
         self.stdev_chord_lengths = None
         self.rgb_image = None
+        self.image_key = None
+        self.inference_key = None
+        self.processing_key = None
+        self.postprocessing_key = None
         self.counter = 0
         self.first = None
         self.current_results = None
@@ -60,6 +58,7 @@ class CombinedWorker:
 
     def set_image_path(self, image_path):
         self.image_path = image_path
+        self.model_output = None
 
     def set_weights_path(self, weights):
         self.weights_path = weights
@@ -91,6 +90,39 @@ class CombinedWorker:
     def set_callback(self, callback):
         self.callback = callback
 
+    def set_profiler(self, profiler):
+        self.profiler = profiler
+
+    def set_batch_size(self, batch_size):
+        self.batch_size = batch_size
+
+    def set_model_output(self, model_output):
+        self.model_output = model_output
+
+    def set_stage_cache(self, stage_cache):
+        self.stage_cache = stage_cache
+
+    def set_output_cache(self, output_cache):
+        self.output_cache = output_cache
+
+    @profiled_worker
+    def predict(self, image_paths):
+        image_keys = [pipeline.file_key(image_path) for image_path in image_paths]
+        results = pipeline.run_inferences(image_keys, image_paths, self.weights_path, self.batch_size,
+                                          self.stage_cache, self.output_cache)
+
+        return [model_output for _, model_output in results]
+
+    def iterate_with_predictions(self, image_paths):
+        for start in range(0, len(image_paths), self.batch_size):
+            chunk = image_paths[start:start + self.batch_size]
+
+            for image_path, model_output in zip(chunk, self.predict(chunk)):
+                self.set_image_path(image_path)
+                self.set_model_output(model_output)
+                yield image_path
+
+    @profiled_worker
     def run_processing(self):
         if not self.image_path:
             raise ValueError("[-] Error: Image path is not set.")
@@ -100,16 +132,23 @@ class CombinedWorker:
 
         try:
             self.rgb_image = cv2.imread(self.image_path, cv2.IMREAD_COLOR)[:, :, ::-1]
+            self.image_key = pipeline.file_key(self.image_path)
 
-            model = model_operations.init_trained_model(self.weights_path)
+            if self.model_output is None:
+                self.model_output = self.predict([self.image_path])[0]
 
-            model_output = model_operations.run_prediction(self.image_path, model)
-            self.inference_labelmap = generate_processing_labelmap(model_output, self.rgb_image.shape, self.confidence,
-                                                                   self.labels, self.callback)
+            model_output = self.model_output
+            self.model_output = None
+            self.inference_key = pipeline.make_key("inference", [self.image_key],
+                                                   pipeline.inference_params(self.weights_path))
+            self.processing_key, self.inference_labelmap = pipeline.run_processing_labelmap(
+                self.inference_key, model_output, self.rgb_image.shape, self.confidence, self.labels, self.callback,
+                self.stage_cache)
 
         except Exception as e:
             print(f"[-] Error in processing: {e}")
 
+    @profiled_worker
     def run_postprocessing(self):
         if self.rgb_image is None:
             raise ValueError("[-] Error: Run processing first")
@@ -124,17 +163,18 @@ class CombinedWorker:
             raise ValueError("[-] Error: Run processing first")
 
         try:
-            grayscaled = convert_to_grayscale(self.rgb_image, self.callback)
-            thresholded = apply_dynamic_threshold(grayscaled, self.callback)
-            parenchyma_cleaned = remove_small_components(thresholded, self.parenchyma_minimum_size, self.callback)
-            inverted = invert_image_binary(parenchyma_cleaned, self.callback)
-            alveoli_cleaned = remove_small_components(inverted, self.alveoli_minimum_size, self.callback)
-            inverted_back = invert_image_binary(alveoli_cleaned, self.callback)
-
-            self.labelmap = generate_postprocessing_labelmap(self.inference_labelmap, inverted_back, self.labels, self.callback)
+            threshold_key, thresholded = pipeline.run_threshold(self.image_key, self.rgb_image, None, self.callback,
+                                                                self.stage_cache)
+            cleanup_key, inverted_back = pipeline.run_component_cleanup(
+                threshold_key, thresholded, self.parenchyma_minimum_size, self.alveoli_minimum_size, self.callback,
+                self.stage_cache)
+            self.postprocessing_key, self.labelmap = pipeline.run_postprocessing_labelmap(
+                self.processing_key, self.inference_labelmap, cleanup_key, inverted_back, self.labels, self.callback,
+                self.stage_cache)
         except Exception as e:
             print(f"[-] Error: Error in post-processing: {e}")
 
+    @profiled_worker
     def run_assessments(self):
         if self.labelmap is None:
             raise ValueError("[-] Error: Run postprocessing first")
@@ -152,11 +192,11 @@ class CombinedWorker:
             raise ValueError("[-] Error: Image path is not set")
 
         try:
-            self.mli, self.assessments_layer, self.number_of_chords, self.stdev_chord_lengths = calculate_mean_linear_intercept(
-                self.labelmap, self.number_of_lines, self.minimum_length, self.scale, self.labels,
-                self.randomized_distribution, self.callback)
-            self.asvd, self.airspace_pixels, self.non_airspace_pixels = calculate_airspace_volume_density(self.labelmap,
-                                                                                                          self.labels)
+            self.mli, self.assessments_layer, self.number_of_chords, self.stdev_chord_lengths = pipeline.run_mli(
+                self.postprocessing_key, self.labelmap, self.number_of_lines, self.minimum_length, self.scale,
+                self.labels, self.randomized_distribution, self.callback, self.stage_cache)[1]
+            self.asvd, self.airspace_pixels, self.non_airspace_pixels = pipeline.run_asvd(
+                self.postprocessing_key, self.labelmap, self.labels, self.stage_cache)[1]
             self.shortened_image_path = os.path.join(os.path.basename(os.path.dirname(self.image_path)),
                                                      os.path.basename(self.image_path))
 
@@ -169,6 +209,7 @@ class CombinedWorker:
         except Exception as e:
             print(f"[-] Error in metrics calculation: {e}")
 
+    @profiled_worker
     def run_complete_pipline(self):
         self.run_processing()
         self.run_postprocessing()
@@ -2,7 +2,8 @@
 import argparse
 import os
 import torch
-from alveoleye.lungcv.model_operations import init_trained_model, run_prediction
+from alveoleye.lungcv.model_operations import get_trained_model, run_predictions
+from alveoleye.lungcv.output_cache import ModelOutputCache
 import matplotlib.pyplot as plt
 import numpy as np
 from PIL import Image
@@ -19,6 +20,9 @@ def validate_arguments(args):
     if not os.path.isfile(args.weights_path):
         raise ValueError(f"Model file does not exist: {args.weights_path}")
 
+    if args.batch_size < 1:
+        raise ValueError("Batch size must be at least 1")
+
 
 def print_arguments(args):
     print(f"[+] Running with the following arguments:\n\n"
@@ -28,9 +32,7 @@ def print_arguments(args):
           f"    Colorbar Orientation: {args.colorbar_orientation}\n")
 
 
-def create_heatmaps(args, confidence_maps_output_dir, image_path):
-    model = init_trained_model(args.weights_path)
-    prediction = run_prediction(image_path, model)
+def create_heatmaps(args, confidence_maps_output_dir, image_path, prediction):
     masks = prediction["masks"]
     labels = prediction["labels"]
     original_image = np.array(Image.open(image_path).convert("RGB"))
@@ -95,10 +97,21 @@ def process_images_in_directory(args):
 
     print(f"[+] Producing confidence maps for {total_images}")
 
-    for idx, image_name in enumerate(image_files):
-        image_path = os.path.join(args.input_dir, image_name)
-        create_heatmaps(args, confidence_maps_output_dir, image_path)
-        print(f"[+] Processed {idx + 1}/{total_images} images", end="\r")
+    output_cache = ModelOutputCache(args.cache_dir) if args.cache_dir else None
+    model = None if output_cache else get_trained_model(args.weights_path)
+    image_paths = [os.path.join(args.input_dir, image_name) for image_name in image_files]
+
+    for start in range(0, total_images, args.batch_size):
+        batch_paths = image_paths[start:start + args.batch_size]
+
+        if output_cache:
+            predictions = output_cache.predict(batch_paths, args.weights_path, args.batch_size)
+        else:
+            predictions = run_predictions(batch_paths, model, args.batch_size)
+
+        for offset, (image_path, prediction) in enumerate(zip(batch_paths, predictions)):
+            create_heatmaps(args, confidence_maps_output_dir, image_path, prediction)
+            print(f"[+] Processed {start + offset + 1}/{total_images} images", end="\r")
 
     print(f"[+] Produced {total_images}/{total_images} confidence maps")
 
@@ -126,6 +139,10 @@ if __name__ == "__main__":
                         default="vertical", help="Orientation of the colorbar (default: vertical)")
     parser.add_argument("--weights-path", type=str, default=default_weights_path,
                         help="Path to the model weights file (optional)")
+    parser.add_argument("--batch-size", type=int, default=4,
+                        help="Number of same-size images per model forward pass (default: 4)")
+    parser.add_argument("--cache-dir", type=str, default=None,
+                        help="Directory for persistent model output caching across runs (optional)")
 
     args = parser.parse_args()
 
@@ -3,8 +3,14 @@ import argparse
 import os
 import time
 
+from alveoleye.lungcv.output_cache import ModelOutputCache
 from alveoleye.paper_scripts._combined_workers import CombinedWorker
-from alveoleye._export_operations import make_save_image_callback
+from alveoleye._export_operations import (
+    DEFAULT_SNAPSHOT_COMPRESS_LEVEL,
+    DEFAULT_SNAPSHOT_FORMAT,
+    SNAPSHOT_FORMATS,
+    make_save_image_callback,
+)
 
 
 def validate_arguments(args):
@@ -17,16 +23,27 @@ def validate_arguments(args):
 def print_arguments(args):
     print(f"[+] Generating intermediate images with the following arguments:\n\n"
           f"    Input Image: {args.input_image}\n"
-          f"    Output Directory: {args.output_dir}\n")
+          f"    Output Directory: {args.output_dir}\n"
+          f"    Snapshot Format: {args.snapshot_format}\n")
 
 
 def generate_intermediate_snapshots(args):
     combined_worker = CombinedWorker()
     combined_worker.set_image_path(args.input_image)
     combined_worker.set_weights_path(args.weights_path if args.weights_path else None)
-    combined_worker.set_callback(make_save_image_callback(args.output_dir))
+    snapshot_writer = make_save_image_callback(args.output_dir, fmt=args.snapshot_format,
+                                               compress_level=args.compress_level)
+    combined_worker.set_callback(snapshot_writer)
 
+    if args.cache_dir:
+        combined_worker.set_output_cache(ModelOutputCache(args.cache_dir))
+
+    # Snapshots are written in the background; the pipeline only waits when the queue is full
+    pipeline_start_time = time.time()
     combined_worker.run_complete_pipline()
+    print(f"[+] Pipeline finished in {time.time() - pipeline_start_time:.2f} seconds, writing remaining snapshots")
+
+    snapshot_writer.flush()
 
 
 def main(args):
@@ -48,6 +65,14 @@ if __name__ == "__main__":
                         help="Path to the model weights file (optional)")
     parser.add_argument("--output-dir", type=str, required=False,
                         help="Export location for results")
+    parser.add_argument("--cache-dir", type=str, required=False, default=None,
+                        help="Directory for persistent model output caching across runs (optional)")
+    parser.add_argument("--snapshot-format", type=str, required=False, default=DEFAULT_SNAPSHOT_FORMAT,
+                        choices=list(SNAPSHOT_FORMATS),
+                        help=f"Snapshot encoding; npy saves the raw arrays (default: {DEFAULT_SNAPSHOT_FORMAT})")
+    parser.add_argument("--compress-level", type=int, required=False, default=DEFAULT_SNAPSHOT_COMPRESS_LEVEL,
+                        choices=range(10), metavar="0-9",
+                        help=f"PNG zlib level; 1 is much faster (default: {DEFAULT_SNAPSHOT_COMPRESS_LEVEL})")
 
     args = parser.parse_args()
 
@@ -5,6 +5,8 @@ import time
 
 from PIL import Image
 
+from alveoleye.lungcv.output_cache import ModelOutputCache
+from alveoleye.lungcv.profiling import StageProfiler
 from alveoleye.paper_scripts._utils import get_image_paths
 from alveoleye.paper_scripts._combined_workers import CombinedWorker
 from alveoleye._export_operations import export_accumulated_results
@@ -31,6 +33,9 @@ def validate_arguments(args):
     if args.output_dir and not os.access(os.path.dirname(args.output_dir) or '.', os.W_OK):
         raise ValueError(f"[-] Error: Output directory is not writable: {args.output_dir}")
 
+    if args.batch_size < 1:
+        raise ValueError("[-] Error: The batch size must be at least 1.")
+
     if args.weights_path and not os.path.isfile(args.weights_path):
         raise ValueError(f"[-] Error: The specified weights path '{args.weights_path}' does not exist or is not a file.")
 
@@ -49,6 +54,10 @@ def print_arguments(args):
 
 
 def run_determinism_trial(combined_worker, image_paths, iterations):
+    # Every iteration must really rerun the model, cached stages would always agree
+    combined_worker.set_stage_cache(None)
+    combined_worker.set_output_cache(None)
+
     for image_path in image_paths:
         previous_result = None
         combined_worker.set_image_path(image_path)
@@ -69,8 +78,7 @@ def run_determinism_trial(combined_worker, image_paths, iterations):
 
 def run_randomized_line_location_trial(combined_worker, image_paths, iterations):
     combined_worker.set_randomized_distribution(True)
-    for image_path in image_paths:
-        combined_worker.set_image_path(image_path)
+    for image_path in combined_worker.iterate_with_predictions(image_paths):
         combined_worker.run_processing()
         combined_worker.run_postprocessing()
 
@@ -79,8 +87,7 @@ def run_randomized_line_location_trial(combined_worker, image_paths, iterations)
 
 
 def run_variable_number_of_lines_trial(combined_worker, image_paths, iterations):
-    for image_path in image_paths:
-        combined_worker.set_image_path(image_path)
+    for image_path in combined_worker.iterate_with_predictions(image_paths):
         combined_worker.run_processing()
         combined_worker.run_postprocessing()
 
@@ -104,6 +111,13 @@ def run_trial(args):
 
     combined_worker = CombinedWorker()
     combined_worker.set_weights_path(args.weights_path if args.weights_path else None)
+    combined_worker.set_batch_size(args.batch_size)
+
+    if args.cache_dir:
+        combined_worker.set_output_cache(ModelOutputCache(args.cache_dir))
+
+    if args.profile_dir:
+        combined_worker.set_profiler(StageProfiler())
 
     if args.trial == "determinism_trial":
         run_determinism_trial(combined_worker, image_paths, args.iterations)
@@ -122,6 +136,10 @@ def run_trial(args):
 
         print(f"[+] Saved trial results as {export_file_name}")
 
+    if args.profile_dir:
+        combined_worker.profiler.save(args.profile_dir, args.trial)
+        print(f"[+] Saved stage profile to {os.path.join(args.profile_dir, args.trial)}.profile.json")
+
 
 def main(args):
     start_time = time.time()
@@ -147,6 +165,13 @@ if __name__ == "__main__":
                         help="export location for results (optional for determinism trial; required otherwise)")
     parser.add_argument("--weights-path", type=str, required=False, default=None,
                         help="path to the model weights file (optional)")
+    parser.add_argument("--batch-size", type=int, required=False, default=4,
+                        help="number of same-size images per model forward pass (default: 4)")
+    parser.add_argument("--cache-dir", type=str, required=False, default=None,
+                        help="directory for persistent model output caching across runs (optional)")
+    parser.add_argument("--profile-dir", type=str, required=False, default=None,
+                        help="directory to save a per-stage time and memory profile "
+                             "(JSON and Chrome trace) to (optional)")
 
     args = parser.parse_args()
 